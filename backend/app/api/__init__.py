@@ -1,9 +1,11 @@
 from fastapi import APIRouter
-from app.api import auth, photo
+from app.api import auth, photo, blob, job
 
 # 创建主路由
 api_router = APIRouter()
 
 # 注册子路由
 api_router.include_router(auth.router)
+api_router.include_router(job.router)
 api_router.include_router(photo.router)
+api_router.include_router(blob.router)
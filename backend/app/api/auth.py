@@ -5,7 +5,13 @@ from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
 
 from app.core.database import get_db
-from app.core.security import get_password_hash, verify_password, create_access_token, get_current_user
+from app.core.security import (
+    create_access_token,
+    get_current_user,
+    get_password_hash_async,
+    password_needs_rehash,
+    verify_password_async,
+)
 from app.models.user import User
 from app.schemas.user import UserCreate, UserResponse, Token
 
@@ -23,7 +29,7 @@ async def register(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
         )
     
     # 创建新用户
-    hashed_password = get_password_hash(user_in.password)
+    hashed_password = await get_password_hash_async(user_in.password)
     db_user = User(
         username=user_in.username,
         password_hash=hashed_password
@@ -49,13 +55,18 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
     user = result.scalar_one_or_none()
     
     # 验证密码
-    if not user or not verify_password(form_data.password, user.password_hash):
+    if not user or not await verify_password_async(form_data.password, user.password_hash):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    # 计算强度配置变化后，在用户登录、拿到明文密码时按新强度重新哈希
+    if password_needs_rehash(user.password_hash):
+        user.password_hash = await get_password_hash_async(form_data.password)
+        await db.commit()
+    
     # 创建访问令牌
     access_token = create_access_token(data={"sub": str(user.id)})
     return {"access_token": access_token, "token_type": "bearer"}
@@ -0,0 +1,101 @@
+import re
+from typing import Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+
+from app.services.blob_store import BlobNotFoundError, get_blob_store, is_valid_digest, verify_blob_signature
+
+router = APIRouter(prefix="/api/blobs", tags=["blob"])
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# 内容寻址的 blob 永远不会改变，可以让浏览器长期缓存
+CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段 Range 请求头
+    :return: (start, end) 闭区间；不支持的格式返回 None，表示返回完整内容
+    :raises ValueError: 范围无法满足
+    """
+    match = RANGE_PATTERN.match(header.strip())
+    if not match:
+        # 多段或非 bytes 单位的范围直接忽略，按完整内容返回
+        return None
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        # bytes=-N 表示最后 N 个字节
+        length = int(last)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError(header)
+    return start, min(end, size - 1)
+
+
+@router.api_route("/{digest}", methods=["GET", "HEAD"])
+async def get_blob(digest: str, request: Request, exp: int = 0, sig: str = ""):
+    """
+    以原始字节流返回图片，支持 ETag 协商缓存和 Range 断点续传
+    地址由记录详情和历史列表接口签发（见 blob_url），<img> 无法携带 Bearer 令牌，以签名代替登录校验
+    :param digest: 内容的 SHA-256 摘要
+    :param exp: 签名过期时间
+    :param sig: 签名
+    """
+    if not is_valid_digest(digest):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="图片不存在")
+    if not verify_blob_signature(digest, exp, sig):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="图片链接无效或已过期")
+
+    store = get_blob_store()
+    try:
+        info = await run_in_threadpool(store.stat, digest)
+    except BlobNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="图片不存在")
+
+    etag = f'"{digest}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        try:
+            byte_range = _parse_range(range_header, info.size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{info.size}"
+            return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers=headers)
+
+    if byte_range:
+        start, end = byte_range
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+    else:
+        start, end = 0, info.size - 1
+        status_code = status.HTTP_200_OK
+    headers["Content-Length"] = str(end - start + 1)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=info.content_type)
+
+    try:
+        chunks = await run_in_threadpool(store.iter_range, digest, start, end)
+    except BlobNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="图片不存在")
+    return StreamingResponse(chunks, status_code=status_code, headers=headers, media_type=info.content_type)
@@ -0,0 +1,176 @@
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Request, status, UploadFile, File, Form
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import Optional
+
+from app.core.config import settings
+from app.core.database import async_session, get_db
+from app.core.rate_limit import get_rate_limiter
+from app.core.security import get_current_user
+from app.models.job import AnalysisJob
+from app.models.photo import Photo
+from app.models.user import User
+from app.schemas.job import JobResponse
+from app.services.ai_service import AIService, AUTO_MODEL
+from app.services.job_queue import TERMINAL_STATUSES, get_job_worker
+from app.services.phash_index import to_signed
+from app.services.photo_service import load_photo_response, prepare_upload, store_image
+from app.services.sse import format_sse
+
+router = APIRouter(prefix="/api/photo/jobs", tags=["job"])
+
+# 长轮询和事件流单次等待的最长时间（秒）
+MAX_WAIT_SECONDS = 30
+
+
+async def _get_user_job(db: AsyncSession, job_id: int, user_id: int) -> AnalysisJob:
+    result = await db.execute(
+        select(AnalysisJob).where(AnalysisJob.id == job_id, AnalysisJob.user_id == user_id)
+    )
+    job = result.scalar_one_or_none()
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在"
+        )
+    return job
+
+
+async def _build_job_response(db: AsyncSession, job: AnalysisJob) -> dict:
+    response = JobResponse.model_validate(job).model_dump()
+    if job.status == "succeeded" and job.photo_id:
+        photo = await db.get(Photo, job.photo_id)
+        if photo:
+            response["result"] = {**await load_photo_response(db, photo), "cached": job.cached}
+    return response
+
+
+async def _wait_for_change(job_id: int, timeout: float) -> None:
+    worker = get_job_worker()
+    if worker:
+        await worker.wait_for_change(job_id, timeout)
+    else:
+        # 本进程没有运行 worker 时退化为定时轮询
+        await asyncio.sleep(min(timeout, settings.JOB_POLL_INTERVAL_SECONDS))
+
+
+@router.post("", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_job(
+    file: UploadFile = File(...),
+    model: Optional[str] = Form(None),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    提交图片分析任务，立即返回任务ID，分析在后台执行
+    :param file: 上传的图片文件
+    :param model: 使用的AI模型，可选，默认使用配置中的模型
+    :param current_user: 当前登录用户
+    :param db: 数据库会话
+    :return: 任务信息
+    """
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="请上传图片文件"
+        )
+
+    try:
+        model_name = AIService(model=model).model or AUTO_MODEL
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    await get_rate_limiter().check_user(current_user.id)
+
+    image = await prepare_upload(file.file, file.filename)
+
+    # 图片先写入 blob 存储，任务只记录摘要，重启后仍可继续处理
+    thumbnail_hash = await store_image(image)
+
+    job = AnalysisJob(
+        user_id=current_user.id,
+        filename=file.filename,
+        model=model_name,
+        image_hash=image.image_hash,
+        thumbnail_hash=thumbnail_hash,
+        phash=to_signed(image.phash),
+        max_attempts=settings.JOB_MAX_ATTEMPTS
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+
+    worker = get_job_worker()
+    if worker:
+        worker.notify()
+
+    return await _build_job_response(db, job)
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(
+    job_id: int,
+    wait: float = 0,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    查询任务状态
+    :param job_id: 任务ID
+    :param wait: 长轮询等待秒数，任务未结束时最多等待这么久再返回
+    :param current_user: 当前登录用户
+    :param db: 数据库会话
+    :return: 任务信息，成功时包含分析结果
+    """
+    job = await _get_user_job(db, job_id, current_user.id)
+    if wait > 0 and job.status not in TERMINAL_STATUSES:
+        await _wait_for_change(job_id, min(wait, MAX_WAIT_SECONDS))
+        await db.refresh(job)
+    return await _build_job_response(db, job)
+
+
+@router.get("/{job_id}/events")
+async def stream_job_events(
+    job_id: int,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    以 Server-Sent Events 推送任务状态变化，任务结束后关闭连接
+    :param job_id: 任务ID
+    :param request: 请求对象，用于检测客户端断开
+    :param current_user: 当前登录用户
+    :param db: 数据库会话
+    """
+    await _get_user_job(db, job_id, current_user.id)
+    user_id = current_user.id
+
+    async def event_stream():
+        last_state = None
+        while True:
+            async with async_session() as session:
+                job = await _get_user_job(session, job_id, user_id)
+                state = (job.status, job.attempts)
+                if state != last_state:
+                    last_state = state
+                    payload = jsonable_encoder(await _build_job_response(session, job))
+                    yield format_sse(job.status, payload)
+                else:
+                    # 心跳，防止代理因长时间无数据断开连接
+                    yield ": keep-alive\n\n"
+            if job.status in TERMINAL_STATUSES or await request.is_disconnected():
+                break
+            await _wait_for_change(job_id, MAX_WAIT_SECONDS)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
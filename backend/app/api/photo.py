@@ -1,31 +1,60 @@
-import os
 import json
-import base64
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Header, Request, status, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, delete
 from sqlalchemy.orm import selectinload
 from typing import List, Optional
 
-from app.core.database import get_db
+from app.core.config import settings
+from app.core.database import async_session, get_db
+from app.core.deadline import ClientDisconnectedError, Deadline, cancel_on_disconnect
+from app.core.rate_limit import get_rate_limiter
 from app.core.security import get_current_user
 from app.models.user import User
 from app.models.photo import Photo
 from app.schemas.photo import PhotoAnalyzeResponse, PhotoListResponse, PhotoListItem
-from app.services.ai_service import AIService
-from app.utils.image import compress_image, generate_thumbnail
+from app.services.ai_service import AIService, PROMPT_VERSION
+from app.services.batch_analysis import BatchAnalysis
+from app.services.blob_store import blob_url
+from app.services.phash_index import phash_index
+from app.services.photo_service import (
+    count_photos,
+    create_photo,
+    decode_cursor,
+    encode_cursor,
+    find_existing_photo,
+    find_reusable_analysis,
+    get_user_photo,
+    list_photos,
+    load_photo_response,
+    prepare_upload,
+    release_blobs,
+    resolve_analysis,
+    spool_uploads,
+    store_image,
+)
+from app.services.result_cache import analysis_cache
+from app.services.sse import format_sse
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/photo", tags=["photo"])
 
-# 确保上传目录存在
-UPLOAD_DIR = "uploads"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# 历史记录每页最多返回的条数
+MAX_PAGE_SIZE = 100
 
 
 @router.post("/analyze", response_model=PhotoAnalyzeResponse)
 async def analyze_photo(
+    request: Request,
     file: UploadFile = File(...),
     model: Optional[str] = Form(None),
+    request_timeout: Optional[float] = Header(None, alias="X-Request-Timeout", gt=0),
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
@@ -33,10 +62,14 @@ async def analyze_photo(
     上传图片并进行AI分析
     :param file: 上传的图片文件
     :param model: 使用的AI模型，可选，默认使用配置中的模型
+    :param request_timeout: 客户端愿意等待的秒数，只能缩短 ANALYSIS_DEADLINE_SECONDS
     :param current_user: 当前登录用户
     :param db: 数据库会话
     :return: 分析结果
     """
+    # 截止时间从收到请求时开始计算，上传处理的耗时也计入
+    deadline = Deadline.for_request(settings.ANALYSIS_DEADLINE_SECONDS, request_timeout)
+    
     # 检查文件类型
     if not file.content_type.startswith("image/"):
         raise HTTPException(
@@ -44,137 +77,286 @@ async def analyze_photo(
             detail="请上传图片文件"
         )
     
-    # 读取文件内容
-    file_content = await file.read()
+    try:
+        ai_service = AIService(model=model, deadline=deadline)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    # 上传内容已由框架流式写入临时文件（小文件在内存、大文件落盘），
+    # 在图片处理池中从文件对象解码一次，生成压缩图、缩略图和哈希
+    image = await prepare_upload(file.file, file.filename)
+    
+    # 同一用户重复上传同一张图片，直接返回已有的分析记录
+    existing_photo = await find_existing_photo(db, current_user.id, image.image_hash, ai_service.model)
+    if existing_photo:
+        return {**await load_photo_response(db, existing_photo), "cached": True}
+    
+    # 客户端断开后取消进行中的模型调用，不再为无人接收的结果消耗配额；
+    # 只有需要调用模型时才计入用户的分析次数，超出时返回 429
+    try:
+        analysis_result, cached, duplicate_of_id = await cancel_on_disconnect(
+            request,
+            resolve_analysis(
+                db, current_user.id, ai_service, image,
+                before_call=lambda: get_rate_limiter().check_user(current_user.id)
+            )
+        )
+    except ClientDisconnectedError as e:
+        raise HTTPException(
+            status_code=499,
+            detail=str(e)
+        )
+    
+    # 图片写入 blob 存储，数据库只保存内容摘要
+    thumbnail_hash = await store_image(image)
     
-    # 压缩图片
-    compressed_content, img_format = compress_image(file_content)
+    # 创建图片记录
+    photo = await create_photo(
+        db,
+        user_id=current_user.id,
+        filename=file.filename,
+        image_hash=image.image_hash,
+        thumbnail_hash=thumbnail_hash,
+        phash=image.phash,
+        model=ai_service.model,
+        analysis_result=analysis_result,
+        duplicate_of_id=duplicate_of_id
+    )
     
-    # 生成缩略图
-    thumbnail = generate_thumbnail(compressed_content)
+    return {**await load_photo_response(db, photo), "cached": cached}
+
+
+@router.post("/analyze/stream")
+async def analyze_photo_stream(
+    file: UploadFile = File(...),
+    model: Optional[str] = Form(None),
+    request_timeout: Optional[float] = Header(None, alias="X-Request-Timeout", gt=0),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    上传图片并以 Server-Sent Events 推送AI分析过程，评分和每条点评生成后立即推送
+    客户端断开时 StreamingResponse 取消响应流，进行中的模型调用随之取消
+    :param file: 上传的图片文件
+    :param model: 使用的AI模型，可选，默认使用配置中的模型
+    :param request_timeout: 客户端愿意等待的秒数，只能缩短 ANALYSIS_DEADLINE_SECONDS
+    :param current_user: 当前登录用户
+    :param db: 数据库会话
+    :return: text/event-stream，事件依次为
+        - score：{"dimension", "value"}，一个维度的评分
+        - item：{"category", "index", "text"}，highlights/improvements/suggestions 中的一条
+        - result：完整的分析记录，与 /analyze 的返回相同；复用已有结果时直接推送
+        - error：{"detail"}，分析失败
+    """
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="请上传图片文件"
+        )
     
-    # 保存图片到临时目录
-    file_path = os.path.join(UPLOAD_DIR, f"{current_user.id}_{file.filename}")
-    with open(file_path, "wb") as f:
-        f.write(compressed_content)
+    deadline = Deadline.for_request(settings.ANALYSIS_DEADLINE_SECONDS, request_timeout)
     
     try:
-        # 调用AI服务进行分析
-        ai_service = AIService(model=model)
-        analysis_result = await ai_service.analyze_photo(file_path, file.filename)
-        
-        # 将压缩后的图片转换为 base64 字符串
-        image_base64 = base64.b64encode(compressed_content).decode('utf-8')
-        img_format = 'jpeg'  # 压缩后统一为 jpeg 格式
-        full_image_data = f'data:image/{img_format};base64,{image_base64}'
-        
-        # 创建图片记录
-        photo = Photo(
-            user_id=current_user.id,
-            filename=file.filename,
-            thumbnail=thumbnail,
-            image_data=full_image_data,
-            score_tech=analysis_result["scores"]["technical"],
-            score_comp=analysis_result["scores"]["composition"],
-            score_aes=analysis_result["scores"]["aesthetic"],
-            score_story=analysis_result["scores"]["narrative"],
-            overall_score=analysis_result["overall_score"],
-            analysis=json.dumps(analysis_result["analysis"]),
-            model_used=ai_service.model
+        ai_service = AIService(model=model, deadline=deadline)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
-        
-        db.add(photo)
-        await db.commit()
-        await db.refresh(photo)
-        
-        # 构建响应
-        return {
-            "id": photo.id,
-            "filename": photo.filename,
-            "thumbnail": photo.thumbnail,
-            "image_data": photo.image_data,
-            "scores": {
-                "technical": photo.score_tech,
-                "composition": photo.score_comp,
-                "aesthetic": photo.score_aes,
-                "narrative": photo.score_story
-            },
-            "overall_score": photo.overall_score,
-            "analysis": json.loads(photo.analysis),
-            "model_used": photo.model_used,
-            "created_at": photo.created_at
-        }
-        
-    finally:
-        # 清理临时文件
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    
+    # 上传文件和数据库会话在接口函数返回后即被关闭，图片在这里处理完，响应流中使用自己的会话
+    image = await prepare_upload(file.file, file.filename)
+    
+    existing_photo = await find_existing_photo(db, current_user.id, image.image_hash, ai_service.model)
+    existing_response = {**await load_photo_response(db, existing_photo), "cached": True} if existing_photo else None
+    # 可复用的结果在响应开始前查找，只有需要调用模型时才计入用户的分析次数，超出时仍能返回 429
+    reusable = None
+    if existing_response is None:
+        reusable = await find_reusable_analysis(db, current_user.id, ai_service, image)
+        if reusable is None:
+            await get_rate_limiter().check_user(current_user.id)
+    user_id = current_user.id
+
+    async def event_stream():
+        try:
+            if existing_response is not None:
+                yield format_sse("result", jsonable_encoder(existing_response))
+                return
+            
+            if reusable is not None:
+                analysis_result, duplicate_of_id = reusable
+                cached = True
+            else:
+                analysis_result, duplicate_of_id, cached = None, None, False
+                async for event in ai_service.stream_analysis(image.content, image.filename):
+                    event_type = event.pop("type")
+                    if event_type == "result":
+                        analysis_result = event["result"]
+                    else:
+                        yield format_sse(event_type, event)
+            
+            thumbnail_hash = await store_image(image)
+            
+            async with async_session() as session:
+                if not cached:
+                    await analysis_cache.set(image.image_hash, ai_service.model, PROMPT_VERSION, analysis_result)
+                photo = await create_photo(
+                    session,
+                    user_id=user_id,
+                    filename=image.filename,
+                    image_hash=image.image_hash,
+                    thumbnail_hash=thumbnail_hash,
+                    phash=image.phash,
+                    model=ai_service.model,
+                    analysis_result=analysis_result,
+                    duplicate_of_id=duplicate_of_id
+                )
+                response = {**await load_photo_response(session, photo), "cached": cached}
+            yield format_sse("result", jsonable_encoder(response))
+        except Exception as e:
+            logger.warning("流式分析图片 %s 失败: %s", image.filename, e)
+            yield format_sse("error", {"detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@router.post("/analyze/batch")
+async def analyze_photo_batch(
+    files: List[UploadFile] = File(...),
+    model: Optional[str] = Form(None),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    批量上传图片并进行AI分析，以 NDJSON 逐行返回每张图片的结果
+    :param files: 上传的图片文件
+    :param model: 使用的AI模型，可选，默认使用配置中的模型
+    :param current_user: 当前登录用户
+    :return: application/x-ndjson 流，每行一个 JSON 对象，格式见 BatchAnalysis.run。
+             新记录在全部图片完成后一次性写入，逐张返回的结果 id 为空，记录 id 只在最后一行 done 的 saved 中给出；
+             读到 done 之前断开时不写入任何记录，重新提交时已完成的图片命中结果缓存
+    """
+    if len(files) > settings.BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"单次最多上传 {settings.BATCH_MAX_FILES} 张图片"
+        )
+    if any(not (file.content_type or "").startswith("image/") for file in files):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="请上传图片文件"
+        )
+    
+    try:
+        AIService(model=model)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    # 批量上传按图片数计入用户的分析次数
+    await get_rate_limiter().check_user(current_user.id, cost=len(files))
+    
+    # 上传的临时文件在接口函数返回后即被关闭，而分析在响应流中进行，
+    # 这里把内容转存到自己持有的临时文件，不把整批原图读入内存
+    spooled = await run_in_threadpool(spool_uploads, [file.file for file in files])
+    batch = BatchAnalysis(current_user.id, model, [(file.filename, f) for file, f in zip(files, spooled)])
+
+    async def lines():
+        async for line in batch.run():
+            yield json.dumps(jsonable_encoder(line), ensure_ascii=False) + "\n"
+
+    # 响应体开始输出前客户端就断开时 batch.run() 不会执行；中途断开时 Starlette 也不关闭停在 yield 上的生成器。
+    # 两种情况都由响应结束后的后台任务取消未完成的图片并关闭临时文件
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(batch.close)
+    )
 
 
 @router.get("/history", response_model=PhotoListResponse)
 async def get_history(
     page: int = 1,
     page_size: int = 10,
+    cursor: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
     获取历史记录列表
     :param page: 页码，默认1
-    :param page_size: 每页数量，默认10
+    :param page_size: 每页数量，默认10，最多100
+    :param cursor: 分页游标，取自上一页的 next_cursor，传入时忽略 page
     :param current_user: 当前登录用户
     :param db: 数据库会话
     :return: 历史记录列表
     """
-    # 计算偏移量
-    offset = (page - 1) * page_size
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    
+    # 解析游标
+    position = None
+    if cursor:
+        try:
+            position = decode_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
     
     # 查询总数
-    total_result = await db.execute(
-        select(Photo).where(Photo.user_id == current_user.id)
-    )
-    total = len(total_result.scalars().all())
+    total = await count_photos(db, current_user.id)
     
-    # 查询分页数据
-    result = await db.execute(
-        select(Photo)
-        .where(Photo.user_id == current_user.id)
-        .order_by(Photo.created_at.desc())
-        .offset(offset)
-        .limit(page_size)
+    # 查询分页数据，多取一条用于判断是否还有下一页
+    rows = await list_photos(
+        db,
+        current_user.id,
+        limit=page_size + 1,
+        offset=(max(page, 1) - 1) * page_size,
+        cursor=position
     )
-    photos = result.scalars().all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
     
     # 构建响应
     return {
         "total": total,
         "items": [{
-            "id": photo.id,
-            "filename": photo.filename,
-            "thumbnail": photo.thumbnail,
-            "overall_score": photo.overall_score,
-            "created_at": photo.created_at
-        } for photo in photos]
+            "id": row.id,
+            "filename": row.filename,
+            "thumbnail": blob_url(row.thumbnail_hash) or row.thumbnail,
+            "overall_score": row.overall_score,
+            "created_at": row.created_at
+        } for row in rows],
+        "next_cursor": encode_cursor(rows[-1].created_at, rows[-1].id) if has_more else None
     }
 
 
 @router.get("/{photo_id}", response_model=PhotoAnalyzeResponse)
 async def get_photo_detail(
     photo_id: int,
+    include: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     """
     获取单条分析详情
     :param photo_id: 图片ID
+    :param include: 逗号分隔的附加内容，include=image 时原图以 data URI 内联返回，默认只返回 blob 地址
     :param current_user: 当前登录用户
     :param db: 数据库会话
     :return: 分析详情
     """
-    result = await db.execute(
-        select(Photo).where(Photo.id == photo_id, Photo.user_id == current_user.id)
-    )
-    photo = result.scalar_one_or_none()
+    photo = await get_user_photo(db, current_user.id, photo_id)
     
     if not photo:
         raise HTTPException(
@@ -182,36 +364,8 @@ async def get_photo_detail(
             detail="图片不存在"
         )
     
-    # 构建响应
-    try:
-        analysis_data = json.loads(photo.analysis) if photo.analysis else {
-            "highlights": [],
-            "improvements": [],
-            "suggestions": []
-        }
-    except json.JSONDecodeError:
-        analysis_data = {
-            "highlights": [],
-            "improvements": [],
-            "suggestions": []
-        }
-    
-    return {
-        "id": photo.id,
-        "filename": photo.filename,
-        "thumbnail": photo.thumbnail,
-        "image_data": photo.image_data,
-        "scores": {
-            "technical": photo.score_tech,
-            "composition": photo.score_comp,
-            "aesthetic": photo.score_aes,
-            "narrative": photo.score_story
-        },
-        "overall_score": photo.overall_score,
-        "analysis": analysis_data,
-        "model_used": photo.model_used,
-        "created_at": photo.created_at
-    }
+    include_image = "image" in (include or "").split(",")
+    return await load_photo_response(db, photo, include_image=include_image)
 
 
 @router.delete("/{photo_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -227,14 +381,22 @@ async def delete_photo(
     :param db: 数据库会话
     """
     result = await db.execute(
-        delete(Photo).where(Photo.id == photo_id, Photo.user_id == current_user.id)
+        select(Photo.image_hash, Photo.thumbnail_hash)
+        .where(Photo.id == photo_id, Photo.user_id == current_user.id)
     )
+    row = result.first()
     
-    if result.rowcount == 0:
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="图片不存在"
         )
     
+    await db.execute(
+        delete(Photo).where(Photo.id == photo_id, Photo.user_id == current_user.id)
+    )
     await db.commit()
+    phash_index.remove(photo_id)
+    
+    await release_blobs(db, {row.image_hash, row.thumbnail_hash} - {None})
     return None
@@ -1,5 +1,6 @@
+import os
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 
 
 class Settings(BaseSettings):
@@ -8,19 +9,134 @@ class Settings(BaseSettings):
     OPENAI_BASE_URL: str = "https://api.openai.com/v1"
 
     ANTHROPIC_API_KEY: Optional[str] = None
+    ANTHROPIC_BASE_URL: str = "https://api.anthropic.com/v1"
 
     DEEPSEEK_API_KEY: Optional[str] = None
     DEEPSEEK_BASE_URL: str = "https://api.deepseek.com/v1"
 
     DEFAULT_AI_MODEL: str = "deepseek"
 
+    # Provider HTTP Pool
+    HTTP_POOL_LIMIT: int = 100
+    HTTP_POOL_LIMIT_PER_HOST: int = 32
+    HTTP_KEEPALIVE_SECONDS: float = 60.0
+    HTTP_DNS_CACHE_SECONDS: int = 300
+    HTTP_CONNECT_TIMEOUT_SECONDS: float = 10.0
+    HTTP_READ_TIMEOUT_SECONDS: float = 120.0
+
+    # Provider Retries & Deadlines
+    PROVIDER_ATTEMPT_TIMEOUT_SECONDS: float = 60.0
+    PROVIDER_RETRY_MAX_ATTEMPTS: int = 3
+    PROVIDER_RETRY_BASE_SECONDS: float = 0.5
+    PROVIDER_RETRY_MAX_SECONDS: float = 10.0
+    ANALYSIS_DEADLINE_SECONDS: float = 150.0
+
+    # Image Processing Pool
+    IMAGE_POOL_KIND: str = "thread"  # thread / process
+    IMAGE_POOL_WORKERS: int = max(2, min(8, os.cpu_count() or 2))
+    IMAGE_POOL_MAX_QUEUE: int = 32
+    IMAGE_PROFILES_ENABLED: bool = True
+
+    # Local Quality Pre-scoring
+    QUALITY_PRESCORE_ENABLED: bool = True
+    QUALITY_SHORT_CIRCUIT_TECHNICAL: bool = False
+
+    # Structured Output
+    STRUCTURED_OUTPUT_ENABLED: bool = True
+    ANALYSIS_MAX_ITEMS: int = 3
+    ANALYSIS_ITEM_MAX_CHARS: int = 40
+    ANALYSIS_REPAIR_ENABLED: bool = True
+
+    # Provider Routing
+    ROUTER_ENABLED: bool = True
+    ROUTER_PROVIDERS: str = "deepseek,openai,claude"
+    ROUTER_WINDOW_SIZE: int = 100
+    ROUTER_MIN_SAMPLES: int = 5
+    ROUTER_HEDGE_ENABLED: bool = False
+    ROUTER_HEDGE_MIN_DELAY_SECONDS: float = 2.0
+    ROUTER_HEDGE_DEFAULT_DELAY_SECONDS: float = 20.0
+    CIRCUIT_FAILURE_THRESHOLD: int = 5
+    CIRCUIT_RESET_SECONDS: float = 30.0
+
+    # Rate Limiting
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"  # memory / sqlite
+    RATE_LIMIT_SQLITE_PATH: str = "./rate_limit.db"
+    USER_RATE_LIMIT_PER_MINUTE: int = 20
+    USER_RATE_LIMIT_BURST: int = 10
+    PROVIDER_RATE_LIMITS: str = "deepseek=60,openai=60,claude=30"
+    PROVIDER_RATE_LIMIT_BURST: int = 5
+    PROVIDER_RATE_LIMIT_MAX_WAIT_SECONDS: float = 30.0
+    PROVIDER_RETRY_AFTER_DEFAULT_SECONDS: float = 5.0
+
     # JWT
     JWT_SECRET: str = "your-super-secret-key-change-in-production"
     JWT_ALGORITHM: str = "HS256"
     JWT_EXPIRE_DAYS: int = 7
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = max(2, min(4, os.cpu_count() or 2))
+    AUTH_CACHE_ENABLED: bool = True
+    AUTH_CACHE_SIZE: int = 10000
+    AUTH_USER_CACHE_TTL_SECONDS: float = 60.0
 
     # Database
     DATABASE_URL: str = "sqlite+aiosqlite:///./app.db"
+    DB_ECHO: bool = False
+    DB_AUTO_MIGRATE: bool = True
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT_SECONDS: float = 30.0
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_COMMAND_TIMEOUT_SECONDS: float = 60.0
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+
+    # Blob Storage
+    BLOB_BACKEND: str = "local"  # local / s3
+    BLOB_DIR: str = "./blobs"
+    S3_BUCKET: Optional[str] = None
+    S3_ENDPOINT_URL: Optional[str] = None
+    S3_ACCESS_KEY: Optional[str] = None
+    S3_SECRET_KEY: Optional[str] = None
+    S3_REGION: Optional[str] = None
+    BLOB_URL_TTL_SECONDS: int = 3600
+    BLOB_GC_GRACE_SECONDS: int = 3600
+
+    # Analysis Cache
+    ANALYSIS_CACHE_ENABLED: bool = True
+    ANALYSIS_CACHE_TTL_SECONDS: int = 30 * 24 * 3600
+    ANALYSIS_CACHE_MEMORY_SIZE: int = 512
+    ANALYSIS_CACHE_MAX_ENTRIES: int = 100000
+    ANALYSIS_COALESCE_ENABLED: bool = True
+    ANALYSIS_PROVIDER_CONCURRENCY: str = "deepseek=16,openai=16,claude=8"
+
+    # Near-duplicate Detection
+    NEAR_DUPLICATE_ENABLED: bool = True
+    NEAR_DUPLICATE_MAX_DISTANCE: int = 4
+    NEAR_DUPLICATE_MIN_HASH_BITS: int = 8
+
+    # Analysis Jobs
+    JOB_WORKER_ENABLED: bool = True
+    JOB_WORKER_CONCURRENCY: int = 8
+    JOB_PROVIDER_CONCURRENCY: str = "deepseek=4,openai=4,claude=2"
+    JOB_MAX_ATTEMPTS: int = 5
+    JOB_RETRY_BASE_SECONDS: float = 2.0
+    JOB_RETRY_MAX_SECONDS: float = 300.0
+    JOB_POLL_INTERVAL_SECONDS: float = 1.0
+    JOB_LEASE_SECONDS: float = 60.0
+
+    # Batch Analysis
+    BATCH_MAX_FILES: int = 50
+    BATCH_CONCURRENCY: int = 8
+    BATCH_PROVIDER_CONCURRENCY: str = "deepseek=4,openai=4,claude=2"
+
+    # Metrics
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: Optional[str] = None
 
     # App
     DEBUG: bool = True
@@ -32,3 +148,13 @@ class Settings(BaseSettings):
 
 
 settings = Settings()
+
+
+def parse_provider_limits(value: str) -> Dict[str, int]:
+    """解析 "deepseek=4,openai=4" 格式的按服务商配置"""
+    limits = {}
+    for item in value.split(","):
+        name, _, limit = item.strip().partition("=")
+        if name and limit:
+            limits[name.strip()] = int(limit)
+    return limits
@@ -1,10 +1,86 @@
+from typing import Any, Dict
+
+from sqlalchemy import event
+from sqlalchemy.engine import URL, make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from app.core.config import settings
+from app.migrations import run_migrations
+
+# 未指定驱动的数据库地址使用的异步驱动
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+
+def database_url(value: str) -> URL:
+    """解析数据库地址，postgresql:// 等未指定驱动的地址换成对应的异步驱动"""
+    url = make_url(value)
+    if url.drivername in ASYNC_DRIVERS:
+        url = url.set(drivername=ASYNC_DRIVERS[url.drivername])
+    return url
+
+
+def _is_memory_sqlite(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def engine_options(url: URL) -> Dict[str, Any]:
+    """按数据库类型生成连接池配置"""
+    options: Dict[str, Any] = {"echo": settings.DB_ECHO}
+    # 内存 SQLite 只有一个共享连接，不使用连接池参数
+    if _is_memory_sqlite(url):
+        return options
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT_SECONDS,
+        pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+    )
+    if url.get_backend_name() == "sqlite":
+        # aiosqlite 默认每次使用新建连接，连接池复用连接，PRAGMA 和页缓存在连接之间保留
+        options["poolclass"] = AsyncAdaptedQueuePool
+    elif url.get_backend_name() == "postgresql":
+        options["connect_args"] = {
+            "command_timeout": settings.DB_COMMAND_TIMEOUT_SECONDS,
+            "server_settings": {"application_name": "photo-assistant"},
+        }
+    return options
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """
+    每个新连接建立后设置 SQLite 参数
+    - WAL：读写互不阻塞，多个请求可同时读取，写入只需追加日志
+    - synchronous=NORMAL：WAL 模式下只在检查点时 fsync，断电最多丢失最近提交的事务，不会损坏数据库
+    - busy_timeout：写锁被占用时等待而不是立即报 database is locked
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}")
+    # 负数表示以 KiB 为单位
+    cursor.execute(f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+def create_engine(url: str):
+    """创建异步引擎，SQLite 连接建立时应用 PRAGMA"""
+    parsed = database_url(url)
+    new_engine = create_async_engine(parsed, **engine_options(parsed))
+    if parsed.get_backend_name() == "sqlite" and not _is_memory_sqlite(parsed):
+        event.listen(new_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    return new_engine
 
 
-engine = create_async_engine(settings.DATABASE_URL, echo=settings.DEBUG)
+engine = create_engine(settings.DATABASE_URL)
 
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
@@ -22,5 +98,7 @@ async def get_db():
 
 
 async def init_db():
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    """执行尚未执行的数据库迁移；关闭 DB_AUTO_MIGRATE 时需在部署时手动运行 python -m scripts.migrate"""
+    if not settings.DB_AUTO_MIGRATE:
+        return
+    await run_migrations(engine)
@@ -0,0 +1,120 @@
+"""
+请求级的截止时间
+
+分析接口收到请求时创建 Deadline，随 AIService 传到每次模型调用：单次调用的超时取
+PROVIDER_ATTEMPT_TIMEOUT_SECONDS 与剩余时间中较小的一个，剩余时间不够时不再重试或切换服务商。
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Awaitable, Optional, TypeVar
+
+from starlette.requests import Request
+
+T = TypeVar("T")
+
+
+class DeadlineExceededError(Exception):
+    """请求的截止时间已到，分析没有完成"""
+
+
+class ProviderTimeoutError(Exception):
+    """单次模型调用超过了 PROVIDER_ATTEMPT_TIMEOUT_SECONDS"""
+
+
+class ClientDisconnectedError(Exception):
+    """客户端在分析完成前断开了连接"""
+
+
+class Deadline:
+    """截止时间，seconds 为 None 时不限制整体耗时，只限制单次调用"""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    @classmethod
+    def for_request(cls, default: float, requested: Optional[float] = None) -> "Deadline":
+        """
+        :param default: 服务端允许的最长时间
+        :param requested: 客户端通过 X-Request-Timeout 要求的时间，只能缩短
+        """
+        return cls(default if requested is None else min(default, requested))
+
+    def remaining(self) -> Optional[float]:
+        """剩余秒数，不限制时为 None"""
+        if self.expires_at is None:
+            return None
+        return self.expires_at - time.monotonic()
+
+    def allows(self, seconds: float) -> bool:
+        """剩余时间是否还够等待 seconds 秒后再发起调用"""
+        remaining = self.remaining()
+        return remaining is None or remaining > seconds
+
+    async def run(self, awaitable: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """
+        在单次超时和剩余时间内等待 awaitable，超时后取消它（进行中的 HTTP 请求随之关闭）
+        :param timeout: 单次调用的超时，None 时只受截止时间限制
+        :raises ProviderTimeoutError: 超过单次超时
+        :raises DeadlineExceededError: 超过截止时间，剩余时间比单次超时更短时不归咎于服务商
+        """
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise DeadlineExceededError("分析超时，请稍后重试")
+        bounded_by_deadline = remaining is not None and (timeout is None or remaining < timeout)
+        limit = remaining if bounded_by_deadline else timeout
+        if limit is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, limit)
+        except asyncio.TimeoutError:
+            if bounded_by_deadline:
+                raise DeadlineExceededError("分析超时，请稍后重试") from None
+            raise ProviderTimeoutError(f"模型服务 {limit:g} 秒内没有响应") from None
+
+    async def iterate(self, stream: AsyncIterator[T], first_timeout: Optional[float] = None) -> AsyncIterator[T]:
+        """
+        逐个取出流式输出，首个元素受单次超时限制，之后的元素只受截止时间限制
+        超时或提前退出时关闭 stream
+        """
+        first = True
+        try:
+            while True:
+                try:
+                    item = await self.run(stream.__anext__(), first_timeout if first else None)
+                except StopAsyncIteration:
+                    return
+                first = False
+                yield item
+        finally:
+            await stream.aclose()
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    # 请求体已读完，之后 receive 只会在客户端断开或响应结束时返回 http.disconnect
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    等待 awaitable 完成，客户端先断开时取消它，进行中的模型调用随之取消
+    只能在请求体读完之后调用
+    :raises ClientDisconnectedError: 客户端已断开
+    """
+    task: "asyncio.Future[Any]" = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        task.cancel()
+        await asyncio.wait({task})
+        raise ClientDisconnectedError("客户端已断开连接")
+    finally:
+        watcher.cancel()
+        # 自身被取消时同样取消分析
+        task.cancel()
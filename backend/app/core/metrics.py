@@ -0,0 +1,478 @@
+"""
+进程内的 Prometheus 风格指标
+
+计数器、仪表和直方图都保存在内存中，/metrics 接口按 Prometheus 文本格式输出。
+记录一次观测只是一次加锁的加法（直方图多一次二分查找），不依赖外部服务；
+多进程部署时每个进程各自统计，由 Prometheus 按实例抓取后汇总。
+"""
+import asyncio
+import math
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# 一条样本：(指标名后缀, 标签, 值)
+Sample = Tuple[str, Dict[str, str], float]
+
+# 默认的直方图分桶（秒），覆盖毫秒级的图片处理到数十秒的模型调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+class _Metric(ABC):
+    """带标签的指标，每组标签值对应一个子指标，子指标创建后缓存复用"""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        self._lock = Lock()
+
+    @abstractmethod
+    def _new_child(self) -> "_Metric":
+        ...
+
+    def labels(self, *values: str):
+        """
+        获取一组标签值对应的子指标
+        :param values: 按 labelnames 顺序的标签值
+        """
+        # 热路径上标签值通常已是字符串，直接按原值查找，不逐个转换
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}")
+            key = tuple(str(value) for value in values)
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abstractmethod
+    def _child_samples(self) -> Iterator[Sample]:
+        ...
+
+    def samples(self) -> Iterator[Sample]:
+        if not self.labelnames:
+            yield from self._child_samples()
+            return
+        for key, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, key))
+            for suffix, extra, value in child._child_samples():
+                yield suffix, {**labels, **extra}, value
+
+    def clear(self) -> None:
+        """清空已有的子指标，用于测试"""
+        with self._lock:
+            self._children.clear()
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = 0.0
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def _child_samples(self) -> Iterator[Sample]:
+        yield "_total", {}, self._value
+
+
+class Gauge(_Metric):
+    """可增可减的当前值，如进行中的请求数"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = 0.0
+
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation)
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def _child_samples(self) -> Iterator[Sample]:
+        yield "", {}, self._value
+
+
+class Histogram(_Metric):
+    """
+    分桶直方图，记录观测值的分布、总和与次数
+    各桶只记本桶的次数，输出时再累加成 Prometheus 要求的累计值
+    """
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float) -> None:
+        # 值等于桶上限时计入该桶（le 为小于等于）
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """记录 with 块的耗时，块内抛出异常时同样记录"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+    def _child_samples(self) -> Iterator[Sample]:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            yield "_bucket", {"le": _format_value(bound)}, cumulative
+        yield "_sum", {}, total
+        yield "_count", {}, cumulative
+
+
+# 抓取时才计算的指标：返回 (指标名, 类型, 说明, [(后缀, 标签, 值)])
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]
+
+
+class MetricsRegistry:
+    """指标注册表，render 输出全部指标"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Collector] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标 {metric.name} 已注册")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def register_collector(self, collector: Collector) -> None:
+        """注册抓取时调用的回调，用于导出其他模块已有的统计（如缓存命中数）"""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """按 Prometheus 文本格式（0.0.4）输出"""
+        families = [
+            (metric.name, metric.type, metric.documentation, list(metric.samples()))
+            for metric in self._metrics.values()
+        ]
+        for collector in self._collectors:
+            families.extend(collector())
+
+        lines = []
+        for name, metric_type, documentation, samples in families:
+            # 计数器的指标族名不带 _total 后缀
+            family = name[:-len("_total")] if metric_type == "counter" and name.endswith("_total") else name
+            lines.append(f"# HELP {family} {documentation}")
+            lines.append(f"# TYPE {family} {metric_type}")
+            for suffix, labels, value in samples:
+                lines.append(f"{family}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "按路由和状态码统计的 HTTP 请求数", ["method", "route", "status"]
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP 请求耗时，流式响应计到最后一个字节发出", ["method", "route"]
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "正在处理的 HTTP 请求数")
+
+STAGE_DURATION = REGISTRY.histogram(
+    "analysis_stage_duration_seconds", "分析流程各阶段耗时", ["stage"]
+)
+
+PROVIDER_REQUEST_DURATION = REGISTRY.histogram(
+    "provider_request_duration_seconds",
+    "模型服务商调用耗时，不含等待速率限制和并发名额的时间",
+    ["provider"],
+    buckets=(0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0),
+)
+PROVIDER_REQUESTS = REGISTRY.counter(
+    "provider_requests_total", "模型服务商调用次数，outcome 为 ok/error/rate_limited/cancelled", ["provider", "outcome"]
+)
+PROVIDER_IN_FLIGHT = REGISTRY.gauge("provider_requests_in_flight", "正在进行的模型服务商调用数", ["provider"])
+PROVIDER_TOKENS = REGISTRY.counter(
+    "provider_tokens_total", "模型服务商返回的 token 用量，kind 为 input/output", ["provider", "kind"]
+)
+PROVIDER_PARSE = REGISTRY.counter(
+    "provider_parse_total",
+    "模型输出的解析结果，outcome 为 ok/repaired（补充了缺失字段）/failed",
+    ["provider", "outcome"],
+)
+PROVIDER_RETRIES = REGISTRY.counter(
+    "provider_retries_total",
+    "模型服务商调用的重试次数，reason 为 http_<状态码>/timeout/connection",
+    ["provider", "reason"],
+)
+ANALYSIS_COALESCED = REGISTRY.counter(
+    "analysis_coalesced_total", "与进行中的相同分析合并、没有调用模型的请求数"
+)
+
+# 各服务商 usage 字段中输入、输出 token 数的键名
+USAGE_KEYS = {
+    "input": ("prompt_tokens", "input_tokens"),
+    "output": ("completion_tokens", "output_tokens"),
+}
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """记录分析流程中一个阶段的耗时"""
+    STAGE_DURATION.labels(stage).observe(seconds)
+
+
+def time_stage(stage: str):
+    """
+    记录 with 块的耗时
+    :param stage: 阶段名，如 parse、db_commit
+    """
+    return STAGE_DURATION.labels(stage).time()
+
+
+def record_usage(provider: str, usage: Optional[Dict[str, int]]) -> None:
+    """
+    记录一次调用的 token 用量
+    :param usage: 服务商响应中的 usage 字段，兼容 OpenAI 与 Claude 的键名
+    """
+    if not usage:
+        return
+    for kind, keys in USAGE_KEYS.items():
+        for key in keys:
+            if usage.get(key):
+                PROVIDER_TOKENS.labels(provider, kind).inc(usage[key])
+                break
+
+
+def provider_usage_report() -> Dict[str, Dict[str, float]]:
+    """
+    各服务商每次分析的平均 token 用量和失败率
+    每次分析包含追问缺失字段的请求；error_rate 为调用失败（含限流）的比例
+    """
+    outcomes: Dict[str, Dict[str, float]] = {}
+    for (provider, outcome), child in list(PROVIDER_PARSE._children.items()):
+        outcomes.setdefault(provider, {})[outcome] = child.value
+    calls: Dict[str, Dict[str, float]] = {}
+    for (provider, outcome), child in list(PROVIDER_REQUESTS._children.items()):
+        calls.setdefault(provider, {})[outcome] = child.value
+
+    report = {}
+    for provider in sorted(set(outcomes) | set(calls)):
+        parsed = outcomes.get(provider, {})
+        analyses = sum(parsed.values())
+        requests = calls.get(provider, {})
+        finished = sum(value for outcome, value in requests.items() if outcome != "cancelled")
+        report[provider] = {
+            "analyses": analyses,
+            "avg_input_tokens": round(PROVIDER_TOKENS.labels(provider, "input").value / analyses, 1) if analyses else 0.0,
+            "avg_output_tokens": round(PROVIDER_TOKENS.labels(provider, "output").value / analyses, 1) if analyses else 0.0,
+            "repair_rate": round(parsed.get("repaired", 0) / analyses, 3) if analyses else 0.0,
+            "parse_failure_rate": round(parsed.get("failed", 0) / analyses, 3) if analyses else 0.0,
+            "error_rate": round((finished - requests.get("ok", 0)) / finished, 3) if finished else 0.0,
+        }
+    return report
+
+
+def service_collector(
+    cache_stats: Callable[[], Dict[str, Any]],
+    pool_stats: Callable[[], Dict[str, Any]],
+    router_snapshot: Callable[[], Dict[str, Any]]
+) -> Collector:
+    """
+    导出结果缓存、图片处理池和服务商路由已有的统计
+    各统计由 services 中的对象提供，以回调传入，core 不依赖 services
+    """
+    def collect():
+        cache = cache_stats()
+        yield "analysis_cache_lookups_total", "counter", "分析结果缓存查询次数", [
+            ("_total", {"result": "memory_hit"}, cache["memory_hits"]),
+            ("_total", {"result": "db_hit"}, cache["db_hits"]),
+            ("_total", {"result": "miss"}, cache["misses"]),
+        ]
+        yield "analysis_cache_hit_ratio", "gauge", "分析结果缓存命中率", [("", {}, cache["hit_rate"])]
+
+        pool = pool_stats()
+        yield "image_pool_tasks", "gauge", "图片处理池中排队和执行中的任务数", [
+            ("", {"state": "queued"}, pool["queued"]),
+            ("", {"state": "running"}, pool["running"]),
+        ]
+        yield "image_pool_tasks_finished_total", "counter", "图片处理池已结束的任务数", [
+            ("_total", {"outcome": "completed"}, pool["completed"]),
+            ("_total", {"outcome": "failed"}, pool["failed"]),
+            ("_total", {"outcome": "rejected"}, pool["rejected"]),
+        ]
+
+        snapshot = router_snapshot()
+        providers = snapshot["providers"]
+        yield "provider_circuit_state", "gauge", "服务商熔断器状态，当前状态为 1", [
+            ("", {"provider": provider, "state": state}, int(stats["state"] == state))
+            for provider, stats in providers.items()
+            for state in ("closed", "open", "half_open")
+        ]
+        yield "provider_error_rate", "gauge", "服务商近期调用的错误率", [
+            ("", {"provider": provider}, stats["error_rate"]) for provider, stats in providers.items()
+        ]
+        yield "provider_recent_latency_seconds", "gauge", "路由统计的服务商近期调用耗时分位数", [
+            ("", {"provider": provider, "quantile": quantile}, stats[key])
+            for provider, stats in providers.items()
+            for quantile, key in (("0.5", "p50_seconds"), ("0.95", "p95_seconds"))
+            if stats[key] is not None
+        ]
+        yield "provider_hedges_total", "counter", "对冲请求的发起和胜出次数", [
+            ("_total", {"outcome": "sent"}, snapshot["hedges"]),
+            ("_total", {"outcome": "won"}, snapshot["hedge_wins"]),
+        ]
+
+    return collect
+
+
+@contextmanager
+def track_provider_call(provider: str) -> Iterator[None]:
+    """统计一次服务商调用的耗时、结果和进行中的数量"""
+    in_flight = PROVIDER_IN_FLIGHT.labels(provider)
+    in_flight.inc()
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    except (asyncio.CancelledError, GeneratorExit):
+        outcome = "cancelled"
+        raise
+    except Exception as e:
+        # 避免 core 依赖 services，限流错误按 ProviderHTTPError.rate_limited 属性识别
+        if getattr(e, "rate_limited", False):
+            outcome = "rate_limited"
+        raise
+    finally:
+        in_flight.dec()
+        PROVIDER_REQUEST_DURATION.labels(provider).observe(time.perf_counter() - started)
+        PROVIDER_REQUESTS.labels(provider, outcome).inc()
+
+
+class MetricsMiddleware:
+    """
+    记录每个请求的耗时、状态码和进行中的请求数
+    直接实现 ASGI 接口而不是 BaseHTTPMiddleware，不包装请求和响应体，流式响应也不会被缓冲；
+    路由标签使用匹配到的路径模板（如 /api/photo/{photo_id}），避免路径参数造成标签无限增长
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            # 路由匹配时 FastAPI 把路由对象写入 scope
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUEST_DURATION.labels(method, path).observe(elapsed)
+            HTTP_REQUESTS.labels(method, path, str(status_code)).inc()
@@ -0,0 +1,228 @@
+import asyncio
+import math
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from typing import Dict, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import parse_provider_limits, settings
+from app.utils.cache import LRUCache
+
+# 进程内最多保留的令牌桶数，被淘汰的桶下次使用时视为已装满
+MAX_BUCKETS = 100000
+
+# 令牌桶状态：(剩余令牌, 更新时间)
+BucketState = Tuple[float, float]
+
+
+class RateLimitExceededError(Exception):
+    """用户请求过于频繁"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"请求过于频繁，请 {retry_after} 秒后重试")
+        self.retry_after = retry_after
+
+
+class ProviderRateLimitedError(Exception):
+    """服务商的调用配额在允许的等待时间内无法获得"""
+
+    def __init__(self, provider: str, retry_after: int):
+        super().__init__(f"服务商 {provider} 请求过多，请 {retry_after} 秒后重试")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+def take_tokens(state: Optional[BucketState], now: float, capacity: float, rate: float, cost: float) -> Tuple[BucketState, float]:
+    """
+    按经过的时间补充令牌后尝试取出 cost 个
+    桶中令牌不少于 min(cost, capacity) 即放行并扣除全部 cost，允许欠账，超过桶容量的批量请求也能通过，
+    但之后需要等待欠下的令牌补回
+    :return: (新状态, 需要等待的秒数)，0 表示放行
+    """
+    tokens = capacity if state is None else min(capacity, state[0] + max(0.0, now - state[1]) * rate)
+    needed = min(cost, capacity)
+    if tokens >= needed:
+        return (tokens - cost, now), 0.0
+    return (tokens, now), (needed - tokens) / rate
+
+
+def defer_tokens(state: Optional[BucketState], now: float, capacity: float, rate: float, seconds: float) -> BucketState:
+    """清空令牌，使 seconds 秒后才能再取出一个"""
+    tokens = capacity if state is None else min(capacity, state[0] + max(0.0, now - state[1]) * rate)
+    return min(tokens, 1 - rate * seconds), now
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头，支持秒数和 HTTP 日期两种格式"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitBackend(ABC):
+    """
+    令牌桶的存储后端
+    默认的进程内实现只在单个进程中生效；多个 uvicorn worker 需要共同遵守同一个限额时使用共享后端，
+    共享后端只需实现 take 和 defer 两个原子操作
+    """
+
+    @abstractmethod
+    async def take(self, key: str, capacity: float, rate: float, cost: float = 1.0) -> float:
+        """
+        从桶中取出令牌
+        :return: 需要等待的秒数，0 表示放行
+        """
+
+    @abstractmethod
+    async def defer(self, key: str, capacity: float, rate: float, seconds: float) -> None:
+        """seconds 秒内不再放行该桶的请求"""
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """进程内的令牌桶，所有操作都在事件循环中同步完成"""
+
+    def __init__(self, maxsize: int = MAX_BUCKETS):
+        self._buckets: LRUCache[BucketState] = LRUCache(maxsize=maxsize)
+
+    async def take(self, key: str, capacity: float, rate: float, cost: float = 1.0) -> float:
+        state, wait = take_tokens(self._buckets.get(key), time.monotonic(), capacity, rate, cost)
+        self._buckets.set(key, state)
+        return wait
+
+    async def defer(self, key: str, capacity: float, rate: float, seconds: float) -> None:
+        self._buckets.set(key, defer_tokens(self._buckets.get(key), time.monotonic(), capacity, rate, seconds))
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """
+    保存在 SQLite 文件中的令牌桶，同一台机器上的多个 worker 进程共享
+    每次操作在 BEGIN IMMEDIATE 事务中读-改-写，由 SQLite 的文件锁保证原子性
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rate_limit_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._lock = Lock()
+
+    def _update(self, key: str, update) -> float:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                # 多个进程间不能使用 monotonic 时钟
+                state, wait = update(row, time.time())
+                self._conn.execute(
+                    "INSERT INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (key, *state)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    async def take(self, key: str, capacity: float, rate: float, cost: float = 1.0) -> float:
+        return await run_in_threadpool(
+            self._update, key, lambda state, now: take_tokens(state, now, capacity, rate, cost)
+        )
+
+    async def defer(self, key: str, capacity: float, rate: float, seconds: float) -> None:
+        await run_in_threadpool(
+            self._update, key, lambda state, now: (defer_tokens(state, now, capacity, rate, seconds), 0.0)
+        )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class RateLimiter:
+    """
+    令牌桶限流
+    - 用户：每个用户触发分析的速率，超出时抛出 RateLimitExceededError，由接口返回 429
+    - 服务商：发往每个服务商的调用速率，超出时排队等待；服务商返回 Retry-After 时暂停向其发送请求
+    """
+
+    def __init__(self, backend: RateLimitBackend, enabled: bool = settings.RATE_LIMIT_ENABLED):
+        self.backend = backend
+        self.enabled = enabled
+        self.provider_limits: Dict[str, int] = parse_provider_limits(settings.PROVIDER_RATE_LIMITS)
+
+    async def check_user(self, user_id: int, cost: float = 1.0) -> None:
+        """
+        记录用户发起的分析，超出限额时抛出 RateLimitExceededError
+        :param cost: 本次请求计入的分析数，批量上传为图片数
+        """
+        if not self.enabled or settings.USER_RATE_LIMIT_PER_MINUTE <= 0:
+            return
+        wait = await self.backend.take(
+            f"user:{user_id}",
+            settings.USER_RATE_LIMIT_BURST,
+            settings.USER_RATE_LIMIT_PER_MINUTE / 60,
+            cost
+        )
+        if wait > 0:
+            raise RateLimitExceededError(math.ceil(wait))
+
+    def _provider_bucket(self, provider: str) -> Optional[Tuple[str, float, float]]:
+        per_minute = self.provider_limits.get(provider)
+        if not self.enabled or not per_minute:
+            return None
+        return f"provider:{provider}", settings.PROVIDER_RATE_LIMIT_BURST, per_minute / 60
+
+    async def acquire_provider(self, provider: str) -> None:
+        """
+        调用服务商前取得配额，配额不足时等待；预计等待超过 PROVIDER_RATE_LIMIT_MAX_WAIT_SECONDS 时
+        抛出 ProviderRateLimitedError，由路由切换到其他服务商
+        """
+        bucket = self._provider_bucket(provider)
+        if bucket is None:
+            return
+        key, capacity, rate = bucket
+        deadline = time.monotonic() + settings.PROVIDER_RATE_LIMIT_MAX_WAIT_SECONDS
+        while True:
+            wait = await self.backend.take(key, capacity, rate)
+            if wait <= 0:
+                return
+            if time.monotonic() + wait > deadline:
+                raise ProviderRateLimitedError(provider, math.ceil(wait))
+            await asyncio.sleep(wait)
+
+    async def defer_provider(self, provider: str, retry_after: Optional[float]) -> None:
+        """服务商返回 429 等限流响应后，在 retry_after 秒内暂停向其发送请求"""
+        bucket = self._provider_bucket(provider)
+        if bucket is None:
+            return
+        key, capacity, rate = bucket
+        seconds = settings.PROVIDER_RETRY_AFTER_DEFAULT_SECONDS if retry_after is None else retry_after
+        await self.backend.defer(key, capacity, rate, seconds)
+
+
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    global _rate_limiter
+    if _rate_limiter is None:
+        if settings.RATE_LIMIT_BACKEND == "sqlite":
+            backend: RateLimitBackend = SQLiteRateLimitBackend(settings.RATE_LIMIT_SQLITE_PATH)
+        else:
+            backend = MemoryRateLimitBackend()
+        _rate_limiter = RateLimiter(backend)
+    return _rate_limiter
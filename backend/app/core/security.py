@@ -1,36 +1,74 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Dict, Optional
 
 from jose import JWTError, jwt
 import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import make_transient_to_detached
 
 from app.core.config import settings
 from app.core.database import get_db
 from app.models.user import User
+from app.utils.cache import LRUCache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# 已验证的 token -> 用户ID，条目不晚于 token 本身过期
+_token_cache: LRUCache[int] = LRUCache(maxsize=settings.AUTH_CACHE_SIZE)
+# 用户ID -> 用户各列的值；只在本进程内失效，多个 worker 之间依赖 TTL 收敛
+_user_cache: LRUCache[Dict[str, Any]] = LRUCache(maxsize=settings.AUTH_CACHE_SIZE, ttl=settings.AUTH_USER_CACHE_TTL_SECONDS)
+
+
+# bcrypt 在计算期间释放 GIL，放在独立的有界线程池中执行：不阻塞事件循环，也不占用默认线程池，
+# 登录高峰时多出的请求在这里排队，不影响上传等其他请求
+_password_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix="password-hash"
+)
+
+
+def _password_bytes(password: str) -> bytes:
+    # bcrypt 只使用前 72 字节，新版 bcrypt 对更长的输入直接报错，按字节截断
+    return password.encode('utf-8')[:72]
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     # 直接使用bcrypt库验证密码，避免passlib兼容性问题
-    plain_password_bytes = plain_password.encode('utf-8')
-    hashed_password_bytes = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(plain_password_bytes, hashed_password_bytes)
+    return bcrypt.checkpw(_password_bytes(plain_password), hashed_password.encode('utf-8'))
 
 
 def get_password_hash(password: str) -> str:
     # 直接使用bcrypt库生成密码哈希，避免passlib兼容性问题
-    # bcrypt限制密码不能超过72字节，需要手动截断
-    password = password[:72]
-    password_bytes = password.encode('utf-8')
-    hashed_bytes = bcrypt.hashpw(password_bytes, bcrypt.gensalt())
+    hashed_bytes = bcrypt.hashpw(_password_bytes(password), bcrypt.gensalt(rounds=settings.BCRYPT_ROUNDS))
     return hashed_bytes.decode('utf-8')
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """在密码线程池中验证密码"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """在密码线程池中生成密码哈希"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, get_password_hash, password)
+
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """哈希的计算强度与当前配置的 BCRYPT_ROUNDS 不同，需要在下次登录时重新生成"""
+    try:
+        return int(hashed_password.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -42,26 +80,73 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
+def invalidate_user(user_id: int) -> None:
+    """用户信息变化后移除缓存，下次请求重新查询"""
+    _user_cache.pop(user_id)
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_changed_user(mapper, connection, target: User) -> None:
+    invalidate_user(target.id)
+
+
+def _decode_token(token: str) -> Optional[int]:
+    """验证 token，返回用户ID，无效时返回 None；验证结果按 token 缓存"""
+    if settings.AUTH_CACHE_ENABLED:
+        user_id = _token_cache.get(token)
+        if user_id is not None:
+            return user_id
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
+        user_id = int(payload["sub"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        return None
+    if settings.AUTH_CACHE_ENABLED:
+        # jose 已校验过 exp，缓存条目在 token 过期时一并失效
+        expires_in = payload.get("exp", 0) - time.time()
+        if expires_in > 0:
+            _token_cache.set(token, user_id, ttl=expires_in)
+    return user_id
+
+
+def _cached_user(user_id: int) -> Optional[User]:
+    columns = _user_cache.get(user_id)
+    if columns is None:
+        return None
+    # 每次请求重建脱离会话的实例，避免多个请求共享同一个对象
+    user = User(**columns)
+    make_transient_to_detached(user)
+    return user
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: AsyncSession = Depends(get_db)
 ) -> User:
+    """
+    当前登录用户
+    token 验证结果和用户信息都有进程内缓存，命中时不查询数据库；会话在未执行查询前不会占用连接
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="无法验证凭据",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, settings.JWT_SECRET, algorithms=[settings.JWT_ALGORITHM])
-        user_id: int = payload.get("sub")
-        if user_id is None:
-            raise credentials_exception
-    except JWTError:
+    user_id = _decode_token(token)
+    if user_id is None:
         raise credentials_exception
 
+    if settings.AUTH_CACHE_ENABLED:
+        user = _cached_user(user_id)
+        if user is not None:
+            return user
+
     result = await db.execute(select(User).where(User.id == user_id))
     user = result.scalar_one_or_none()
 
     if user is None:
         raise credentials_exception
+    if settings.AUTH_CACHE_ENABLED:
+        _user_cache.set(user_id, {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs})
     return user
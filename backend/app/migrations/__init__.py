@@ -0,0 +1,81 @@
+"""
+版本化的数据库迁移
+
+每个迁移是 app/migrations/versions 下的一个模块，定义 revision、down_revision 和 upgrade(conn)，
+按 down_revision 串成一条链依次执行；已执行的版本记录在 schema_migrations 表中。
+修改模型的表结构时，在 versions 下新增一个迁移，down_revision 指向当前最新的版本。
+"""
+import importlib
+import logging
+import pkgutil
+from types import ModuleType
+from typing import List, Optional
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+VERSION_TABLE = sa.Table(
+    "schema_migrations",
+    sa.MetaData(),
+    sa.Column("revision", sa.String(32), primary_key=True),
+    sa.Column("applied_at", sa.DateTime, nullable=False, server_default=sa.func.current_timestamp()),
+)
+
+# PostgreSQL 上多个进程同时启动时用 advisory lock 串行执行迁移
+ADVISORY_LOCK_ID = 72_190_001
+
+
+def load_migrations() -> List[ModuleType]:
+    """按执行顺序返回全部迁移"""
+    package = importlib.import_module(f"{__name__}.versions")
+    modules = {
+        module.revision: module
+        for module in (
+            importlib.import_module(f"{package.__name__}.{info.name}")
+            for info in pkgutil.iter_modules(package.__path__)
+        )
+    }
+    ordered: List[ModuleType] = []
+    previous: Optional[str] = None
+    while len(ordered) < len(modules):
+        following = [module for module in modules.values() if module.down_revision == previous]
+        if len(following) != 1:
+            raise RuntimeError(f"迁移 {previous} 之后应有且只有一个迁移，实际为 {[m.revision for m in following]}")
+        ordered.append(following[0])
+        previous = following[0].revision
+    return ordered
+
+
+def applied_revisions(conn: Connection) -> List[str]:
+    if not sa.inspect(conn).has_table(VERSION_TABLE.name):
+        return []
+    return list(conn.execute(sa.select(VERSION_TABLE.c.revision)).scalars())
+
+
+def upgrade(conn: Connection) -> List[str]:
+    """
+    执行尚未执行的迁移
+    :return: 本次执行的版本
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute(sa.text("SELECT pg_advisory_xact_lock(:id)"), {"id": ADVISORY_LOCK_ID})
+    VERSION_TABLE.create(conn, checkfirst=True)
+    applied = set(applied_revisions(conn))
+    executed = []
+    for migration in load_migrations():
+        if migration.revision in applied:
+            continue
+        logger.info("执行数据库迁移 %s", migration.revision)
+        migration.upgrade(conn)
+        conn.execute(sa.insert(VERSION_TABLE).values(revision=migration.revision))
+        executed.append(migration.revision)
+    return executed
+
+
+async def run_migrations(engine: AsyncEngine) -> List[str]:
+    """在一个事务中执行待执行的迁移，PostgreSQL 上任一迁移失败时整体回滚"""
+    async with engine.begin() as conn:
+        return await conn.run_sync(upgrade)
@@ -0,0 +1,103 @@
+"""
+初始表结构
+
+引入版本化迁移之前的数据库由 create_all 创建，并在每次启动时补齐新增的列和索引；
+这里建立当时的完整表结构，对已有的旧数据库同样只补齐缺少的列和索引，之后的结构变化都以新的迁移提交。
+表结构在此处固定，不引用 app.models，模型之后的修改不会改变本迁移的行为。
+"""
+import sqlalchemy as sa
+from sqlalchemy.engine import Connection
+
+revision = "0001"
+down_revision = None
+
+metadata = sa.MetaData()
+
+sa.Table(
+    "users",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("username", sa.String(50), nullable=False, unique=True, index=True),
+    sa.Column("password_hash", sa.String(255), nullable=False),
+    sa.Column("created_at", sa.DateTime, nullable=False),
+    sa.Column("updated_at", sa.DateTime, nullable=False),
+)
+
+sa.Table(
+    "photos",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+    sa.Column("filename", sa.String(255), nullable=False),
+    sa.Column("image_hash", sa.String(64), nullable=True, index=True),
+    sa.Column("thumbnail_hash", sa.String(64), nullable=True, index=True),
+    sa.Column("phash", sa.BigInteger, nullable=True),
+    sa.Column("duplicate_of_id", sa.Integer, sa.ForeignKey("photos.id", ondelete="SET NULL"), nullable=True),
+    sa.Column("thumbnail", sa.Text, nullable=True),
+    sa.Column("image_data", sa.Text, nullable=True),
+    sa.Column("score_tech", sa.Integer, nullable=True),
+    sa.Column("score_comp", sa.Integer, nullable=True),
+    sa.Column("score_aes", sa.Integer, nullable=True),
+    sa.Column("score_story", sa.Integer, nullable=True),
+    sa.Column("overall_score", sa.Integer, nullable=True),
+    sa.Column("analysis", sa.Text, nullable=True),
+    sa.Column("model_used", sa.String(50), nullable=True),
+    sa.Column("created_at", sa.DateTime, nullable=False),
+    sa.Index("ix_photos_user_id_created_at", "user_id", "created_at", "id"),
+)
+
+sa.Table(
+    "analysis_jobs",
+    metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False, index=True),
+    sa.Column("filename", sa.String(255), nullable=False),
+    sa.Column("model", sa.String(50), nullable=False),
+    sa.Column("image_hash", sa.String(64), nullable=False),
+    sa.Column("thumbnail_hash", sa.String(64), nullable=False),
+    sa.Column("phash", sa.BigInteger, nullable=False),
+    sa.Column("status", sa.String(20), nullable=False),
+    sa.Column("attempts", sa.Integer, nullable=False),
+    sa.Column("max_attempts", sa.Integer, nullable=False),
+    sa.Column("next_run_at", sa.DateTime, nullable=False),
+    sa.Column("locked_by", sa.String(32), nullable=True),
+    sa.Column("locked_until", sa.DateTime, nullable=True),
+    sa.Column("error", sa.Text, nullable=True),
+    sa.Column("cached", sa.Boolean, nullable=False),
+    sa.Column("photo_id", sa.Integer, sa.ForeignKey("photos.id", ondelete="SET NULL"), nullable=True),
+    sa.Column("created_at", sa.DateTime, nullable=False),
+    sa.Column("updated_at", sa.DateTime, nullable=False),
+    sa.Index("ix_analysis_jobs_status_next_run_at", "status", "next_run_at"),
+)
+
+sa.Table(
+    "analysis_cache",
+    metadata,
+    sa.Column("key", sa.String(160), primary_key=True),
+    sa.Column("image_hash", sa.String(64), nullable=False),
+    sa.Column("model", sa.String(50), nullable=False),
+    sa.Column("prompt_version", sa.String(20), nullable=False),
+    sa.Column("result", sa.Text, nullable=False),
+    sa.Column("hit_count", sa.Integer, nullable=False),
+    sa.Column("created_at", sa.DateTime, nullable=False),
+    sa.Column("expires_at", sa.DateTime, nullable=False, index=True),
+    sa.Column("last_hit_at", sa.DateTime, nullable=False, index=True),
+)
+
+
+def upgrade(conn: Connection) -> None:
+    metadata.create_all(conn)
+
+    # 旧数据库中的表由早期版本创建，可能缺少后来新增的列和索引；新增的列都允许为空
+    inspector = sa.inspect(conn)
+    for table in metadata.sorted_tables:
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(sa.text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+        existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(conn)
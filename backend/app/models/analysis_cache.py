@@ -0,0 +1,21 @@
+from datetime import datetime
+from sqlalchemy import String, Integer, Text, DateTime
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.core.database import Base
+
+
+class AnalysisCacheEntry(Base):
+    """AI 分析结果缓存，键为 (图片内容摘要, 模型, prompt 版本)"""
+    __tablename__ = "analysis_cache"
+
+    key: Mapped[str] = mapped_column(String(160), primary_key=True)
+    image_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    model: Mapped[str] = mapped_column(String(50), nullable=False)
+    prompt_version: Mapped[str] = mapped_column(String(20), nullable=False)
+    result: Mapped[str] = mapped_column(Text, nullable=False)
+    hit_count: Mapped[int] = mapped_column(Integer, default=0)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, index=True)
+    last_hit_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
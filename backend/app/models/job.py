@@ -0,0 +1,37 @@
+from datetime import datetime
+from sqlalchemy import String, Integer, BigInteger, Text, DateTime, ForeignKey, Index
+from sqlalchemy.orm import Mapped, mapped_column
+from typing import Optional
+
+from app.core.database import Base
+
+
+class AnalysisJob(Base):
+    """异步分析任务，图片在入队时已写入 blob 存储"""
+    __tablename__ = "analysis_jobs"
+    __table_args__ = (
+        Index("ix_analysis_jobs_status_next_run_at", "status", "next_run_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False, index=True)
+    filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    model: Mapped[str] = mapped_column(String(50), nullable=False)
+    image_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    thumbnail_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    phash: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+    # pending / running / succeeded / failed
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default="pending")
+    attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    max_attempts: Mapped[int] = mapped_column(Integer, nullable=False, default=5)
+    next_run_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    # 执行中任务的租约：持有者定期续租，过期后其他 worker 才能接管
+    locked_by: Mapped[Optional[str]] = mapped_column(String(32), nullable=True)
+    locked_until: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    cached: Mapped[bool] = mapped_column(default=False)
+    photo_id: Mapped[Optional[int]] = mapped_column(ForeignKey("photos.id", ondelete="SET NULL"), nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,5 +1,5 @@
 from datetime import datetime
-from sqlalchemy import String, Integer, Text, DateTime, ForeignKey
+from sqlalchemy import String, Integer, BigInteger, Text, DateTime, ForeignKey, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from typing import TYPE_CHECKING, Optional
 
@@ -11,12 +11,29 @@ if TYPE_CHECKING:
 
 class Photo(Base):
     __tablename__ = "photos"
+    __table_args__ = (
+        # 历史记录按 (created_at, id) 倒序分页，id 显式放入索引以便在 PostgreSQL 上同样覆盖排序
+        Index("ix_photos_user_id_created_at", "user_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
     filename: Mapped[str] = mapped_column(String(255), nullable=False)
-    thumbnail: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
-    image_data: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # 存储原图片或压缩后的图片
+    # 图片内容存放在 blob 存储中，这里只记录内容的 SHA-256 摘要
+    image_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)
+    thumbnail_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, index=True)
+    # 感知哈希（dHash），用于识别近似重复的图片
+    phash: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    # 复用了哪条记录的分析结果
+    duplicate_of_id: Mapped[Optional[int]] = mapped_column(ForeignKey("photos.id", ondelete="SET NULL"), nullable=True)
+    # 旧版本以 base64 data URI 直接存储在表中，迁移到 blob 存储后清空
+    # 大字段默认不随查询加载，访问前需用 undefer() 或 refresh() 显式加载，未加载时访问会直接报错
+    thumbnail: Mapped[Optional[str]] = mapped_column(
+        Text, nullable=True, deferred=True, deferred_group="legacy_payload", deferred_raiseload=True
+    )
+    image_data: Mapped[Optional[str]] = mapped_column(
+        Text, nullable=True, deferred=True, deferred_group="legacy_payload", deferred_raiseload=True
+    )
 
     # 四维度评分
     score_tech: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
@@ -26,7 +43,7 @@ class Photo(Base):
     overall_score: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
 
     # 分析结果
-    analysis: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    analysis: Mapped[Optional[str]] = mapped_column(Text, nullable=True, deferred=True, deferred_raiseload=True)
     model_used: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import Optional
+
+from app.schemas.photo import PhotoAnalyzeResponse
+
+
+class JobResponse(BaseModel):
+    id: int
+    status: str
+    filename: str
+    model: str
+    attempts: int
+    error: Optional[str]
+    photo_id: Optional[int]
+    cached: bool
+    created_at: datetime
+    updated_at: datetime
+    # 任务成功后附带分析结果
+    result: Optional[PhotoAnalyzeResponse] = None
+
+    class Config:
+        from_attributes = True
@@ -26,6 +26,8 @@ class PhotoAnalyzeResponse(BaseModel):
     analysis: AnalysisDetail
     model_used: str
     created_at: datetime
+    # 是否复用了已有的分析结果（缓存命中或重复上传）
+    cached: bool = False
 
     class Config:
         from_attributes = True
@@ -45,3 +47,5 @@ class PhotoListItem(BaseModel):
 class PhotoListResponse(BaseModel):
     total: int
     items: List[PhotoListItem]
+    # 下一页的游标，没有更多数据时为空
+    next_cursor: Optional[str] = None
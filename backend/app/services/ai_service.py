@@ -1,33 +1,269 @@
-from typing import Dict, Any, Optional
-from app.core.config import settings
+import asyncio
+import copy
+import logging
+import time
+from contextlib import nullcontext
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from app.core.config import parse_provider_limits, settings
+from app.core.deadline import Deadline, DeadlineExceededError
+from app.core.metrics import ANALYSIS_COALESCED, PROVIDER_RETRIES, track_provider_call
+from app.core.rate_limit import get_rate_limiter
 
-# 导入不同模型的客户端
-from app.services.deepseek_client import DeepSeekClient
-from app.services.openai_client import OpenAIClient
-from app.services.claude_client import ClaudeClient
+from app.services.blob_store import compute_digest
+from app.services.http_pool import get_client_registry
+from app.services.image_pool import image_pool
+from app.services.prompt import technical_override
+from app.services.provider_retry import retry_delay, retry_reason
+from app.services.provider_router import ProviderHTTPError, ProviderUnavailableError, get_provider_router
+from app.services.result_cache import make_cache_key
+from app.utils.image import ImageProfile, get_image_profile, prepare_for_profile
+from app.utils.image_quality import QualityReport, assess_image_quality
+from app.utils.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# prompt 或输出格式变化时递增，使旧的缓存结果失效
+PROMPT_VERSION = "v3"
+
+# 异步任务中表示未指定模型、由路由选择服务商
+AUTO_MODEL = "auto"
+
+# 进程内进行中的分析，按图片摘要、模型和 prompt 版本合并并发的相同请求
+_in_flight: SingleFlight[Tuple[Dict[str, Any], str]] = SingleFlight()
+
+# 合并后的分析使用的服务商并发限制，不属于任何一个请求，首次使用时创建
+_shared_limits: Dict[str, asyncio.Semaphore] = {}
+
+
+def _shared_provider_limits() -> Dict[str, asyncio.Semaphore]:
+    if not _shared_limits:
+        _shared_limits.update({
+            name: asyncio.Semaphore(limit)
+            for name, limit in parse_provider_limits(settings.ANALYSIS_PROVIDER_CONCURRENCY).items()
+        })
+    return _shared_limits
 
 
 class AIService:
-    def __init__(self, model: Optional[str] = None):
-        self.model = model or settings.DEFAULT_AI_MODEL
-        self.client = self._get_client()
-    
+    def __init__(
+        self,
+        model: Optional[str] = None,
+        provider_limits: Optional[Dict[str, asyncio.Semaphore]] = None,
+        deadline: Optional[Deadline] = None,
+        shared_limits: Optional[Dict[str, asyncio.Semaphore]] = None
+    ):
+        """
+        :param model: 使用的模型，None 时由路由选择
+        :param provider_limits: 各服务商调用的并发限制，由调用方在多次分析间共享
+        :param deadline: 来自接口请求的截止时间，None 时只限制单次调用的耗时
+        :param shared_limits: 服务级的并发限制，与 provider_limits 同时生效
+        """
+        # 未指定模型且开启路由时由路由选择服务商，model 在分析完成后才确定
+        self.routed = model is None and settings.ROUTER_ENABLED
+        self.model = None if self.routed else (model or settings.DEFAULT_AI_MODEL)
+        self.client = self._get_client() if self.model else None
+        self.provider_limits = provider_limits or {}
+        self.shared_limits = shared_limits or {}
+        self.deadline = deadline or Deadline()
+
     def _get_client(self):
-        """根据模型名称获取对应的客户端实例"""
-        if self.model == "deepseek":
-            return DeepSeekClient()
-        elif self.model == "openai":
-            return OpenAIClient()
-        elif self.model == "claude":
-            return ClaudeClient()
-        else:
-            raise ValueError(f"不支持的模型: {self.model}")
-    
-    async def analyze_photo(self, image_path: str, filename: str) -> Dict[str, Any]:
-        """统一的图片分析接口"""
-        return await self.client.analyze_photo(image_path, filename)
-    
+        """根据模型名称从注册表获取共享的客户端实例"""
+        return get_client_registry().get_client(self.model)
+
+    def _get_profile(self, model: str) -> Optional[ImageProfile]:
+        """模型的图片预处理配置"""
+        if not settings.IMAGE_PROFILES_ENABLED:
+            return None
+        return get_image_profile(model)
+
+    async def _assess_quality(self, image_data: bytes) -> Optional[QualityReport]:
+        """本地测量画质作为 prompt 的评分依据，测量失败时不影响分析"""
+        if not settings.QUALITY_PRESCORE_ENABLED:
+            return None
+        try:
+            return await image_pool.run(assess_image_quality, image_data)
+        except Exception as e:
+            logger.warning("本地画质测量失败，不附加测量结果: %s", e)
+            return None
+
+    def candidates(self) -> List[str]:
+        """可能用于分析的服务商，按优先顺序"""
+        if self.model:
+            return [self.model]
+        router = get_provider_router()
+        ranked = router.rank()
+        return ranked + [provider for provider in router.providers if provider not in ranked]
+
+    async def _retry_delay(self, provider: str, error: Exception, attempt: int) -> Optional[float]:
+        """
+        第 attempt 次调用失败后的处理：服务商返回限流响应时暂停后续发往它的请求
+        :return: 重试前的等待秒数，不应重试时为 None
+        """
+        if isinstance(error, ProviderHTTPError) and error.rate_limited:
+            await get_rate_limiter().defer_provider(provider, error.retry_after)
+        delay = retry_delay(error, attempt, self.deadline)
+        if delay is not None:
+            PROVIDER_RETRIES.labels(provider, retry_reason(error)).inc()
+            logger.info("服务商 %s 第 %s 次调用失败，%.2f 秒后重试: %s", provider, attempt, delay, error)
+        return delay
+
+    async def _throttled(self, provider: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        按服务商的速率限制发出调用，每次调用受单次超时和截止时间限制；
+        429、5xx、超时和连接错误在同一服务商上退避后重试，其他错误直接抛出
+        """
+        limiter = get_rate_limiter()
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.deadline.run(limiter.acquire_provider(provider))
+            try:
+                with track_provider_call(provider):
+                    return await self.deadline.run(call(), settings.PROVIDER_ATTEMPT_TIMEOUT_SECONDS)
+            except Exception as e:
+                delay = await self._retry_delay(provider, e, attempt)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+
+    async def _analyze_with(
+        self,
+        provider: str,
+        image_data: bytes,
+        filename: str,
+        variants: Dict[str, bytes],
+        quality: Optional[QualityReport] = None
+    ) -> Dict[str, Any]:
+        client = get_client_registry().get_client(provider)
+        profile = self._get_profile(provider)
+        media_type = "image/jpeg"
+        if profile is not None:
+            # 按服务商实际使用的尺寸重新编码，减少上传量和 token
+            if provider not in variants:
+                variants[provider] = await image_pool.run(prepare_for_profile, image_data, profile)
+            image_data, media_type = variants[provider], profile.media_type
+        # 等待并发名额的时间也计入路由的耗时统计，排队严重的服务商会让位给其他服务商；
+        # 先占调用方的名额，在调用方限制上排队时不占用服务级的名额
+        limit = self.provider_limits.get(provider) or nullcontext()
+        shared = self.shared_limits.get(provider) or nullcontext()
+        async with limit, shared:
+            return await self._throttled(
+                provider, lambda: client.analyze_photo(image_data, filename, media_type=media_type, quality=quality)
+            )
+
+    async def analyze_photo(self, image_data: bytes, filename: str, image_hash: Optional[str] = None) -> Dict[str, Any]:
+        """
+        统一的图片分析接口，未指定模型时由路由选择服务商并在失败时切换
+        同一图片、同一模型的分析正在进行时，等待它的结果而不再调用模型；
+        发起分析的请求被取消时分析继续进行，所有等待的请求都取消后才取消，失败时所有请求得到同样的错误
+        :param image_hash: 图片内容的摘要，未提供时在这里计算
+        """
+        if not settings.ANALYSIS_COALESCE_ENABLED:
+            result, self.model = await self._analyze(image_data, filename)
+            return result
+        key = make_cache_key(image_hash or compute_digest(image_data), self.model or AUTO_MODEL, PROMPT_VERSION)
+        # 合并后的分析由所有等待的请求共享，使用服务级的截止时间，不受发起者的截止时间限制；
+        # 服务商调用由发起者发出，同时占用发起者（批量请求、任务队列）和服务级的并发名额，
+        # 等待者不发出调用，不占用名额。每个请求只用自己的截止时间限制等待，超时放弃等待不影响其他请求
+        flight = AIService(
+            self.model,
+            provider_limits=self.provider_limits,
+            deadline=Deadline(settings.ANALYSIS_DEADLINE_SECONDS),
+            shared_limits=_shared_provider_limits()
+        )
+        (result, self.model), shared = await self.deadline.run(
+            _in_flight.run(key, lambda: flight._analyze(image_data, filename))
+        )
+        if shared:
+            ANALYSIS_COALESCED.inc()
+        # 同一个结果交给所有等待的请求，发起者和等待者都得到各自的副本，修改时互不影响
+        return copy.deepcopy(result)
+
+    async def _analyze(self, image_data: bytes, filename: str) -> Tuple[Dict[str, Any], str]:
+        """
+        调用模型分析图片
+        :return: (分析结果, 实际返回结果的服务商)
+        """
+        router = get_provider_router()
+        providers = None if self.routed else [self.model]
+
+        # 首选服务商的图片在调用前准备好，预处理失败（如处理队列已满）不计入服务商的错误
+        variants: Dict[str, bytes] = {}
+        first = (router.rank(providers) or [None])[0]
+        profile = self._get_profile(first) if first else None
+        if profile is not None:
+            variants[first] = await image_pool.run(prepare_for_profile, image_data, profile)
+        # 画质只测量一次，切换服务商时复用
+        quality = await self._assess_quality(image_data)
+
+        return await router.call(
+            lambda provider: self._analyze_with(provider, image_data, filename, variants, quality),
+            providers
+        )
+
+    async def stream_analysis(self, image_data: bytes, filename: str) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式分析照片，事件格式见各客户端的 stream_analysis
+        输出开始后无法再切换服务商，因此只使用排名第一的服务商，不做失败切换和对冲；
+        只在产出第一个事件之前重试。完成后 model 为实际使用的服务商
+        """
+        router = get_provider_router()
+        ranked = router.rank(None if self.routed else [self.model])
+        if not ranked:
+            raise ProviderUnavailableError("模型服务暂时不可用，请稍后重试")
+        provider = ranked[0]
+
+        client = get_client_registry().get_client(provider)
+        quality = await self._assess_quality(image_data)
+        technical = technical_override(quality)
+        profile = self._get_profile(provider)
+        media_type = "image/jpeg"
+        if profile is not None:
+            image_data = await image_pool.run(prepare_for_profile, image_data, profile)
+            media_type = profile.media_type
+
+        if not router.breakers[provider].acquire():
+            raise ProviderUnavailableError("模型服务暂时不可用，请稍后重试")
+        limit = self.provider_limits.get(provider) or nullcontext()
+        started = time.perf_counter()
+        limiter = get_rate_limiter()
+        attempt = 0
+        try:
+            async with limit:
+                if technical is not None:
+                    # 技术分由本地测量给出，无需等待模型
+                    yield {"type": "score", "dimension": "technical", "value": technical}
+                while True:
+                    attempt += 1
+                    emitted = False
+                    await self.deadline.run(limiter.acquire_provider(provider))
+                    try:
+                        with track_provider_call(provider):
+                            stream = client.stream_analysis(image_data, filename, media_type=media_type, quality=quality)
+                            async for event in self.deadline.iterate(stream, settings.PROVIDER_ATTEMPT_TIMEOUT_SECONDS):
+                                if technical is not None and event.get("dimension") == "technical":
+                                    continue
+                                emitted = True
+                                yield event
+                        break
+                    except Exception as e:
+                        # 已推送的事件无法撤回，输出开始后不再重试
+                        delay = None if emitted else await self._retry_delay(provider, e, attempt)
+                        if delay is None:
+                            raise
+                    await asyncio.sleep(delay)
+        except (asyncio.CancelledError, GeneratorExit, DeadlineExceededError):
+            # 客户端断开或截止时间已到，没有可归咎于服务商的结果，不计入统计
+            router.breakers[provider].release()
+            raise
+        except Exception:
+            router.record(provider, time.perf_counter() - started, False)
+            raise
+        router.record(provider, time.perf_counter() - started, True)
+        self.model = provider
+
     def switch_model(self, model: str):
         """切换 AI 模型"""
+        self.routed = False
         self.model = model
         self.client = self._get_client()
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, BinaryIO, Dict, List, Optional, Tuple
+
+from app.core.config import parse_provider_limits, settings
+from app.core.database import async_session
+from app.models.photo import Photo
+from app.services.ai_service import AIService
+from app.services.blob_store import blob_url
+from app.services.image_pool import image_pool
+from app.services.photo_service import (
+    PreparedImage,
+    build_photo,
+    create_photos,
+    find_existing_photo,
+    load_photo_response,
+    prepare_upload,
+    resolve_analysis,
+    store_image,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BatchAnalysis:
+    """
+    一次批量分析请求，按完成顺序逐张产出结果
+    - 预处理：同时提交到图片处理池的任务不超过池的 worker 数，批量请求只排队等待，不会占满队列被拒绝
+    - 分析：同时分析的图片数不超过 BATCH_CONCURRENCY，每个服务商的调用数受 BATCH_PROVIDER_CONCURRENCY 限制
+    - 去重：同一批次中内容相同的图片只分析一次，不重复建记录
+    - 保存：新记录在全部图片完成后一次性写入；中途断开时不写入，已完成的分析结果仍在结果缓存中，重新提交不会重复调用模型
+    """
+
+    def __init__(self, user_id: int, model: Optional[str], uploads: List[Tuple[str, BinaryIO]]):
+        """
+        :param user_id: 用户ID
+        :param model: 使用的模型，None 时由路由选择
+        :param uploads: (文件名, 上传内容的临时文件) 列表，文件在预处理后关闭
+        """
+        self.user_id = user_id
+        self.model = model
+        self.uploads = uploads
+        self._prepare_slots = asyncio.Semaphore(image_pool.workers)
+        self._analyze_slots = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+        self._provider_limits = {
+            name: asyncio.Semaphore(limit)
+            for name, limit in parse_provider_limits(settings.BATCH_PROVIDER_CONCURRENCY).items()
+        }
+        # 待写入的新记录，按上传顺序
+        self._pending: Dict[int, Photo] = {}
+        # 按内容摘要记录首次出现的图片及其分析任务，重复的图片指向首次出现的位置
+        self._first_index: Dict[str, int] = {}
+        self._shared: Dict[str, asyncio.Task] = {}
+        self._aliases: Dict[int, int] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def close(self) -> None:
+        """取消尚未完成的图片并关闭全部上传内容的临时文件，可重复调用"""
+        for task in [*self._tasks, *self._shared.values()]:
+            task.cancel()
+        for _, file in self.uploads:
+            file.close()
+
+    async def _prepare(self, filename: str, file: BinaryIO):
+        try:
+            async with self._prepare_slots:
+                return await prepare_upload(file, filename)
+        finally:
+            file.close()
+
+    async def _analyze(self, index: int, filename: str, file: BinaryIO) -> Dict[str, Any]:
+        image = await self._prepare(filename, file)
+        first = self._first_index.setdefault(image.image_hash, index)
+        if first != index:
+            # 同一批次中已有相同内容的图片，等待它的结果；shield 避免本任务被取消时连带取消共享的分析
+            result = await asyncio.shield(self._shared[image.image_hash])
+            self._aliases[index] = first
+            return {**result, "filename": filename, "cached": True}
+        task = asyncio.ensure_future(self._resolve(index, filename, image))
+        self._shared[image.image_hash] = task
+        return await task
+
+    async def _resolve(self, index: int, filename: str, image: PreparedImage) -> Dict[str, Any]:
+        # 每张图片使用独立的 AIService，分析完成后 model 为实际返回结果的服务商
+        ai_service = AIService(model=self.model, provider_limits=self._provider_limits)
+
+        async with self._analyze_slots:
+            async with async_session() as db:
+                existing_photo = await find_existing_photo(db, self.user_id, image.image_hash, ai_service.model)
+                if existing_photo:
+                    return {**await load_photo_response(db, existing_photo), "cached": True}
+                analysis_result, cached, duplicate_of_id = await resolve_analysis(db, self.user_id, ai_service, image)
+
+        thumbnail_hash = await store_image(image)
+
+        self._pending[index] = build_photo(
+            user_id=self.user_id,
+            filename=filename,
+            image_hash=image.image_hash,
+            thumbnail_hash=thumbnail_hash,
+            phash=image.phash,
+            model=ai_service.model,
+            analysis_result=analysis_result,
+            duplicate_of_id=duplicate_of_id
+        )
+        # 记录在批量写入后才有 id
+        return {
+            "id": None,
+            "filename": filename,
+            "thumbnail": blob_url(thumbnail_hash),
+            "image_data": blob_url(image.image_hash),
+            **analysis_result,
+            "model_used": ai_service.model,
+            "cached": cached
+        }
+
+    async def _run_one(self, index: int, filename: str, file: BinaryIO) -> Dict[str, Any]:
+        try:
+            result = await self._analyze(index, filename, file)
+        except Exception as e:
+            logger.warning("批量分析第 %s 张图片 %s 失败: %s", index, filename, e)
+            return {"event": "error", "index": index, "filename": filename, "error": str(e)}
+        return {"event": "result", "index": index, "result": result}
+
+    async def _save(self) -> List[Dict[str, int]]:
+        indexes = sorted(self._pending)
+        async with async_session() as db:
+            photos = await create_photos(db, [self._pending[index] for index in indexes])
+        ids = {index: photo.id for index, photo in zip(indexes, photos)}
+        # 重复的图片与首次出现的图片共用同一条记录
+        ids.update({index: ids[first] for index, first in self._aliases.items() if first in ids})
+        return [{"index": index, "id": ids[index]} for index in sorted(ids)]
+
+    async def run(self) -> AsyncIterator[Dict[str, Any]]:
+        """
+        按完成顺序产出每张图片的结果，最后产出汇总
+        - {"event": "result", "index", "result"}：分析结果，新记录的 id 为空，写入后在 done 的 saved 中给出；
+          批次内重复的图片 cached 为 true
+        - {"event": "error", "index", "filename", "error"}：该图片处理失败
+        - {"event": "done", "total", "succeeded", "failed", "saved"}：saved 为新记录写入后的 [{"index", "id"}]
+        """
+        self._tasks = [
+            asyncio.create_task(self._run_one(index, filename, file))
+            for index, (filename, file) in enumerate(self.uploads)
+        ]
+        failed = 0
+        try:
+            for future in asyncio.as_completed(self._tasks):
+                line = await future
+                if line["event"] == "error":
+                    failed += 1
+                yield line
+        finally:
+            # 客户端断开时取消尚未完成的图片
+            self.close()
+
+        summary: Dict[str, Any] = {
+            "event": "done",
+            "total": len(self.uploads),
+            "succeeded": len(self.uploads) - failed,
+            "failed": failed,
+            "saved": []
+        }
+        try:
+            summary["saved"] = await self._save()
+        except Exception:
+            logger.exception("批量分析保存记录失败")
+            summary["error"] = "保存分析记录失败"
+        yield summary
@@ -0,0 +1,334 @@
+import hashlib
+import hmac
+import os
+import re
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Iterator, Optional
+
+from app.core.config import settings
+
+CHUNK_SIZE = 64 * 1024
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class BlobNotFoundError(Exception):
+    """请求的 blob 不存在"""
+
+
+@dataclass
+class BlobInfo:
+    digest: str
+    size: int
+    content_type: str
+    # 最后写入时间（Unix 时间戳），相同内容再次写入时会刷新
+    modified_at: float = 0.0
+
+
+def compute_digest(data: bytes) -> str:
+    """计算内容的 SHA-256 摘要，作为 blob 的唯一标识"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def is_valid_digest(digest: str) -> bool:
+    return bool(DIGEST_PATTERN.match(digest))
+
+
+def guess_content_type(head: bytes) -> str:
+    """根据文件头判断图片类型"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "application/octet-stream"
+
+
+def shard_key(digest: str) -> str:
+    """按摘要前缀分两级目录，避免单个目录下文件过多"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}"
+
+
+def sign_blob(digest: str, expires: int) -> str:
+    """blob 访问地址的签名，只有拿到记录详情的用户才能得到"""
+    message = f"{digest}:{expires}".encode()
+    return hmac.new(settings.JWT_SECRET.encode(), message, hashlib.sha256).hexdigest()[:32]
+
+
+def verify_blob_signature(digest: str, expires: int, signature: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(sign_blob(digest, expires), signature)
+
+
+def blob_url(digest: Optional[str]) -> Optional[str]:
+    """
+    生成带签名的 blob 访问地址
+    <img> 无法携带 Authorization 头，因此用短期有效的签名代替登录校验；
+    过期时间按 BLOB_URL_TTL_SECONDS 对齐，同一时间窗口内地址不变，浏览器缓存仍然有效
+    """
+    if not digest:
+        return None
+    ttl = settings.BLOB_URL_TTL_SECONDS
+    expires = (int(time.time()) // ttl + 2) * ttl
+    return f"/api/blobs/{digest}?exp={expires}&sig={sign_blob(digest, expires)}"
+
+
+class BlobStore(ABC):
+    """
+    内容寻址的 blob 存储接口
+    所有 blob 以内容的 SHA-256 摘要为键，相同内容只存储一份
+    """
+
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        """写入内容并返回摘要，内容已存在时只刷新写入时间"""
+
+    @abstractmethod
+    def stat(self, digest: str) -> BlobInfo:
+        ...
+
+    @abstractmethod
+    def iter_range(self, digest: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """
+        按块读取内容
+        :param start: 起始偏移（包含）
+        :param end: 结束偏移（包含），None 表示读到末尾
+        """
+
+    @abstractmethod
+    def delete(self, digest: str) -> None:
+        ...
+
+    @abstractmethod
+    def iter_digests(self) -> Iterator[str]:
+        """遍历存储中的全部摘要，用于清理不再被引用的 blob"""
+
+    def exists(self, digest: str) -> bool:
+        try:
+            self.stat(digest)
+            return True
+        except BlobNotFoundError:
+            return False
+
+    def get(self, digest: str) -> bytes:
+        return b"".join(self.iter_range(digest))
+
+
+class LocalBlobStore(BlobStore):
+    """本地文件系统存储，路径为 root/ab/cd/<digest>"""
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, *shard_key(digest).split("/"))
+
+    def put(self, data: bytes) -> str:
+        digest = compute_digest(data)
+        path = self._path(digest)
+        if os.path.exists(path):
+            try:
+                # 刷新写入时间，清理时据此跳过可能属于尚未保存记录的 blob
+                os.utime(path)
+                return digest
+            except FileNotFoundError:
+                # 恰好被并发删除，重新写入
+                pass
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # 先写临时文件再原子替换，避免并发写入或中途失败留下不完整的文件
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return digest
+
+    def stat(self, digest: str) -> BlobInfo:
+        path = self._path(digest)
+        try:
+            with open(path, "rb") as f:
+                head = f.read(16)
+                info = os.fstat(f.fileno())
+        except FileNotFoundError:
+            raise BlobNotFoundError(digest)
+        return BlobInfo(
+            digest=digest,
+            size=info.st_size,
+            content_type=guess_content_type(head),
+            modified_at=info.st_mtime,
+        )
+
+    def iter_range(self, digest: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        try:
+            f = open(self._path(digest), "rb")
+        except FileNotFoundError:
+            raise BlobNotFoundError(digest)
+
+        def _iter() -> Iterator[bytes]:
+            with f:
+                f.seek(start)
+                remaining = None if end is None else end - start + 1
+                while remaining is None or remaining > 0:
+                    chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    if remaining is not None:
+                        remaining -= len(chunk)
+                    yield chunk
+
+        return _iter()
+
+    def delete(self, digest: str) -> None:
+        try:
+            os.remove(self._path(digest))
+        except FileNotFoundError:
+            pass
+
+    def iter_digests(self) -> Iterator[str]:
+        for _, _, files in os.walk(self.root):
+            for name in files:
+                if is_valid_digest(name):
+                    yield name
+
+
+class S3BlobStore(BlobStore):
+    """
+    S3 兼容对象存储
+    client 只需要实现 boto3 S3 客户端的 put_object / head_object / get_object / delete_object /
+    copy_object / list_objects_v2，
+    因此 MinIO、moto 或任何本地替身都可以直接使用
+    """
+
+    def __init__(self, bucket: str, client: Any = None, prefix: str = ""):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = client or self._create_client()
+
+    @staticmethod
+    def _create_client() -> Any:
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("使用 S3 存储需要安装 boto3: pip install boto3")
+        return boto3.client(
+            "s3",
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            aws_access_key_id=settings.S3_ACCESS_KEY,
+            aws_secret_access_key=settings.S3_SECRET_KEY,
+            region_name=settings.S3_REGION,
+        )
+
+    def _key(self, digest: str) -> str:
+        return f"{self.prefix}{shard_key(digest)}"
+
+    @staticmethod
+    def _is_not_found(exc: Exception) -> bool:
+        response = getattr(exc, "response", None) or {}
+        code = str(response.get("Error", {}).get("Code", ""))
+        return code in ("404", "NoSuchKey", "NotFound") or isinstance(exc, KeyError)
+
+    def put(self, data: bytes) -> str:
+        digest = compute_digest(data)
+        try:
+            info = self.stat(digest)
+        except BlobNotFoundError:
+            info = None
+        if info is not None:
+            # 复制到自身以刷新 LastModified，清理时据此跳过可能属于尚未保存记录的 blob
+            key = self._key(digest)
+            self.client.copy_object(
+                Bucket=self.bucket,
+                Key=key,
+                CopySource={"Bucket": self.bucket, "Key": key},
+                MetadataDirective="REPLACE",
+                ContentType=info.content_type,
+            )
+            return digest
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=self._key(digest),
+            Body=data,
+            ContentType=guess_content_type(data[:16]),
+        )
+        return digest
+
+    def stat(self, digest: str) -> BlobInfo:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(digest))
+        except Exception as e:
+            if self._is_not_found(e):
+                raise BlobNotFoundError(digest)
+            raise
+        return BlobInfo(
+            digest=digest,
+            size=int(head["ContentLength"]),
+            content_type=head.get("ContentType") or "application/octet-stream",
+            modified_at=head["LastModified"].timestamp() if head.get("LastModified") else 0.0,
+        )
+
+    def iter_range(self, digest: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        kwargs = {"Bucket": self.bucket, "Key": self._key(digest)}
+        if start or end is not None:
+            kwargs["Range"] = f"bytes={start}-{'' if end is None else end}"
+        try:
+            body = self.client.get_object(**kwargs)["Body"]
+        except Exception as e:
+            if self._is_not_found(e):
+                raise BlobNotFoundError(digest)
+            raise
+
+        def _iter() -> Iterator[bytes]:
+            try:
+                while True:
+                    chunk = body.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+            finally:
+                close = getattr(body, "close", None)
+                if close:
+                    close()
+
+        return _iter()
+
+    def delete(self, digest: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(digest))
+
+    def iter_digests(self) -> Iterator[str]:
+        kwargs = {"Bucket": self.bucket, "Prefix": self.prefix}
+        while True:
+            page = self.client.list_objects_v2(**kwargs)
+            for item in page.get("Contents", []):
+                name = item["Key"].rsplit("/", 1)[-1]
+                if is_valid_digest(name):
+                    yield name
+            if not page.get("IsTruncated"):
+                break
+            kwargs["ContinuationToken"] = page["NextContinuationToken"]
+
+
+@lru_cache
+def get_blob_store() -> BlobStore:
+    """根据配置创建全局 blob 存储实例"""
+    if settings.BLOB_BACKEND == "local":
+        return LocalBlobStore(settings.BLOB_DIR)
+    elif settings.BLOB_BACKEND == "s3":
+        if not settings.S3_BUCKET:
+            raise ValueError("BLOB_BACKEND=s3 时必须配置 S3_BUCKET")
+        return S3BlobStore(settings.S3_BUCKET)
+    else:
+        raise ValueError(f"不支持的存储后端: {settings.BLOB_BACKEND}")
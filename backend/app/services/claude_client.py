@@ -1,148 +1,69 @@
 import aiohttp
-import base64
 import json
-from typing import Dict, Any
+from typing import AsyncIterator, Dict, Any, Optional
 from app.core.config import settings
+from app.core.metrics import record_usage
+from app.services.provider_client import ProviderClient
+from app.services.sse import iter_sse_events
 
 
-class ClaudeClient:
-    def __init__(self):
-        self.api_key = settings.ANTHROPIC_API_KEY
-        self.base_url = "https://api.anthropic.com/v1"
-        self.headers = {
+class ClaudeClient(ProviderClient):
+    provider = "claude"
+    display_name = "Claude"
+    model_name = "claude-3-opus-20240229"
+    endpoint = "/messages"
+    # 结构化输出通过强制调用这个工具实现，工具参数即分析结果
+    tool_name = "record_photo_analysis"
+
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
+        super().__init__(settings.ANTHROPIC_API_KEY, settings.ANTHROPIC_BASE_URL, session)
+
+    def _headers(self) -> Dict[str, str]:
+        return {
             "x-api-key": self.api_key,
             "content-type": "application/json",
             "anthropic-version": "2023-06-01"
         }
-    
-    async def analyze_photo(self, image_path: str, filename: str) -> Dict[str, Any]:
-        """使用 Claude API 分析照片"""
-        # 读取图片并转换为 base64
-        with open(image_path, "rb") as f:
-            image_data = f.read()
-        base64_image = base64.b64encode(image_data).decode("utf-8")
-        
-        # 构建 prompt
-        prompt = self._build_prompt()
-        
-        # 构建请求体
-        payload = {
-            "model": "claude-3-opus-20240229",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt
-                        },
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/jpeg",
-                                "data": base64_image
-                            }
-                        }
-                    ]
-                }
-            ],
-            "temperature": 0.1,
-            "max_tokens": 1000
+
+    def _image_content(self, base64_image: str, media_type: str) -> Dict[str, Any]:
+        return {
+            "type": "image",
+            "source": {
+                "type": "base64",
+                "media_type": media_type,
+                "data": base64_image
+            }
         }
-        
-        # 发送请求
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.base_url}/messages",
-                headers=self.headers,
-                json=payload
-            ) as response:
-                response_data = await response.json()
-                
-                if response.status != 200:
-                    raise Exception(f"Claude API 调用失败: {response_data}")
-                
-                # 解析响应
-                content = response_data["content"][0]["text"]
-                return self._parse_response(content)
-    
-    def _build_prompt(self) -> str:
-        """构建用于分析照片的 prompt"""
-        return """
-你是一位专业的摄影导师，请从以下四个维度为这张照片进行评分和点评：
 
-1. 技术 (Technical): 评分范围 0-100，评价要点包括曝光准确性、对焦精准度、景深运用、画面稳定性
-2. 构图 (Composition): 评分范围 0-100，评价要点包括三分法/黄金分割、引导线、画面平衡、空间层次
-3. 美学 (Aesthetic): 评分范围 0-100，评价要点包括色彩和谐、光影效果、氛围营造、视觉冲击力
-4. 叙事 (Narrative): 评分范围 0-100，评价要点包括主题表达、情感传递、创意独特性、故事性
+    def _structured_output(self, payload: Dict[str, Any], schema: Dict[str, Any]) -> None:
+        payload["tools"] = [{"name": self.tool_name, "description": "记录对照片的评分和点评", "input_schema": schema}]
+        payload["tool_choice"] = {"type": "tool", "name": self.tool_name}
 
-请按照以下严格的 JSON 格式输出结果，不要添加任何额外的文本或解释：
-{
-  "scores": {
-    "technical": 85,
-    "composition": 78,
-    "aesthetic": 82,
-    "narrative": 75
-  },
-  "analysis": {
-    "highlights": ["构图运用三分法，主体突出", "色彩和谐，整体氛围统一"],
-    "improvements": ["背景略显杂乱", "可尝试更低的拍摄角度"],
-    "suggestions": ["后期适当提高对比度", "裁剪去除边缘干扰元素"]
-  }
-}
+    def _response_text(self, response_data: Dict[str, Any]) -> str:
+        record_usage(self.provider, response_data.get("usage"))
+        for block in response_data["content"]:
+            if block.get("type") == "tool_use":
+                return json.dumps(block.get("input", {}), ensure_ascii=False)
+        return "".join(block.get("text", "") for block in response_data["content"] if block.get("type") == "text")
 
-请注意：
-- 分数必须是整数
-- 评价要客观、具体、可操作
-- 先肯定优点，再指出不足
-- 建议要能立刻实践
-- 语言要友好，鼓励为主
-        """
-    
-    def _parse_response(self, content: str) -> Dict[str, Any]:
-        """解析 API 响应，提取评分和分析结果"""
-        # 清理响应内容，确保是纯 JSON
-        import re
-        import json
-        
-        # 移除可能的markdown格式
-        content = content.strip()
-        if content.startswith('```json'):
-            content = content[7:]
-        if content.endswith('```'):
-            content = content[:-3]
-        
-        # 使用正则表达式提取JSON内容
-        json_match = re.search(r'\{.*\}', content, re.DOTALL)
-        if not json_match:
-            raise Exception(f"无法解析 Claude API 响应: {content}")
-        
-        json_content = json_match.group(0)
-        data = json.loads(json_content)
-        
-        # 确保analysis是字典格式
-        analysis = data.get("analysis", {})
-        if isinstance(analysis, str):
-            try:
-                analysis = json.loads(analysis)
-            except json.JSONDecodeError:
-                analysis = {}
-        
-        # 确保analysis包含必要的字段
-        if "highlights" not in analysis:
-            analysis["highlights"] = []
-        if "improvements" not in analysis:
-            analysis["improvements"] = []
-        if "suggestions" not in analysis:
-            analysis["suggestions"] = []
-        
-        # 计算综合评分
-        scores = data["scores"]
-        overall_score = int((scores["technical"] + scores["composition"] + scores["aesthetic"] + scores["narrative"]) / 4)
-        
-        return {
-            "scores": scores,
-            "overall_score": overall_score,
-            "analysis": analysis
-        }
+    async def _stream_text(self, response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+        # message_start 带输入 token 数，message_delta 带累计的输出 token 数
+        usage: Dict[str, int] = {}
+        async for event_name, data in iter_sse_events(response):
+            if event_name == "message_stop":
+                break
+            if event_name == "error":
+                raise Exception(f"Claude API 调用失败: {data}")
+            if event_name == "message_start":
+                usage.update(json.loads(data).get("message", {}).get("usage") or {})
+            elif event_name == "message_delta":
+                usage.update(json.loads(data).get("usage") or {})
+            if event_name != "content_block_delta":
+                continue
+            delta = json.loads(data).get("delta", {})
+            if delta.get("type") == "text_delta":
+                yield delta.get("text", "")
+            elif delta.get("type") == "input_json_delta":
+                # 工具调用的参数以 JSON 片段流式到达
+                yield delta.get("partial_json", "")
+        record_usage(self.provider, usage)
@@ -0,0 +1,95 @@
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+from app.core.config import settings
+from app.services.deepseek_client import DeepSeekClient
+from app.services.openai_client import OpenAIClient
+from app.services.claude_client import ClaudeClient
+
+CLIENT_CLASSES = {
+    "deepseek": DeepSeekClient,
+    "openai": OpenAIClient,
+    "claude": ClaudeClient,
+}
+
+
+class ClientRegistry:
+    """
+    应用生命周期内的模型客户端注册表
+    每个服务商持有一个带连接池的 aiohttp 会话，连接在请求之间保持复用；
+    客户端对象本身是无状态的，也只创建一次。
+    注意：aiohttp 只支持 HTTP/1.1，这里通过 keep-alive 复用连接来省去握手开销。
+    """
+
+    def __init__(
+        self,
+        limit: int = settings.HTTP_POOL_LIMIT,
+        limit_per_host: int = settings.HTTP_POOL_LIMIT_PER_HOST,
+        keepalive_timeout: float = settings.HTTP_KEEPALIVE_SECONDS,
+        dns_cache_seconds: int = settings.HTTP_DNS_CACHE_SECONDS,
+        connect_timeout: float = settings.HTTP_CONNECT_TIMEOUT_SECONDS,
+        read_timeout: float = settings.HTTP_READ_TIMEOUT_SECONDS,
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_seconds = dns_cache_seconds
+        self.timeout = aiohttp.ClientTimeout(connect=connect_timeout, sock_read=read_timeout)
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._clients: Dict[str, Any] = {}
+
+    def get_session(self, provider: str) -> aiohttp.ClientSession:
+        """获取服务商的共享会话，首次使用时创建"""
+        session = self._sessions.get(provider)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_cache_seconds,
+            )
+            session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._sessions[provider] = session
+        return session
+
+    def get_client(self, provider: str) -> Any:
+        """获取服务商的客户端实例"""
+        client = self._clients.get(provider)
+        if client is None or client.session.closed:
+            client_class = CLIENT_CLASSES.get(provider)
+            if client_class is None:
+                raise ValueError(f"不支持的模型: {provider}")
+            client = client_class(session=self.get_session(provider))
+            self._clients[provider] = client
+        return client
+
+    async def close(self) -> None:
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+        self._clients.clear()
+
+
+_registry: Optional[ClientRegistry] = None
+
+
+def get_client_registry() -> ClientRegistry:
+    """获取全局注册表；未经 lifespan 初始化时（如脚本中）按需创建"""
+    global _registry
+    if _registry is None:
+        _registry = ClientRegistry()
+    return _registry
+
+
+async def init_client_registry() -> ClientRegistry:
+    global _registry
+    _registry = ClientRegistry()
+    return _registry
+
+
+async def close_client_registry() -> None:
+    global _registry
+    if _registry is not None:
+        await _registry.close()
+        _registry = None
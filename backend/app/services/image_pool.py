@@ -0,0 +1,131 @@
+import asyncio
+import math
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import observe_stage
+
+
+class PoolSaturatedError(Exception):
+    """图片处理队列已满"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"图片处理队列已满，请 {retry_after} 秒后重试")
+        self.retry_after = retry_after
+
+
+class ImageProcessingPool:
+    """
+    图片处理执行器，把 Pillow 的 CPU 密集操作移出事件循环
+    - thread：线程池，Pillow 解码/编码/缩放时会释放 GIL，可以直接传文件对象
+    - process：进程池，完全绕开 GIL，参数和返回值需要可 pickle
+    并发数由 workers 限制，超出的任务在事件循环侧排队，排队数达到 max_queue 后直接拒绝
+    """
+
+    def __init__(
+        self,
+        kind: str = settings.IMAGE_POOL_KIND,
+        workers: int = settings.IMAGE_POOL_WORKERS,
+        max_queue: int = settings.IMAGE_POOL_MAX_QUEUE,
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"不支持的执行器类型: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        # 指标
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.total_wait_seconds = 0.0
+
+    def start(self) -> None:
+        if self._executor is not None:
+            return
+        if self.kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image")
+        self._semaphore = asyncio.Semaphore(self.workers)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+            self._semaphore = None
+
+    @property
+    def accepts_file_objects(self) -> bool:
+        """进程池无法传递打开的文件对象"""
+        return self.kind == "thread"
+
+    def _retry_after(self) -> int:
+        """按平均处理耗时估算排队任务全部完成所需的秒数"""
+        finished = self.completed + self.failed
+        average = self.total_seconds / finished if finished else 1.0
+        backlog = (self.queued + self.running) / self.workers
+        return max(1, math.ceil(average * backlog))
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        在执行器中运行函数
+        :raises PoolSaturatedError: 排队任务已达上限
+        """
+        self.start()
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise PoolSaturatedError(self._retry_after())
+
+        self.queued += 1
+        enqueued_at = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        started = time.perf_counter()
+        self.total_wait_seconds += started - enqueued_at
+        observe_stage("image_queue", started - enqueued_at)
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self._executor, func, *args)
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.total_seconds += elapsed
+            self.max_seconds = max(self.max_seconds, elapsed)
+            self.running -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        finished = self.completed + self.failed
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "avg_seconds": round(self.total_seconds / finished, 4) if finished else 0.0,
+            "max_seconds": round(self.max_seconds, 4),
+            "avg_wait_seconds": round(self.total_wait_seconds / finished, 4) if finished else 0.0,
+        }
+
+
+image_pool = ImageProcessingPool()
@@ -0,0 +1,304 @@
+import asyncio
+import logging
+import random
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import and_, or_, select, update
+
+from app.core.config import parse_provider_limits, settings
+from app.core.database import async_session
+from app.models.job import AnalysisJob
+from app.services.ai_service import AIService, AUTO_MODEL
+from app.services.blob_store import BlobNotFoundError, get_blob_store
+from app.services.photo_service import PreparedImage, create_photo, find_existing_photo, resolve_analysis
+from app.services.phash_index import to_unsigned
+from app.services.provider_retry import retry_reason
+from app.services.provider_router import ProviderHTTPError
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("succeeded", "failed")
+
+
+def claimable(now: datetime):
+    """可以领取的任务：到期的待处理任务，或租约已过期（持有者已退出或失去响应）的运行中任务"""
+    return or_(
+        and_(AnalysisJob.status == "pending", AnalysisJob.next_run_at <= now),
+        and_(
+            AnalysisJob.status == "running",
+            or_(AnalysisJob.locked_until.is_(None), AnalysisJob.locked_until <= now)
+        )
+    )
+
+
+def retry_delay(attempts: int) -> float:
+    """指数退避加随机抖动，避免多个失败任务同时重试"""
+    delay = min(settings.JOB_RETRY_MAX_SECONDS, settings.JOB_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    任务失败后是否重新排队
+    服务商拒绝的请求（限流以外的 4xx）、无法解析的响应、无效的模型和已删除的图片重试也会得到同样的结果，
+    直接标记失败，不浪费服务商配额；服务不可用、超时、连接和数据库错误等暂时性错误退避后重试
+    """
+    if isinstance(error, ProviderHTTPError):
+        return retry_reason(error) is not None
+    # AnalysisParseError 是 ValueError 的子类
+    return not isinstance(error, (ValueError, BlobNotFoundError))
+
+
+class AnalysisJobWorker:
+    """
+    异步分析任务的工作池
+    任务持久化在 analysis_jobs 表中，多个 worker 协程通过条件更新抢占任务，
+    因此多个 uvicorn 进程同时运行也不会重复处理。领取时写入带过期时间的租约并在执行期间续租，
+    持有者退出或失去响应后，租约过期的任务才会被其他 worker 接管。
+    """
+
+    def __init__(
+        self,
+        concurrency: int = settings.JOB_WORKER_CONCURRENCY,
+        provider_limits: Optional[Dict[str, int]] = None,
+        poll_interval: float = settings.JOB_POLL_INTERVAL_SECONDS,
+        lease_seconds: float = settings.JOB_LEASE_SECONDS,
+    ):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        # 租约持有者标识，区分共用同一张表的多个进程
+        self.worker_id = uuid.uuid4().hex
+        limits = provider_limits if provider_limits is not None else parse_provider_limits(settings.JOB_PROVIDER_CONCURRENCY)
+        self._provider_semaphores: Dict[str, asyncio.Semaphore] = {
+            name: asyncio.Semaphore(limit) for name, limit in limits.items()
+        }
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup = asyncio.Event()
+        self._listeners: Dict[int, List[asyncio.Event]] = defaultdict(list)
+
+    async def start(self) -> None:
+        await self._recover_interrupted()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self) -> None:
+        """有新任务入队时唤醒空闲的 worker"""
+        self._wakeup.set()
+
+    async def wait_for_change(self, job_id: int, timeout: float) -> None:
+        """等待任务状态变化，超时后返回，由调用方重新查询状态"""
+        event = asyncio.Event()
+        self._listeners[job_id].append(event)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            listeners = self._listeners.get(job_id)
+            if listeners is not None:
+                if event in listeners:
+                    listeners.remove(event)
+                if not listeners:
+                    del self._listeners[job_id]
+
+    def _publish(self, job_id: int) -> None:
+        for event in self._listeners.get(job_id, []):
+            event.set()
+
+    async def _recover_interrupted(self) -> None:
+        """租约已过期的运行中任务重新排队，其他进程仍在执行的任务不受影响"""
+        now = datetime.utcnow()
+        async with async_session() as db:
+            await db.execute(
+                update(AnalysisJob)
+                .where(
+                    AnalysisJob.status == "running",
+                    or_(AnalysisJob.locked_until.is_(None), AnalysisJob.locked_until <= now)
+                )
+                .values(status="pending", next_run_at=now, locked_by=None, locked_until=None)
+            )
+            await db.commit()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("领取分析任务失败")
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._process(job)
+
+    async def _claim(self) -> Optional[AnalysisJob]:
+        """抢占一个到期的待处理任务或租约过期的运行中任务"""
+        async with async_session() as db:
+            now = datetime.utcnow()
+            result = await db.execute(
+                select(AnalysisJob.id)
+                .where(claimable(now))
+                .order_by(AnalysisJob.next_run_at)
+                .limit(1)
+            )
+            job_id = result.scalar_one_or_none()
+            if job_id is None:
+                return None
+
+            # 条件更新保证同一任务只会被一个 worker 领取
+            claimed = await db.execute(
+                update(AnalysisJob)
+                .where(AnalysisJob.id == job_id, claimable(now))
+                .values(
+                    status="running",
+                    attempts=AnalysisJob.attempts + 1,
+                    locked_by=self.worker_id,
+                    locked_until=now + timedelta(seconds=self.lease_seconds),
+                    updated_at=now
+                )
+            )
+            await db.commit()
+            if claimed.rowcount != 1:
+                return None
+            job = await db.get(AnalysisJob, job_id)
+
+        self._publish(job_id)
+        return job
+
+    async def _process(self, job: AnalysisJob) -> None:
+        try:
+            values = await self._execute_with_lease(job)
+            if values is None:
+                return
+        except asyncio.CancelledError:
+            # 进程退出时放回队列，下次启动继续执行
+            await self._finish(job.id, status="pending", next_run_at=datetime.utcnow())
+            raise
+        except Exception as e:
+            logger.warning("分析任务 %s 第 %s 次执行失败: %s", job.id, job.attempts, e)
+            if is_retryable(e) and job.attempts < job.max_attempts:
+                values = {
+                    "status": "pending",
+                    "error": str(e),
+                    "next_run_at": datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts)),
+                }
+            else:
+                values = {"status": "failed", "error": str(e)}
+        await self._finish(job.id, **values)
+
+    async def _execute_with_lease(self, job: AnalysisJob) -> Optional[dict]:
+        """执行任务并定期续租；租约已被其他 worker 接管时取消执行并返回 None"""
+        execution = asyncio.create_task(self._execute(job))
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        try:
+            await asyncio.wait({execution, heartbeat}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            heartbeat.cancel()
+            if not execution.done():
+                execution.cancel()
+        if execution.done() and not execution.cancelled():
+            return execution.result()
+        logger.warning("分析任务 %s 的租约已被其他 worker 接管，放弃执行", job.id)
+        return None
+
+    async def _heartbeat(self, job_id: int) -> None:
+        """每 1/3 租约续租一次，租约不再属于本 worker 时返回"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                async with async_session() as db:
+                    renewed = await db.execute(
+                        update(AnalysisJob)
+                        .where(AnalysisJob.id == job_id, AnalysisJob.locked_by == self.worker_id)
+                        .values(locked_until=datetime.utcnow() + timedelta(seconds=self.lease_seconds))
+                    )
+                    await db.commit()
+            except Exception:
+                # 数据库暂时不可用时继续执行，下一次再续租
+                logger.exception("分析任务 %s 续租失败", job_id)
+                continue
+            if renewed.rowcount != 1:
+                return
+
+    async def _execute(self, job: AnalysisJob) -> dict:
+        # 未指定模型的任务由路由选择服务商，并发限制作用在实际调用的服务商上
+        ai_service = AIService(
+            model=None if job.model == AUTO_MODEL else job.model,
+            provider_limits=self._provider_semaphores
+        )
+        async with async_session() as db:
+            existing_photo = await find_existing_photo(db, job.user_id, job.image_hash, ai_service.model)
+            if existing_photo:
+                return {"status": "succeeded", "photo_id": existing_photo.id, "cached": True, "error": None}
+
+            content = await run_in_threadpool(get_blob_store().get, job.image_hash)
+            image = PreparedImage(
+                filename=job.filename,
+                content=content,
+                image_hash=job.image_hash,
+                thumbnail=b"",
+                phash=to_unsigned(job.phash),
+            )
+            analysis_result, cached, duplicate_of_id = await resolve_analysis(db, job.user_id, ai_service, image)
+            photo = await create_photo(
+                db,
+                user_id=job.user_id,
+                filename=job.filename,
+                image_hash=job.image_hash,
+                thumbnail_hash=job.thumbnail_hash,
+                phash=image.phash,
+                model=ai_service.model,
+                analysis_result=analysis_result,
+                duplicate_of_id=duplicate_of_id
+            )
+        return {"status": "succeeded", "photo_id": photo.id, "cached": cached, "error": None}
+
+    async def _finish(self, job_id: int, **values) -> None:
+        """写入执行结果并释放租约，租约已被接管时不覆盖接管者的状态"""
+        async with async_session() as db:
+            await db.execute(
+                update(AnalysisJob)
+                .where(AnalysisJob.id == job_id, AnalysisJob.locked_by == self.worker_id)
+                .values(updated_at=datetime.utcnow(), locked_by=None, locked_until=None, **values)
+            )
+            await db.commit()
+        self._publish(job_id)
+
+
+job_worker: Optional[AnalysisJobWorker] = None
+
+
+def get_job_worker() -> Optional[AnalysisJobWorker]:
+    return job_worker
+
+
+async def start_job_worker() -> AnalysisJobWorker:
+    global job_worker
+    job_worker = AnalysisJobWorker()
+    await job_worker.start()
+    return job_worker
+
+
+async def stop_job_worker() -> None:
+    global job_worker
+    if job_worker:
+        await job_worker.stop()
+        job_worker = None
@@ -1,145 +1,67 @@
 import aiohttp
-import base64
 import json
-from typing import Dict, Any
+from typing import AsyncIterator, Dict, Any, Optional
 from app.core.config import settings
+from app.core.metrics import record_usage
+from app.services.provider_client import ProviderClient
+from app.services.sse import iter_sse_events
 
 
-class OpenAIClient:
-    def __init__(self):
-        self.api_key = settings.OPENAI_API_KEY
-        self.base_url = settings.OPENAI_BASE_URL
-        self.headers = {
+class OpenAICompatibleClient(ProviderClient):
+    """OpenAI chat/completions 格式的服务商，DeepSeek 也使用这一格式"""
+
+    endpoint = "/chat/completions"
+    # 是否支持 response_format 的 json_schema 类型，不支持时使用 JSON 模式，字段由 prompt 约束
+    json_schema_supported = True
+
+    def _headers(self) -> Dict[str, str]:
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-    
-    async def analyze_photo(self, image_path: str, filename: str) -> Dict[str, Any]:
-        """使用 OpenAI GPT-4V API 分析照片"""
-        # 读取图片并转换为 base64
-        with open(image_path, "rb") as f:
-            image_data = f.read()
-        base64_image = base64.b64encode(image_data).decode("utf-8")
-        
-        # 构建 prompt
-        prompt = self._build_prompt()
-        
-        # 构建请求体
-        payload = {
-            "model": "gpt-5-mini",
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            "temperature": 0.1,
-            "max_tokens": 1000
+
+    def _image_content(self, base64_image: str, media_type: str) -> Dict[str, Any]:
+        return {
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:{media_type};base64,{base64_image}"
+            }
         }
-        
-        # 发送请求
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                f"{self.base_url}/chat/completions",
-                headers=self.headers,
-                json=payload
-            ) as response:
-                response_data = await response.json()
-                
-                if response.status != 200:
-                    raise Exception(f"OpenAI API 调用失败: {response_data}")
-                
-                # 解析响应
-                content = response_data["choices"][0]["message"]["content"]
-                return self._parse_response(content)
-    
-    def _build_prompt(self) -> str:
-        """构建用于分析照片的 prompt"""
-        return """
-你是一位专业的摄影导师，请从以下四个维度为这张照片进行评分和点评：
 
-1. 技术 (Technical): 评分范围 0-100，评价要点包括曝光准确性、对焦精准度、景深运用、画面稳定性
-2. 构图 (Composition): 评分范围 0-100，评价要点包括三分法/黄金分割、引导线、画面平衡、空间层次
-3. 美学 (Aesthetic): 评分范围 0-100，评价要点包括色彩和谐、光影效果、氛围营造、视觉冲击力
-4. 叙事 (Narrative): 评分范围 0-100，评价要点包括主题表达、情感传递、创意独特性、故事性
+    def _structured_output(self, payload: Dict[str, Any], schema: Dict[str, Any]) -> None:
+        if self.json_schema_supported:
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "photo_analysis", "strict": True, "schema": schema}
+            }
+        else:
+            payload["response_format"] = {"type": "json_object"}
 
-请按照以下严格的 JSON 格式输出结果，不要添加任何额外的文本或解释：
-{
-  "scores": {
-    "technical": 85,
-    "composition": 78,
-    "aesthetic": 82,
-    "narrative": 75
-  },
-  "analysis": {
-    "highlights": ["构图运用三分法，主体突出", "色彩和谐，整体氛围统一"],
-    "improvements": ["背景略显杂乱", "可尝试更低的拍摄角度"],
-    "suggestions": ["后期适当提高对比度", "裁剪去除边缘干扰元素"]
-  }
-}
+    def _response_text(self, response_data: Dict[str, Any]) -> str:
+        record_usage(self.provider, response_data.get("usage"))
+        return response_data["choices"][0]["message"]["content"]
 
-请注意：
-- 分数必须是整数
-- 评价要客观、具体、可操作
-- 先肯定优点，再指出不足
-- 建议要能立刻实践
-- 语言要友好，鼓励为主
-        """
-    
-    def _parse_response(self, content: str) -> Dict[str, Any]:
-        """解析 API 响应，提取评分和分析结果"""
-        # 清理响应内容，确保是纯 JSON
-        import re
-        import json
-        
-        # 移除可能的markdown格式
-        content = content.strip()
-        if content.startswith('```json'):
-            content = content[7:]
-        if content.endswith('```'):
-            content = content[:-3]
-        
-        # 使用正则表达式提取JSON内容
-        json_match = re.search(r'\{.*\}', content, re.DOTALL)
-        if not json_match:
-            raise Exception(f"无法解析 OpenAI API 响应: {content}")
-        
-        json_content = json_match.group(0)
-        data = json.loads(json_content)
-        
-        # 确保analysis是字典格式
-        analysis = data.get("analysis", {})
-        if isinstance(analysis, str):
-            try:
-                analysis = json.loads(analysis)
-            except json.JSONDecodeError:
-                analysis = {}
-        
-        # 确保analysis包含必要的字段
-        if "highlights" not in analysis:
-            analysis["highlights"] = []
-        if "improvements" not in analysis:
-            analysis["improvements"] = []
-        if "suggestions" not in analysis:
-            analysis["suggestions"] = []
-        
-        # 计算综合评分
-        scores = data["scores"]
-        overall_score = int((scores["technical"] + scores["composition"] + scores["aesthetic"] + scores["narrative"]) / 4)
-        
-        return {
-            "scores": scores,
-            "overall_score": overall_score,
-            "analysis": analysis
-        }
+    def _prepare_stream(self, payload: Dict[str, Any]) -> None:
+        payload["stream"] = True
+        # 最后一个数据块附带本次调用的 token 用量
+        payload["stream_options"] = {"include_usage": True}
+
+    async def _stream_text(self, response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+        async for _, data in iter_sse_events(response):
+            if data == "[DONE]":
+                break
+            chunk = json.loads(data)
+            record_usage(self.provider, chunk.get("usage"))
+            choices = chunk.get("choices") or []
+            delta = choices[0].get("delta", {}).get("content") if choices else None
+            if delta:
+                yield delta
+
+
+class OpenAIClient(OpenAICompatibleClient):
+    provider = "openai"
+    display_name = "OpenAI"
+    model_name = "gpt-5-mini"
+
+    def __init__(self, session: Optional[aiohttp.ClientSession] = None):
+        super().__init__(settings.OPENAI_API_KEY, settings.OPENAI_BASE_URL, session)
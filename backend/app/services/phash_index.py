@@ -0,0 +1,134 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import async_session
+from app.models.photo import Photo
+
+HASH_BITS = 64
+_SIGN_BIT = 1 << (HASH_BITS - 1)
+_MASK = (1 << HASH_BITS) - 1
+
+
+def to_signed(value: int) -> int:
+    """64 位无符号哈希转为有符号整数，便于存入数据库的 BIGINT 列"""
+    return value - (1 << HASH_BITS) if value & _SIGN_BIT else value
+
+
+def to_unsigned(value: int) -> int:
+    return value & _MASK
+
+
+def is_informative(value: int, min_bits: int = None) -> bool:
+    """
+    哈希是否包含足够的结构信息
+    夜景、雪景、雾天、天空等大面积平坦的画面相邻像素几乎没有明暗差，dHash 接近全 0（或全 1），
+    彼此之间距离很小却并不是同一张照片，这类哈希不参与近似重复匹配
+    """
+    if min_bits is None:
+        min_bits = settings.NEAR_DUPLICATE_MIN_HASH_BITS
+    bits = to_unsigned(value).bit_count()
+    return min(bits, HASH_BITS - bits) >= min_bits
+
+
+class PerceptualHashIndex:
+    """
+    基于多索引哈希（multi-index hashing）的汉明距离近邻索引
+
+    把 64 位哈希切成 max_distance + 1 段，由鸽巢原理，距离不超过 max_distance 的两个哈希
+    至少有一段完全相同。查询时只需在每段的精确匹配桶里取候选再逐个验证距离，
+    候选数量约为 N * 段数 / 2^段长，百万级数据下也只需比较几百个哈希。
+    """
+
+    def __init__(self, max_distance: int = settings.NEAR_DUPLICATE_MAX_DISTANCE):
+        self.max_distance = max_distance
+        segments = max_distance + 1
+        base, extra = divmod(HASH_BITS, segments)
+        # (位移, 掩码)，前 extra 段多分配 1 位
+        self._segments: List[Tuple[int, int]] = []
+        shift = HASH_BITS
+        for i in range(segments):
+            width = base + (1 if i < extra else 0)
+            shift -= width
+            self._segments.append((shift, (1 << width) - 1))
+        self._tables: List[Dict[int, List[int]]] = [defaultdict(list) for _ in range(segments)]
+        self._hashes: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, item_id: int, value: int) -> None:
+        value = to_unsigned(value)
+        if item_id in self._hashes:
+            self.remove(item_id)
+        if not is_informative(value):
+            return
+        self._hashes[item_id] = value
+        for table, (shift, mask) in zip(self._tables, self._segments):
+            table[(value >> shift) & mask].append(item_id)
+
+    def add_many(self, items: Iterable[Tuple[int, int]]) -> None:
+        for item_id, value in items:
+            self.add(item_id, value)
+
+    def remove(self, item_id: int) -> None:
+        value = self._hashes.pop(item_id, None)
+        if value is None:
+            return
+        for table, (shift, mask) in zip(self._tables, self._segments):
+            key = (value >> shift) & mask
+            bucket = table.get(key)
+            if bucket:
+                bucket.remove(item_id)
+                if not bucket:
+                    del table[key]
+
+    def clear(self) -> None:
+        for table in self._tables:
+            table.clear()
+        self._hashes.clear()
+
+    def query(self, value: int, max_distance: int = None) -> List[Tuple[int, int]]:
+        """
+        查找与给定哈希距离不超过 max_distance 的条目
+        :return: [(条目ID, 汉明距离)]，按距离升序
+        """
+        value = to_unsigned(value)
+        if not is_informative(value):
+            return []
+        if max_distance is None or max_distance > self.max_distance:
+            max_distance = self.max_distance
+
+        seen = set()
+        matches = []
+        hashes = self._hashes
+        for table, (shift, mask) in zip(self._tables, self._segments):
+            bucket = table.get((value >> shift) & mask)
+            if not bucket:
+                continue
+            for item_id in bucket:
+                if item_id in seen:
+                    continue
+                seen.add(item_id)
+                distance = (hashes[item_id] ^ value).bit_count()
+                if distance <= max_distance:
+                    matches.append((item_id, distance))
+        matches.sort(key=lambda m: m[1])
+        return matches
+
+    async def load(self, batch_size: int = 10000) -> None:
+        """从数据库加载所有已计算哈希的图片"""
+        self.clear()
+        async with async_session() as db:
+            result = await db.stream(
+                select(Photo.id, Photo.phash)
+                .where(Photo.phash.is_not(None))
+                .execution_options(yield_per=batch_size)
+            )
+            async for photo_id, phash in result:
+                self.add(photo_id, phash)
+
+
+phash_index = PerceptualHashIndex()
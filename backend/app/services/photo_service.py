@@ -0,0 +1,481 @@
+import base64
+import json
+import shutil
+import tempfile
+from dataclasses import dataclass, field
+import time
+from datetime import datetime
+from typing import Any, Awaitable, BinaryIO, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from fastapi import HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Row, case, func, inspect, or_, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import undefer
+
+from app.core.config import settings
+from app.core.metrics import observe_stage, time_stage
+from app.models.job import AnalysisJob
+from app.models.photo import Photo
+from app.services.ai_service import AIService, PROMPT_VERSION
+from app.services.blob_store import (
+    BlobNotFoundError,
+    blob_url,
+    compute_digest,
+    get_blob_store,
+    guess_content_type,
+)
+from app.services.image_pool import image_pool
+from app.services.phash_index import phash_index, to_signed
+from app.services.result_cache import analysis_cache
+from app.utils.image import encode_data_uri, process_image
+
+
+@dataclass
+class PreparedImage:
+    """预处理后的上传图片"""
+    filename: str
+    content: bytes
+    image_hash: str
+    thumbnail: bytes
+    phash: int
+    # 预处理各步骤耗时（秒），见 ProcessedImage.timings，另加内容摘要 digest
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+def prepare_image(source: Union[bytes, BinaryIO], filename: str) -> PreparedImage:
+    """
+    压缩图片并生成缩略图、内容摘要和感知哈希
+    :param source: 上传的原始图片数据，或上传的临时文件对象
+    :param filename: 文件名
+    :return: 预处理结果
+    """
+    processed = process_image(source)
+    started = time.perf_counter()
+    image_hash = compute_digest(processed.content)
+    return PreparedImage(
+        filename=filename,
+        content=processed.content,
+        image_hash=image_hash,
+        thumbnail=processed.thumbnail,
+        phash=processed.phash,
+        timings={**processed.timings, "digest": time.perf_counter() - started},
+    )
+
+
+async def prepare_upload(file: BinaryIO, filename: str) -> PreparedImage:
+    """
+    在图片处理池中预处理上传文件，避免阻塞事件循环
+    :param file: 上传的临时文件对象
+    :param filename: 文件名
+    :return: 预处理结果
+    :raises PoolSaturatedError: 处理队列已满
+    """
+    # 进程池无法传递文件对象，先读出原始数据
+    if image_pool.accepts_file_objects:
+        source = file
+    else:
+        with time_stage("upload_read"):
+            source = file.read()
+    image = await image_pool.run(prepare_image, source, filename)
+    # 各步骤在工作线程或子进程中计时，回到事件循环后再记录
+    for stage, seconds in image.timings.items():
+        observe_stage(stage, seconds)
+    return image
+
+
+async def store_image(image: PreparedImage) -> str:
+    """
+    把压缩图和缩略图写入 blob 存储，数据库只保存内容摘要
+    :return: 缩略图的摘要
+    """
+    blob_store = get_blob_store()
+    with time_stage("blob_write"):
+        await run_in_threadpool(blob_store.put, image.content)
+        return await run_in_threadpool(blob_store.put, image.thumbnail)
+
+
+def spool_uploads(files: List[BinaryIO]) -> List[BinaryIO]:
+    """
+    把上传的临时文件逐块复制到新的临时文件，供响应返回后继续处理
+    :param files: 框架的上传文件对象，请求结束时会被关闭
+    :return: 定位在开头的临时文件，由调用方关闭
+    """
+    spooled = []
+    try:
+        for file in files:
+            copy = tempfile.TemporaryFile()
+            spooled.append(copy)
+            file.seek(0)
+            shutil.copyfileobj(file, copy)
+            copy.seek(0)
+    except BaseException:
+        for copy in spooled:
+            copy.close()
+        raise
+    return spooled
+
+
+def load_analysis(photo: Photo) -> dict:
+    try:
+        analysis_data = json.loads(photo.analysis) if photo.analysis else None
+    except json.JSONDecodeError:
+        analysis_data = None
+    return analysis_data or {
+        "highlights": [],
+        "improvements": [],
+        "suggestions": []
+    }
+
+
+def build_photo_response(photo: Photo) -> dict:
+    """构建图片分析详情响应，未迁移的旧记录仍返回 data URI"""
+    return {
+        "id": photo.id,
+        "filename": photo.filename,
+        "thumbnail": blob_url(photo.thumbnail_hash) or photo.thumbnail,
+        "image_data": blob_url(photo.image_hash) or photo.image_data,
+        "scores": {
+            "technical": photo.score_tech,
+            "composition": photo.score_comp,
+            "aesthetic": photo.score_aes,
+            "narrative": photo.score_story
+        },
+        "overall_score": photo.overall_score,
+        "analysis": load_analysis(photo),
+        "model_used": photo.model_used,
+        "created_at": photo.created_at
+    }
+
+
+async def load_photo_response(db: AsyncSession, photo: Photo, include_image: bool = False) -> dict:
+    """
+    构建详情响应，只加载响应实际需要的延迟加载列
+    :param photo: 图片记录
+    :param include_image: 是否把原图以 data URI 内联返回，默认只返回 blob 地址，由客户端单独请求并缓存
+    :return: 详情响应
+    """
+    # 未迁移到 blob 存储的旧记录只能返回内联数据
+    needed = {"analysis"}
+    if photo.thumbnail_hash is None:
+        needed.add("thumbnail")
+    if photo.image_hash is None:
+        needed.add("image_data")
+    unloaded = needed & inspect(photo).unloaded
+    if unloaded:
+        await db.refresh(photo, attribute_names=sorted(unloaded))
+
+    response = build_photo_response(photo)
+    if include_image and photo.image_hash:
+        try:
+            content = await run_in_threadpool(get_blob_store().get, photo.image_hash)
+        except BlobNotFoundError:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="图片不存在"
+            )
+        response["image_data"] = encode_data_uri(content, guess_content_type(content[:16]))
+    return response
+
+
+async def get_user_photo(db: AsyncSession, user_id: int, photo_id: int) -> Optional[Photo]:
+    """查询用户的图片记录，同时加载分析结果，旧版内联图片数据不加载"""
+    result = await db.execute(
+        select(Photo)
+        .options(undefer(Photo.analysis))
+        .where(Photo.id == photo_id, Photo.user_id == user_id)
+    )
+    return result.scalar_one_or_none()
+
+
+def _analysis_result_from_photo(photo: Photo) -> dict:
+    return {
+        "scores": {
+            "technical": photo.score_tech,
+            "composition": photo.score_comp,
+            "aesthetic": photo.score_aes,
+            "narrative": photo.score_story
+        },
+        "overall_score": photo.overall_score,
+        "analysis": load_analysis(photo)
+    }
+
+
+# 近似重复查找时每次查询的候选数，按汉明距离从近到远分批查询
+NEAR_DUPLICATE_CANDIDATES = 100
+
+
+# 历史记录列表只需要的列，避免读出分析结果等大字段
+HISTORY_COLUMNS = (
+    Photo.id,
+    Photo.filename,
+    Photo.thumbnail_hash,
+    # 已迁移到 blob 存储的记录不读取旧的内联缩略图
+    case((Photo.thumbnail_hash.is_(None), Photo.thumbnail)).label("thumbnail"),
+    Photo.overall_score,
+    Photo.created_at,
+)
+
+
+def encode_cursor(created_at: datetime, photo_id: int) -> str:
+    """把最后一条记录的 (created_at, id) 编码为不透明的分页游标"""
+    raw = f"{created_at.isoformat()}|{photo_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    解析分页游标
+    :raises ValueError: 游标格式错误
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, photo_id = raw.split("|")
+        return datetime.fromisoformat(created_at), int(photo_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("无效的分页游标") from e
+
+
+async def count_photos(db: AsyncSession, user_id: int) -> int:
+    """统计用户的记录数，只走 user_id 索引"""
+    result = await db.execute(
+        select(func.count()).select_from(Photo).where(Photo.user_id == user_id)
+    )
+    return result.scalar_one()
+
+
+async def list_photos(
+    db: AsyncSession,
+    user_id: int,
+    limit: int,
+    offset: int = 0,
+    cursor: Optional[Tuple[datetime, int]] = None
+) -> List[Row]:
+    """
+    按创建时间倒序查询历史记录的列表列
+    :param limit: 返回条数
+    :param offset: 偏移量，仅在没有游标时使用
+    :param cursor: 上一页最后一条记录的 (created_at, id)，沿索引直接定位，不随页数变慢
+    :return: 记录行
+    """
+    query = (
+        select(*HISTORY_COLUMNS)
+        .where(Photo.user_id == user_id)
+        .order_by(Photo.created_at.desc(), Photo.id.desc())
+        .limit(limit)
+    )
+    if cursor is not None:
+        # 使用行值比较而不是展开的 OR 条件，SQLite/PostgreSQL 才能把它作为索引范围扫描
+        query = query.where(tuple_(Photo.created_at, Photo.id) < tuple_(*cursor))
+    elif offset:
+        query = query.offset(offset)
+    result = await db.execute(query)
+    return result.all()
+
+
+async def find_existing_photo(db: AsyncSession, user_id: int, image_hash: str, model: Optional[str]) -> Optional[Photo]:
+    """查找同一用户分析过的相同图片，model 为 None（未指定模型）时不限模型"""
+    conditions = [Photo.user_id == user_id, Photo.image_hash == image_hash]
+    if model is not None:
+        conditions.append(Photo.model_used == model)
+    result = await db.execute(
+        select(Photo)
+        .options(undefer(Photo.analysis))
+        .where(*conditions)
+        .order_by(Photo.id.desc())
+        .limit(1)
+    )
+    return result.scalar_one_or_none()
+
+
+async def find_near_duplicate(db: AsyncSession, user_id: int, phash: int, model: Optional[str]) -> Optional[Photo]:
+    """
+    查找同一用户用同一模型分析过的近似重复图片
+    索引是全局的，只在用户自己的记录中复用，避免把其他用户照片的评价返回给当前用户；
+    常见图片（如流行的壁纸）的最近邻可能全是其他用户的记录，因此按距离分批查询，直到找到或候选用完
+    :param user_id: 用户ID
+    :param phash: 感知哈希
+    :param model: 模型名称，None 表示不限模型
+    :return: 距离最近的图片记录
+    """
+    matches = phash_index.query(phash)
+    if not matches:
+        return None
+
+    conditions = [Photo.user_id == user_id, Photo.score_tech.is_not(None)]
+    if model is not None:
+        conditions.append(Photo.model_used == model)
+    for start in range(0, len(matches), NEAR_DUPLICATE_CANDIDATES):
+        candidate_ids = [photo_id for photo_id, _ in matches[start:start + NEAR_DUPLICATE_CANDIDATES]]
+        result = await db.execute(
+            select(Photo).options(undefer(Photo.analysis)).where(Photo.id.in_(candidate_ids), *conditions)
+        )
+        photos = {photo.id: photo for photo in result.scalars()}
+        # 前面的批次距离更近，批次内按距离顺序取第一个
+        for photo_id in candidate_ids:
+            if photo_id in photos:
+                return photos[photo_id]
+    return None
+
+
+async def find_reusable_analysis(
+    db: AsyncSession,
+    user_id: int,
+    ai_service: AIService,
+    image: PreparedImage
+) -> Optional[Tuple[Dict[str, Any], Optional[int]]]:
+    """
+    查找可复用的分析结果，依次尝试结果缓存和该用户的近似重复图片
+    找到时 ai_service.model 为结果所属的模型
+    :return: (分析结果, 复用的图片ID)，没有可复用的结果时返回 None
+    """
+    # 相同图片已经用同一模型分析过时直接复用结果，避免重复调用AI服务
+    for model in ai_service.candidates():
+        analysis_result = await analysis_cache.get(image.image_hash, model, PROMPT_VERSION)
+        if analysis_result is not None:
+            ai_service.model = model
+            return analysis_result, None
+
+    # 缩放、重新导出后的同一张照片内容摘要不同，再按感知哈希查找近似重复的记录
+    if settings.NEAR_DUPLICATE_ENABLED:
+        near_photo = await find_near_duplicate(db, user_id, image.phash, ai_service.model)
+        if near_photo:
+            ai_service.model = near_photo.model_used
+            return _analysis_result_from_photo(near_photo), near_photo.id
+    return None
+
+
+async def resolve_analysis(
+    db: AsyncSession,
+    user_id: int,
+    ai_service: AIService,
+    image: PreparedImage,
+    before_call: Optional[Callable[[], Awaitable[None]]] = None
+) -> Tuple[Dict[str, Any], bool, Optional[int]]:
+    """
+    获取图片的分析结果，没有可复用的结果时才调用AI服务
+    未指定模型时任一服务商的结果都可复用，完成后 ai_service.model 为结果所属的模型
+    :param before_call: 确定要调用AI服务时先执行，如计入用户的分析次数；复用已有结果时不执行
+    :return: (分析结果, 是否复用了已有结果, 复用的图片ID)
+    """
+    reusable = await find_reusable_analysis(db, user_id, ai_service, image)
+    if reusable is not None:
+        analysis_result, duplicate_of_id = reusable
+        return analysis_result, True, duplicate_of_id
+
+    if before_call is not None:
+        await before_call()
+
+    # 调用AI服务进行分析，图片直接以内存数据传给客户端
+    analysis_result = await ai_service.analyze_photo(image.content, image.filename, image.image_hash)
+
+    await analysis_cache.set(image.image_hash, ai_service.model, PROMPT_VERSION, analysis_result)
+    return analysis_result, False, None
+
+
+def build_photo(
+    user_id: int,
+    filename: str,
+    image_hash: str,
+    thumbnail_hash: str,
+    phash: int,
+    model: str,
+    analysis_result: Dict[str, Any],
+    duplicate_of_id: Optional[int] = None
+) -> Photo:
+    """由分析结果构建图片记录，尚未写入数据库"""
+    return Photo(
+        user_id=user_id,
+        filename=filename,
+        image_hash=image_hash,
+        thumbnail_hash=thumbnail_hash,
+        phash=to_signed(phash),
+        duplicate_of_id=duplicate_of_id,
+        score_tech=analysis_result["scores"]["technical"],
+        score_comp=analysis_result["scores"]["composition"],
+        score_aes=analysis_result["scores"]["aesthetic"],
+        score_story=analysis_result["scores"]["narrative"],
+        overall_score=analysis_result["overall_score"],
+        analysis=json.dumps(analysis_result["analysis"]),
+        model_used=model
+    )
+
+
+async def create_photo(
+    db: AsyncSession,
+    user_id: int,
+    filename: str,
+    image_hash: str,
+    thumbnail_hash: str,
+    phash: int,
+    model: str,
+    analysis_result: Dict[str, Any],
+    duplicate_of_id: Optional[int] = None
+) -> Photo:
+    """保存分析记录并加入近似重复索引"""
+    photo = build_photo(
+        user_id, filename, image_hash, thumbnail_hash, phash, model, analysis_result, duplicate_of_id
+    )
+
+    db.add(photo)
+    with time_stage("db_commit"):
+        await db.commit()
+    await db.refresh(photo)
+    phash_index.add(photo.id, phash)
+    return photo
+
+
+async def create_photos(db: AsyncSession, photos: List[Photo]) -> List[Photo]:
+    """
+    在一个事务中批量保存分析记录并加入近似重复索引
+    主键和默认值在 flush 时回填，不再逐条 refresh
+    :param photos: build_photo 构建的记录
+    :return: 已保存的记录
+    """
+    if not photos:
+        return photos
+    db.add_all(photos)
+    with time_stage("db_commit"):
+        await db.commit()
+    phash_index.add_many((photo.id, photo.phash) for photo in photos)
+    return photos
+
+
+async def is_blob_referenced(db: AsyncSession, digest: str) -> bool:
+    """blob 是否仍被记录或尚未完成的分析任务引用"""
+    result = await db.execute(
+        select(Photo.id)
+        .where(or_(Photo.image_hash == digest, Photo.thumbnail_hash == digest))
+        .limit(1)
+    )
+    if result.first() is not None:
+        return True
+    # 任务入队时图片已写入 blob 存储，执行时再读取
+    result = await db.execute(
+        select(AnalysisJob.id)
+        .where(
+            AnalysisJob.status.in_(("pending", "running")),
+            or_(AnalysisJob.image_hash == digest, AnalysisJob.thumbnail_hash == digest)
+        )
+        .limit(1)
+    )
+    return result.first() is not None
+
+
+async def release_blobs(db: AsyncSession, digests: Set[str]) -> None:
+    """
+    删除记录后清理不再被引用的 blob
+    内容寻址的 blob 可能被多条记录共享；并发上传相同内容时 put 会直接复用已有文件，而记录要在分析完成后才写入，
+    因此最近 BLOB_GC_GRACE_SECONDS 内写入过的 blob 不在这里删除，由 scripts.gc_blobs 定期回收
+    """
+    blob_store = get_blob_store()
+    for digest in digests:
+        if await is_blob_referenced(db, digest):
+            continue
+        try:
+            info = await run_in_threadpool(blob_store.stat, digest)
+        except BlobNotFoundError:
+            continue
+        if time.time() - info.modified_at < settings.BLOB_GC_GRACE_SECONDS:
+            continue
+        await run_in_threadpool(blob_store.delete, digest)
@@ -0,0 +1,193 @@
+import json
+import math
+from typing import Any, Dict, Optional, Sequence
+from app.core.config import settings
+from app.schemas.photo import AnalysisDetail, ScoreDetail
+from app.utils.image_quality import QualityReport
+from app.utils.stream_json import ANALYSIS_KEYS, SCORE_KEYS
+
+_CRITERIA = {
+    "technical": "技术 (Technical): 评分范围 0-100，评价要点包括曝光准确性、对焦精准度、景深运用、画面稳定性",
+    "composition": "构图 (Composition): 评分范围 0-100，评价要点包括三分法/黄金分割、引导线、画面平衡、空间层次",
+    "aesthetic": "美学 (Aesthetic): 评分范围 0-100，评价要点包括色彩和谐、光影效果、氛围营造、视觉冲击力",
+    "narrative": "叙事 (Narrative): 评分范围 0-100，评价要点包括主题表达、情感传递、创意独特性、故事性",
+}
+
+_EXAMPLE_SCORES = {"technical": 85, "composition": 78, "aesthetic": 82, "narrative": 75}
+
+_ANALYSIS_EXAMPLE = """  "analysis": {
+    "highlights": ["构图运用三分法，主体突出", "色彩和谐，整体氛围统一"],
+    "improvements": ["背景略显杂乱", "可尝试更低的拍摄角度"],
+    "suggestions": ["后期适当提高对比度", "裁剪去除边缘干扰元素"]
+  }"""
+
+_NOTES = """请注意：
+- 分数必须是整数
+- 评价要客观、具体、可操作
+- 先肯定优点，再指出不足
+- 建议要能立刻实践
+- 语言要友好，鼓励为主"""
+
+
+def _compose(dimensions) -> str:
+    """按需要评分的维度拼出完整的 prompt"""
+    criteria = "\n".join(f"{i}. {_CRITERIA[key]}" for i, key in enumerate(dimensions, 1))
+    scores = ",\n".join(f'    "{key}": {_EXAMPLE_SCORES[key]}' for key in dimensions)
+    return f"""
+你是一位专业的摄影导师，请从以下{"一二三四"[len(dimensions) - 1]}个维度为这张照片进行评分和点评：
+
+{criteria}
+
+请按照以下严格的 JSON 格式输出结果，不要添加任何额外的文本或解释：
+{{
+  "scores": {{
+{scores}
+  }},
+{_ANALYSIS_EXAMPLE}
+}}
+
+{_NOTES}
+"""
+
+
+# 模块加载时生成，每次调用直接复用
+ANALYSIS_PROMPT = _compose(list(_CRITERIA))
+# 技术分由本地测量给出时，只需模型评价其余三个维度
+PROMPT_WITHOUT_TECHNICAL = _compose([key for key in _CRITERIA if key != "technical"])
+
+
+# 精简版 prompt：输出格式由服务商的 JSON schema / 工具调用约束，不再需要完整示例
+_COMPACT_CRITERIA = {
+    "technical": "technical 技术：曝光、对焦、景深、画面稳定",
+    "composition": "composition 构图：三分法/黄金分割、引导线、平衡、层次",
+    "aesthetic": "aesthetic 美学：色彩、光影、氛围、视觉冲击力",
+    "narrative": "narrative 叙事：主题、情感、创意、故事性",
+}
+
+_CATEGORY_NAMES = {"highlights": "优点", "improvements": "不足", "suggestions": "可立即实践的建议"}
+
+
+def _skeleton(dimensions: Sequence[str], categories: Sequence[str]) -> str:
+    """只含字段名的单行 JSON 骨架"""
+    skeleton: Dict[str, Any] = {}
+    if dimensions:
+        skeleton["scores"] = {key: 0 for key in dimensions}
+    if categories:
+        skeleton["analysis"] = {key: [] for key in categories}
+    return json.dumps(skeleton, ensure_ascii=False, separators=(",", ":"))
+
+
+def _item_rule() -> str:
+    return f"每类 1-{settings.ANALYSIS_MAX_ITEMS} 条，每条不超过 {settings.ANALYSIS_ITEM_MAX_CHARS} 字"
+
+
+def _compose_compact(dimensions: Sequence[str]) -> str:
+    criteria = "\n".join(f"- {_COMPACT_CRITERIA[key]}" for key in dimensions)
+    categories = "、".join(f"{key}（{name}）" for key, name in _CATEGORY_NAMES.items())
+    return (
+        f"你是一位专业的摄影导师，为这张照片的以下维度打分（0-100 的整数）：\n{criteria}\n"
+        f"并在 analysis 中给出 {categories}，{_item_rule()}；先肯定优点再指出不足，语言友好、具体、可操作。\n"
+        f"只输出 JSON：{_skeleton(dimensions, ANALYSIS_KEYS)}\n"
+    )
+
+
+COMPACT_PROMPT = _compose_compact(SCORE_KEYS)
+COMPACT_PROMPT_WITHOUT_TECHNICAL = _compose_compact([key for key in SCORE_KEYS if key != "technical"])
+
+
+def score_dimensions(technical: Optional[int] = None) -> Sequence[str]:
+    """需要模型评分的维度，技术分由本地给出时不含 technical"""
+    return [key for key in SCORE_KEYS if technical is None or key != "technical"]
+
+
+_SCORE_PROPERTIES = ScoreDetail.model_json_schema()["properties"]
+_ANALYSIS_PROPERTIES = AnalysisDetail.model_json_schema()["properties"]
+
+
+def analysis_schema(dimensions: Sequence[str] = SCORE_KEYS, categories: Sequence[str] = ANALYSIS_KEYS) -> Dict[str, Any]:
+    """
+    由 ScoreDetail、AnalysisDetail 生成服务商结构化输出使用的 JSON schema
+    :param dimensions: 需要输出的评分维度
+    :param categories: 需要输出的点评类别
+    """
+    def select(properties, keys) -> Dict[str, Any]:
+        return {
+            "type": "object",
+            "properties": {
+                key: {name: value for name, value in properties[key].items() if name != "title"} for key in keys
+            },
+            "required": list(keys),
+            "additionalProperties": False,
+        }
+
+    properties = {}
+    if dimensions:
+        properties["scores"] = select(_SCORE_PROPERTIES, dimensions)
+    if categories:
+        properties["analysis"] = select(_ANALYSIS_PROPERTIES, categories)
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+
+def output_token_budget(dimensions: Sequence[str] = SCORE_KEYS, categories: Sequence[str] = ANALYSIS_KEYS) -> int:
+    """
+    按要求的条数和字数估算输出的 token 上限
+    中文约一字一个 token，每条点评另计引号和分隔符，再留 25% 余量，按 64 取整
+    """
+    items = len(categories) * settings.ANALYSIS_MAX_ITEMS
+    tokens = 40 + 8 * len(dimensions) + items * (settings.ANALYSIS_ITEM_MAX_CHARS + 4)
+    return int(math.ceil(tokens * 1.25 / 64) * 64)
+
+
+def technical_override(quality: Optional[QualityReport]) -> Optional[int]:
+    """
+    开启 QUALITY_SHORT_CIRCUIT_TECHNICAL 时直接使用本地技术评分
+    :return: 本地技术评分，不替代模型评分时为 None
+    """
+    if quality is None or not settings.QUALITY_SHORT_CIRCUIT_TECHNICAL:
+        return None
+    return quality.technical_score
+
+
+def build_prompt(quality: Optional[QualityReport] = None, compact: bool = False) -> str:
+    """
+    构建用于分析照片的 prompt
+    :param quality: 本地画质测量结果，提供时附在 prompt 后作为评分依据
+    :param compact: 输出格式已由服务商的结构化输出约束时使用精简版
+    """
+    technical = technical_override(quality)
+    if compact:
+        prompt = COMPACT_PROMPT if technical is None else COMPACT_PROMPT_WITHOUT_TECHNICAL
+        if quality is None:
+            return prompt
+        if technical is None:
+            return f"{prompt}本地测量结果（评价技术维度时以此为依据）：\n{quality.describe()}\n"
+        return f"{prompt}技术维度已由本地测量评为 {technical} 分，测量发现的问题请在 improvements 和 suggestions 中回应：\n{quality.describe()}\n"
+    if quality is None:
+        return ANALYSIS_PROMPT
+    if technical is None:
+        return (
+            f"{ANALYSIS_PROMPT}\n以下是本地对图片的客观测量结果，评价技术维度时请以此为依据，"
+            f"不要与测量结果矛盾：\n{quality.describe()}\n"
+        )
+    return (
+        f"{PROMPT_WITHOUT_TECHNICAL}\n技术维度已由本地测量评为 {technical} 分，无需再评分。"
+        f"测量结果如下，测量发现的问题请在 improvements 和 suggestions 中给出对应的改进建议：\n"
+        f"{quality.describe()}\n"
+    )
+
+
+def build_repair_prompt(partial: Dict[str, Any], dimensions: Sequence[str], categories: Sequence[str]) -> str:
+    """
+    只追问缺少的字段
+    :param partial: 已解析出的部分结果 {"scores": ..., "analysis": ...}
+    :param dimensions: 缺少的评分维度，非空时请求中需要附带图片
+    :param categories: 缺少或为空的点评类别
+    """
+    fields = [f"scores.{key}" for key in dimensions] + [f"analysis.{key}" for key in categories]
+    existing = json.dumps(partial, ensure_ascii=False, separators=(",", ":"))
+    rule = f"，点评{_item_rule()}" if categories else ""
+    return (
+        f"以下是对这张照片已有的评价，部分字段缺失：\n{existing}\n"
+        f"请只补充 {'、'.join(fields)}{rule}，不要重复已有内容。\n"
+        f"只输出 JSON：{_skeleton(dimensions, categories)}\n"
+    )
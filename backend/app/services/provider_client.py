@@ -0,0 +1,270 @@
+import aiohttp
+import base64
+import json
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Any, List, Optional, Sequence
+from app.core.config import settings
+from app.core.metrics import PROVIDER_PARSE, time_stage
+from app.core.rate_limit import parse_retry_after
+from app.services.prompt import (
+    analysis_schema,
+    build_prompt,
+    build_repair_prompt,
+    output_token_budget,
+    score_dimensions,
+    technical_override,
+)
+from app.services.provider_router import ProviderHTTPError
+from app.utils.image_quality import QualityReport
+from app.utils.stream_json import (
+    ANALYSIS_KEYS,
+    AnalysisParseError,
+    AnalysisStreamParser,
+    extract_partial,
+    parse_analysis,
+    parse_analysis_fields,
+)
+
+
+class ProviderClient(ABC):
+    """
+    模型服务商客户端的公共部分：prompt、请求发送、错误处理、结果解析和缺失字段的补充
+    子类只描述各服务商的请求和响应格式：
+    - _headers：请求头
+    - _image_content：消息中图片部分的格式
+    - _structured_output：约束输出格式的参数（JSON schema、JSON 模式或工具调用）
+    - _response_text：从非流式响应中取出模型输出的文本
+    - _stream_text：从流式响应中依次取出文本片段，并记录 token 用量
+    """
+
+    # 服务商标识，用于监控指标
+    provider: str = ""
+    # 出现在错误信息中的名称
+    display_name: str = ""
+    model_name: str = ""
+    endpoint: str = ""
+    # 未使用结构化输出时的输出上限，使用时按要求的条数和字数估算
+    max_tokens: int = 1000
+    temperature: float = 0.1
+
+    def __init__(self, api_key: str, base_url: str, session: Optional[aiohttp.ClientSession] = None):
+        # 应用级共享的连接池会话，未提供时每次请求临时创建
+        self.session = session
+        self.api_key = api_key
+        self.base_url = base_url
+        self.headers = self._headers()
+
+    @abstractmethod
+    def _headers(self) -> Dict[str, str]:
+        ...
+
+    @abstractmethod
+    def _image_content(self, base64_image: str, media_type: str) -> Dict[str, Any]:
+        ...
+
+    @abstractmethod
+    def _structured_output(self, payload: Dict[str, Any], schema: Dict[str, Any]) -> None:
+        ...
+
+    @abstractmethod
+    def _response_text(self, response_data: Dict[str, Any]) -> str:
+        ...
+
+    @abstractmethod
+    def _stream_text(self, response: aiohttp.ClientResponse) -> AsyncIterator[str]:
+        ...
+
+    def _prepare_stream(self, payload: Dict[str, Any]) -> None:
+        """流式请求的额外参数"""
+        payload["stream"] = True
+
+    def _build_prompt(self, quality: Optional[QualityReport] = None, compact: bool = False) -> str:
+        """构建用于分析照片的 prompt，quality 为本地画质测量结果"""
+        return build_prompt(quality, compact)
+
+    def _build_payload(
+        self,
+        prompt: str,
+        image_data: Optional[bytes] = None,
+        media_type: str = "image/jpeg",
+        schema: Optional[Dict[str, Any]] = None,
+        max_tokens: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        :param image_data: 图片数据，为 None 时只发送文字
+        :param schema: 输出的 JSON schema，为 None 时只由 prompt 约束格式
+        """
+        content: List[Dict[str, Any]] = [{"type": "text", "text": prompt}]
+        if image_data is not None:
+            # 图片直接在内存中转换为 base64
+            content.append(self._image_content(base64.b64encode(image_data).decode("utf-8"), media_type))
+        payload = {
+            "model": self.model_name,
+            "messages": [{"role": "user", "content": content}],
+            "temperature": self.temperature,
+            "max_tokens": max_tokens or self.max_tokens
+        }
+        if schema is not None:
+            self._structured_output(payload, schema)
+        return payload
+
+    def _analysis_payload(self, image_data: bytes, media_type: str, quality: Optional[QualityReport]) -> Dict[str, Any]:
+        """分析照片的请求体，开启结构化输出时使用精简 prompt 和按需估算的输出上限"""
+        if not settings.STRUCTURED_OUTPUT_ENABLED:
+            return self._build_payload(self._build_prompt(quality), image_data, media_type)
+        dimensions = score_dimensions(technical_override(quality))
+        return self._build_payload(
+            self._build_prompt(quality, compact=True),
+            image_data,
+            media_type,
+            analysis_schema(dimensions),
+            output_token_budget(dimensions)
+        )
+
+    @asynccontextmanager
+    async def _post(self, payload: Dict[str, Any]) -> AsyncIterator[aiohttp.ClientResponse]:
+        """发送请求，非 200 响应抛出 ProviderHTTPError；优先复用共享会话以避免重复的 DNS/TCP/TLS 握手"""
+        session = self.session or aiohttp.ClientSession()
+        try:
+            async with session.post(
+                f"{self.base_url}{self.endpoint}",
+                headers=self.headers,
+                json=payload
+            ) as response:
+                if response.status != 200:
+                    raise ProviderHTTPError(
+                        f"{self.display_name} API 调用失败: {await response.text()}",
+                        response.status,
+                        parse_retry_after(response.headers.get("Retry-After"))
+                    )
+                yield response
+        finally:
+            if session is not self.session:
+                await session.close()
+
+    async def _request(self, payload: Dict[str, Any]) -> str:
+        """发送非流式请求，返回模型输出的文本"""
+        async with self._post(payload) as response:
+            return self._response_text(await response.json())
+
+    async def analyze_photo(self, image_data: bytes, filename: str, media_type: str = "image/jpeg", quality: Optional[QualityReport] = None) -> Dict[str, Any]:
+        """分析照片，返回评分和点评"""
+        content = await self._request(self._analysis_payload(image_data, media_type, quality))
+        return await self._complete(content, image_data, media_type, quality)
+
+    async def stream_analysis(self, image_data: bytes, filename: str, media_type: str = "image/jpeg", quality: Optional[QualityReport] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式分析照片，评分和每条点评完整到达后立即产出
+        :return: 依次产出 score / item 事件，最后产出 {"type": "result", "result": 分析结果}
+        """
+        payload = self._analysis_payload(image_data, media_type, quality)
+        self._prepare_stream(payload)
+
+        parser = AnalysisStreamParser()
+        chunks = []
+        emitted = set()
+        async with self._post(payload) as response:
+            async for text in self._stream_text(response):
+                chunks.append(text)
+                for event in parser.feed(text):
+                    emitted.add(event.get("dimension") or event.get("category"))
+                    yield event
+
+        # 完整文本与非流式调用走同一个解析器，追问补充的字段同样按事件推送
+        result = await self._complete("".join(chunks), image_data, media_type, quality)
+        for dimension, value in result["scores"].items():
+            if dimension not in emitted:
+                yield {"type": "score", "dimension": dimension, "value": value}
+        for category, items in result["analysis"].items():
+            if category not in emitted:
+                for index, item in enumerate(items):
+                    yield {"type": "item", "category": category, "index": index, "text": item}
+        yield {"type": "result", "result": result}
+
+    async def _complete(
+        self,
+        content: str,
+        image_data: bytes,
+        media_type: str,
+        quality: Optional[QualityReport]
+    ) -> Dict[str, Any]:
+        """
+        解析模型输出；输出被截断或缺少字段时，保留已完整的部分，只追问缺少的字段
+        :return: 分析结果
+        """
+        technical = technical_override(quality)
+        with time_stage("parse"):
+            try:
+                result, absent = parse_analysis_fields(content, technical)
+                analysis = {key: items for key, items in result["analysis"].items() if key not in absent}
+                partial = {"scores": result["scores"], "analysis": analysis}
+            except AnalysisParseError:
+                result = None
+                partial = extract_partial(content)
+
+        dimensions = [key for key in score_dimensions(technical) if key not in partial["scores"]]
+        # 空列表是合法的点评（如没有需要改进之处），只追问输出中没有出现的类别
+        categories = [key for key in ANALYSIS_KEYS if key not in partial["analysis"]]
+        if result is not None and (not categories or not settings.ANALYSIS_REPAIR_ENABLED):
+            PROVIDER_PARSE.labels(self.provider, "ok").inc()
+            return result
+        if result is None and not dimensions and not categories:
+            # 截断发生在最后一条点评之后，已有内容足够
+            result = self._parse_response(json.dumps(partial, ensure_ascii=False), technical)
+            PROVIDER_PARSE.labels(self.provider, "repaired").inc()
+            return result
+        if result is None and (not settings.ANALYSIS_REPAIR_ENABLED or not (partial["scores"] or partial["analysis"])):
+            # 没有可保留的内容，补充字段等同于重新分析，交由调用方切换服务商或重试
+            PROVIDER_PARSE.labels(self.provider, "failed").inc()
+            raise AnalysisParseError(f"无法解析 {self.display_name} API 响应: {content[:200]}")
+
+        try:
+            supplement = await self._repair(partial, dimensions, categories, image_data, media_type)
+            merged = {
+                "scores": {**partial["scores"], **{key: supplement["scores"][key] for key in dimensions if key in supplement["scores"]}},
+                "analysis": {**partial["analysis"], **{key: supplement["analysis"][key] for key in categories if key in supplement["analysis"]}},
+            }
+            repaired = self._parse_response(json.dumps(merged, ensure_ascii=False), technical)
+        except Exception:
+            if result is not None:
+                # 只缺点评时补充失败，仍使用已有的完整评分
+                PROVIDER_PARSE.labels(self.provider, "ok").inc()
+                return result
+            PROVIDER_PARSE.labels(self.provider, "failed").inc()
+            raise
+        PROVIDER_PARSE.labels(self.provider, "repaired").inc()
+        return repaired
+
+    async def _repair(
+        self,
+        partial: Dict[str, Any],
+        dimensions: Sequence[str],
+        categories: Sequence[str],
+        image_data: bytes,
+        media_type: str
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        只追问缺少的字段
+        评分需要看图，缺少评分时附带图片；只缺点评时按已有评价补充，不再上传图片
+        :return: 补充的部分结果，格式同 extract_partial
+        """
+        schema = analysis_schema(dimensions, categories) if settings.STRUCTURED_OUTPUT_ENABLED else None
+        payload = self._build_payload(
+            build_repair_prompt(partial, dimensions, categories),
+            image_data if dimensions else None,
+            media_type,
+            schema,
+            output_token_budget(dimensions, categories)
+        )
+        return extract_partial(await self._request(payload))
+
+    def _parse_response(self, content: str, technical: Optional[int] = None) -> Dict[str, Any]:
+        """
+        解析模型输出，提取评分和分析结果
+        :param technical: 本地测量的技术评分，提供时替代模型的技术评分
+        """
+        try:
+            return parse_analysis(content, technical)
+        except AnalysisParseError as e:
+            raise AnalysisParseError(f"无法解析 {self.display_name} API 响应: {e}") from None
@@ -0,0 +1,49 @@
+import asyncio
+import random
+from typing import Optional
+
+import aiohttp
+
+from app.core.config import settings
+from app.core.deadline import Deadline, ProviderTimeoutError
+from app.services.provider_router import ProviderHTTPError
+
+# 可以原样重发的状态码：请求未被处理或服务商暂时过载；其余 4xx 重发也会得到同样的结果
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504, 529}
+
+
+def retry_reason(error: BaseException) -> Optional[str]:
+    """
+    可重试错误的类别，用于监控指标
+    分析请求不修改服务商侧的任何状态，这些错误重发是安全的
+    :return: http_<状态码> / timeout / connection，不可重试时为 None
+    """
+    if isinstance(error, ProviderHTTPError):
+        return f"http_{error.status}" if error.status in RETRYABLE_STATUSES else None
+    if isinstance(error, (ProviderTimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError)):
+        return "connection"
+    return None
+
+
+def retry_delay(error: BaseException, attempt: int, deadline: Deadline) -> Optional[float]:
+    """
+    第 attempt 次调用失败后，在同一服务商上重试前的等待时间
+    指数退避加随机抖动；Retry-After 更长时按 Retry-After 等待，超过 PROVIDER_RETRY_MAX_SECONDS 时不再重试，
+    交由路由切换服务商
+    :return: 等待秒数，不应重试时为 None
+    """
+    if attempt >= settings.PROVIDER_RETRY_MAX_ATTEMPTS or retry_reason(error) is None:
+        return None
+    delay = min(settings.PROVIDER_RETRY_MAX_SECONDS, settings.PROVIDER_RETRY_BASE_SECONDS * 2 ** (attempt - 1))
+    delay = delay / 2 + random.uniform(0, delay / 2)
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        if retry_after > settings.PROVIDER_RETRY_MAX_SECONDS:
+            return None
+        delay = max(delay, retry_after)
+    # 等待之后已来不及完成一次调用
+    if not deadline.allows(delay):
+        return None
+    return delay
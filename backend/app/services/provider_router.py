@@ -0,0 +1,320 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.deadline import DeadlineExceededError
+
+logger = logging.getLogger(__name__)
+
+# 未指定模型时用于路由的服务商 API Key
+PROVIDER_API_KEYS = {
+    "deepseek": lambda: settings.DEEPSEEK_API_KEY,
+    "openai": lambda: settings.OPENAI_API_KEY,
+    "claude": lambda: settings.ANTHROPIC_API_KEY,
+}
+
+# 错误率超过该值的服务商排在最后，只作为兜底
+UNHEALTHY_ERROR_RATE = 0.5
+
+
+class ProviderUnavailableError(Exception):
+    """所有服务商的熔断器都处于打开状态"""
+
+
+class ProviderHTTPError(Exception):
+    """服务商返回了非 200 的响应"""
+
+    def __init__(self, message: str, status: int, retry_after: Optional[float] = None):
+        """
+        :param status: HTTP 状态码
+        :param retry_after: 响应头 Retry-After 的秒数，没有时为 None
+        """
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def rate_limited(self) -> bool:
+        """服务商要求降低请求速率"""
+        return self.status == 429 or (self.status == 503 and self.retry_after is not None)
+
+
+class CircuitBreaker:
+    """
+    熔断器
+    - closed：正常放行，连续失败达到阈值后打开
+    - open：直接拒绝，经过 reset_seconds 后进入半开
+    - half_open：只放行一个探测请求，成功则关闭，失败则重新打开
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = settings.CIRCUIT_FAILURE_THRESHOLD,
+        reset_seconds: float = settings.CIRCUIT_RESET_SECONDS,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def _refresh(self) -> None:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+            self.state = "half_open"
+            self._probing = False
+
+    def available(self) -> bool:
+        """是否可以发出请求，不占用半开状态的探测名额"""
+        self._refresh()
+        if self.state == "half_open":
+            return not self._probing
+        return self.state == "closed"
+
+    def acquire(self) -> bool:
+        """发出请求前调用，半开状态下只有第一个调用方能拿到探测名额"""
+        if not self.available():
+            return False
+        if self.state == "half_open":
+            self._probing = True
+        return True
+
+    def release(self) -> None:
+        """请求被取消、没有结果时归还探测名额"""
+        self._probing = False
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning("熔断器打开，连续失败 %s 次", self.failures)
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class ProviderStats:
+    """单个服务商最近若干次请求的耗时和成败"""
+
+    def __init__(self, window: int = settings.ROUTER_WINDOW_SIZE):
+        self.samples: Deque[Tuple[float, bool]] = deque(maxlen=window)
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.samples.append((latency, ok))
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    @property
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """成功请求耗时的分位数"""
+        latencies = sorted(latency for latency, ok in self.samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * q))]
+
+
+class ProviderRouter:
+    """
+    多服务商路由
+    按最近请求的 p50 耗时选择最快的健康服务商，失败时依次切换到下一个；
+    开启对冲时，首选服务商超过自身 p95 仍未返回，就向下一个服务商发出相同请求，取先成功的结果
+    """
+
+    def __init__(
+        self,
+        providers: List[str],
+        hedge_enabled: bool = settings.ROUTER_HEDGE_ENABLED,
+        min_samples: int = settings.ROUTER_MIN_SAMPLES,
+    ):
+        self.providers = providers
+        self.hedge_enabled = hedge_enabled
+        self.min_samples = min_samples
+        self.stats: Dict[str, ProviderStats] = {provider: ProviderStats() for provider in providers}
+        self.breakers: Dict[str, CircuitBreaker] = {provider: CircuitBreaker() for provider in providers}
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _ensure(self, provider: str) -> None:
+        # 用户指定了未参与路由的模型时也记录统计
+        if provider not in self.stats:
+            self.stats[provider] = ProviderStats()
+            self.breakers[provider] = CircuitBreaker()
+
+    def rank(self, providers: Optional[List[str]] = None) -> List[str]:
+        """
+        按健康状况和耗时排序可用的服务商
+        样本不足的服务商排在有数据的之后，按配置顺序；熔断中的服务商不参与
+        """
+        candidates = providers or self.providers
+        for provider in candidates:
+            self._ensure(provider)
+        order = {provider: index for index, provider in enumerate(candidates)}
+
+        def key(provider: str):
+            stats = self.stats[provider]
+            unhealthy = stats.error_rate > UNHEALTHY_ERROR_RATE
+            if len(stats) < self.min_samples or stats.percentile(0.5) is None:
+                return (unhealthy, 1, 0.0, order[provider])
+            return (unhealthy, 0, stats.percentile(0.5), order[provider])
+
+        return sorted((p for p in candidates if self.breakers[p].available()), key=key)
+
+    def hedge_delay(self, provider: str) -> float:
+        """对冲等待时间：首选服务商的 p95，样本不足时使用默认值"""
+        stats = self.stats[provider]
+        p95 = stats.percentile(0.95) if len(stats) >= self.min_samples else None
+        if p95 is None:
+            return settings.ROUTER_HEDGE_DEFAULT_DELAY_SECONDS
+        return max(p95, settings.ROUTER_HEDGE_MIN_DELAY_SECONDS)
+
+    def record(self, provider: str, latency: float, ok: bool) -> None:
+        """记录一次请求的耗时和成败，并更新熔断器；不经过 call 的请求（如流式输出）由调用方记录"""
+        self._ensure(provider)
+        self.stats[provider].record(latency, ok)
+        if ok:
+            self.breakers[provider].record_success()
+        else:
+            self.breakers[provider].record_failure()
+
+    async def _attempt(self, provider: str, func: Callable[[str], Awaitable[Any]]) -> Any:
+        started = time.perf_counter()
+        try:
+            result = await func(provider)
+        except (asyncio.CancelledError, DeadlineExceededError):
+            # 被取消的请求（客户端断开、对冲落败）没有结果，不在这里计入统计，对冲落败由 call 记录；
+            # 请求的截止时间已到时服务商未必有问题，同样不计入
+            self.breakers[provider].release()
+            raise
+        except Exception:
+            self.record(provider, time.perf_counter() - started, False)
+            raise
+        self.record(provider, time.perf_counter() - started, True)
+        return result
+
+    async def call(
+        self,
+        func: Callable[[str], Awaitable[Any]],
+        providers: Optional[List[str]] = None,
+        hedge: Optional[bool] = None,
+    ) -> Tuple[Any, str]:
+        """
+        依次尝试服务商直到成功
+        :param func: 接收服务商名称、返回分析结果的协程函数，结果无效时应抛出异常
+        :param providers: 候选服务商，默认为全部参与路由的服务商
+        :param hedge: 是否对冲，默认使用配置
+        :return: (结果, 实际返回结果的服务商)
+        """
+        remaining = self.rank(providers)
+        if not remaining:
+            raise ProviderUnavailableError("模型服务暂时不可用，请稍后重试")
+        hedge = self.hedge_enabled if hedge is None else hedge
+
+        pending: Dict[asyncio.Task, str] = {}
+        started: Dict[asyncio.Task, float] = {}
+        last_error: Optional[Exception] = None
+        hedged = False
+
+        def launch() -> bool:
+            while remaining:
+                provider = remaining.pop(0)
+                if self.breakers[provider].acquire():
+                    task = asyncio.create_task(self._attempt(provider, func))
+                    pending[task] = provider
+                    started[task] = time.perf_counter()
+                    return True
+            return False
+
+        launch()
+        primary = next(iter(pending.values()), None)
+        try:
+            while pending:
+                timeout = None
+                if hedge and not hedged and remaining and len(pending) == 1:
+                    timeout = self.hedge_delay(next(iter(pending.values())))
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    # 首选服务商超过 p95 仍未返回，向下一个服务商发出对冲请求
+                    hedged = launch()
+                    if hedged:
+                        self.hedges += 1
+                    continue
+
+                for task in done:
+                    provider = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except DeadlineExceededError:
+                        # 没有时间再切换服务商
+                        raise
+                    except Exception as e:
+                        logger.warning("服务商 %s 调用失败: %s", provider, e)
+                        last_error = e
+                        continue
+                    if hedged and provider != primary:
+                        self.hedge_wins += 1
+                    # 对冲中落后的请求超过了胜出者的耗时，按超时计入统计，否则变慢的服务商会一直被首选
+                    for loser, loser_provider in pending.items():
+                        self.stats[loser_provider].record(time.perf_counter() - started[loser], False)
+                    return result, provider
+
+                if not pending:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if last_error is not None:
+            raise last_error
+        raise ProviderUnavailableError("模型服务暂时不可用，请稍后重试")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前各服务商的统计与熔断状态"""
+        providers = {}
+        for provider, stats in self.stats.items():
+            p50 = stats.percentile(0.5)
+            p95 = stats.percentile(0.95)
+            providers[provider] = {
+                "state": self.breakers[provider].state,
+                "samples": len(stats),
+                "error_rate": round(stats.error_rate, 3),
+                "p50_seconds": round(p50, 3) if p50 is not None else None,
+                "p95_seconds": round(p95, 3) if p95 is not None else None,
+            }
+        return {"providers": providers, "hedges": self.hedges, "hedge_wins": self.hedge_wins}
+
+
+def configured_providers() -> List[str]:
+    """配置了 API Key 的服务商，默认模型排在最前；都未配置时只使用默认模型"""
+    names = [name.strip() for name in settings.ROUTER_PROVIDERS.split(",") if name.strip()]
+    providers = [name for name in names if name in PROVIDER_API_KEYS and PROVIDER_API_KEYS[name]()]
+    if not providers:
+        return [settings.DEFAULT_AI_MODEL]
+    if settings.DEFAULT_AI_MODEL in providers:
+        providers.remove(settings.DEFAULT_AI_MODEL)
+        providers.insert(0, settings.DEFAULT_AI_MODEL)
+    return providers
+
+
+_router: Optional[ProviderRouter] = None
+
+
+def get_provider_router() -> ProviderRouter:
+    global _router
+    if _router is None:
+        _router = ProviderRouter(configured_providers())
+    return _router
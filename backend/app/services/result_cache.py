@@ -0,0 +1,158 @@
+import copy
+import json
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from app.core.config import settings
+from app.core.database import async_session
+from app.models.analysis_cache import AnalysisCacheEntry
+from app.utils.cache import LRUCache
+
+# 每写入多少条执行一次过期和容量清理
+PRUNE_INTERVAL = 100
+
+
+# 支持 INSERT ... ON CONFLICT 的方言
+UPSERT_DIALECTS = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def make_cache_key(image_hash: str, model: str, prompt_version: str) -> str:
+    return f"{image_hash}:{model}:{prompt_version}"
+
+
+class AnalysisResultCache:
+    """
+    两级分析结果缓存
+    - 内存 LRU：同一进程内的重复请求直接命中
+    - 数据库表：进程重启后仍然有效，按 TTL 过期，超过条目上限时淘汰最久未命中的记录
+    写入和读出的都是副本，调用方可以修改自己拿到的结果，不影响缓存中的内容
+    """
+
+    def __init__(
+        self,
+        memory_size: int = settings.ANALYSIS_CACHE_MEMORY_SIZE,
+        ttl_seconds: int = settings.ANALYSIS_CACHE_TTL_SECONDS,
+        max_entries: int = settings.ANALYSIS_CACHE_MAX_ENTRIES,
+        enabled: bool = settings.ANALYSIS_CACHE_ENABLED,
+    ):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory: LRUCache[Dict[str, Any]] = LRUCache(maxsize=memory_size, ttl=ttl_seconds)
+        self._writes_since_prune = 0
+
+        # 命中率统计
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.memory_hits + self.db_hits + self.misses
+        return (self.memory_hits + self.db_hits) / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self.memory),
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+        }
+
+    async def get(self, image_hash: str, model: str, prompt_version: str) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存的分析结果
+        :return: 分析结果，未命中返回 None
+        """
+        if not self.enabled:
+            return None
+
+        key = make_cache_key(image_hash, model, prompt_version)
+        result = self.memory.get(key)
+        if result is not None:
+            self.memory_hits += 1
+            return copy.deepcopy(result)
+
+        now = datetime.utcnow()
+        async with async_session() as db:
+            entry = await db.get(AnalysisCacheEntry, key)
+            if entry is None or entry.expires_at <= now:
+                self.misses += 1
+                return None
+            entry.hit_count += 1
+            entry.last_hit_at = now
+            await db.commit()
+            result = json.loads(entry.result)
+
+        self.db_hits += 1
+        self.memory.set(key, copy.deepcopy(result))
+        return result
+
+    async def set(self, image_hash: str, model: str, prompt_version: str, result: Dict[str, Any]) -> None:
+        """写入分析结果"""
+        if not self.enabled:
+            return
+
+        key = make_cache_key(image_hash, model, prompt_version)
+        self.memory.set(key, copy.deepcopy(result))
+
+        now = datetime.utcnow()
+        values = {
+            "result": json.dumps(result, ensure_ascii=False),
+            "created_at": now,
+            "last_hit_at": now,
+            "expires_at": now + timedelta(seconds=self.ttl_seconds),
+        }
+        async with async_session() as db:
+            # 并发分析同一张图片时两个请求会同时写入同一个键，用 upsert 避免主键冲突
+            insert = UPSERT_DIALECTS.get(db.bind.dialect.name)
+            if insert is not None:
+                stmt = insert(AnalysisCacheEntry).values(
+                    key=key, image_hash=image_hash, model=model, prompt_version=prompt_version, hit_count=0, **values
+                )
+                await db.execute(stmt.on_conflict_do_update(index_elements=[AnalysisCacheEntry.key], set_=values))
+                await db.commit()
+            else:
+                await self._merge(db, key, image_hash, model, prompt_version, values)
+
+            self._writes_since_prune += 1
+            if self._writes_since_prune >= PRUNE_INTERVAL:
+                self._writes_since_prune = 0
+                await self._prune(db)
+
+    async def _merge(self, db, key: str, image_hash: str, model: str, prompt_version: str, values: Dict[str, Any]) -> None:
+        """不支持 upsert 的数据库：先查后写，插入冲突说明并发请求已写入相同结果"""
+        entry = await db.get(AnalysisCacheEntry, key)
+        if entry is None:
+            entry = AnalysisCacheEntry(key=key, image_hash=image_hash, model=model, prompt_version=prompt_version)
+            db.add(entry)
+        for name, value in values.items():
+            setattr(entry, name, value)
+        try:
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+
+    async def _prune(self, db) -> None:
+        """删除过期条目，并在超过容量时淘汰最久未命中的条目"""
+        await db.execute(delete(AnalysisCacheEntry).where(AnalysisCacheEntry.expires_at <= datetime.utcnow()))
+        count = (await db.execute(select(func.count()).select_from(AnalysisCacheEntry))).scalar_one()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            oldest = (
+                select(AnalysisCacheEntry.key)
+                .order_by(AnalysisCacheEntry.last_hit_at)
+                .limit(overflow)
+                .scalar_subquery()
+            )
+            await db.execute(delete(AnalysisCacheEntry).where(AnalysisCacheEntry.key.in_(oldest)))
+        await db.commit()
+
+
+analysis_cache = AnalysisResultCache()
@@ -0,0 +1,35 @@
+import json
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import aiohttp
+
+
+async def iter_sse_events(response: aiohttp.ClientResponse) -> AsyncIterator[Tuple[Optional[str], str]]:
+    """
+    逐个读取服务商返回的 Server-Sent Events
+    :return: (事件名, data 内容)，多行 data 按换行拼接
+    """
+    event: Optional[str] = None
+    data = []
+    async for raw in response.content:
+        line = raw.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data:
+                yield event, "\n".join(data)
+            event, data = None, []
+            continue
+        if line.startswith(":"):
+            continue
+        field, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if field == "event":
+            event = value
+        elif field == "data":
+            data.append(value)
+    if data:
+        yield event, "\n".join(data)
+
+
+def format_sse(event: str, payload: Dict[str, Any]) -> str:
+    """按 Server-Sent Events 格式编码一条事件"""
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
@@ -1,91 +1,383 @@
-from PIL import Image
+from PIL import Image, ImageOps
 import io
+import math
 import base64
-from typing import Tuple, Optional
+import time
+from dataclasses import dataclass, field
+from typing import BinaryIO, Dict, Tuple, Optional, Union
 
+# 解码时的最长边上限，视觉模型不会用到更高的分辨率
+MAX_DECODE_EDGE = 2048
 
-def compress_image(image_data: bytes, target_size: int = 1024 * 1024, quality: int = 85) -> Tuple[bytes, str]:
-    """
-    压缩图片，目标大小默认1MB
-    :param image_data: 原始图片数据
-    :param target_size: 目标大小（字节）
-    :param quality: 初始质量
-    :return: (压缩后的图片数据, 图片格式)
-    """
-    img = Image.open(io.BytesIO(image_data))
-    
-    # 获取原始格式
-    img_format = img.format or 'JPEG'
-    
+# 按目标大小压缩时的质量下限，仍然超出时改为缩小尺寸
+MIN_QUALITY = 40
+# 质量搜索用的探测图每边缩小的倍数
+PROBE_FACTOR = 4
+# 预计大小的安全余量
+SIZE_MARGIN = 0.95
+# 支持按质量调整大小的格式
+QUALITY_FORMATS = {'JPEG', 'WEBP'}
+
+
+@dataclass
+class ProcessedImage:
+    """一次解码得到的全部派生数据"""
+    content: bytes  # 压缩后的 JPEG
+    thumbnail: bytes
+    phash: int
+    width: int
+    height: int
+    # 各步骤耗时（秒）：decode、compress、thumbnail、phash，由调用方汇总到监控指标
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
     # 确保图片是RGB格式，JPEG不支持RGBA
     if img.mode == 'RGBA':
         # 将RGBA转换为RGB，使用白色作为背景
         img_rgb = Image.new('RGB', img.size, (255, 255, 255))
         img_rgb.paste(img, mask=img.split()[3])  # 使用alpha通道作为遮罩
-        img = img_rgb
+        return img_rgb
     elif img.mode != 'RGB':
-        img = img.convert('RGB')
-    
-    # 如果已经小于目标大小，直接返回
+        return img.convert('RGB')
+    return img
+
+
+def _decode(fp: BinaryIO, max_edge: int) -> Tuple[Image.Image, Optional[str]]:
+    """
+    解码为最长边不超过 max_edge 的 RGB 图片
+    :return: (图片, 原始格式)
+    """
+    img = Image.open(fp)
+    img_format = img.format
+    # JPEG 在解码阶段直接按 1/2、1/4、1/8 缩小，不必先解码出完整分辨率
+    # draft 要求宽高都不小于请求尺寸，因此按原图比例换算
+    ratio = max_edge / max(img.size)
+    if ratio < 1:
+        img.draft('RGB', (math.ceil(img.width * ratio), math.ceil(img.height * ratio)))
+    img = _to_rgb(img)
+    if max(img.size) > max_edge:
+        img = ImageOps.contain(img, (max_edge, max_edge), Image.Resampling.LANCZOS)
+    return img, img_format
+
+
+def _encode(img: Image.Image, img_format: str, quality: int) -> bytes:
     img_byte_arr = io.BytesIO()
     img.save(img_byte_arr, format=img_format, quality=quality)
-    img_bytes = img_byte_arr.getvalue()
-    
+    return img_byte_arr.getvalue()
+
+
+def _search_quality(
+    probe: Image.Image,
+    img_format: str,
+    probe_sizes: Dict[int, int],
+    low: int,
+    high: int,
+    limit: float
+) -> Optional[int]:
+    """在探测图上二分查找编码大小不超过 limit 的最高质量，探测结果缓存在 probe_sizes 中"""
+    best = None
+    while low <= high:
+        mid = (low + high) // 2
+        if mid not in probe_sizes:
+            probe_sizes[mid] = len(_encode(probe, img_format, mid))
+        if probe_sizes[mid] <= limit:
+            best = mid
+            low = mid + 1
+        else:
+            high = mid - 1
+    return best
+
+
+def _encode_to_target(
+    img: Image.Image,
+    target_size: int,
+    quality: int,
+    img_format: str = 'JPEG',
+    min_quality: int = MIN_QUALITY
+) -> bytes:
+    """
+    按目标大小编码已解码的图片
+    质量在缩小的探测图上二分查找，按完整编码与探测编码的大小比例换算成预计大小，
+    只对选中的质量做完整编码；最低质量仍然超出时，按预计大小估算缩放比例。
+    通常 1~4 次完整编码即可命中目标大小
+    """
+    # 如果已经小于目标大小，直接返回
+    img_bytes = _encode(img, img_format, quality)
     if len(img_bytes) <= target_size:
-        return img_bytes, img_format
-    
-    # 逐步降低质量直到满足大小要求
-    while len(img_bytes) > target_size and quality > 10:
-        quality -= 5
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format=img_format, quality=quality)
-        img_bytes = img_byte_arr.getvalue()
-    
-    # 如果质量已经降到10%还是太大，就调整尺寸
-    if len(img_bytes) > target_size:
-        # 计算缩放比例
-        scale = (target_size / len(img_bytes)) ** 0.5
-        new_width = int(img.width * scale)
-        new_height = int(img.height * scale)
-        
+        return img_bytes
+
+    estimated = len(img_bytes)
+    if img_format.upper() in QUALITY_FORMATS and quality > min_quality:
+        probe = img
+        if min(img.size) >= PROBE_FACTOR * 64:
+            probe = img.reduce(PROBE_FACTOR)
+        probe_sizes = {quality: len(_encode(probe, img_format, quality))}
+        ratio = len(img_bytes) / probe_sizes[quality]
+        high = quality - 1
+
+        # 换算比例随质量略有变化，首次预计偏小时按实测大小校准后再搜索一次
+        for _ in range(2):
+            found = _search_quality(probe, img_format, probe_sizes, min_quality, high, target_size * SIZE_MARGIN / ratio)
+            if found is None:
+                break
+            img_bytes = _encode(img, img_format, found)
+            if len(img_bytes) <= target_size:
+                return img_bytes
+            ratio = len(img_bytes) / probe_sizes[found]
+            high = found - 1
+
+        # 最低质量仍然太大，就调整尺寸
+        quality = min_quality
+        if quality not in probe_sizes:
+            probe_sizes[quality] = len(_encode(probe, img_format, quality))
+        estimated = probe_sizes[quality] * ratio
+
+    # 编码大小近似与像素数成正比，按面积估算缩放比例；缩小后细节密度变高，超出时继续缩小
+    while True:
+        scale = min(math.sqrt(target_size * SIZE_MARGIN / estimated), SIZE_MARGIN)
+        new_width = max(1, int(img.width * scale))
+        new_height = max(1, int(img.height * scale))
         img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format=img_format, quality=quality)
-        img_bytes = img_byte_arr.getvalue()
+        img_bytes = _encode(img, img_format, quality)
+        if len(img_bytes) <= target_size or min(img.size) <= 16:
+            return img_bytes
+        estimated = len(img_bytes)
+
+
+def _encode_thumbnail(img: Image.Image, size: Tuple[int, int]) -> bytes:
+    # 保持宽高比缩小，resize 直接生成新图，不复制原图
+    if img.width > size[0] or img.height > size[1]:
+        img = ImageOps.contain(img, size, Image.Resampling.LANCZOS)
     
-    return img_bytes, img_format
+    # 保存为JPEG
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format='JPEG', quality=70)
+    return img_byte_arr.getvalue()
+
+
+def _dhash(img: Image.Image, hash_size: int) -> int:
+    # 先缩小再转灰度，避免对完整尺寸做颜色转换
+    small = img.resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR, reducing_gap=2.0).convert('L')
+    pixels = small.tobytes()
+
+    value = 0
+    row_width = hash_size + 1
+    for row in range(hash_size):
+        offset = row * row_width
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def compress_image(
+    image_data: bytes,
+    target_size: int = 1024 * 1024,
+    quality: int = 85,
+    max_edge: int = MAX_DECODE_EDGE
+) -> Tuple[bytes, str]:
+    """
+    压缩图片，目标大小默认1MB
+    :param image_data: 原始图片数据
+    :param target_size: 目标大小（字节）
+    :param quality: 初始质量
+    :param max_edge: 最长边上限
+    :return: (压缩后的图片数据, 图片格式)
+    """
+    img, img_format = _decode(io.BytesIO(image_data), max_edge)
+    img_format = img_format or 'JPEG'
+    return _encode_to_target(img, target_size, quality, img_format), img_format
 
 
-def generate_thumbnail(image_data: bytes, size: Tuple[int, int] = (100, 100)) -> str:
+def generate_thumbnail(image_data: bytes, size: Tuple[int, int] = (100, 100)) -> bytes:
     """
-    生成缩略图并转换为base64编码
+    生成JPEG缩略图
     :param image_data: 原始图片数据
     :param size: 缩略图尺寸
-    :return: base64编码的缩略图
+    :return: 缩略图数据
     """
     img = Image.open(io.BytesIO(image_data))
+    img.draft('RGB', size)
+    return _encode_thumbnail(_to_rgb(img), size)
+
+
+def compute_dhash(image_data: bytes, hash_size: int = 8) -> int:
+    """
+    计算图片的差异哈希（dHash），用于识别缩放、重新压缩后的近似重复图片
+    :param image_data: 图片数据
+    :param hash_size: 哈希边长，结果为 hash_size * hash_size 位
+    :return: 无符号整数形式的哈希值
+    """
+    img = Image.open(io.BytesIO(image_data))
+    # JPEG 可以在解码时直接缩小，避免解码完整尺寸
+    img.draft('RGB', (hash_size + 1, hash_size))
+    return _dhash(_to_rgb(img), hash_size)
+
+
+def process_image(
+    source: Union[bytes, BinaryIO],
+    target_size: int = 1024 * 1024,
+    quality: int = 85,
+    max_edge: int = MAX_DECODE_EDGE,
+    thumbnail_size: Tuple[int, int] = (100, 100)
+) -> ProcessedImage:
+    """
+    只解码一次，从同一帧派生压缩图、缩略图和感知哈希
+    :param source: 图片数据或文件对象（如上传的临时文件），文件对象不会被整体读入内存
+    :param target_size: 压缩图目标大小（字节）
+    :param quality: 初始质量
+    :param max_edge: 最长边上限
+    :param thumbnail_size: 缩略图尺寸
+    :return: 处理结果
+    """
+    started = time.perf_counter()
+    img, _ = _decode(io.BytesIO(source) if isinstance(source, bytes) else source, max_edge)
+
+    # 解码时从文件对象读取上传内容，读取耗时计入 decode
+    decoded = time.perf_counter()
+    content = _encode_to_target(img, target_size, quality)
+    compressed = time.perf_counter()
+    thumbnail = _encode_thumbnail(img, thumbnail_size)
+    thumbnailed = time.perf_counter()
+    phash = _dhash(img, 8)
+    timings = {
+        'decode': decoded - started,
+        'compress': compressed - decoded,
+        'thumbnail': thumbnailed - compressed,
+        'phash': time.perf_counter() - thumbnailed,
+    }
     
-    # 确保图片是RGB格式，JPEG不支持RGBA
-    if img.mode == 'RGBA':
-        # 将RGBA转换为RGB，使用白色作为背景
-        img_rgb = Image.new('RGB', img.size, (255, 255, 255))
-        img_rgb.paste(img, mask=img.split()[3])  # 使用alpha通道作为遮罩
-        img = img_rgb
-    elif img.mode != 'RGB':
-        img = img.convert('RGB')
-    
-    # 生成缩略图，保持宽高比
-    img.thumbnail(size, Image.Resampling.LANCZOS)
-    
-    # 保存为JPEG
-    img_byte_arr = io.BytesIO()
-    img.save(img_byte_arr, format='JPEG', quality=70)
-    img_bytes = img_byte_arr.getvalue()
-    
-    # 转换为base64
-    base64_thumbnail = base64.b64encode(img_bytes).decode('utf-8')
-    
-    return f"data:image/jpeg;base64,{base64_thumbnail}"
+    return ProcessedImage(
+        content=content,
+        thumbnail=thumbnail,
+        phash=phash,
+        width=img.width,
+        height=img.height,
+        timings=timings
+    )
+
+
+@dataclass(frozen=True)
+class ImageProfile:
+    """
+    模型服务商的图片预处理配置，尽量让发送的像素与模型实际使用的一致
+    各服务商会在服务端把图片缩放到自己的尺寸上限，多出的像素只会增加上传量和 token
+    """
+    name: str
+    max_edge: int  # 最长边上限
+    short_edge: int = 0  # 最短边上限，0 表示不限制
+    max_pixels: int = 0  # 总像素上限，0 表示不限制
+    tile_size: int = 0  # 按图块计费时的图块边长，尺寸会对齐到图块边界
+    img_format: str = 'JPEG'
+    quality: int = 85
+    target_size: int = 512 * 1024
+    # token 估算：base_tokens + tokens_per_tile * 图块数 + 像素数 / pixels_per_token
+    base_tokens: int = 0
+    tokens_per_tile: int = 0
+    pixels_per_token: int = 0
+
+    @property
+    def media_type(self) -> str:
+        return f"image/{self.img_format.lower()}"
+
+
+IMAGE_PROFILES: Dict[str, ImageProfile] = {
+    # GPT 视觉模型（high detail）：先缩放到 2048 以内，再把最短边缩到 768，按 512 图块计费
+    "openai": ImageProfile(
+        name="openai", max_edge=2048, short_edge=768, tile_size=512,
+        base_tokens=85, tokens_per_tile=170
+    ),
+    # Claude：最长边超过 1568 或超过约 115 万像素时服务端会缩小，token 约为 宽×高/750
+    "claude": ImageProfile(
+        name="claude", max_edge=1568, max_pixels=1_150_000,
+        pixels_per_token=750
+    ),
+    # DeepSeek-VL：高分辨率分支输入固定为 1024×1024，每张图固定 576 个视觉 token
+    "deepseek": ImageProfile(
+        name="deepseek", max_edge=1024, target_size=384 * 1024,
+        base_tokens=576
+    ),
+}
+
+# 图块对齐时，溢出部分不超过图块边长的该比例才缩小去掉这一列/行图块
+TILE_SLACK = 0.15
+
+
+def get_image_profile(model: str) -> Optional[ImageProfile]:
+    return IMAGE_PROFILES.get(model)
+
+
+def fit_to_profile(width: int, height: int, profile: ImageProfile) -> Tuple[int, int]:
+    """
+    计算按配置缩放后的尺寸，只缩小不放大
+    :return: (宽, 高)
+    """
+    scale = 1.0
+    if profile.max_edge:
+        scale = min(scale, profile.max_edge / max(width, height))
+    if profile.short_edge:
+        scale = min(scale, profile.short_edge / min(width, height))
+    if profile.max_pixels:
+        scale = min(scale, math.sqrt(profile.max_pixels / (width * height)))
+    width, height = max(1, int(width * scale)), max(1, int(height * scale))
+
+    # 刚好超出图块边界几个像素时会多算一整列/行图块，略微缩小对齐到边界
+    if profile.tile_size:
+        tile = profile.tile_size
+        candidates = [
+            (edge - edge % tile) / edge
+            for edge in (width, height)
+            if edge > tile and 0 < edge % tile <= tile * TILE_SLACK
+        ]
+        if candidates:
+            scale = min(candidates)
+            width, height = max(1, int(width * scale)), max(1, int(height * scale))
+    return width, height
+
+
+def estimate_image_tokens(width: int, height: int, profile: ImageProfile) -> int:
+    """按配置的计费方式估算图片占用的输入 token"""
+    tokens = profile.base_tokens
+    if profile.tokens_per_tile:
+        tiles = math.ceil(width / profile.tile_size) * math.ceil(height / profile.tile_size)
+        tokens += profile.tokens_per_tile * tiles
+    if profile.pixels_per_token:
+        tokens += math.ceil(width * height / profile.pixels_per_token)
+    return tokens
+
+
+def prepare_for_profile(image_data: bytes, profile: ImageProfile) -> bytes:
+    """
+    把压缩后的图片转换为服务商配置要求的尺寸和格式
+    :param image_data: 压缩后的图片数据
+    :param profile: 服务商配置
+    :return: 发送给模型的图片数据，已满足要求时原样返回
+    """
+    img = Image.open(io.BytesIO(image_data))
+    size = fit_to_profile(img.width, img.height, profile)
+    if size == img.size and img.format == profile.img_format and len(image_data) <= profile.target_size:
+        return image_data
+
+    img.draft('RGB', size)
+    img = _to_rgb(img)
+    if img.size != size:
+        img = img.resize(size, Image.Resampling.LANCZOS)
+    return _encode_to_target(img, profile.target_size, profile.quality, profile.img_format)
+
+
+def encode_data_uri(image_data: bytes, media_type: str = "image/jpeg") -> str:
+    """把图片数据编码为 data URI"""
+    return f"data:{media_type};base64,{base64.b64encode(image_data).decode()}"
+
+
+def decode_data_uri(data_uri: str) -> bytes:
+    """
+    解码 data:image/...;base64,... 格式的字符串
+    :param data_uri: data URI 字符串
+    :return: 图片数据
+    """
+    _, _, encoded = data_uri.partition(',')
+    return base64.b64decode(encoded or data_uri)
 
 
 def get_image_metadata(image_data: bytes) -> Optional[dict]:
@@ -0,0 +1,298 @@
+"""
+本地的图片技术质量分析
+
+在缩小到 ANALYSIS_EDGE 的灰度帧上用 NumPy 向量化计算，单张图片耗时在几十毫秒以内：
+- 清晰度：拉普拉斯算子响应的方差，失焦和抖动的图片边缘响应弱；
+  按分块计算后取最清晰的部分，浅景深虚化的背景不算模糊，亮度先归一化，暗图不会被误判为模糊
+- 曝光：亮度均值、对比度，以及直方图两端被截断（死黑、过曝）的像素比例
+- 噪声：Immerkær 噪声估计，用中位数代替均值，边缘和纹理作为离群值不影响结果
+- 水平倾斜：强边缘中接近水平的线条的主方向
+- 三分法：按梯度能量估计视觉重心，计算其与最近的三分点的距离
+
+结果作为客观依据写入模型的 prompt，也可以直接作为技术维度的评分。
+"""
+import io
+import math
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# 分析用的帧最长边
+ANALYSIS_EDGE = 512
+
+# 清晰度（拉普拉斯方差）在对数刻度上映射到 0-1 的区间
+SHARPNESS_LOW = 20.0
+SHARPNESS_HIGH = 400.0
+# 清晰度取分块拉普拉斯方差的该百分位
+SHARPNESS_PERCENTILE = 90
+# 计算清晰度前把亮度标准差归一化到该值
+NORMALIZED_CONTRAST = 50.0
+# 噪声标准差（0-255 灰度，分析尺寸下）在该区间内线性扣分
+NOISE_LOW = 1.5
+NOISE_HIGH = 5.0
+# 灰度不超过 / 不低于该值视为死黑 / 过曝
+SHADOW_LEVEL = 5
+HIGHLIGHT_LEVEL = 250
+# 截断像素比例低于该值不扣分
+CLIPPING_TOLERANCE = 0.01
+# 亮度均值偏离中间调超过该值才扣分
+BRIGHTNESS_TOLERANCE = 50.0
+# 只检测该角度以内的倾斜，更大的角度通常是有意的斜构图
+MAX_TILT_DEGREES = 15.0
+# 小于该角度的倾斜不提示
+MIN_TILT_DEGREES = 1.0
+# 最短边小于该值时视为尺寸过小
+MIN_SHORT_EDGE = 480
+# 清晰度和视觉重心计算的分块边长
+BLOCK_SIZE = 16
+
+# 三分点，以及画面内任意一点到最近三分点的最大距离（角落到最近三分点）
+THIRDS_POINTS = np.array([(x, y) for x in (1 / 3, 2 / 3) for y in (1 / 3, 2 / 3)])
+MAX_THIRDS_DISTANCE = math.hypot(1 / 3, 1 / 3)
+
+
+@dataclass
+class QualityReport:
+    """图片技术质量的分析结果"""
+    width: int  # 原图尺寸
+    height: int
+    sharpness: float  # 拉普拉斯方差，越大越清晰
+    brightness: float  # 亮度均值 0-255
+    contrast: float  # 亮度标准差
+    shadows_clipped: float  # 死黑像素比例
+    highlights_clipped: float  # 过曝像素比例
+    noise: float  # 噪声标准差估计
+    tilt: Optional[float]  # 水平线倾斜角度（度），没有明显的水平线时为 None
+    subject_position: Tuple[float, float]  # 视觉重心的相对位置 (x, y)
+    thirds: float  # 视觉重心靠近三分点的程度 0-1
+    technical_score: int  # 综合的技术评分 0-100
+    issues: List[str] = field(default_factory=list)  # 发现的问题
+
+    def describe(self) -> str:
+        """供 prompt 使用的测量结果说明"""
+        lines = [
+            f"- 尺寸：{self.width}x{self.height}",
+            f"- 清晰度（拉普拉斯方差）：{self.sharpness:.0f}（低于 {SHARPNESS_LOW:.0f} 通常失焦或抖动，高于 {SHARPNESS_HIGH:.0f} 清晰）",
+            f"- 亮度均值：{self.brightness:.0f}/255，对比度（标准差）：{self.contrast:.0f}",
+            f"- 死黑像素：{self.shadows_clipped:.1%}，过曝像素：{self.highlights_clipped:.1%}",
+            f"- 噪声估计：{self.noise:.1f}",
+        ]
+        if self.tilt is not None:
+            lines.append(f"- 水平线倾斜：约 {abs(self.tilt):.1f}°")
+        x, y = self.subject_position
+        lines.append(f"- 视觉重心位置：水平 {x:.0%}、垂直 {y:.0%}，接近三分点程度 {self.thirds:.2f}（0-1）")
+        lines.append(f"- 本地技术评分：{self.technical_score}")
+        if self.issues:
+            lines.append(f"- 发现的问题：{'；'.join(self.issues)}")
+        return "\n".join(lines)
+
+
+def _grayscale(img: Image.Image) -> np.ndarray:
+    """缩小到 ANALYSIS_EDGE 的灰度帧，float32"""
+    gray = img.convert("L")
+    if max(gray.size) > ANALYSIS_EDGE:
+        gray.thumbnail((ANALYSIS_EDGE, ANALYSIS_EDGE), Image.Resampling.BILINEAR)
+    return np.asarray(gray, dtype=np.float32)
+
+
+def _laplacian(gray: np.ndarray) -> np.ndarray:
+    return (
+        gray[1:-1, :-2] + gray[1:-1, 2:] + gray[:-2, 1:-1] + gray[2:, 1:-1]
+        - 4 * gray[1:-1, 1:-1]
+    )
+
+
+def _block_reduce(values: np.ndarray, func) -> Optional[np.ndarray]:
+    """按 BLOCK_SIZE 分块，对每块在块内两个轴上执行 func（如 mean、var）"""
+    rows = values.shape[0] // BLOCK_SIZE
+    cols = values.shape[1] // BLOCK_SIZE
+    if rows < 2 or cols < 2:
+        return None
+    blocks = values[:rows * BLOCK_SIZE, :cols * BLOCK_SIZE].reshape(rows, BLOCK_SIZE, cols, BLOCK_SIZE)
+    return func(blocks, axis=(1, 3))
+
+
+def _sharpness(gray: np.ndarray, contrast: float) -> float:
+    """亮度归一化后的分块拉普拉斯方差，取最清晰部分的百分位"""
+    if contrast > 1:
+        gray = (gray - gray.mean()) * (NORMALIZED_CONTRAST / contrast)
+    laplacian = _laplacian(gray)
+    variances = _block_reduce(laplacian, np.var)
+    if variances is None:
+        return float(laplacian.var())
+    return float(np.percentile(variances, SHARPNESS_PERCENTILE))
+
+
+def _gradients(gray: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sobel 梯度，方向比简单差分准确；与 _laplacian 的输出对齐（去掉一圈边界）"""
+    gx = (
+        gray[:-2, 2:] + 2 * gray[1:-1, 2:] + gray[2:, 2:]
+        - gray[:-2, :-2] - 2 * gray[1:-1, :-2] - gray[2:, :-2]
+    )
+    gy = (
+        gray[2:, :-2] + 2 * gray[2:, 1:-1] + gray[2:, 2:]
+        - gray[:-2, :-2] - 2 * gray[:-2, 1:-1] - gray[:-2, 2:]
+    )
+    return gx, gy
+
+
+def _noise_sigma(gray: np.ndarray) -> float:
+    """
+    Immerkær 噪声估计
+    该卷积核对平滑的亮度变化响应为 0，对标准差为 σ 的白噪声响应的标准差为 6σ；
+    高斯分布的绝对值中位数为 0.6745 倍标准差
+    """
+    conv = (
+        gray[:-2, :-2] - 2 * gray[:-2, 1:-1] + gray[:-2, 2:]
+        - 2 * gray[1:-1, :-2] + 4 * gray[1:-1, 1:-1] - 2 * gray[1:-1, 2:]
+        + gray[2:, :-2] - 2 * gray[2:, 1:-1] + gray[2:, 2:]
+    )
+    return float(np.median(np.abs(conv)) / 0.6745 / 6)
+
+
+def _tilt(gx: np.ndarray, gy: np.ndarray, magnitude: np.ndarray) -> Optional[float]:
+    """
+    估计接近水平的线条的倾斜角度
+    水平线的梯度方向接近竖直，线条角度为 atan(-gx / gy)；只统计最强的边缘，
+    接近水平的边缘要占足够比例且方向集中，才认为存在一条主水平线
+    """
+    threshold = max(float(np.percentile(magnitude, 95)), 80.0)
+    strong = (magnitude >= threshold) & (np.abs(gy) > np.abs(gx))
+    if strong.sum() < 50:
+        return None
+    angles = np.degrees(np.arctan(-gx[strong] / gy[strong]))
+    weights = magnitude[strong]
+    near = np.abs(angles) <= MAX_TILT_DEGREES
+    if weights[near].sum() < 0.3 * weights.sum():
+        return None
+
+    histogram, edges = np.histogram(
+        angles[near], bins=int(MAX_TILT_DEGREES * 4), range=(-MAX_TILT_DEGREES, MAX_TILT_DEGREES), weights=weights[near]
+    )
+    # 相邻三格平滑后取峰值，峰值附近的权重不足时方向太分散
+    smoothed = np.convolve(histogram, np.ones(3), mode="same")
+    peak = int(np.argmax(smoothed))
+    if smoothed[peak] < 0.25 * histogram.sum():
+        return None
+    window = (angles[near] >= edges[max(peak - 1, 0)]) & (angles[near] <= edges[min(peak + 2, len(edges) - 1)])
+    return float(np.average(angles[near][window], weights=weights[near][window]))
+
+
+def _subject_position(magnitude: np.ndarray) -> Tuple[float, float]:
+    """按分块梯度能量高于平均的部分计算视觉重心，返回相对坐标"""
+    blocks = _block_reduce(magnitude, np.mean)
+    if blocks is None:
+        return 0.5, 0.5
+    rows, cols = blocks.shape
+    weights = np.clip(blocks - blocks.mean(), 0, None)
+    total = weights.sum()
+    if total <= 0:
+        return 0.5, 0.5
+    ys, xs = np.mgrid[0:rows, 0:cols]
+    x = float(((xs + 0.5) * weights).sum() / total / cols)
+    y = float(((ys + 0.5) * weights).sum() / total / rows)
+    return x, y
+
+
+def _score(
+    sharpness: float,
+    brightness: float,
+    clipped: float,
+    noise: float,
+    short_edge: int,
+    tilt: Optional[float]
+) -> int:
+    sharp_part = np.clip(
+        (math.log10(max(sharpness, 1e-6)) - math.log10(SHARPNESS_LOW))
+        / (math.log10(SHARPNESS_HIGH) - math.log10(SHARPNESS_LOW)),
+        0, 1
+    )
+    clip_penalty = np.clip((clipped - CLIPPING_TOLERANCE) / 0.2, 0, 1)
+    brightness_penalty = np.clip((abs(brightness - 128) - BRIGHTNESS_TOLERANCE) / 60, 0, 1)
+    exposure_part = np.clip(1 - clip_penalty - brightness_penalty, 0, 1)
+    noise_part = 1 - np.clip((noise - NOISE_LOW) / (NOISE_HIGH - NOISE_LOW), 0, 1)
+
+    # 曝光问题按比例压低总分，严重过曝或欠曝的图片即使清晰也不会得高分
+    score = 100 * (0.55 * sharp_part + 0.25 * noise_part + 0.2) * (0.5 + 0.5 * exposure_part)
+    if short_edge < MIN_SHORT_EDGE:
+        score -= 15
+    if tilt is not None and abs(tilt) >= MIN_TILT_DEGREES:
+        score -= min(10, 2 * abs(tilt))
+    return int(round(np.clip(score, 0, 100)))
+
+
+def analyze_quality(img: Image.Image, size: Optional[Tuple[int, int]] = None) -> QualityReport:
+    """
+    分析图片的技术质量
+    :param img: 已解码的图片
+    :param size: 原图尺寸，img 是缩小后的帧时传入
+    :return: 分析结果
+    """
+    width, height = size or img.size
+    gray = _grayscale(img)
+
+    histogram = np.bincount(gray.astype(np.uint8).ravel(), minlength=256)
+    pixels = histogram.sum()
+    shadows_clipped = float(histogram[:SHADOW_LEVEL + 1].sum() / pixels)
+    highlights_clipped = float(histogram[HIGHLIGHT_LEVEL:].sum() / pixels)
+    brightness = float(gray.mean())
+    contrast = float(gray.std())
+
+    if min(gray.shape) < 3:
+        sharpness, noise, tilt, position = 0.0, 0.0, None, (0.5, 0.5)
+    else:
+        sharpness = _sharpness(gray, contrast)
+        gx, gy = _gradients(gray)
+        magnitude = np.hypot(gx, gy)
+        noise = _noise_sigma(gray)
+        tilt = _tilt(gx, gy, magnitude)
+        position = _subject_position(magnitude)
+
+    distance = float(np.min(np.hypot(*(THIRDS_POINTS - np.array(position)).T)))
+    thirds = float(np.clip(1 - distance / MAX_THIRDS_DISTANCE, 0, 1))
+
+    issues = []
+    if sharpness < SHARPNESS_LOW:
+        issues.append("画面模糊，可能失焦或手抖")
+    if highlights_clipped > 0.05 or brightness > 128 + BRIGHTNESS_TOLERANCE:
+        issues.append("曝光过度，高光细节丢失")
+    if shadows_clipped > 0.05 or brightness < 128 - BRIGHTNESS_TOLERANCE:
+        issues.append("曝光不足，暗部细节丢失")
+    if contrast < 25:
+        issues.append("对比度偏低，画面发灰")
+    if noise > NOISE_HIGH:
+        issues.append("噪点明显")
+    if tilt is not None and abs(tilt) >= MIN_TILT_DEGREES:
+        issues.append(f"水平线倾斜约 {abs(tilt):.1f}°")
+    if min(width, height) < MIN_SHORT_EDGE:
+        issues.append("图片尺寸过小")
+
+    return QualityReport(
+        width=width,
+        height=height,
+        sharpness=round(sharpness, 1),
+        brightness=round(brightness, 1),
+        contrast=round(contrast, 1),
+        shadows_clipped=round(shadows_clipped, 4),
+        highlights_clipped=round(highlights_clipped, 4),
+        noise=round(noise, 2),
+        tilt=round(tilt, 1) if tilt is not None else None,
+        subject_position=(round(position[0], 3), round(position[1], 3)),
+        thirds=round(thirds, 3),
+        technical_score=_score(sharpness, brightness, shadows_clipped + highlights_clipped, noise, min(width, height), tilt),
+        issues=issues,
+    )
+
+
+def assess_image_quality(image_data: bytes) -> QualityReport:
+    """
+    从图片数据分析技术质量，JPEG 在解码时直接缩小到分析尺寸
+    :param image_data: 图片数据
+    :return: 分析结果
+    """
+    img = Image.open(io.BytesIO(image_data))
+    size = img.size
+    img.draft("L", (ANALYSIS_EDGE, ANALYSIS_EDGE))
+    return analyze_quality(img, size)
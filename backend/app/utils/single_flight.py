@@ -0,0 +1,55 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class _Flight(Generic[T]):
+    """一次进行中的执行及等待它的调用方数量"""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[T]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight(Generic[T]):
+    """
+    合并并发的相同调用：同一个 key 同时只执行一次，其余调用方等待同一个结果
+    - 执行在独立的任务中进行，发起执行的调用方被取消时，其余调用方继续等待，不受影响
+    - 所有调用方都放弃等待后才取消执行
+    - 结果和异常都传给所有调用方；执行结束后立即移除 key，之后的调用重新执行
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight[T]] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def _forget(self, key: Hashable, flight: _Flight[T]) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        :param func: 没有进行中的执行时调用，返回要执行的协程
+        :return: (结果, 是否复用了其他调用方发起的执行)
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        flight.waiters += 1
+        try:
+            # shield 使本调用方被取消时不连带取消共享的执行
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # 没有调用方在等待，取消执行；立即移除 key，之后的调用不会加入正在取消的执行
+                self._forget(key, flight)
+                flight.task.cancel()
@@ -0,0 +1,363 @@
+import json
+import re
+from typing import Annotated, Any, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, ValidationError
+
+# 评分结果中逐条推送的字段
+SCORE_KEYS = ("technical", "composition", "aesthetic", "narrative")
+ANALYSIS_KEYS = ("highlights", "improvements", "suggestions")
+
+_NUMBER_CHARS = set("+-0123456789.eE")
+_WHITESPACE = set(" \t\r\n")
+# 模型输出的字符串里偶尔带有未转义的换行，按宽松模式解析
+_DECODER = json.JSONDecoder(strict=False)
+
+# 括号配对扫描只关心字符串和花括号：完整的字符串整体跳过，其中的括号不计入；单独的引号表示字符串未闭合
+_JSON_TOKENS = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}"]', re.S)
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+# 文本中括号不配对时最多尝试的起点数，避免病态输入退化为平方复杂度
+_MAX_CANDIDATES = 8
+
+
+class IncrementalJSONParser:
+    """
+    增量 JSON 解析器
+    模型的输出按任意长度的文本片段到达，feed 每次接收一段，返回其中新完成的标量值 [(路径, 值)]，
+    路径为从根对象开始的键和数组下标，例如 ("scores", "technical")、("analysis", "highlights", 0)。
+    第一个 { 之前的内容（如 ```json 代码块标记、说明文字）被忽略，根对象结束后的内容也被忽略；
+    只做流式提取，不校验整体结构，完整文本仍由 parse_analysis 解析。
+    """
+
+    def __init__(self):
+        self.started = False
+        self.done = False
+        # 容器栈：[类型, 当前键或下标]
+        self._stack: List[list] = []
+        self._expect_key = False
+        self._token: Optional[str] = None  # string / number / literal
+        self._buffer: List[str] = []
+        self._escape = False
+        self._text: List[str] = []
+
+    @property
+    def text(self) -> str:
+        """从根对象开始到目前为止收到的原文"""
+        return "".join(self._text)
+
+    def _path(self) -> Tuple[Any, ...]:
+        return tuple(frame[1] for frame in self._stack)
+
+    def _value_done(self, value: Any, events: List[Tuple[Tuple[Any, ...], Any]]) -> None:
+        if self._expect_key:
+            # 对象的键
+            self._stack[-1][1] = value
+            return
+        events.append((self._path(), value))
+
+    def _finish_scalar(self, events: List[Tuple[Tuple[Any, ...], Any]]) -> None:
+        raw = "".join(self._buffer)
+        self._buffer = []
+        token, self._token = self._token, None
+        try:
+            value = _DECODER.decode(f'"{raw}"' if token == "string" else raw)
+        except json.JSONDecodeError:
+            return
+        self._value_done(value, events)
+
+    def feed(self, chunk: str) -> List[Tuple[Tuple[Any, ...], Any]]:
+        events: List[Tuple[Tuple[Any, ...], Any]] = []
+        for char in chunk:
+            if self.done:
+                break
+            if not self.started:
+                if char != "{":
+                    continue
+                self.started = True
+            self._text.append(char)
+
+            if self._token == "string":
+                if self._escape:
+                    self._escape = False
+                    self._buffer.append(char)
+                elif char == "\\":
+                    self._escape = True
+                    self._buffer.append(char)
+                elif char == '"':
+                    self._finish_scalar(events)
+                else:
+                    self._buffer.append(char)
+                continue
+
+            if self._token is not None:
+                if char in _NUMBER_CHARS or char.isalpha():
+                    self._buffer.append(char)
+                    continue
+                self._finish_scalar(events)
+
+            if char in _WHITESPACE:
+                continue
+            if char == '"':
+                self._token = "string"
+            elif char == "{":
+                self._stack.append(["object", None])
+                self._expect_key = True
+            elif char == "[":
+                self._stack.append(["array", 0])
+                self._expect_key = False
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if not self._stack:
+                    self.done = True
+                self._expect_key = False
+            elif char == ":":
+                self._expect_key = False
+            elif char == ",":
+                if self._stack and self._stack[-1][0] == "array":
+                    self._stack[-1][1] += 1
+                else:
+                    self._expect_key = True
+            elif char in _NUMBER_CHARS or char.isalpha():
+                self._token = "number" if char in _NUMBER_CHARS else "literal"
+                self._buffer.append(char)
+        return events
+
+
+class AnalysisStreamParser:
+    """
+    从模型的流式输出中提取评分和每条点评
+    每个维度的评分、highlights/improvements/suggestions 中的每一条在完整到达后立即产出事件
+    """
+
+    def __init__(self):
+        self.parser = IncrementalJSONParser()
+
+    @property
+    def text(self) -> str:
+        return self.parser.text
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        events = []
+        for path, value in self.parser.feed(chunk):
+            if len(path) == 2 and path[0] == "scores" and path[1] in SCORE_KEYS and isinstance(value, (int, float)):
+                events.append({"type": "score", "dimension": path[1], "value": int(value)})
+            elif len(path) == 3 and path[0] == "analysis" and path[1] in ANALYSIS_KEYS and isinstance(value, str):
+                events.append({"type": "item", "category": path[1], "index": path[2], "text": value})
+        return events
+
+
+def extract_partial(content: str) -> Dict[str, Dict[str, Any]]:
+    """
+    从可能被截断或格式错误的输出中取出已经完整的评分和点评
+    :return: {"scores": {维度: 分数}, "analysis": {类别: [点评]}}，只包含实际出现的字段
+    """
+    scores: Dict[str, Any] = {}
+    analysis: Dict[str, List[str]] = {}
+    for event in AnalysisStreamParser().feed(content):
+        if event["type"] == "score":
+            scores[event["dimension"]] = event["value"]
+        else:
+            analysis.setdefault(event["category"], []).append(event["text"])
+    return {"scores": scores, "analysis": analysis}
+
+
+class AnalysisParseError(ValueError):
+    """模型输出中没有符合格式的分析结果"""
+
+
+def _object_end(text: str, start: int) -> Optional[int]:
+    """
+    从 start 处的 { 开始按括号配对找到对象的结束位置
+    只用一个正则顺序扫描字符串和花括号，不会像贪婪的 \\{.*\\} 那样回溯
+    :return: 对象结束后的下标；括号不配对时为 None，字符串未闭合（输出被截断）时为 -1
+    """
+    depth = 0
+    for match in _JSON_TOKENS.finditer(text, start):
+        token = match.group()
+        if token == "{":
+            depth += 1
+        elif token == "}":
+            depth -= 1
+            if depth == 0:
+                return match.end()
+        elif token == '"':
+            return -1
+    return None
+
+
+def iter_json_objects(text: str) -> Iterator[Any]:
+    """
+    依次解析文本中的顶层 JSON 对象
+    对象前后的说明文字、代码块标记都被跳过；合法的对象直接由 C 实现的解码器识别边界，
+    解码失败时按括号配对找到对象的范围，修正常见的格式错误后再解码
+    """
+    start = text.find("{")
+    attempts = 0
+    while start != -1 and attempts < _MAX_CANDIDATES:
+        attempts += 1
+        try:
+            value, end = _DECODER.raw_decode(text, start)
+        except json.JSONDecodeError:
+            end = _object_end(text, start)
+            if end == -1:
+                return
+            if end is None:
+                # 括号不配对，可能是说明文字里单独的 {，从下一个 { 重新开始
+                start = text.find("{", start + 1)
+                continue
+            try:
+                value = _DECODER.decode(_TRAILING_COMMA.sub(r"\1", text[start:end]))
+            except json.JSONDecodeError:
+                start = text.find("{", end)
+                continue
+        yield value
+        start = text.find("{", end)
+
+
+def _to_score(value: Any) -> Any:
+    """评分偶尔带有单位，如 "85分" """
+    if isinstance(value, str):
+        return value.strip().rstrip("分").strip()
+    return value
+
+
+def _round_score(value: float) -> int:
+    """评分可能是小数，四舍五入为 0-100 的整数"""
+    return min(100, max(0, int(round(value))))
+
+
+def _to_items(value: Any) -> Any:
+    """点评可能是单个字符串、JSON 字符串或非字符串元素，统一为字符串列表"""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        decoded = next(iter_json_objects(f'{{"v": {value}}}'), None) if value.lstrip().startswith("[") else None
+        value = decoded["v"] if decoded else [value]
+    if isinstance(value, list):
+        return [item if isinstance(item, str) else json.dumps(item, ensure_ascii=False) for item in value if item is not None]
+    return value
+
+
+def _to_analysis(value: Any) -> Any:
+    """analysis 偶尔被输出为 JSON 字符串"""
+    if isinstance(value, str):
+        return next(iter_json_objects(value), {})
+    return {} if value is None else value
+
+
+Score = Annotated[float, BeforeValidator(_to_score)]
+Items = Annotated[List[str], BeforeValidator(_to_items)]
+
+
+# 格式规范的输出由不含 Python 校验函数的模型一次校验完成，失败时再用宽松的模型修正
+class _Scores(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    # 技术分由本地测量给出时模型不输出；小数和数字字符串按宽松模式接受
+    technical: Optional[float] = None
+    composition: float
+    aesthetic: float
+    narrative: float
+
+
+class _Analysis(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    highlights: List[str] = Field(default_factory=list)
+    improvements: List[str] = Field(default_factory=list)
+    suggestions: List[str] = Field(default_factory=list)
+
+
+class _AnalysisOutput(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    scores: _Scores
+    analysis: _Analysis = Field(default_factory=_Analysis)
+
+
+class _LenientScores(_Scores):
+    technical: Optional[Score] = None
+    composition: Score
+    aesthetic: Score
+    narrative: Score
+
+
+class _LenientAnalysis(_Analysis):
+    highlights: Items = Field(default_factory=list)
+    improvements: Items = Field(default_factory=list)
+    suggestions: Items = Field(default_factory=list)
+
+
+class _LenientAnalysisOutput(_AnalysisOutput):
+    scores: _LenientScores
+    analysis: Annotated[_LenientAnalysis, BeforeValidator(_to_analysis)] = Field(default_factory=_LenientAnalysis)
+
+
+def _parse_output(content: str) -> _AnalysisOutput:
+    # 快速路径：文本中只有一个对象（可带代码块标记和说明文字）时，由 pydantic 直接解析并校验
+    start, end = content.find("{"), content.rfind("}")
+    if start != -1 and end > start:
+        try:
+            return _AnalysisOutput.model_validate_json(content[start:end + 1])
+        except ValidationError:
+            pass
+
+    error = None
+    for data in iter_json_objects(content):
+        if not isinstance(data, dict) or "scores" not in data:
+            continue
+        try:
+            return _AnalysisOutput.model_validate(data)
+        except ValidationError:
+            pass
+        try:
+            return _LenientAnalysisOutput.model_validate(data)
+        except ValidationError as e:
+            error = e
+    detail = f"{error}; " if error else ""
+    raise AnalysisParseError(f"{detail}{content[:200]}")
+
+
+def parse_analysis(content: str, technical: Optional[int] = None) -> Dict[str, Any]:
+    """
+    从模型输出中解析评分和分析结果
+    :param content: 模型输出的完整文本，可以带代码块标记和说明文字
+    :param technical: 本地测量的技术评分，提供时替代模型的技术评分
+    :return: {"scores": ..., "overall_score": ..., "analysis": ...}
+    """
+    return _to_result(_parse_output(content), content, technical)
+
+
+def parse_analysis_fields(content: str, technical: Optional[int] = None) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    同 parse_analysis，另外返回输出中没有出现的点评类别
+    结果中缺少的类别为空列表，与模型明确给出的空列表无法区分，需要追问时按这里返回的类别判断
+    :return: (分析结果, 没有出现的类别)
+    """
+    output = _parse_output(content)
+    missing = [key for key in ANALYSIS_KEYS if key not in output.analysis.model_fields_set]
+    return _to_result(output, content, technical), missing
+
+
+def _to_result(output: _AnalysisOutput, content: str, technical: Optional[int]) -> Dict[str, Any]:
+    if technical is None:
+        if output.scores.technical is None:
+            raise AnalysisParseError(f"缺少 technical 评分; {content[:200]}")
+        technical = _round_score(output.scores.technical)
+    scores = {
+        "technical": technical,
+        "composition": _round_score(output.scores.composition),
+        "aesthetic": _round_score(output.scores.aesthetic),
+        "narrative": _round_score(output.scores.narrative),
+    }
+    analysis = output.analysis
+    return {
+        "scores": scores,
+        "overall_score": int(sum(scores.values()) / len(scores)),
+        "analysis": {
+            "highlights": analysis.highlights,
+            "improvements": analysis.improvements,
+            "suggestions": analysis.suggestions,
+        },
+    }
@@ -0,0 +1,101 @@
+"""
+已登录请求的鉴权开销：开启与关闭用户缓存时 /api/auth/me 与 /api/photo/history 的吞吐量
+
+在 backend 目录下运行：
+    python -m benchmarks.bench_auth --requests 2000 --concurrency 16 --photos 200
+
+在临时 SQLite 数据库中创建一个用户和若干记录，通过 ASGI 直接调用应用（不经过网络），
+统计每秒请求数和每个请求执行的 SQL 语句数。
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="bench_auth_")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_tmp}/bench.db"
+os.environ["DEBUG"] = "false"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+
+import httpx  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.core.database import async_session, engine, init_db  # noqa: E402
+from app.core.security import create_access_token, get_password_hash  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services.photo_service import build_photo, create_photos  # noqa: E402
+from main import app  # noqa: E402
+
+ANALYSIS = {
+    "scores": {"technical": 70, "composition": 70, "aesthetic": 70, "narrative": 70},
+    "overall_score": 70,
+    "analysis": {"highlights": ["主体清晰"], "improvements": ["背景杂乱"], "suggestions": ["降低机位"]},
+}
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        event.listen(engine.sync_engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+async def seed(photos: int) -> str:
+    await init_db()
+    async with async_session() as db:
+        user = User(username="bench", password_hash=get_password_hash("bench-password"))
+        db.add(user)
+        await db.commit()
+        await create_photos(db, [
+            build_photo(user.id, f"photo_{i}.jpg", f"{i:064x}", f"{i + 1:064x}", i, "deepseek", ANALYSIS)
+            for i in range(photos)
+        ])
+    return create_access_token({"sub": str(user.id)})
+
+
+async def run_case(client: httpx.AsyncClient, path: str, token: str, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    headers = {"Authorization": f"Bearer {token}"}
+
+    async def one():
+        async with semaphore:
+            response = await client.get(path, headers=headers)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return requests / (time.perf_counter() - started)
+
+
+async def main_async(args) -> None:
+    token = await seed(args.photos)
+    counter = QueryCounter()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for path in ("/api/auth/me", "/api/photo/history?page_size=12"):
+            print(f"\n{path}: requests={args.requests}, concurrency={args.concurrency}")
+            for enabled in (False, True):
+                settings.AUTH_CACHE_ENABLED = enabled
+                # 预热，缓存开启时填充缓存
+                await run_case(client, path, token, 10, 1)
+                counter.count = 0
+                rps = await run_case(client, path, token, args.requests, args.concurrency)
+                label = "cached auth" if enabled else "db lookup"
+                print(f"  {label:<12} {rps:8.1f} req/s | {counter.count / args.requests:4.2f} queries/request")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="已登录请求鉴权开销基准测试")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--photos", type=int, default=200)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
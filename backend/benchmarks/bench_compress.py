@@ -0,0 +1,135 @@
+"""
+按目标大小压缩：二分查找质量与原先逐级降低质量的对比
+
+在 backend 目录下运行：
+    python -m benchmarks.bench_compress --target-kb 1024
+
+对一组合成图片（不同尺寸、细节程度）分别运行：
+- legacy：原 compress_image，完整分辨率下质量从 85 每次降 5，到 10 仍超出再按平方根缩放
+- search：当前 compress_image，最长边限制为 MAX_DECODE_EDGE，在探测图上二分查找质量
+统计完整编码次数、探测编码次数、耗时和输出大小
+"""
+import argparse
+import io
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from PIL import Image, ImageDraw, ImageFilter
+
+import app.utils.image as image_utils
+from app.utils.image import _to_rgb, compress_image
+
+
+def legacy_compress(image_data: bytes, target_size: int, quality: int = 85) -> bytes:
+    img = _to_rgb(Image.open(io.BytesIO(image_data)))
+    img_bytes = image_utils._encode(img, 'JPEG', quality)
+    while len(img_bytes) > target_size and quality > 10:
+        quality -= 5
+        img_bytes = image_utils._encode(img, 'JPEG', quality)
+    if len(img_bytes) > target_size:
+        scale = (target_size / len(img_bytes)) ** 0.5
+        img = img.resize((int(img.width * scale), int(img.height * scale)), Image.Resampling.LANCZOS)
+        img_bytes = image_utils._encode(img, 'JPEG', quality)
+    return img_bytes
+
+
+def _photo(width: int, height: int, noise: float, blur: bool) -> Image.Image:
+    base = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    grain = Image.effect_noise((width // 2, height // 2), 60).resize((width, height)).convert("RGB")
+    img = Image.blend(base, grain, noise)
+    return img.filter(ImageFilter.SMOOTH) if blur else img
+
+
+def _document(width: int, height: int) -> Image.Image:
+    img = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(img)
+    for y in range(0, height, 18):
+        for x in range(0, width, 9):
+            if (x * 7 + y * 13) % 5:
+                draw.rectangle([x, y, x + 5, y + 10], fill=(20, 20, 20))
+    return img
+
+
+def build_corpus() -> List[Tuple[str, bytes]]:
+    corpus = []
+    cases = [
+        ("1024x768 smooth", _photo(1024, 768, 0.2, True)),
+        ("2048x1536 smooth", _photo(2048, 1536, 0.3, True)),
+        ("2048x1536 noisy", _photo(2048, 1536, 0.6, False)),
+        ("4000x3000 smooth", _photo(4000, 3000, 0.35, True)),
+        ("4000x3000 noisy", _photo(4000, 3000, 0.7, False)),
+        ("6000x4000 noisy", _photo(6000, 4000, 0.5, False)),
+        ("3000x2000 text", _document(3000, 2000)),
+    ]
+    for name, img in cases:
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=95)
+        corpus.append((name, buffer.getvalue()))
+    return corpus
+
+
+@contextmanager
+def count_encodes(counter: Dict[str, int]):
+    """统计编码次数，尺寸恰为上一次完整编码按 PROBE_FACTOR 缩小的计为探测编码"""
+    original = image_utils._encode
+    last_full = [None]
+
+    def counting(img, img_format, quality):
+        factor = image_utils.PROBE_FACTOR
+        full = last_full[0]
+        if full and img.size == (-(-full[0] // factor), -(-full[1] // factor)):
+            counter["probe"] += 1
+        else:
+            counter["full"] += 1
+            last_full[0] = img.size
+        return original(img, img_format, quality)
+
+    image_utils._encode = counting
+    try:
+        yield
+    finally:
+        image_utils._encode = original
+
+
+def run(func, data: bytes, target_size: int):
+    counter = {"full": 0, "probe": 0}
+    with count_encodes(counter):
+        started = time.perf_counter()
+        output = func(data, target_size)
+        elapsed = time.perf_counter() - started
+    size = Image.open(io.BytesIO(output)).size
+    return counter, elapsed, len(output), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按目标大小压缩基准测试")
+    parser.add_argument("--target-kb", type=int, default=1024)
+    args = parser.parse_args()
+    target_size = args.target_kb * 1024
+
+    pipelines = {
+        "legacy": legacy_compress,
+        "search": lambda data, target: compress_image(data, target_size=target)[0],
+    }
+    totals = {name: [0, 0.0] for name in pipelines}
+
+    for case, data in build_corpus():
+        print(f"{case} ({len(data) / 1024:.0f} KB)")
+        for name, func in pipelines.items():
+            counter, elapsed, output_size, dims = run(func, data, target_size)
+            totals[name][0] += counter["full"]
+            totals[name][1] += elapsed
+            print(
+                f"  {name:<7} encodes {counter['full']:2d} full + {counter['probe']:2d} probe | "
+                f"{elapsed * 1000:7.0f}ms | {output_size / 1024:6.0f} KB | {dims[0]}x{dims[1]}"
+                + ("" if output_size <= target_size else "  OVER TARGET")
+            )
+
+    print("total")
+    for name, (encodes, elapsed) in totals.items():
+        print(f"  {name:<7} {encodes:3d} full encodes | {elapsed * 1000:7.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+历史记录分页：原实现（整表读入后 len() + OFFSET）与 COUNT + 列裁剪 + 游标分页的对比
+
+在 backend 目录下运行：
+    python -m benchmarks.bench_history --photos 100000 --payload-kb 1
+
+在临时 SQLite 数据库中为一个用户写入指定数量的记录，payload-kb 模拟未迁移到 blob 存储的
+旧记录中内联的 image_data / thumbnail 大小，然后分别测量：
+- legacy：原实现，读出用户的全部 Photo 对象计算总数，再 OFFSET 分页
+- offset：COUNT(*) + 只查列表列 + OFFSET 分页
+- keyset：COUNT(*) + 只查列表列 + 按 (created_at, id) 游标分页
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.database import Base
+from app.models.photo import Photo
+from app.models.user import User  # noqa: F401  注册 users 表
+from app.services.photo_service import count_photos, list_photos
+
+PAGE_SIZE = 12
+
+INSERT_PHOTO = (
+    "INSERT INTO photos (user_id, filename, image_hash, thumbnail_hash, thumbnail, image_data, "
+    "score_tech, score_comp, score_aes, score_story, overall_score, analysis, model_used, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def seed(path: str, photos: int, payload_kb: int) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "INSERT INTO users (id, username, password_hash, created_at, updated_at) VALUES (1, 'bench', '', ?, ?)",
+        (datetime.utcnow(), datetime.utcnow())
+    )
+    payload = "data:image/jpeg;base64," + "A" * (payload_kb * 1024) if payload_kb else None
+    analysis = json.dumps({"highlights": ["主体清晰"] * 3, "improvements": ["背景杂乱"] * 3, "suggestions": ["降低机位"] * 3})
+    started = datetime(2024, 1, 1)
+    batch = []
+    for i in range(photos):
+        batch.append((
+            1, f"photo_{i}.jpg", None if payload else f"{i:064x}", None if payload else f"{i + 1:064x}",
+            payload, payload, 70, 70, 70, 70, 70, analysis, "deepseek",
+            started + timedelta(seconds=i)
+        ))
+        if len(batch) == 5000:
+            conn.executemany(INSERT_PHOTO, batch)
+            batch.clear()
+    if batch:
+        conn.executemany(INSERT_PHOTO, batch)
+    conn.commit()
+    conn.close()
+
+
+async def legacy_page(db, user_id: int, page: int):
+    total = len((await db.execute(select(Photo).where(Photo.user_id == user_id))).scalars().all())
+    result = await db.execute(
+        select(Photo)
+        .where(Photo.user_id == user_id)
+        .order_by(Photo.created_at.desc())
+        .offset((page - 1) * PAGE_SIZE)
+        .limit(PAGE_SIZE)
+    )
+    return total, result.scalars().all()
+
+
+async def offset_page(db, user_id: int, page: int):
+    total = await count_photos(db, user_id)
+    return total, await list_photos(db, user_id, PAGE_SIZE + 1, offset=(page - 1) * PAGE_SIZE)
+
+
+async def keyset_page(db, user_id: int, cursor):
+    total = await count_photos(db, user_id)
+    return total, await list_photos(db, user_id, PAGE_SIZE + 1, cursor=cursor)
+
+
+async def measure(session_factory, func, *args, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        # 每次使用新会话，排除 ORM identity map 的影响
+        async with session_factory() as db:
+            started = time.perf_counter()
+            await func(db, *args)
+            timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+async def main_async(args) -> None:
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        started = time.perf_counter()
+        seed(path, args.photos, args.payload_kb)
+        print(
+            f"seeded {args.photos} photos ({args.payload_kb} KB inline payload) in "
+            f"{time.perf_counter() - started:.1f}s, db {os.path.getsize(path) / 1024 / 1024:.0f} MB"
+        )
+
+        conn = sqlite3.connect(path)
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id, filename FROM photos WHERE user_id = 1 AND "
+            "(created_at, id) < ('2024-01-02', 10) ORDER BY created_at DESC, id DESC LIMIT 13"
+        ).fetchall()
+        conn.close()
+        print("keyset plan: " + " / ".join(row[-1] for row in plan))
+
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        last_page = args.photos // PAGE_SIZE
+        pages = [1, last_page // 2, last_page]
+
+        # 各页对应的游标，模拟客户端一路翻页拿到的 next_cursor
+        cursors = {}
+        async with session_factory() as db:
+            for page in pages:
+                if page == 1:
+                    cursors[page] = None
+                    continue
+                row = (await list_photos(db, 1, 1, offset=(page - 1) * PAGE_SIZE - 1))[0]
+                cursors[page] = (row.created_at, row.id)
+
+        elapsed = await measure(session_factory, count_photos, 1, repeat=args.repeat)
+        print(f"COUNT(*) alone {elapsed:.1f}ms")
+
+        for page in pages:
+            print(f"page {page}")
+            if not args.skip_legacy:
+                elapsed = await measure(session_factory, legacy_page, 1, page, repeat=1)
+                print(f"  legacy  {elapsed:9.1f}ms")
+            elapsed = await measure(session_factory, offset_page, 1, page, repeat=args.repeat)
+            print(f"  offset  {elapsed:9.1f}ms")
+            elapsed = await measure(session_factory, keyset_page, 1, cursors[page], repeat=args.repeat)
+            print(f"  keyset  {elapsed:9.1f}ms")
+    finally:
+        await engine.dispose()
+        os.remove(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="历史记录分页基准测试")
+    parser.add_argument("--photos", type=int, default=100000)
+    parser.add_argument("--payload-kb", type=int, default=1, help="旧记录内联的图片数据大小，0 表示已迁移到 blob 存储")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--skip-legacy", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
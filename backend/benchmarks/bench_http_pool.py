@@ -0,0 +1,87 @@
+"""
+共享连接池与每次新建会话的单请求开销对比
+
+在 backend 目录下运行：
+    python -m benchmarks.bench_http_pool --requests 300 --concurrency 1 16
+
+模拟服务的响应延迟为 0，测得的耗时即客户端侧的请求开销（建连、序列化、解析）。
+"""
+import argparse
+import asyncio
+import io
+import statistics
+import time
+
+from PIL import Image
+
+from app.services.deepseek_client import DeepSeekClient
+from app.services.http_pool import ClientRegistry
+from benchmarks.mock_provider import start_mock_provider
+
+
+def make_image() -> bytes:
+    img = Image.effect_noise((1024, 768), 40).convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+async def run_case(client, image_data: bytes, requests: int, concurrency: int):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await client.analyze_photo(image_data, "bench.jpg")
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    return latencies, elapsed
+
+
+async def main_async(args) -> None:
+    runner, base_url = await start_mock_provider(latency=0.0)
+    stats = runner.app["stats"]
+    image_data = make_image()
+
+    try:
+        for concurrency in args.concurrency:
+            print(f"\nconcurrency={concurrency}, requests={args.requests}")
+            for label in ("per-request session", "pooled session"):
+                registry = ClientRegistry()
+                if label == "pooled session":
+                    client = registry.get_client("deepseek")
+                else:
+                    client = DeepSeekClient()
+                client.base_url = base_url
+
+                # 预热，排除首次建连
+                await client.analyze_photo(image_data, "warmup.jpg")
+                stats.peers.clear()
+
+                latencies, elapsed = await run_case(client, image_data, args.requests, concurrency)
+                latencies.sort()
+                print(
+                    f"  {label:<20} mean {statistics.mean(latencies):6.2f}ms | "
+                    f"p50 {latencies[len(latencies) // 2]:6.2f}ms | "
+                    f"p95 {latencies[int(len(latencies) * 0.95)]:6.2f}ms | "
+                    f"{args.requests / elapsed:7.1f} req/s | connections {stats.connections}"
+                )
+                await registry.close()
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型客户端连接池基准测试")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16])
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+图片预处理对事件循环的阻塞程度
+
+在 backend 目录下运行：
+    python -m benchmarks.bench_image_pool --images 8 --width 6000 --height 4000
+
+同时处理多张大图，并用一个每 10ms 唤醒一次的探针协程测量事件循环的调度延迟，
+对比三种方式：
+- inline：在协程中直接调用 prepare_image（改动前的做法）
+- thread：在线程池中处理，Pillow 解码/编码时释放 GIL
+- process：在进程池中处理
+"""
+import argparse
+import asyncio
+import io
+import statistics
+import time
+
+from PIL import Image, ImageFilter
+
+from app.services.image_pool import ImageProcessingPool
+from app.services.photo_service import prepare_image
+
+PROBE_INTERVAL = 0.01
+
+
+def make_photo(width: int, height: int) -> bytes:
+    base = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.effect_noise((width // 4, height // 4), 30).resize((width, height)).convert("RGB")
+    img = Image.blend(base, noise, 0.35).filter(ImageFilter.SMOOTH)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+async def probe(lags: list, stop: asyncio.Event) -> None:
+    """记录每次唤醒比预期晚了多少毫秒"""
+    while not stop.is_set():
+        expected = time.perf_counter() + PROBE_INTERVAL
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(max(0.0, time.perf_counter() - expected) * 1000)
+
+
+async def run_case(kind: str, data: bytes, images: int, workers: int):
+    pool = None
+    if kind != "inline":
+        pool = ImageProcessingPool(kind=kind, workers=workers, max_queue=images)
+        pool.start()
+        # 预热，排除进程启动和模块导入
+        await asyncio.gather(*(pool.run(prepare_image, data, "warmup.jpg") for _ in range(workers)))
+
+    async def one(index: int):
+        if pool is None:
+            return prepare_image(data, f"{index}.jpg")
+        return await pool.run(prepare_image, data, f"{index}.jpg")
+
+    lags = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+    await asyncio.sleep(PROBE_INTERVAL * 2)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(images)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe_task
+    if pool is not None:
+        pool.shutdown()
+    return lags, elapsed
+
+
+async def main_async(args) -> None:
+    data = make_photo(args.width, args.height)
+    print(f"{args.images} x {args.width}x{args.height} ({len(data) / 1024:.0f} KB), workers={args.workers}")
+    for kind in ("inline", "thread", "process"):
+        lags, elapsed = await run_case(kind, data, args.images, args.workers)
+        lags.sort()
+        print(
+            f"  {kind:<8} total {elapsed * 1000:7.0f}ms | "
+            f"loop lag p50 {statistics.median(lags):7.1f}ms | "
+            f"p99 {lags[int(len(lags) * 0.99)]:7.1f}ms | max {lags[-1]:7.1f}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片处理池事件循环阻塞基准测试")
+    parser.add_argument("--images", type=int, default=8)
+    parser.add_argument("--width", type=int, default=6000)
+    parser.add_argument("--height", type=int, default=4000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
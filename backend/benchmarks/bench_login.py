@@ -0,0 +1,92 @@
+"""
+登录高峰下的吞吐量和事件循环阻塞：bcrypt 在事件循环中直接计算与放到密码线程池的对比
+
+在 backend 目录下运行：
+    python -m benchmarks.bench_login --logins 64 --concurrency 16 --rounds 12
+
+通过 ASGI 直接调用 /api/auth/login，同时运行一个每 10ms 唤醒一次的探测任务，
+其最大唤醒延迟即登录期间其他请求（如上传、历史记录）最长被阻塞的时间。
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+_tmp = tempfile.mkdtemp(prefix="bench_login_")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_tmp}/bench.db"
+os.environ["DEBUG"] = "false"
+
+import httpx  # noqa: E402
+
+from app.api import auth as auth_api  # noqa: E402
+from app.core import security  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.database import async_session, engine, init_db  # noqa: E402
+from app.models.user import User  # noqa: E402
+from main import app  # noqa: E402
+
+PROBE_INTERVAL = 0.01
+
+
+async def verify_inline(plain_password: str, hashed_password: str) -> bool:
+    """原实现：在事件循环中直接计算"""
+    return security.verify_password(plain_password, hashed_password)
+
+
+async def probe(stop: asyncio.Event, lags: list) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+
+async def run_case(client: httpx.AsyncClient, logins: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            response = await client.post("/api/auth/login", data={"username": "bench", "password": "bench-password"})
+            response.raise_for_status()
+
+    stop = asyncio.Event()
+    lags: list = []
+    probe_task = asyncio.create_task(probe(stop, lags))
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await probe_task
+    return logins / elapsed, max(lags) * 1000
+
+
+async def main_async(args) -> None:
+    settings.BCRYPT_ROUNDS = args.rounds
+    await init_db()
+    async with async_session() as db:
+        db.add(User(username="bench", password_hash=security.get_password_hash("bench-password")))
+        await db.commit()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(
+            f"logins={args.logins}, concurrency={args.concurrency}, rounds={args.rounds}, "
+            f"hash workers={settings.PASSWORD_HASH_WORKERS}"
+        )
+        for label, verify in (("event loop", verify_inline), ("hash executor", security.verify_password_async)):
+            auth_api.verify_password_async = verify
+            rate, max_lag = await run_case(client, args.logins, args.concurrency)
+            print(f"  {label:<14} {rate:7.1f} logins/s | max event loop stall {max_lag:8.1f}ms")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="登录吞吐量与事件循环阻塞基准测试")
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=12)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
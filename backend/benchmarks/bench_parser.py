@@ -0,0 +1,118 @@
+"""
+模型输出解析的吞吐量：原先各客户端中的正则解析与 parse_analysis 对比
+
+在 backend 目录下运行：
+    python -m benchmarks.bench_parser --iterations 2000
+
+语料收集了模型输出中常见的格式问题：代码块标记、前后的说明文字、说明文字中的花括号、
+字符串内的花括号和未转义换行、末尾多余的逗号、小数或字符串形式的评分、被序列化为字符串的 analysis、
+超长的前置说明以及被截断的输出。输出每种写法能否解析，以及两种实现的每秒解析次数。
+"""
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Tuple
+
+from app.utils.stream_json import parse_analysis
+from benchmarks.mock_provider import CANNED_RESULT
+
+_RESULT = json.dumps(CANNED_RESULT, ensure_ascii=False)
+_PRETTY = json.dumps(CANNED_RESULT, ensure_ascii=False, indent=2)
+
+# (名称, 模型输出, 是否包含可用的结果)
+MESSY_OUTPUTS: List[Tuple[str, str, bool]] = [
+    ("plain", _RESULT, True),
+    ("pretty", _PRETTY, True),
+    ("fenced", f"```json\n{_PRETTY}\n```", True),
+    ("preamble", f"好的，以下是对这张照片的分析：\n\n{_PRETTY}", True),
+    ("trailing_braces", f"{_RESULT}\n\n如需调整格式请告诉我，例如 {{\"scores\": ...}}。", True),
+    ("preamble_braces", f"格式为 {{scores, analysis}}：\n{_RESULT}", True),
+    ("unbalanced_prose", f"注意 {{ 这是说明\n{_RESULT}", True),
+    ("braces_in_strings", _RESULT.replace("背景略显杂乱", "背景略显杂乱 {左上角}"), True),
+    ("raw_newline", _RESULT.replace("主体清晰，", "主体清晰，\n"), True),
+    ("trailing_comma", _PRETTY.replace('"narrative": 68', '"narrative": 68,'), True),
+    ("float_scores", _RESULT.replace('"technical": 78', '"technical": 78.5'), True),
+    ("string_scores", _RESULT.replace('"composition": 72', '"composition": "72"'), True),
+    ("analysis_as_string", json.dumps(
+        {"scores": CANNED_RESULT["scores"], "analysis": json.dumps(CANNED_RESULT["analysis"], ensure_ascii=False)},
+        ensure_ascii=False
+    ), True),
+    ("missing_category", json.dumps(
+        {"scores": CANNED_RESULT["scores"], "analysis": {"highlights": ["主体清晰"]}}, ensure_ascii=False
+    ), True),
+    ("long_preamble", "这张照片的拍摄条件分析如下。" * 400 + f"\n```json\n{_PRETTY}\n```", True),
+    ("truncated", _PRETTY[:len(_PRETTY) // 2], False),
+    ("no_json", "抱歉，我无法分析这张图片。", False),
+    ("missing_scores", json.dumps({"analysis": CANNED_RESULT["analysis"]}, ensure_ascii=False), False),
+]
+
+
+def legacy_parse(content: str) -> Dict[str, Any]:
+    """原先三个客户端中 _parse_response 的实现"""
+    import re
+    import json
+
+    content = content.strip()
+    if content.startswith('```json'):
+        content = content[7:]
+    if content.endswith('```'):
+        content = content[:-3]
+
+    json_match = re.search(r'\{.*\}', content, re.DOTALL)
+    if not json_match:
+        raise Exception(f"无法解析 API 响应: {content}")
+
+    data = json.loads(json_match.group(0))
+    analysis = data.get("analysis", {})
+    if isinstance(analysis, str):
+        try:
+            analysis = json.loads(analysis)
+        except json.JSONDecodeError:
+            analysis = {}
+    for key in ("highlights", "improvements", "suggestions"):
+        analysis.setdefault(key, [])
+
+    scores = data["scores"]
+    overall_score = int((scores["technical"] + scores["composition"] + scores["aesthetic"] + scores["narrative"]) / 4)
+    return {"scores": scores, "overall_score": overall_score, "analysis": analysis}
+
+
+def _succeeds(parse, content: str) -> bool:
+    try:
+        parse(content)
+        return True
+    except Exception:
+        return False
+
+
+def bench(parse, contents: List[str], iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for content in contents:
+            try:
+                parse(content)
+            except Exception:
+                pass
+    return iterations * len(contents) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模型输出解析基准测试")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'case':<20} {'legacy':>7} {'parse_analysis':>15}")
+    for name, content, _ in MESSY_OUTPUTS:
+        print(f"{name:<20} {str(_succeeds(legacy_parse, content)):>7} {str(_succeeds(parse_analysis, content)):>15}")
+
+    # 吞吐量分别按全部语料和可被两者都解析的常见写法统计
+    everything = [content for _, content, _ in MESSY_OUTPUTS]
+    common = [content for _, content, _ in MESSY_OUTPUTS if _succeeds(legacy_parse, content)]
+    for label, contents in (("all", everything), ("legacy-parsable", common)):
+        legacy = bench(legacy_parse, contents, args.iterations)
+        current = bench(parse_analysis, contents, args.iterations)
+        print(f"  {label:<16} legacy {legacy:9.0f}/s | parse_analysis {current:9.0f}/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+近似重复索引查询延迟随数据规模的变化
+
+在 backend 目录下运行：
+    python -m benchmarks.bench_phash_index --sizes 1000 10000 100000 1000000
+
+一半查询是对已有哈希随机翻转若干位得到的近似重复，另一半是随机哈希（通常无匹配）。
+规模较小时同时给出线性扫描的耗时作为对照。
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app.services.phash_index import PerceptualHashIndex
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def flip_bits(value: int, count: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(64), count):
+        value ^= 1 << bit
+    return value
+
+
+def linear_scan(hashes, value, max_distance):
+    return [(i, (h ^ value).bit_count()) for i, h in enumerate(hashes) if (h ^ value).bit_count() <= max_distance]
+
+
+def run(size: int, queries: int, max_distance: int, rng: random.Random) -> None:
+    hashes = [rng.getrandbits(64) for _ in range(size)]
+    index = PerceptualHashIndex(max_distance=max_distance)
+
+    started = time.perf_counter()
+    index.add_many(enumerate(hashes))
+    build_seconds = time.perf_counter() - started
+
+    query_values = []
+    for i in range(queries):
+        if i % 2 == 0:
+            query_values.append(flip_bits(rng.choice(hashes), rng.randint(0, max_distance), rng))
+        else:
+            query_values.append(rng.getrandbits(64))
+
+    latencies = []
+    found = 0
+    for value in query_values:
+        started = time.perf_counter()
+        matches = index.query(value)
+        latencies.append((time.perf_counter() - started) * 1e6)
+        found += bool(matches)
+
+    line = (
+        f"{size:>9,} | build {build_seconds:6.2f}s | "
+        f"mean {statistics.mean(latencies):7.1f}us | p50 {percentile(latencies, 50):7.1f}us | "
+        f"p99 {percentile(latencies, 99):7.1f}us | hit {found}/{queries}"
+    )
+
+    if size <= 100_000:
+        scan_latencies = []
+        for value in query_values[:50]:
+            started = time.perf_counter()
+            linear_scan(hashes, value, max_distance)
+            scan_latencies.append((time.perf_counter() - started) * 1e6)
+        line += f" | linear scan mean {statistics.mean(scan_latencies):9.1f}us"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="感知哈希索引基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--max-distance", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"max_distance={args.max_distance}, queries={args.queries}")
+    for size in args.sizes:
+        run(size, args.queries, args.max_distance, rng)
+
+
+if __name__ == "__main__":
+    main()
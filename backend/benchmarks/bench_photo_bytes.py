@@ -0,0 +1,196 @@
+"""
+各接口查询从数据库读出的字节数：大字段延迟加载前后对比
+
+在 backend 目录下运行：
+    python -m benchmarks.bench_photo_bytes --photos 200 --image-kb 300
+
+临时 SQLite 数据库中写入两类记录：
+- legacy：未迁移的旧记录，image_data / thumbnail 以 base64 data URI 内联存储
+- blob：已迁移到 blob 存储的记录，表中只有摘要
+通过自定义 sqlite3 游标统计 fetch 返回的所有值的字节数，对比：
+- before：原查询方式，select(Photo) 加载全部列
+- after：当前实现，大字段默认不加载，按需读取
+include=image 内联的原图从 blob 存储读取，不计入数据库读取量
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import undefer
+
+from app.core.config import settings
+from app.core.database import Base
+from app.models.photo import Photo
+from app.models.user import User  # noqa: F401  注册 users 表
+from app.services import blob_store
+from app.services.photo_service import (
+    build_photo_response,
+    count_photos,
+    find_existing_photo,
+    get_user_photo,
+    list_photos,
+    load_photo_response,
+)
+
+PAGE_SIZE = 12
+
+
+class CountingCursor(sqlite3.Cursor):
+    bytes_read = 0
+
+    @classmethod
+    def _count(cls, rows):
+        for row in rows:
+            for value in row:
+                if isinstance(value, (str, bytes)):
+                    cls.bytes_read += len(value)
+                elif value is not None:
+                    cls.bytes_read += 8
+        return rows
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None:
+            self._count([row])
+        return row
+
+    def fetchmany(self, size=None):
+        return self._count(super().fetchmany(size) if size is not None else super().fetchmany())
+
+    def fetchall(self):
+        return self._count(super().fetchall())
+
+
+class CountingConnection(sqlite3.Connection):
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+
+def seed(path: str, photos: int, image_kb: int) -> dict:
+    """写入 legacy 与 blob 两类记录各 photos 条，返回各自的示例 id 和摘要"""
+    store = blob_store.get_blob_store()
+    image = os.urandom(image_kb * 1024)
+    thumbnail = os.urandom(4 * 1024)
+    image_uri = "data:image/jpeg;base64," + "A" * (len(image) * 4 // 3)
+    thumbnail_uri = "data:image/jpeg;base64," + "A" * (len(thumbnail) * 4 // 3)
+    image_hash = store.put(b"\xff\xd8\xff" + image)
+    thumbnail_hash = store.put(b"\xff\xd8\xff" + thumbnail)
+    analysis = json.dumps({"highlights": ["主体清晰"] * 3, "improvements": ["背景杂乱"] * 3, "suggestions": ["降低机位"] * 3})
+
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "INSERT INTO users (id, username, password_hash, created_at, updated_at) VALUES (1, 'bench', '', ?, ?)",
+        (datetime.utcnow(), datetime.utcnow())
+    )
+    started = datetime(2024, 1, 1)
+    rows = []
+    for i in range(photos * 2):
+        legacy = i % 2 == 0
+        rows.append((
+            1, f"photo_{i}.jpg",
+            None if legacy else image_hash, None if legacy else thumbnail_hash,
+            thumbnail_uri if legacy else None, image_uri if legacy else None,
+            70, 70, 70, 70, 70, analysis, "deepseek", started + timedelta(seconds=i)
+        ))
+    conn.executemany(
+        "INSERT INTO photos (user_id, filename, image_hash, thumbnail_hash, thumbnail, image_data, "
+        "score_tech, score_comp, score_aes, score_story, overall_score, analysis, model_used, created_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows
+    )
+    conn.commit()
+    conn.close()
+    return {"legacy_id": 1, "blob_id": 2, "image_hash": image_hash}
+
+
+async def before_history(db):
+    total = len((await db.execute(select(Photo).options(undefer("*")).where(Photo.user_id == 1))).scalars().all())
+    result = await db.execute(
+        select(Photo).options(undefer("*")).where(Photo.user_id == 1)
+        .order_by(Photo.created_at.desc()).limit(PAGE_SIZE)
+    )
+    return total, result.scalars().all()
+
+
+async def after_history(db):
+    return await count_photos(db, 1), await list_photos(db, 1, PAGE_SIZE + 1)
+
+
+async def before_detail(db, photo_id: int):
+    result = await db.execute(select(Photo).options(undefer("*")).where(Photo.id == photo_id, Photo.user_id == 1))
+    return build_photo_response(result.scalar_one())
+
+
+async def after_detail(db, photo_id: int, include_image: bool = False):
+    photo = await get_user_photo(db, 1, photo_id)
+    return await load_photo_response(db, photo, include_image=include_image)
+
+
+async def before_duplicate_check(db, image_hash: str):
+    result = await db.execute(
+        select(Photo).options(undefer("*"))
+        .where(Photo.user_id == 1, Photo.image_hash == image_hash, Photo.model_used == "deepseek")
+        .order_by(Photo.id.desc()).limit(1)
+    )
+    return build_photo_response(result.scalar_one())
+
+
+async def after_duplicate_check(db, image_hash: str):
+    photo = await find_existing_photo(db, 1, image_hash, "deepseek")
+    return await load_photo_response(db, photo)
+
+
+async def measure(session_factory, func, *args) -> int:
+    async with session_factory() as db:
+        CountingCursor.bytes_read = 0
+        await func(db, *args)
+        return CountingCursor.bytes_read
+
+
+async def main_async(args) -> None:
+    workdir = tempfile.mkdtemp()
+    settings.BLOB_DIR = os.path.join(workdir, "blobs")
+    blob_store.get_blob_store.cache_clear()
+    path = os.path.join(workdir, "bench.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", connect_args={"factory": CountingConnection})
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        ids = seed(path, args.photos, args.image_kb)
+        print(f"{args.photos} legacy + {args.photos} blob photos, image {args.image_kb} KB")
+
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        cases = [
+            ("history page", (before_history,), (after_history,)),
+            ("detail (blob)", (before_detail, ids["blob_id"]), (after_detail, ids["blob_id"])),
+            ("detail (blob) include=image", (before_detail, ids["blob_id"]), (after_detail, ids["blob_id"], True)),
+            ("detail (legacy)", (before_detail, ids["legacy_id"]), (after_detail, ids["legacy_id"])),
+            ("duplicate upload check", (before_duplicate_check, ids["image_hash"]),
+             (after_duplicate_check, ids["image_hash"])),
+        ]
+        for name, before, after in cases:
+            before_bytes = await measure(session_factory, *before)
+            after_bytes = await measure(session_factory, *after)
+            print(f"  {name:<28} before {before_bytes / 1024:10.1f} KB | after {after_bytes / 1024:8.1f} KB")
+    finally:
+        await engine.dispose()
+        shutil.rmtree(workdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Photo 查询读取字节数对比")
+    parser.add_argument("--photos", type=int, default=200)
+    parser.add_argument("--image-kb", type=int, default=300)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+本地画质测量的耗时
+
+在 backend 目录下运行：
+    python -m benchmarks.bench_quality --count 20
+
+对压测图片集中各种尺寸的图片调用 assess_image_quality，输出单张耗时的中位数和最大值
+"""
+import argparse
+import statistics
+import time
+
+from app.utils.image_quality import assess_image_quality
+from benchmarks.corpus import generate_corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地画质测量基准测试")
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.count, args.seed)
+    timings = []
+    for image in corpus:
+        started = time.perf_counter()
+        report = assess_image_quality(image.content)
+        timings.append((time.perf_counter() - started) * 1000)
+        print(f"  {image.filename:<24} {report.width}x{report.height:<6} {timings[-1]:6.1f} ms  score={report.technical_score}")
+    print(f"median {statistics.median(timings):.1f} ms | max {max(timings):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+SQLite 并发写入与读取吞吐量：默认引擎配置与连接池 + WAL + PRAGMA 的对比
+
+在 backend 目录下运行：
+    python -m benchmarks.bench_sqlite --writers 8 --readers 8 --seconds 5
+
+每个配置使用一个新的临时数据库，写入方逐条插入记录并提交（对应上传分析后保存记录），
+读取方同时查询历史记录第一页，统计每秒完成的写入和读取数，以及 database is locked 错误数。
+- default：原配置，create_async_engine 默认参数（aiosqlite 每次新建连接，回滚日志模式）
+- tuned：app.core.database.create_engine（连接池复用连接，WAL、synchronous=NORMAL、busy_timeout 等）
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.core.database import create_engine
+from app.migrations import run_migrations
+from app.models.user import User
+from app.services.photo_service import build_photo, list_photos
+
+ANALYSIS = {
+    "scores": {"technical": 70, "composition": 70, "aesthetic": 70, "narrative": 70},
+    "overall_score": 70,
+    "analysis": {"highlights": ["主体清晰"], "improvements": ["背景杂乱"], "suggestions": ["降低机位"]},
+}
+
+
+async def run_case(engine, writers: int, readers: int, seconds: float):
+    await run_migrations(engine)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as db:
+        db.add(User(id=1, username="bench", password_hash=""))
+        await db.commit()
+
+    counts = {"writes": 0, "reads": 0, "locked": 0}
+    deadline = time.perf_counter() + seconds
+
+    async def writer(worker: int):
+        i = 0
+        while time.perf_counter() < deadline:
+            i += 1
+            photo = build_photo(1, f"w{worker}_{i}.jpg", f"{worker:08x}{i:056x}", f"{i:064x}", i, "deepseek", ANALYSIS)
+            try:
+                async with session_factory() as db:
+                    db.add(photo)
+                    await db.commit()
+                counts["writes"] += 1
+            except OperationalError:
+                counts["locked"] += 1
+
+    async def reader():
+        while time.perf_counter() < deadline:
+            try:
+                async with session_factory() as db:
+                    await list_photos(db, 1, limit=13)
+                counts["reads"] += 1
+            except OperationalError:
+                counts["locked"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(writer(i) for i in range(writers)), *(reader() for _ in range(readers)))
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+    return counts["writes"] / elapsed, counts["reads"] / elapsed, counts["locked"]
+
+
+async def main_async(args) -> None:
+    print(f"writers={args.writers}, readers={args.readers}, seconds={args.seconds}")
+    for label in ("default", "tuned"):
+        path = os.path.join(tempfile.mkdtemp(prefix="bench_sqlite_"), "bench.db")
+        url = f"sqlite+aiosqlite:///{path}"
+        engine = create_async_engine(url) if label == "default" else create_engine(url)
+        writes, reads, locked = await run_case(engine, args.writers, args.readers, args.seconds)
+        print(f"  {label:<8} {writes:8.1f} writes/s | {reads:8.1f} reads/s | locked errors {locked}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite 并发读写吞吐量基准测试")
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
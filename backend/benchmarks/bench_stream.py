@@ -0,0 +1,88 @@
+"""
+流式输出与完整返回的首个评分到达时间对比
+
+在 backend 目录下运行：
+    python -m benchmarks.bench_stream --requests 20 --latency 0.8 --token-delay 0.03
+
+模拟服务在 --latency 后开始输出，之后每 --token-delay 秒输出一个 token。
+完整返回时首个评分与全部结果同时到达；流式输出时首个评分在 scores 对象的第一个值完成后即可展示。
+"""
+import argparse
+import asyncio
+import io
+import statistics
+import time
+
+from PIL import Image
+
+from app.services.http_pool import ClientRegistry
+from benchmarks.mock_provider import start_mock_provider
+
+
+def make_image() -> bytes:
+    img = Image.effect_noise((1024, 768), 40).convert("RGB")
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def summarize(label: str, values) -> str:
+    values = sorted(value * 1000 for value in values)
+    return (
+        f"  {label:<22} mean {statistics.mean(values):7.1f}ms | "
+        f"p50 {values[len(values) // 2]:7.1f}ms | "
+        f"p95 {values[int(len(values) * 0.95)]:7.1f}ms"
+    )
+
+
+async def measure_full(client, image_data: bytes):
+    started = time.perf_counter()
+    await client.analyze_photo(image_data, "bench.jpg")
+    elapsed = time.perf_counter() - started
+    return elapsed, elapsed
+
+
+async def measure_stream(client, image_data: bytes):
+    started = time.perf_counter()
+    first_score = None
+    async for event in client.stream_analysis(image_data, "bench.jpg"):
+        if first_score is None and event["type"] == "score":
+            first_score = time.perf_counter() - started
+    return first_score, time.perf_counter() - started
+
+
+async def main_async(args) -> None:
+    runner, base_url = await start_mock_provider(latency=args.latency, token_delay=args.token_delay)
+    image_data = make_image()
+    registry = ClientRegistry()
+
+    try:
+        for provider in args.providers:
+            client = registry.get_client(provider)
+            client.base_url = base_url
+            print(f"\n{provider}: requests={args.requests}, latency={args.latency}s, token_delay={args.token_delay}s")
+            for label, measure in (("full completion", measure_full), ("stream", measure_stream)):
+                firsts, totals = [], []
+                for _ in range(args.requests):
+                    first, total = await measure(client, image_data)
+                    firsts.append(first)
+                    totals.append(total)
+                print(f" {label}")
+                print(summarize("time to first score", firsts))
+                print(summarize("time to full result", totals))
+    finally:
+        await registry.close()
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式输出首个评分到达时间基准测试")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.8, help="首个 token 前的延迟（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.03, help="相邻 token 的间隔（秒）")
+    parser.add_argument("--providers", nargs="+", default=["deepseek", "claude"])
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+上传预处理流程的单请求峰值内存（RSS）与耗时
+
+在 backend 目录下运行：
+    python -m benchmarks.bench_upload_pipeline --width 6000 --height 4000
+
+每种流程在独立的子进程中执行，用峰值 RSS（Linux 下读取 /proc/self/status 的 VmHWM）的增量作为该流程的峰值内存：
+- legacy：整文件读入内存，compress_image → generate_thumbnail → compute_dhash 各自解码一次，
+  base64 编码两次（发给模型、存入数据库）
+- single-decode：从临时文件对象直接解码，JPEG draft 模式解码时缩小，
+  压缩图、缩略图、感知哈希都从同一帧派生，base64 只编码一次
+"""
+import argparse
+import base64
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from PIL import Image, ImageFilter
+
+
+def make_photo(path: str, width: int, height: int) -> None:
+    """生成带平滑渐变和细节噪声、接近真实照片压缩率的 JPEG"""
+    base = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.effect_noise((width // 4, height // 4), 30).resize((width, height)).convert("RGB")
+    img = Image.blend(base, noise, 0.35).filter(ImageFilter.SMOOTH)
+    img.save(path, format="JPEG", quality=92)
+
+
+def legacy_pipeline(path: str) -> int:
+    from app.utils.image import compress_image, compute_dhash, generate_thumbnail
+
+    with open(path, "rb") as f:
+        file_content = f.read()
+    compressed, _ = compress_image(file_content)
+    thumbnail = generate_thumbnail(compressed)
+    compute_dhash(compressed)
+    api_payload = base64.b64encode(compressed)
+    db_payload = base64.b64encode(compressed)
+    return len(compressed) + len(thumbnail) + len(api_payload) + len(db_payload)
+
+
+def single_decode_pipeline(path: str) -> int:
+    from app.utils.image import process_image
+
+    with open(path, "rb") as f:
+        processed = process_image(f)
+    api_payload = base64.b64encode(processed.content)
+    return len(processed.content) + len(processed.thumbnail) + len(api_payload)
+
+
+def peak_rss_kb() -> int:
+    """当前进程的峰值 RSS（KB）；ru_maxrss 在 Linux 上会继承父进程的值，优先读 VmHWM"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _child(name: str, path: str, queue) -> None:
+    # 先完成导入，排除模块加载的内存
+    import app.utils.image  # noqa: F401
+
+    baseline = peak_rss_kb()
+    started = time.perf_counter()
+    size = PIPELINES[name](path)
+    elapsed = time.perf_counter() - started
+    peak = peak_rss_kb()
+    queue.put((peak - baseline, elapsed, size))
+
+
+PIPELINES = {
+    "legacy": legacy_pipeline,
+    "single-decode": single_decode_pipeline,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上传预处理流程峰值内存基准测试")
+    parser.add_argument("--width", type=int, default=6000)
+    parser.add_argument("--height", type=int, default=4000)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".jpg")
+    os.close(fd)
+    try:
+        make_photo(path, args.width, args.height)
+        print(f"input {args.width}x{args.height}, {os.path.getsize(path) / 1024:.0f} KB")
+
+        context = multiprocessing.get_context("spawn")
+        for name in PIPELINES:
+            queue = context.Queue()
+            process = context.Process(target=_child, args=(name, path, queue))
+            process.start()
+            rss_kb, elapsed, size = queue.get()
+            process.join()
+            print(f"  {name:<14} peak RSS +{rss_kb / 1024:7.1f} MB | {elapsed * 1000:7.0f} ms | output {size / 1024:.0f} KB")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+生成压测用的合成图片集
+
+在 backend 目录下运行：
+    python -m benchmarks.corpus --out /tmp/corpus --count 50 --seed 1
+
+图片按固定比例覆盖几种典型上传：手机原图、横竖构图的相机导出图、小尺寸截图和带透明通道的 PNG。
+每张图片由渐变、低频色块和细节噪声合成，压缩率接近真实照片，内容按种子确定，
+不同序号的图片内容不同，不会命中结果缓存或近似重复检测；--duplicate-ratio 比例的图片重复此前的图片，
+用于模拟用户重复上传。
+"""
+import argparse
+import io
+import os
+import random
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from PIL import Image, ImageDraw, ImageFilter
+
+# (名称, 宽, 高, 格式, 权重)
+SHAPES: List[Tuple[str, int, int, str, int]] = [
+    ("phone", 4032, 3024, "JPEG", 3),
+    ("landscape", 3000, 2000, "JPEG", 3),
+    ("portrait", 2000, 3000, "JPEG", 2),
+    ("screenshot", 1280, 720, "JPEG", 1),
+    ("transparent", 1600, 1200, "PNG", 1),
+]
+
+CONTENT_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png"}
+
+
+@dataclass
+class CorpusImage:
+    filename: str
+    content: bytes
+    content_type: str
+
+
+def make_photo(width: int, height: int, seed: int, img_format: str = "JPEG") -> bytes:
+    """
+    生成一张合成照片
+    :param seed: 内容种子，相同种子生成相同的图片
+    """
+    rng = random.Random(seed)
+    # 小图上作画再放大，生成成本与尺寸基本无关
+    small = (max(8, width // 16), max(8, height // 16))
+    base = Image.linear_gradient("L").rotate(rng.randrange(360)).resize(small).convert("RGB")
+    draw = ImageDraw.Draw(base)
+    for _ in range(rng.randint(4, 10)):
+        x, y = rng.randrange(small[0]), rng.randrange(small[1])
+        r = rng.randint(2, max(3, min(small) // 3))
+        color = tuple(rng.randrange(256) for _ in range(3))
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=color)
+    base = base.filter(ImageFilter.GaussianBlur(1)).resize((width, height), Image.Resampling.BILINEAR)
+    # Image.effect_noise 不受种子控制，细节噪声由种子生成的随机字节构造
+    noise_size = (max(1, width // 4), max(1, height // 4))
+    noise = Image.frombytes("L", noise_size, rng.randbytes(noise_size[0] * noise_size[1]))
+    noise = noise.resize((width, height)).convert("RGB")
+    img = Image.blend(base, noise, rng.uniform(0.1, 0.2))
+
+    if img_format == "PNG":
+        alpha = Image.linear_gradient("L").resize((width, height))
+        img.putalpha(alpha)
+
+    output = io.BytesIO()
+    if img_format == "JPEG":
+        img.save(output, format="JPEG", quality=90)
+    else:
+        img.save(output, format=img_format)
+    return output.getvalue()
+
+
+def generate_corpus(count: int, seed: int = 0, duplicate_ratio: float = 0.0, scale: float = 1.0) -> List[CorpusImage]:
+    """
+    生成 count 张图片
+    :param duplicate_ratio: 重复此前某张图片的比例
+    :param scale: 尺寸缩放系数，小于 1 时生成更小的图片以加快压测准备
+    """
+    rng = random.Random(seed)
+    shapes = [shape for shape in SHAPES for _ in range(shape[4])]
+    corpus: List[CorpusImage] = []
+    for index in range(count):
+        if corpus and rng.random() < duplicate_ratio:
+            previous = rng.choice(corpus)
+            corpus.append(CorpusImage(f"dup_{index}_{previous.filename}", previous.content, previous.content_type))
+            continue
+        name, width, height, img_format, _ = rng.choice(shapes)
+        width, height = max(16, int(width * scale)), max(16, int(height * scale))
+        content = make_photo(width, height, seed * 1_000_003 + index, img_format)
+        extension = "png" if img_format == "PNG" else "jpg"
+        corpus.append(CorpusImage(f"{name}_{index}.{extension}", content, CONTENT_TYPES[img_format]))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成压测用的合成图片集")
+    parser.add_argument("--out", required=True, help="输出目录")
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0)
+    parser.add_argument("--scale", type=float, default=1.0, help="尺寸缩放系数")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    total = 0
+    for image in generate_corpus(args.count, args.seed, args.duplicate_ratio, args.scale):
+        with open(os.path.join(args.out, image.filename), "wb") as f:
+            f.write(image.content)
+        total += len(image.content)
+    print(f"已生成 {args.count} 张图片，共 {total / 1024 / 1024:.1f} MB：{args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+端到端压测：本地模拟模型服务 + 合成图片，按场景驱动整个 FastAPI 应用
+
+在 backend 目录下运行：
+    python -m benchmarks.loadtest --scenario all
+    python -m benchmarks.loadtest --scenario upload_burst --uploads 200 --concurrency 32 \\
+        --latency 1.0 --token-delay 0.02 --error-rate 0.05 --rate-limit-rate 0.05 --stream
+    python -m benchmarks.loadtest --scenario upload_burst --hang-rate 0.05 --disconnect-rate 0.05 --attempt-timeout 2
+
+应用通过 ASGI 在本进程内调用（不经过网络），使用临时 SQLite 数据库和 blob 目录，
+三个服务商都指向本地的 benchmarks.mock_provider，不会调用付费接口。场景：
+- upload_burst：多个用户同时上传 --uploads 张合成图片并等待分析结果，--stream 时使用 SSE 接口
+- history_scroll：每个用户预置 --photos 条记录，按游标连续翻 --pages 页历史记录
+- login_storm：所有用户反复登录共 --logins 次，密码哈希按 BCRYPT_ROUNDS 计算
+
+每个场景输出请求数、按状态码的结果、吞吐量、p50/p95/p99 延迟和峰值内存。
+峰值内存为本进程的峰值 RSS（含压测客户端和线程池中的图片处理），场景开始前重置；
+IMAGE_POOL_KIND=process 时子进程的内存不计入。同样的 --seed 生成同样的图片和错误序列。
+"""
+import argparse
+import asyncio
+import os
+import resource
+import socket
+import tempfile
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# 配置在应用导入时读取，导入前指向临时数据库和本地模拟服务
+MOCK_PORT = _free_port()
+_tmp = tempfile.mkdtemp(prefix="loadtest_")
+_mock_url = f"http://127.0.0.1:{MOCK_PORT}/v1"
+os.environ.update({
+    "DATABASE_URL": f"sqlite+aiosqlite:///{_tmp}/loadtest.db",
+    "BLOB_DIR": f"{_tmp}/blobs",
+    "DEBUG": "false",
+    "JOB_WORKER_ENABLED": "false",
+    "DEEPSEEK_API_KEY": "mock",
+    "OPENAI_API_KEY": "mock",
+    "ANTHROPIC_API_KEY": "mock",
+    "DEEPSEEK_BASE_URL": _mock_url,
+    "OPENAI_BASE_URL": _mock_url,
+    "ANTHROPIC_BASE_URL": _mock_url,
+})
+
+import httpx  # noqa: E402
+from sqlalchemy import select  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.core.database import async_session, engine  # noqa: E402
+from app.core.metrics import provider_usage_report  # noqa: E402
+from app.core.rate_limit import get_rate_limiter  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services.photo_service import build_photo, create_photos  # noqa: E402
+from benchmarks.corpus import CorpusImage, generate_corpus  # noqa: E402
+from benchmarks.mock_provider import start_mock_provider  # noqa: E402
+from main import app  # noqa: E402
+
+PASSWORD = "loadtest-password"
+
+ANALYSIS = {
+    "scores": {"technical": 70, "composition": 70, "aesthetic": 70, "narrative": 70},
+    "overall_score": 70,
+    "analysis": {"highlights": ["主体清晰"], "improvements": ["背景杂乱"], "suggestions": ["降低机位"]},
+}
+
+
+def reset_peak_rss() -> None:
+    """重置本进程的峰值 RSS（Linux 4.0+），不支持时保留进程启动以来的峰值"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def percentile(values: List[float], q: float) -> float:
+    """最近秩百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+@dataclass
+class ScenarioResult:
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    outcomes: Counter = field(default_factory=Counter)
+    elapsed: float = 0.0
+    peak_rss_kb: int = 0
+
+    def report(self) -> str:
+        requests = len(self.latencies)
+        throughput = requests / self.elapsed if self.elapsed else 0.0
+        outcomes = ", ".join(f"{key}={count}" for key, count in sorted(self.outcomes.items()))
+        return (
+            f"{self.name:<15} {requests:6d} req | {throughput:8.1f} req/s | "
+            f"p50 {percentile(self.latencies, 0.5) * 1000:8.1f} ms | "
+            f"p95 {percentile(self.latencies, 0.95) * 1000:8.1f} ms | "
+            f"p99 {percentile(self.latencies, 0.99) * 1000:8.1f} ms | "
+            f"peak RSS {self.peak_rss_kb / 1024:7.1f} MB | {outcomes}"
+        )
+
+
+async def run_requests(
+    name: str,
+    requests: List[Callable[[], Awaitable[str]]],
+    concurrency: int
+) -> ScenarioResult:
+    """
+    以 concurrency 并发执行请求
+    :param requests: 每个元素发出一个请求并返回结果分类（如状态码）
+    """
+    result = ScenarioResult(name)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(request: Callable[[], Awaitable[str]]) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                outcome = await request()
+            except Exception as e:
+                outcome = type(e).__name__
+            result.latencies.append(time.perf_counter() - started)
+            result.outcomes[outcome] += 1
+
+    reset_peak_rss()
+    started = time.perf_counter()
+    await asyncio.gather(*(one(request) for request in requests))
+    result.elapsed = time.perf_counter() - started
+    result.peak_rss_kb = peak_rss_kb()
+    return result
+
+
+async def login(client: httpx.AsyncClient, username: str) -> httpx.Response:
+    return await client.post("/api/auth/login", data={"username": username, "password": PASSWORD})
+
+
+async def create_users(client: httpx.AsyncClient, count: int) -> Dict[str, str]:
+    """注册用户并登录，返回 {用户名: token}"""
+    tokens = {}
+    for index in range(count):
+        username = f"loadtest_{index}"
+        response = await client.post("/api/auth/register", json={"username": username, "password": PASSWORD})
+        if response.status_code not in (201, 400):
+            response.raise_for_status()
+        response = await login(client, username)
+        response.raise_for_status()
+        tokens[username] = response.json()["access_token"]
+    return tokens
+
+
+async def upload(client: httpx.AsyncClient, token: str, image: CorpusImage, stream: bool) -> str:
+    headers = {"Authorization": f"Bearer {token}"}
+    files = {"file": (image.filename, image.content, image.content_type)}
+    if not stream:
+        response = await client.post("/api/photo/analyze", files=files, headers=headers)
+        if response.status_code == 200 and response.json().get("cached"):
+            return "200 cached"
+        return str(response.status_code)
+
+    # SSE 接口的分析失败以 error 事件返回，状态码仍为 200
+    last_event = None
+    async with client.stream("POST", "/api/photo/analyze/stream", files=files, headers=headers) as response:
+        if response.status_code != 200:
+            return str(response.status_code)
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                last_event = line.split(":", 1)[1].strip()
+    return "200" if last_event == "result" else f"stream {last_event}"
+
+
+async def upload_burst(client: httpx.AsyncClient, tokens: Dict[str, str], args) -> ScenarioResult:
+    corpus = generate_corpus(args.uploads, args.seed, args.duplicate_ratio, args.scale)
+    users = list(tokens.values())
+    requests = [
+        lambda image=image, token=users[index % len(users)]: upload(client, token, image, args.stream)
+        for index, image in enumerate(corpus)
+    ]
+    return await run_requests("upload_burst", requests, args.concurrency)
+
+
+async def seed_photos(tokens: Dict[str, str], photos: int) -> None:
+    """直接写入数据库为每个用户预置历史记录"""
+    async with async_session() as db:
+        users = (await db.execute(select(User).where(User.username.in_(list(tokens))))).scalars().all()
+        for user in users:
+            await create_photos(db, [
+                build_photo(user.id, f"photo_{i}.jpg", f"{user.id:08x}{i:056x}", f"{i:064x}", i, "deepseek", ANALYSIS)
+                for i in range(photos)
+            ])
+
+
+async def scroll(client: httpx.AsyncClient, token: str, pages: int, page_size: int, result: ScenarioResult) -> None:
+    """连续翻页，每一页单独计入延迟"""
+    headers = {"Authorization": f"Bearer {token}"}
+    cursor: Optional[str] = None
+    for _ in range(pages):
+        params = {"page_size": page_size}
+        if cursor:
+            params["cursor"] = cursor
+        started = time.perf_counter()
+        response = await client.get("/api/photo/history", params=params, headers=headers)
+        result.latencies.append(time.perf_counter() - started)
+        result.outcomes[str(response.status_code)] += 1
+        if response.status_code != 200:
+            return
+        cursor = response.json().get("next_cursor")
+        if not cursor:
+            return
+
+
+async def history_scroll(client: httpx.AsyncClient, tokens: Dict[str, str], args) -> ScenarioResult:
+    await seed_photos(tokens, args.photos)
+    result = ScenarioResult("history_scroll")
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def user_session(token: str) -> None:
+        async with semaphore:
+            await scroll(client, token, args.pages, args.page_size, result)
+
+    # 每个用户打开 --scrolls 次历史页面
+    reset_peak_rss()
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(token) for token in tokens.values() for _ in range(args.scrolls)))
+    result.elapsed = time.perf_counter() - started
+    result.peak_rss_kb = peak_rss_kb()
+    return result
+
+
+async def login_storm(client: httpx.AsyncClient, tokens: Dict[str, str], args) -> ScenarioResult:
+    usernames = list(tokens)
+
+    async def one(username: str) -> str:
+        return str((await login(client, username)).status_code)
+
+    requests = [lambda username=usernames[i % len(usernames)]: one(username) for i in range(args.logins)]
+    return await run_requests("login_storm", requests, args.concurrency)
+
+
+SCENARIOS = {
+    "upload_burst": upload_burst,
+    "history_scroll": history_scroll,
+    "login_storm": login_storm,
+}
+
+
+async def main_async(args) -> None:
+    # 默认关闭按用户和按服务商的速率限制，测量应用本身的吞吐量而不是配额
+    get_rate_limiter().enabled = args.rate_limit
+    settings.BCRYPT_ROUNDS = args.bcrypt_rounds
+    settings.PROVIDER_ATTEMPT_TIMEOUT_SECONDS = args.attempt_timeout
+    runner, _ = await start_mock_provider(
+        port=MOCK_PORT,
+        latency=args.latency,
+        token_delay=args.token_delay,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        truncate_rate=args.truncate_rate,
+        hang_rate=args.hang_rate,
+        disconnect_rate=args.disconnect_rate,
+        seed=args.seed,
+    )
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    print(
+        f"users={args.users}, concurrency={args.concurrency}, latency={args.latency}s, "
+        f"error_rate={args.error_rate}, rate_limit_rate={args.rate_limit_rate}, stream={args.stream}"
+    )
+    try:
+        # ASGI 传输不会触发 lifespan，手动执行启动和关闭
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+                tokens = await create_users(client, args.users)
+                for name in names:
+                    result = await SCENARIOS[name](client, tokens, args)
+                    print(result.report())
+        stats = runner.app["stats"]
+        print(
+            f"mock provider: {stats.requests} requests, {stats.errors} errors, {stats.rate_limited} rate limited, "
+            f"{stats.hung} hung ({stats.abandoned} abandoned by client), {stats.disconnected} disconnected"
+        )
+        for provider, usage in provider_usage_report().items():
+            print(
+                f"  {provider:<9} analyses {usage['analyses']:5.0f} | avg tokens in {usage['avg_input_tokens']:7.1f} "
+                f"out {usage['avg_output_tokens']:6.1f} | repaired {usage['repair_rate']:.1%} | "
+                f"parse failed {usage['parse_failure_rate']:.1%} | errors {usage['error_rate']:.1%}"
+            )
+    finally:
+        await runner.cleanup()
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端压测")
+    parser.add_argument("--scenario", choices=["all", *SCENARIOS], default="all")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    # upload_burst
+    parser.add_argument("--uploads", type=int, default=50)
+    parser.add_argument("--scale", type=float, default=0.5, help="合成图片的尺寸缩放系数")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.1)
+    parser.add_argument("--stream", action="store_true", help="使用 SSE 分析接口")
+    # history_scroll
+    parser.add_argument("--photos", type=int, default=500, help="每个用户预置的历史记录数")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--page-size", type=int, default=12)
+    parser.add_argument("--scrolls", type=int, default=5, help="每个用户打开历史页面的次数")
+    # login_storm
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--bcrypt-rounds", type=int, default=settings.BCRYPT_ROUNDS)
+    # 应用和模拟服务
+    parser.add_argument("--rate-limit", action="store_true", help="开启按用户和按服务商的速率限制")
+    parser.add_argument("--latency", type=float, default=0.5, help="模拟服务首个 token 前的延迟（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="模拟服务相邻 token 的生成间隔（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟服务返回 500 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="模拟服务返回 429 的比例")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="模拟服务输出中途截断的比例")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="模拟服务一直不返回的比例")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="模拟服务直接断开连接的比例")
+    parser.add_argument(
+        "--attempt-timeout", type=float, default=settings.PROVIDER_ATTEMPT_TIMEOUT_SECONDS, help="单次模型调用的超时（秒）"
+    )
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+本地模拟的视觉模型服务，实现 DeepSeek/OpenAI 的 /chat/completions 与 Claude 的 /messages 接口
+
+独立运行（在 backend 目录下）：
+    python -m benchmarks.mock_provider --port 9100 --latency 0.5 --token-delay 0.03 --error-rate 0.02 --rate-limit-rate 0.05 --hang-rate 0.01
+
+请求体带 "stream": true 时按 Server-Sent Events 逐个 token 返回；--latency 为首个 token 前的延迟，
+完整返回时还要等待全部 token 按 --token-delay 生成完。
+--rate-limit-rate 比例的请求立即返回 429（带 Retry-After），--error-rate 比例的请求在延迟后返回 500，
+--hang-rate 比例的请求一直不返回，直到客户端超时或取消后断开；--disconnect-rate 比例的请求不返回任何内容直接断开连接；
+--fail-first 个最先到达的请求返回 503（用于验证重试）；
+--truncate-rate 比例的分析请求在 suggestions 中途截断（模拟达到 max_tokens），追问缺失字段的请求不截断；
+--seed 固定随机序列，使同样的请求序列得到同样的错误分布。
+请求带有 JSON schema（response_format 或 Claude 的 tools）时只返回 schema 中的字段，Claude 按工具调用返回。
+然后将 DEEPSEEK_BASE_URL / OPENAI_BASE_URL / ANTHROPIC_BASE_URL 指向 http://127.0.0.1:9100/v1
+"""
+import argparse
+import asyncio
+import json
+import random
+from typing import List, Optional, Tuple
+
+from aiohttp import web
+
+CANNED_RESULT = {
+    "scores": {"technical": 78, "composition": 72, "aesthetic": 80, "narrative": 68},
+    "analysis": {
+        "highlights": ["主体清晰，对焦准确", "色彩和谐，整体氛围统一"],
+        "improvements": ["背景略显杂乱", "画面右侧留白过多"],
+        "suggestions": ["尝试更低的拍摄角度", "后期适当裁剪去除边缘干扰元素"],
+    },
+}
+
+CHAT_USAGE = {"prompt_tokens": 900, "completion_tokens": 180, "total_tokens": 1080}
+MESSAGES_USAGE = {"input_tokens": 900, "output_tokens": 180}
+
+
+# 流式输出时每个 token 的字符数，中文约一到两个字一个 token
+TOKEN_CHARS = 3
+
+
+def _tokens(text: str) -> List[str]:
+    return [text[i:i + TOKEN_CHARS] for i in range(0, len(text), TOKEN_CHARS)]
+
+
+async def _generate(request: web.Request, content: str) -> None:
+    """完整返回时等待与流式输出相同的生成时间"""
+    await asyncio.sleep(request.app["token_delay"] * (len(_tokens(content)) - 1))
+
+
+class MockStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.hung = 0
+        self.disconnected = 0
+        # 客户端在响应前主动断开的请求数（超时或取消）
+        self.abandoned = 0
+        self.peers = set()
+        # 同时处理中的请求数及其峰值
+        self.active = 0
+        self.peak_active = 0
+
+    @property
+    def connections(self) -> int:
+        """服务端看到的不同客户端连接数"""
+        return len(self.peers)
+
+
+def _record(request: web.Request) -> None:
+    stats: MockStats = request.app["stats"]
+    stats.requests += 1
+    peer = request.transport.get_extra_info("peername") if request.transport else None
+    if peer:
+        stats.peers.add(peer)
+
+
+@web.middleware
+async def _track_active(request: web.Request, handler) -> web.StreamResponse:
+    stats: MockStats = request.app["stats"]
+    stats.active += 1
+    stats.peak_active = max(stats.peak_active, stats.active)
+    try:
+        return await handler(request)
+    finally:
+        stats.active -= 1
+
+
+async def _hang(request: web.Request) -> web.Response:
+    """不返回响应，直到客户端断开连接"""
+    stats: MockStats = request.app["stats"]
+    stats.hung += 1
+    while request.transport is not None and not request.transport.is_closing():
+        await asyncio.sleep(0.01)
+    stats.abandoned += 1
+    return web.Response(status=504)
+
+
+async def _inject_failure(request: web.Request) -> Optional[web.Response]:
+    """按配置的比例返回限流、服务端错误、不响应或断开连接，正常处理时返回 None"""
+    app = request.app
+    if app["stats"].requests <= app["fail_first"]:
+        app["stats"].errors += 1
+        return web.json_response({"error": {"type": "overloaded_error", "message": "mock overloaded"}}, status=503)
+    roll = app["random"].random()
+    if roll < app["rate_limit_rate"]:
+        app["stats"].rate_limited += 1
+        return web.json_response(
+            {"error": {"type": "rate_limit_error", "message": "mock rate limit"}},
+            status=429,
+            headers={"Retry-After": str(app["retry_after"])}
+        )
+    if roll < app["rate_limit_rate"] + app["error_rate"]:
+        app["stats"].errors += 1
+        await asyncio.sleep(app["latency"])
+        return web.json_response({"error": {"type": "api_error", "message": "mock server error"}}, status=500)
+    roll -= app["rate_limit_rate"] + app["error_rate"]
+    if roll < app["hang_rate"]:
+        return await _hang(request)
+    if roll < app["hang_rate"] + app["disconnect_rate"]:
+        app["stats"].disconnected += 1
+        request.transport.close()
+        return web.Response(status=502)
+    return None
+
+
+def _requested(body: dict) -> dict:
+    """按请求中的 JSON schema 返回对应字段，追问缺失字段时只返回被问到的部分"""
+    response_format = body.get("response_format") or {}
+    if response_format.get("type") == "json_schema":
+        schema = response_format["json_schema"]["schema"]
+    elif body.get("tools"):
+        schema = body["tools"][0]["input_schema"]
+    else:
+        return CANNED_RESULT
+    return {
+        section: {key: CANNED_RESULT[section][key] for key in spec["properties"]}
+        for section, spec in schema["properties"].items()
+    }
+
+
+def _has_image(body: dict) -> bool:
+    return any(
+        part.get("type") in ("image", "image_url")
+        for message in body.get("messages", [])
+        for part in (message.get("content") if isinstance(message.get("content"), list) else [])
+    )
+
+
+def _truncated(request: web.Request, body: dict) -> bool:
+    """按 truncate_rate 模拟输出达到 max_tokens；只截断带图片的分析请求，追问缺失字段的请求正常返回"""
+    return _has_image(body) and request.app["random"].random() < request.app["truncate_rate"]
+
+
+def _truncate(content: str) -> str:
+    """在 suggestions 的第一条中间截断，评分、highlights 和 improvements 保持完整"""
+    cut = content.find('"suggestions"')
+    return content[:cut + 20] if cut != -1 else content[:len(content) // 2]
+
+
+async def _stream(request: web.Request, events: List[Tuple[Optional[str], dict]], done: bool = False) -> web.StreamResponse:
+    """
+    按 Server-Sent Events 逐条写出，相邻两条之间等待 token_delay
+    :param done: 是否以 OpenAI 风格的 data: [DONE] 结束
+    """
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+    await response.prepare(request)
+    for index, (event, data) in enumerate(events):
+        if index:
+            await asyncio.sleep(request.app["token_delay"])
+        prefix = f"event: {event}\n" if event else ""
+        await response.write(f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8"))
+    if done:
+        await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+async def chat_completions(request: web.Request) -> web.StreamResponse:
+    _record(request)
+    body = await request.json()
+    failure = await _inject_failure(request)
+    if failure is not None:
+        return failure
+    await asyncio.sleep(request.app["latency"])
+    content = json.dumps(_requested(body), ensure_ascii=False)
+    truncated = _truncated(request, body)
+    if truncated:
+        content = _truncate(content)
+    finish_reason = "length" if truncated else "stop"
+    if body.get("stream"):
+        events = [
+            (None, {"id": "mock", "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": token}}]})
+            for token in _tokens(content)
+        ]
+        events.append((None, {
+            "id": "mock", "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}]
+        }))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            events.append((None, {"id": "mock", "object": "chat.completion.chunk", "choices": [], "usage": CHAT_USAGE}))
+        return await _stream(request, events, done=True)
+    await _generate(request, content)
+    return web.json_response({
+        "id": "mock",
+        "object": "chat.completion",
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+        "usage": CHAT_USAGE,
+    })
+
+
+async def messages(request: web.Request) -> web.StreamResponse:
+    _record(request)
+    body = await request.json()
+    failure = await _inject_failure(request)
+    if failure is not None:
+        return failure
+    await asyncio.sleep(request.app["latency"])
+    result = _requested(body)
+    content = json.dumps(result, ensure_ascii=False)
+    truncated = _truncated(request, body)
+    if truncated:
+        content = _truncate(content)
+    stop_reason = "max_tokens" if truncated else ("tool_use" if body.get("tools") else "end_turn")
+    # 请求带有工具时按工具调用返回，结果在工具参数中
+    tool = body["tools"][0]["name"] if body.get("tools") else None
+    if body.get("stream"):
+        if tool:
+            block = {"type": "tool_use", "id": "toolu_mock", "name": tool, "input": {}}
+            deltas = [{"type": "input_json_delta", "partial_json": token} for token in _tokens(content)]
+        else:
+            block = {"type": "text", "text": ""}
+            deltas = [{"type": "text_delta", "text": token} for token in _tokens(content)]
+        events = [
+            ("message_start", {
+                "type": "message_start",
+                "message": {"id": "mock", "role": "assistant", "content": [], "usage": {**MESSAGES_USAGE, "output_tokens": 1}},
+            }),
+            ("content_block_start", {"type": "content_block_start", "index": 0, "content_block": block}),
+            *[("content_block_delta", {"type": "content_block_delta", "index": 0, "delta": delta}) for delta in deltas],
+            ("content_block_stop", {"type": "content_block_stop", "index": 0}),
+            ("message_delta", {
+                "type": "message_delta",
+                "delta": {"stop_reason": stop_reason},
+                "usage": {"output_tokens": MESSAGES_USAGE["output_tokens"]},
+            }),
+            ("message_stop", {"type": "message_stop"}),
+        ]
+        return await _stream(request, events)
+    await _generate(request, content)
+    if tool:
+        if truncated:
+            # 截断的工具参数只保留已完整的部分
+            result = {**result, "analysis": {k: v for k, v in result["analysis"].items() if k != "suggestions"}}
+        blocks = [{"type": "tool_use", "id": "toolu_mock", "name": tool, "input": result}]
+    else:
+        blocks = [{"type": "text", "text": content}]
+    return web.json_response({
+        "id": "mock",
+        "type": "message",
+        "role": "assistant",
+        "content": blocks,
+        "stop_reason": stop_reason,
+        "usage": MESSAGES_USAGE,
+    })
+
+
+def create_app(
+    latency: float = 0.0,
+    token_delay: float = 0.0,
+    error_rate: float = 0.0,
+    rate_limit_rate: float = 0.0,
+    retry_after: int = 1,
+    truncate_rate: float = 0.0,
+    hang_rate: float = 0.0,
+    disconnect_rate: float = 0.0,
+    fail_first: int = 0,
+    seed: Optional[int] = None
+) -> web.Application:
+    """
+    :param latency: 首个 token 前的延迟
+    :param token_delay: 相邻 token 之间的延迟，完整返回时等待全部 token 生成完再响应
+    :param error_rate: 返回 500 的请求比例
+    :param rate_limit_rate: 返回 429 的请求比例
+    :param retry_after: 429 响应的 Retry-After 秒数
+    :param truncate_rate: 输出在中途截断（达到 max_tokens）的分析请求比例
+    :param hang_rate: 一直不返回的请求比例
+    :param disconnect_rate: 不返回内容直接断开连接的请求比例
+    :param fail_first: 最先到达的若干个请求返回 503
+    :param seed: 错误注入的随机种子
+    """
+    app = web.Application(client_max_size=64 * 1024 * 1024, middlewares=[_track_active])
+    app["latency"] = latency
+    app["token_delay"] = token_delay
+    app["error_rate"] = error_rate
+    app["rate_limit_rate"] = rate_limit_rate
+    app["retry_after"] = retry_after
+    app["truncate_rate"] = truncate_rate
+    app["hang_rate"] = hang_rate
+    app["disconnect_rate"] = disconnect_rate
+    app["fail_first"] = fail_first
+    app["random"] = random.Random(seed)
+    app["stats"] = MockStats()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/messages", messages)
+    return app
+
+
+async def start_mock_provider(host: str = "127.0.0.1", port: int = 0, **options) -> Tuple[web.AppRunner, str]:
+    """
+    在当前事件循环中启动模拟服务
+    :return: (runner, base_url)，用完后调用 runner.cleanup()
+    """
+    app = create_app(**options)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    actual_port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://{host}:{actual_port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟视觉模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.5, help="每个请求的模拟延迟（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="相邻 token 的生成间隔（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的请求比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的请求比例")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 响应的 Retry-After（秒）")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="输出中途截断的分析请求比例")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="一直不返回的请求比例")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0, help="直接断开连接的请求比例")
+    parser.add_argument("--fail-first", type=int, default=0, help="最先到达的若干个请求返回 503")
+    parser.add_argument("--seed", type=int, default=None, help="错误注入的随机种子")
+    args = parser.parse_args()
+    app = create_app(
+        latency=args.latency,
+        token_delay=args.token_delay,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        truncate_rate=args.truncate_rate,
+        hang_rate=args.hang_rate,
+        disconnect_rate=args.disconnect_rate,
+        fail_first=args.fail_first,
+        seed=args.seed,
+    )
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+各服务商图片预处理配置的上传字节数与图片 token 估算
+
+在 backend 目录下运行：
+    python -m benchmarks.report_image_profiles
+
+对不同尺寸、长宽比的合成照片先按上传流程压缩（最长边 2048、目标 1MB），
+再分别按各服务商配置转换，与直接发送压缩图相比较：
+- bytes：发送的图片字节数（base64 前）
+- tokens：按配置的计费方式估算的图片输入 token；直接发送时服务端也会缩放，
+  因此 token 差异只来自图块对齐，主要节省的是上传量和服务端的解码缩放
+"""
+import argparse
+import io
+import time
+from dataclasses import replace
+
+from PIL import Image, ImageFilter
+
+from app.utils.image import IMAGE_PROFILES, estimate_image_tokens, fit_to_profile, prepare_for_profile, process_image
+
+SIZES = [(6000, 4000), (4000, 3000), (3024, 4032), (4200, 3000), (4000, 4000), (5760, 2160), (1920, 1080)]
+
+
+def make_photo(width: int, height: int) -> bytes:
+    base = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.effect_noise((width // 4, height // 4), 30).resize((width, height)).convert("RGB")
+    img = Image.blend(base, noise, 0.35).filter(ImageFilter.SMOOTH)
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=92)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="图片预处理配置的字节与 token 报告")
+    parser.add_argument("--profiles", nargs="+", default=list(IMAGE_PROFILES))
+    args = parser.parse_args()
+
+    totals = {name: [0, 0, 0, 0] for name in args.profiles}
+    for width, height in SIZES:
+        content = process_image(make_photo(width, height)).content
+        source = Image.open(io.BytesIO(content))
+        print(f"{width}x{height} -> stored {source.width}x{source.height}, {len(content) / 1024:.0f} KB")
+
+        for name in args.profiles:
+            profile = IMAGE_PROFILES[name]
+            # 直接发送时服务端按同样的规则缩放，但不会做图块对齐
+            unaligned = fit_to_profile(source.width, source.height, replace(profile, tile_size=0))
+            baseline_tokens = estimate_image_tokens(*unaligned, profile)
+
+            started = time.perf_counter()
+            sent = prepare_for_profile(content, profile)
+            elapsed = time.perf_counter() - started
+            sent_size = Image.open(io.BytesIO(sent)).size
+            tokens = estimate_image_tokens(*sent_size, profile)
+
+            total = totals[name]
+            total[0] += len(content)
+            total[1] += len(sent)
+            total[2] += baseline_tokens
+            total[3] += tokens
+            print(
+                f"  {name:<9} {sent_size[0]:>4}x{sent_size[1]:<4} | "
+                f"bytes {len(content) / 1024:5.0f} KB -> {len(sent) / 1024:5.0f} KB | "
+                f"tokens {baseline_tokens:5d} -> {tokens:5d} | {elapsed * 1000:4.0f}ms"
+            )
+
+    print("total")
+    for name, (raw_bytes, sent_bytes, baseline_tokens, tokens) in totals.items():
+        print(
+            f"  {name:<9} bytes {raw_bytes / 1024:6.0f} KB -> {sent_bytes / 1024:6.0f} KB "
+            f"({sent_bytes / raw_bytes:5.1%}) | tokens {baseline_tokens:6d} -> {tokens:6d}"
+        )
+
+
+if __name__ == "__main__":
+    main()
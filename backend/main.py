@@ -1,17 +1,42 @@
+import hmac
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from typing import Optional
+from fastapi import FastAPI, Header, HTTPException, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 
 from app.core.config import settings
 from app.core.database import init_db
+from app.core.deadline import DeadlineExceededError, ProviderTimeoutError
+from app.core.metrics import REGISTRY, MetricsMiddleware, service_collector
+from app.core.rate_limit import ProviderRateLimitedError, RateLimitExceededError
 from app.api import api_router
+from app.services.image_pool import PoolSaturatedError, image_pool
+from app.services.provider_router import ProviderUnavailableError, get_provider_router
+from app.services.http_pool import init_client_registry, close_client_registry
+from app.services.job_queue import start_job_worker, stop_job_worker
+from app.services.phash_index import phash_index
+from app.services.result_cache import analysis_cache
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 启动时初始化数据库
     await init_db()
+    # 创建模型服务商的共享连接池
+    await init_client_registry()
+    # 启动图片处理池
+    image_pool.start()
+    # 加载近似重复图片索引
+    if settings.NEAR_DUPLICATE_ENABLED:
+        await phash_index.load()
+    # 启动异步分析任务的工作池
+    if settings.JOB_WORKER_ENABLED:
+        await start_job_worker()
     yield
+    await stop_job_worker()
+    await close_client_registry()
+    image_pool.shutdown()
 
 
 app = FastAPI(
@@ -30,6 +55,69 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 记录每个路由的耗时和状态码，最后添加的中间件在最外层，耗时包括 CORS 处理
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+
+@app.exception_handler(PoolSaturatedError)
+async def pool_saturated_handler(request: Request, exc: PoolSaturatedError):
+    # 图片处理队列已满时让客户端稍后重试，而不是无限排队
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "服务繁忙，请稍后重试"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.exception_handler(ProviderUnavailableError)
+async def provider_unavailable_handler(request: Request, exc: ProviderUnavailableError):
+    # 所有服务商都在熔断中
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(settings.CIRCUIT_RESET_SECONDS))}
+    )
+
+
+@app.exception_handler(DeadlineExceededError)
+async def deadline_exceeded_handler(request: Request, exc: DeadlineExceededError):
+    # 在请求的截止时间内没有完成分析
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={"detail": "分析超时，请稍后重试"}
+    )
+
+
+@app.exception_handler(ProviderTimeoutError)
+async def provider_timeout_handler(request: Request, exc: ProviderTimeoutError):
+    # 所有候选服务商在重试后仍然超时
+    return JSONResponse(
+        status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+        content={"detail": "模型服务响应超时，请稍后重试"}
+    )
+
+
+@app.exception_handler(RateLimitExceededError)
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceededError):
+    # 用户触发分析过于频繁
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": "请求过于频繁，请稍后重试"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+@app.exception_handler(ProviderRateLimitedError)
+async def provider_rate_limited_handler(request: Request, exc: ProviderRateLimitedError):
+    # 所有候选服务商的调用配额都已用完
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "服务繁忙，请稍后重试"},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
 # 注册路由
 app.include_router(api_router)
 
@@ -45,4 +133,30 @@ async def root():
 
 @app.get("/health")
 async def health():
+    """存活检查，内部状态通过 /metrics 查看"""
     return {"status": "ok"}
+
+
+REGISTRY.register_collector(service_collector(
+    analysis_cache.stats, image_pool.stats, lambda: get_provider_router().snapshot()
+))
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    """
+    Prometheus 文本格式的监控指标，包含服务商状态和用量等内部信息，
+    需要在 Authorization 头中携带 Bearer METRICS_TOKEN；未配置 METRICS_TOKEN 时不提供
+    """
+    if not settings.METRICS_ENABLED or not settings.METRICS_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="监控指标未开启"
+        )
+    if not hmac.compare_digest((authorization or "").encode(), f"Bearer {settings.METRICS_TOKEN}".encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无效的监控令牌",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,67 @@
+"""
+为已有图片补算感知哈希，使其参与近似重复检测
+
+在 backend 目录下运行（需先执行 scripts.migrate_blobs）：
+    python -m scripts.backfill_phash --batch-size 500
+"""
+import argparse
+import asyncio
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+
+from app.core.database import async_session, engine, init_db
+from app.models.photo import Photo
+from app.models.user import User  # noqa: F401  确保关系映射完整
+from app.services.blob_store import BlobNotFoundError, get_blob_store
+from app.services.phash_index import to_signed
+from app.utils.image import compute_dhash
+
+
+async def backfill(batch_size: int) -> None:
+    await init_db()
+
+    blob_store = get_blob_store()
+    last_id = 0
+    updated = 0
+
+    while True:
+        async with async_session() as db:
+            result = await db.execute(
+                select(Photo.id, Photo.image_hash)
+                .where(Photo.id > last_id, Photo.phash.is_(None), Photo.image_hash.is_not(None))
+                .order_by(Photo.id)
+                .limit(batch_size)
+            )
+            rows = result.all()
+            if not rows:
+                break
+
+            for row in rows:
+                try:
+                    image_data = await run_in_threadpool(blob_store.get, row.image_hash)
+                except BlobNotFoundError:
+                    print(f"图片 {row.id} 的内容不存在，跳过")
+                    continue
+                phash = await run_in_threadpool(compute_dhash, image_data)
+                await db.execute(
+                    Photo.__table__.update().where(Photo.id == row.id).values(phash=to_signed(phash))
+                )
+                updated += 1
+
+            await db.commit()
+            last_id = rows[-1].id
+            print(f"已处理到 id {last_id}，共更新 {updated} 条")
+
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="补算图片感知哈希")
+    parser.add_argument("--batch-size", type=int, default=500, help="每批处理的记录数")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+清理不再被任何记录引用的 blob
+
+在 backend 目录下运行：
+    python -m scripts.gc_blobs [--dry-run]
+
+删除记录时，最近写入过的 blob 可能属于尚未保存记录的并发上传，不会立即删除；
+本脚本遍历 blob 存储，删除写入时间早于 BLOB_GC_GRACE_SECONDS 且没有记录引用的 blob，可由 cron 定期运行。
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.core.config import settings
+from app.core.database import async_session, engine
+from app.models.user import User  # noqa: F401  确保关系映射完整
+from app.services.blob_store import BlobNotFoundError, get_blob_store
+from app.services.photo_service import is_blob_referenced
+
+
+async def collect(dry_run: bool) -> None:
+    blob_store = get_blob_store()
+    digests = await run_in_threadpool(lambda: list(blob_store.iter_digests()))
+    cutoff = time.time() - settings.BLOB_GC_GRACE_SECONDS
+    removed = 0
+    freed = 0
+
+    async with async_session() as db:
+        for digest in digests:
+            try:
+                info = await run_in_threadpool(blob_store.stat, digest)
+            except BlobNotFoundError:
+                continue
+            if info.modified_at >= cutoff or await is_blob_referenced(db, digest):
+                continue
+            if not dry_run:
+                await run_in_threadpool(blob_store.delete, digest)
+            removed += 1
+            freed += info.size
+
+    action = "可清理" if dry_run else "已清理"
+    print(f"共扫描 {len(digests)} 个 blob，{action} {removed} 个（{freed / 1024 / 1024:.1f} MB）")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="清理不再被引用的 blob")
+    parser.add_argument("--dry-run", action="store_true", help="只统计，不删除")
+    args = parser.parse_args()
+    asyncio.run(collect(args.dry_run))
+
+
+if __name__ == "__main__":
+    main()
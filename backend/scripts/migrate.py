@@ -0,0 +1,44 @@
+"""
+执行数据库迁移
+
+在 backend 目录下运行：
+    python -m scripts.migrate [--status]
+
+默认启动时会自动执行迁移（DB_AUTO_MIGRATE）；多实例部署时可以关闭自动迁移，在发布流程中运行本脚本。
+--status 只列出各迁移是否已执行。
+"""
+import argparse
+import asyncio
+
+from app.core.database import engine
+from app.migrations import applied_revisions, load_migrations, run_migrations
+
+
+async def show_status() -> None:
+    async with engine.connect() as conn:
+        applied = set(await conn.run_sync(applied_revisions))
+    for migration in load_migrations():
+        state = "applied" if migration.revision in applied else "pending"
+        summary = (migration.__doc__ or "").strip().splitlines()
+        print(f"{migration.revision}  {state:<8} {summary[0] if summary else ''}")
+
+
+async def main_async(args) -> None:
+    try:
+        if args.status:
+            await show_status()
+            return
+        executed = await run_migrations(engine)
+        print(f"已执行迁移: {', '.join(executed)}" if executed else "数据库已是最新版本")
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="执行数据库迁移")
+    parser.add_argument("--status", action="store_true", help="只列出各迁移是否已执行")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+将旧版本存储在 photos 表中的 base64 图片迁移到 blob 存储
+
+在 backend 目录下运行：
+    python -m scripts.migrate_blobs --batch-size 200
+
+按主键分批处理，每批一个事务，中断后重新运行会从未迁移的记录继续。
+"""
+import argparse
+import asyncio
+import time
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select, or_, text
+
+from app.core.database import async_session, engine, init_db
+from app.models.photo import Photo
+from app.models.user import User  # noqa: F401  确保关系映射完整
+from app.services.blob_store import get_blob_store
+from app.utils.image import decode_data_uri
+
+
+async def migrate(batch_size: int, vacuum: bool) -> None:
+    # 补齐 image_hash / thumbnail_hash 列
+    await init_db()
+
+    blob_store = get_blob_store()
+    last_id = 0
+    migrated = 0
+    started = time.perf_counter()
+
+    while True:
+        async with async_session() as db:
+            result = await db.execute(
+                select(Photo.id, Photo.image_data, Photo.thumbnail)
+                .where(
+                    Photo.id > last_id,
+                    or_(Photo.image_data.is_not(None), Photo.thumbnail.is_not(None))
+                )
+                .order_by(Photo.id)
+                .limit(batch_size)
+            )
+            rows = result.all()
+            if not rows:
+                break
+
+            for row in rows:
+                values = {"image_data": None, "thumbnail": None}
+                if row.image_data:
+                    values["image_hash"] = await run_in_threadpool(
+                        blob_store.put, decode_data_uri(row.image_data)
+                    )
+                if row.thumbnail:
+                    values["thumbnail_hash"] = await run_in_threadpool(
+                        blob_store.put, decode_data_uri(row.thumbnail)
+                    )
+                await db.execute(
+                    Photo.__table__.update().where(Photo.id == row.id).values(**values)
+                )
+
+            await db.commit()
+            last_id = rows[-1].id
+            migrated += len(rows)
+            print(f"已迁移 {migrated} 条记录 (id <= {last_id})")
+
+    print(f"迁移完成，共 {migrated} 条，耗时 {time.perf_counter() - started:.1f}s")
+
+    if vacuum and engine.dialect.name == "sqlite":
+        # VACUUM 不能在事务中执行
+        async with engine.connect() as conn:
+            await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text("VACUUM"))
+        print("已执行 VACUUM 回收空间")
+
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="迁移图片数据到 blob 存储")
+    parser.add_argument("--batch-size", type=int, default=200, help="每批处理的记录数")
+    parser.add_argument("--vacuum", action="store_true", help="迁移后对 SQLite 执行 VACUUM")
+    args = parser.parse_args()
+    asyncio.run(migrate(args.batch_size, args.vacuum))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from itertools import count
+
+import pytest
+
+# 测试不读取本地 .env 中的密钥，也不连接真实数据库和模型服务
+os.environ.setdefault("DEBUG", "false")
+# 使用临时文件而不是内存数据库：内存数据库只有一个共享连接，并发的会话会互相提交或回滚对方的事务
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='test_db_')}/test.db")
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("BLOB_DIR", tempfile.mkdtemp(prefix="test_blobs_"))
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+_usernames = count()
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """
+    在进程内调用整个应用：内存数据库、临时 blob 目录，三个服务商都指向本地模拟服务
+    用法：async with api(**模拟服务参数) as client，client 已登录一个新用户，
+    client.provider_stats 为模拟服务收到的请求统计
+    """
+    import httpx
+
+    from app.core import rate_limit
+    from app.core.config import settings
+    from app.core.database import Base, engine, init_db
+    from app.services import http_pool, provider_router
+    from app.services.http_pool import ClientRegistry
+    from app.services.image_pool import image_pool
+    from app.services.phash_index import phash_index
+    from app.services.provider_router import ProviderRouter
+    from app.services.result_cache import analysis_cache
+    from benchmarks.mock_provider import start_mock_provider
+    from main import app
+
+    monkeypatch.setattr(settings, "AUTH_CACHE_ENABLED", False)
+    monkeypatch.setattr(provider_router, "_router", ProviderRouter(["deepseek", "openai", "claude"]))
+    monkeypatch.setattr(rate_limit, "_rate_limiter", rate_limit.RateLimiter(rate_limit.MemoryRateLimitBackend()))
+
+    @asynccontextmanager
+    async def session(**options):
+        await init_db()
+        async with engine.begin() as conn:
+            for table in reversed(Base.metadata.sorted_tables):
+                await conn.execute(table.delete())
+        analysis_cache.memory.clear()
+        phash_index.clear()
+
+        runner, base_url = await start_mock_provider(**options)
+        registry = ClientRegistry()
+        monkeypatch.setattr(http_pool, "_registry", registry)
+        for provider in ("deepseek", "openai", "claude"):
+            registry.get_client(provider).base_url = base_url
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=30) as client:
+                username, password = f"user_{next(_usernames)}", "test-password"
+                await client.post("/api/auth/register", json={"username": username, "password": password})
+                response = await client.post("/api/auth/login", data={"username": username, "password": password})
+                client.headers["Authorization"] = f"Bearer {response.json()['access_token']}"
+                client.provider_stats = runner.app["stats"]
+                yield client
+        finally:
+            await registry.close()
+            await runner.cleanup()
+            # 连接属于当前事件循环，下一个测试重新建立
+            await engine.dispose()
+            # 图片处理池的信号量属于当前事件循环，下一个测试重新创建
+            image_pool.shutdown()
+
+    return session
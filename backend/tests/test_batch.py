@@ -0,0 +1,151 @@
+import asyncio
+import io
+import json
+
+from app.api import photo as photo_api
+from app.core.config import settings
+from app.services.batch_analysis import BatchAnalysis
+from app.services.photo_service import spool_uploads
+from benchmarks.corpus import make_photo
+from tests.test_photo_api import upload_files
+
+
+def batch_files(*seeds: int):
+    return [("files", upload) for _, upload in upload_files(*seeds)]
+
+
+def read_lines(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_batch_streams_results_errors_and_saved_ids(api):
+    files = [*batch_files(1, 2, 1), ("files", ("broken.jpg", b"not an image", "image/jpeg"))]
+
+    async def scenario():
+        async with api() as client:
+            response = await client.post("/api/photo/analyze/batch", files=files, data={"model": "deepseek"})
+            history = (await client.get("/api/photo/history")).json()
+            return response, history, client.provider_stats.requests
+
+    response, history, requests = asyncio.run(scenario())
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = read_lines(response)
+    results = {line["index"]: line["result"] for line in lines if line["event"] == "result"}
+    errors = [line for line in lines if line["event"] == "error"]
+    done = lines[-1]
+
+    assert sorted(results) == [0, 1, 2]
+    assert [(error["index"], error["filename"]) for error in errors] == [(3, "broken.jpg")]
+    # 批次内重复的图片只分析一次，与首次出现的图片共用记录
+    # 先完成预处理的一张负责分析，另一张标记为 cached
+    assert sorted([results[0]["cached"], results[2]["cached"]]) == [False, True]
+    assert results[0]["filename"] == results[2]["filename"] == "photo_1.jpg"
+    assert results[0]["scores"] == results[2]["scores"]
+    assert requests == 2
+    assert (done["event"], done["total"], done["succeeded"], done["failed"]) == ("done", 4, 3, 1)
+    saved = {item["index"]: item["id"] for item in done["saved"]}
+    assert sorted(saved) == [0, 1, 2]
+    assert saved[2] == saved[0] != saved[1]
+    assert history["total"] == 2
+    assert {item["id"] for item in history["items"]} == set(saved.values())
+
+
+def test_nothing_is_saved_when_the_client_disconnects(api):
+    async def scenario():
+        async with api(latency=0.2) as client:
+            user_id = (await client.get("/api/auth/me")).json()["id"]
+            uploads = [(f"photo_{seed}.jpg", io.BytesIO(make_photo(320, 240, seed))) for seed in range(3)]
+            stream = BatchAnalysis(user_id, "deepseek", uploads).run()
+            first = await stream.__anext__()
+            # 相当于客户端读到第一行后断开
+            await stream.aclose()
+            history = (await client.get("/api/photo/history")).json()
+            return first, history, uploads
+
+    first, history, uploads = asyncio.run(scenario())
+    assert first["event"] == "result"
+    assert history["total"] == 0
+    assert all(file.closed for _, file in uploads)
+
+
+def test_batch_over_the_file_limit_is_rejected(api, monkeypatch):
+    monkeypatch.setattr(settings, "BATCH_MAX_FILES", 2)
+
+    async def scenario():
+        async with api() as client:
+            response = await client.post("/api/photo/analyze/batch", files=batch_files(1, 2, 3))
+            return response.status_code, client.provider_stats.requests
+
+    assert asyncio.run(scenario()) == (400, 0)
+
+
+def test_batch_provider_limit_applies_to_coalesced_analyses(api, monkeypatch):
+    monkeypatch.setattr(settings, "ANALYSIS_COALESCE_ENABLED", True)
+    monkeypatch.setattr(settings, "BATCH_PROVIDER_CONCURRENCY", "deepseek=2")
+
+    async def scenario():
+        async with api(latency=0.1) as client:
+            files = batch_files(*range(6))
+            response = await client.post("/api/photo/analyze/batch", files=files, data={"model": "deepseek"})
+            return read_lines(response)[-1], client.provider_stats
+
+    done, stats = asyncio.run(scenario())
+    assert done["succeeded"] == 6
+    assert stats.requests == 6
+    assert stats.peak_active == 2
+
+
+def test_spooled_files_are_closed_when_the_client_disconnects_before_the_body(api, monkeypatch):
+    from main import app
+
+    spooled = []
+
+    def recording_spool(files):
+        copies = spool_uploads(files)
+        spooled.extend(copies)
+        return copies
+
+    monkeypatch.setattr(photo_api, "spool_uploads", recording_spool)
+
+    async def scenario():
+        async with api(latency=0.5) as client:
+            request = client.build_request(
+                "POST", "/api/photo/analyze/batch", files=batch_files(1, 2), data={"model": "deepseek"}
+            )
+            messages = [{"type": "http.request", "body": request.read(), "more_body": False}]
+            sent = []
+
+            async def receive():
+                # 请求体发送完后客户端立即断开
+                return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+            async def send(message):
+                sent.append(message)
+                if message["type"] == "http.response.start":
+                    # 写出响应头较慢，断开在响应体开始输出之前被发现
+                    await asyncio.sleep(0.05)
+
+            scope = {
+                "type": "http",
+                "asgi": {"version": "3.0"},
+                "http_version": "1.1",
+                "method": "POST",
+                "scheme": "http",
+                "path": request.url.path,
+                "raw_path": request.url.raw_path,
+                "query_string": b"",
+                "root_path": "",
+                "headers": [(name.lower(), value) for name, value in request.headers.raw],
+                "client": ("127.0.0.1", 50000),
+                "server": ("test", 80),
+            }
+            await app(scope, receive, send)
+            # 在事件循环结束、遗留的生成器被回收之前检查
+            closed = [file.closed for file in spooled]
+            history = (await client.get("/api/photo/history")).json()
+            return sent, closed, history
+
+    sent, closed, history = asyncio.run(scenario())
+    assert [message["type"] for message in sent] == ["http.response.start"]
+    assert closed == [True, True]
+    assert history["total"] == 0
@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from app.api.blob import _parse_range
+from app.services.blob_store import BlobStore, LocalBlobStore, blob_url, sign_blob, verify_blob_signature
+
+DIGEST = "a" * 64
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=10-", (10, 99)),
+    ("bytes=-5", (95, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=90-200", (90, 99)),
+    (" bytes=0-0 ", (0, 0)),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=-", "bytes=0-1,5-6", "items=0-1", "bytes=a-b"])
+def test_parse_range_ignores_unsupported(header):
+    assert _parse_range(header, 100) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=5-1", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        _parse_range(header, 100)
+
+
+def test_blob_url_is_signed():
+    url = blob_url(DIGEST)
+    path, query = url.split("?")
+    params = dict(item.split("=") for item in query.split("&"))
+    assert path == f"/api/blobs/{DIGEST}"
+    assert int(params["exp"]) > time.time()
+    assert verify_blob_signature(DIGEST, int(params["exp"]), params["sig"])
+    assert blob_url(None) is None
+
+
+def test_signature_rejects_tampering_and_expiry():
+    expires = int(time.time()) + 60
+    signature = sign_blob(DIGEST, expires)
+    assert not verify_blob_signature("b" * 64, expires, signature)
+    assert not verify_blob_signature(DIGEST, expires + 1, signature)
+    expired = int(time.time()) - 1
+    assert not verify_blob_signature(DIGEST, expired, sign_blob(DIGEST, expired))
+
+
+def test_local_store_round_trip(tmp_path):
+    store = LocalBlobStore(str(tmp_path))
+    digest = store.put(b"0123456789")
+    assert store.put(b"0123456789") == digest
+    assert store.stat(digest).size == 10
+    assert b"".join(store.iter_range(digest, 2, 4)) == b"234"
+    assert list(store.iter_digests()) == [digest]
+    store.delete(digest)
+    assert not store.exists(digest)
+
+
+def test_store_missing_a_method_cannot_be_created():
+    class IncompleteStore(BlobStore):
+        def put(self, data):
+            return ""
+
+    with pytest.raises(TypeError, match="iter_range"):
+        IncompleteStore()
@@ -0,0 +1,88 @@
+import asyncio
+
+from app.core.database import init_db
+from app.services.result_cache import AnalysisResultCache, make_cache_key
+from app.utils import cache as cache_module
+from app.utils.cache import LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a 变为最近使用
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_overwrite_refreshes_position():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("a", 10)
+    cache.set("c", 3)
+    assert cache.get("a") == 10
+    assert cache.get("b") is None
+
+
+def test_ttl_expires_lazily(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module.time, "monotonic", clock)
+    cache = LRUCache(maxsize=10, ttl=5)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl=60)
+    clock.now += 4
+    assert cache.get("a") == 1
+    clock.now += 2
+    assert cache.get("a", "missing") == "missing"
+    assert cache.get("b") == 2
+    assert len(cache) == 1
+
+
+def test_pop_and_clear():
+    cache = LRUCache(maxsize=10)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.pop("a") == 1
+    assert cache.pop("a") is None
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_cache_key_separates_model_and_prompt_version():
+    keys = {
+        make_cache_key("h", "deepseek", "v1"),
+        make_cache_key("h", "openai", "v1"),
+        make_cache_key("h", "deepseek", "v2"),
+    }
+    assert len(keys) == 3
+
+
+def test_analysis_cache_returns_copies():
+    async def scenario():
+        await init_db()
+        cache = AnalysisResultCache(enabled=True)
+        result = {"scores": {"technical": 80}, "analysis": {"highlights": ["主体清晰"]}}
+        await cache.set("copies", "deepseek", "v0", result)
+        result["analysis"]["highlights"].append("调用方写入后修改")
+        first = await cache.get("copies", "deepseek", "v0")
+        first["analysis"]["highlights"].clear()
+        cache.memory.clear()
+        from_db = await cache.get("copies", "deepseek", "v0")
+        from_db["scores"]["technical"] = 0
+        return first, await cache.get("copies", "deepseek", "v0")
+
+    first, again = asyncio.run(scenario())
+    assert first is not again
+    assert again == {"scores": {"technical": 80}, "analysis": {"highlights": ["主体清晰"]}}
@@ -0,0 +1,22 @@
+from datetime import datetime
+
+import pytest
+
+from app.services.photo_service import decode_cursor, encode_cursor
+
+
+@pytest.mark.parametrize("created_at, photo_id", [
+    (datetime(2024, 1, 1, 12, 30, 45, 123456), 42),
+    (datetime(2024, 1, 1), 1),
+    (datetime(1999, 12, 31, 23, 59, 59), 10 ** 12),
+])
+def test_round_trip(created_at, photo_id):
+    cursor = encode_cursor(created_at, photo_id)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, photo_id)
+
+
+@pytest.mark.parametrize("cursor", ["", "zzz", "!!!", "bm90LWEtY3Vyc29y", encode_cursor(datetime(2024, 1, 1), 1)[:-4]])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match="无效的分页游标"):
+        decode_cursor(cursor)
@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import InvalidRequestError
+
+from app.core.database import async_session
+from app.models.photo import Photo
+from app.services.photo_service import build_photo, create_photos, get_user_photo, list_photos
+from app.utils.image import decode_data_uri
+from benchmarks.mock_provider import CANNED_RESULT
+from tests.test_photo_api import upload_files
+
+ANALYSIS_RESULT = {**CANNED_RESULT, "overall_score": 75}
+
+
+async def seed_photos(client, count: int):
+    """直接写入 count 条记录，每 5 条共用一个 created_at，用于检查同一时间戳内按 id 排序"""
+    user_id = (await client.get("/api/auth/me")).json()["id"]
+    base = datetime(2024, 1, 1)
+    photos = []
+    for i in range(count):
+        photo = build_photo(user_id, f"photo_{i}.jpg", f"{i:064x}", f"{i + 1000:064x}", i, "deepseek", ANALYSIS_RESULT)
+        photo.created_at = base + timedelta(minutes=i // 5)
+        photos.append(photo)
+    async with async_session() as db:
+        await create_photos(db, photos)
+    return sorted(photos, key=lambda photo: (photo.created_at, photo.id), reverse=True)
+
+
+def test_cursor_pages_cover_every_photo_once(api):
+    async def scenario():
+        async with api() as client:
+            photos = await seed_photos(client, 23)
+            pages, cursor = [], None
+            while True:
+                params = {"page_size": 10, **({"cursor": cursor} if cursor else {})}
+                page = (await client.get("/api/photo/history", params=params)).json()
+                pages.append(page)
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    return photos, pages
+
+    photos, pages = asyncio.run(scenario())
+    assert [len(page["items"]) for page in pages] == [10, 10, 3]
+    assert {page["total"] for page in pages} == {23}
+    ids = [item["id"] for page in pages for item in page["items"]]
+    assert ids == [photo.id for photo in photos]
+
+
+def test_cursor_and_offset_pages_agree(api):
+    async def scenario():
+        async with api() as client:
+            await seed_photos(client, 12)
+            first = (await client.get("/api/photo/history", params={"page_size": 5})).json()
+            by_cursor = await client.get(
+                "/api/photo/history", params={"page_size": 5, "cursor": first["next_cursor"], "page": 9}
+            )
+            by_offset = await client.get("/api/photo/history", params={"page_size": 5, "page": 2})
+            return by_cursor.json(), by_offset.json()
+
+    by_cursor, by_offset = asyncio.run(scenario())
+    # 传入游标时忽略 page
+    assert [item["id"] for item in by_cursor["items"]] == [item["id"] for item in by_offset["items"]]
+
+
+def test_invalid_cursor_is_rejected(api):
+    async def scenario():
+        async with api() as client:
+            return await client.get("/api/photo/history", params={"cursor": "not-a-cursor"})
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 400
+
+
+def test_detail_returns_blob_urls_unless_the_image_is_included(api):
+    async def scenario():
+        async with api() as client:
+            analyzed = await client.post("/api/photo/analyze", files=upload_files(1), data={"model": "deepseek"})
+            photo_id = analyzed.json()["id"]
+            default = (await client.get(f"/api/photo/{photo_id}")).json()
+            included = (await client.get(f"/api/photo/{photo_id}", params={"include": "image"})).json()
+            blob = await client.get(default["image_data"])
+            return default, included, blob.content
+
+    default, included, blob = asyncio.run(scenario())
+    assert default["image_data"].startswith("/api/blobs/")
+    assert default["thumbnail"].startswith("/api/blobs/")
+    assert default["analysis"] == CANNED_RESULT["analysis"]
+    assert included["image_data"].startswith("data:image/jpeg;base64,")
+    assert decode_data_uri(included["image_data"]) == blob
+    # 缩略图始终只返回地址
+    assert included["thumbnail"].startswith("/api/blobs/")
+
+
+def test_legacy_record_returns_inline_payload(api):
+    image_data = "data:image/jpeg;base64,bGVnYWN5"
+
+    async def scenario():
+        async with api() as client:
+            [photo] = await seed_photos(client, 1)
+            async with async_session() as db:
+                legacy = await db.get(Photo, photo.id)
+                legacy.image_hash, legacy.thumbnail_hash = None, None
+                legacy.image_data, legacy.thumbnail = image_data, image_data
+                await db.commit()
+            history = (await client.get("/api/photo/history")).json()
+            detail = (await client.get(f"/api/photo/{photo.id}", params={"include": "image"})).json()
+            return history, detail
+
+    history, detail = asyncio.run(scenario())
+    assert history["items"][0]["thumbnail"] == image_data
+    assert detail["image_data"] == image_data and detail["thumbnail"] == image_data
+
+
+def test_deferred_columns_raise_unless_loaded(api):
+    async def scenario():
+        async with api() as client:
+            [photo] = await seed_photos(client, 1)
+            async with async_session() as db:
+                plain = (await db.execute(select(Photo).where(Photo.id == photo.id))).scalar_one()
+                for column in ("analysis", "image_data", "thumbnail"):
+                    with pytest.raises(InvalidRequestError):
+                        getattr(plain, column)
+            async with async_session() as db:
+                detail = await get_user_photo(db, photo.user_id, photo.id)
+                assert detail.analysis is not None
+                with pytest.raises(InvalidRequestError):
+                    detail.image_data
+            async with async_session() as db:
+                return await list_photos(db, photo.user_id, limit=10)
+
+    rows = asyncio.run(scenario())
+    # 列表只返回 HISTORY_COLUMNS，不含分析结果和原图
+    assert set(rows[0]._fields) == {"id", "filename", "thumbnail_hash", "thumbnail", "overall_score", "created_at"}
@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from app.services.http_pool import ClientRegistry
+from benchmarks.mock_provider import start_mock_provider
+
+
+def test_clients_and_sessions_are_shared_per_provider():
+    async def scenario():
+        registry = ClientRegistry()
+        try:
+            client = registry.get_client("deepseek")
+            assert registry.get_client("deepseek") is client
+            assert client.session is registry.get_session("deepseek")
+            assert registry.get_client("openai").session is not client.session
+            with pytest.raises(ValueError):
+                registry.get_client("unknown")
+        finally:
+            await registry.close()
+        return client
+
+    client = asyncio.run(scenario())
+    assert client.session.closed
+
+
+def test_sequential_requests_reuse_one_connection():
+    async def scenario():
+        runner, base_url = await start_mock_provider()
+        registry = ClientRegistry()
+        try:
+            client = registry.get_client("deepseek")
+            client.base_url = base_url
+            for _ in range(5):
+                await client.analyze_photo(b"image", "a.jpg")
+            return runner.app["stats"]
+        finally:
+            await registry.close()
+            await runner.cleanup()
+
+    stats = asyncio.run(scenario())
+    assert stats.requests == 5
+    assert stats.connections == 1
+
+
+def test_closed_session_is_recreated():
+    async def scenario():
+        registry = ClientRegistry()
+        try:
+            client = registry.get_client("claude")
+            await client.session.close()
+            replacement = registry.get_client("claude")
+            return client is not replacement and not replacement.session.closed
+        finally:
+            await registry.close()
+
+    assert asyncio.run(scenario())
@@ -0,0 +1,152 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+from app.utils import image as image_utils
+
+from app.services.image_pool import image_pool
+from app.services.photo_service import prepare_upload
+from app.utils.image import (
+    IMAGE_PROFILES,
+    MAX_DECODE_EDGE,
+    PROBE_FACTOR,
+    compress_image,
+    estimate_image_tokens,
+    fit_to_profile,
+    prepare_for_profile,
+    process_image,
+)
+from benchmarks.corpus import make_photo
+
+
+def open_image(data: bytes) -> Image.Image:
+    return Image.open(io.BytesIO(data))
+
+
+def test_file_object_and_bytes_give_the_same_result():
+    data = make_photo(1600, 1200, seed=1)
+    from_bytes = process_image(data)
+    from_file = process_image(io.BytesIO(data))
+    assert from_file.content == from_bytes.content
+    assert from_file.thumbnail == from_bytes.thumbnail
+    assert from_file.phash == from_bytes.phash
+
+
+def test_large_upload_is_decoded_once_to_the_edge_limit():
+    processed = process_image(make_photo(4000, 3000, seed=2))
+    assert max(processed.width, processed.height) == MAX_DECODE_EDGE
+    assert open_image(processed.content).size == (processed.width, processed.height)
+    assert max(open_image(processed.thumbnail).size) <= 100
+    assert set(processed.timings) == {"decode", "compress", "thumbnail", "phash"}
+
+
+def test_compress_image_matches_the_pipeline_decode():
+    data = make_photo(3000, 2000, seed=3)
+    compressed, img_format = compress_image(data)
+    assert img_format == "JPEG"
+    assert open_image(compressed).size == (process_image(data).width, process_image(data).height)
+
+
+def test_transparent_png_is_flattened_on_white():
+    buffer = io.BytesIO()
+    Image.new("RGBA", (64, 64), (0, 0, 0, 0)).save(buffer, format="PNG")
+    processed = process_image(buffer.getvalue())
+    assert open_image(processed.content).convert("RGB").getpixel((32, 32)) == (255, 255, 255)
+
+
+class RecordingFile(io.BytesIO):
+    """记录每次 read 请求的字节数"""
+
+    def __init__(self, data: bytes):
+        super().__init__(data)
+        self.reads = []
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return super().read(size)
+
+
+def test_upload_is_decoded_from_the_file_without_reading_it_whole():
+    data = make_photo(1600, 1200, seed=4)
+    upload = RecordingFile(data)
+    try:
+        image = asyncio.run(prepare_upload(upload, "a.jpg"))
+    finally:
+        image_pool.shutdown()
+    assert image.content == process_image(data).content
+    assert all(size is not None and 0 <= size < len(data) for size in upload.reads)
+
+
+@pytest.mark.parametrize("target_size", [300_000, 150_000, 60_000, 20_000])
+def test_encoder_meets_budget_with_few_full_encodes(monkeypatch, target_size):
+    img = open_image(make_photo(2048, 1536, seed=5)).convert("RGB")
+    encode = image_utils._encode
+    sizes = []
+
+    def recording_encode(image, img_format, quality):
+        sizes.append(image.size)
+        return encode(image, img_format, quality)
+
+    monkeypatch.setattr(image_utils, "_encode", recording_encode)
+    encoded = image_utils._encode_to_target(img, target_size, 85)
+    assert len(encoded) <= target_size
+    # 探测图上的编码很便宜，完整尺寸的编码次数需要有上限
+    full_encodes = [size for size in sizes if size[0] > img.width // PROBE_FACTOR]
+    assert 1 <= len(full_encodes) <= 4
+
+
+def test_small_image_is_encoded_once(monkeypatch):
+    calls = []
+    encode = image_utils._encode
+    monkeypatch.setattr(image_utils, "_encode", lambda *args: calls.append(args) or encode(*args))
+    compressed, _ = compress_image(make_photo(320, 240, seed=6), target_size=1024 * 1024)
+    assert len(calls) == 1
+    assert open_image(compressed).size == (320, 240)
+
+
+def test_compress_image_respects_target_size():
+    compressed, _ = compress_image(make_photo(3000, 2000, seed=7), target_size=100_000)
+    assert len(compressed) <= 100_000
+
+
+@pytest.mark.parametrize("provider, size, tokens", [
+    ("openai", (1024, 768), 85 + 170 * 4),
+    ("claude", (1238, 928), 1532),
+    ("deepseek", (1024, 768), 576),
+])
+def test_large_photo_is_fitted_to_each_provider(provider, size, tokens):
+    profile = IMAGE_PROFILES[provider]
+    assert fit_to_profile(4000, 3000, profile) == size
+    assert estimate_image_tokens(*size, profile) == tokens
+    assert max(size) <= profile.max_edge
+
+
+def test_small_photo_is_not_upscaled():
+    for profile in IMAGE_PROFILES.values():
+        assert fit_to_profile(300, 200, profile) == (300, 200)
+
+
+def test_edge_just_past_a_tile_is_trimmed():
+    profile = IMAGE_PROFILES["openai"]
+    width, height = fit_to_profile(1100, 700, profile)
+    assert width == 1024
+    # 去掉多出的一列图块，token 从 3×2 块降到 2×2 块
+    assert estimate_image_tokens(width, height, profile) < estimate_image_tokens(1100, 700, profile)
+
+
+def test_prepare_for_profile_resizes_to_the_provider_limits():
+    data = make_photo(2048, 1536, seed=8)
+    profile = IMAGE_PROFILES["deepseek"]
+    prepared = prepare_for_profile(data, profile)
+    assert open_image(prepared).size == (1024, 768)
+    assert len(prepared) <= profile.target_size
+
+
+def test_prepare_for_profile_keeps_fitting_images_and_converts_formats():
+    fitting = make_photo(640, 480, seed=9)
+    assert prepare_for_profile(fitting, IMAGE_PROFILES["openai"]) is fitting
+    png = make_photo(640, 480, seed=9, img_format="PNG")
+    prepared = open_image(prepare_for_profile(png, IMAGE_PROFILES["openai"]))
+    assert (prepared.format, prepared.size) == ("JPEG", (640, 480))
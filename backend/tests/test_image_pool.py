@@ -0,0 +1,78 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.services.image_pool import ImageProcessingPool, PoolSaturatedError, image_pool
+from tests.test_photo_api import upload_files
+
+
+def test_queue_beyond_limit_is_rejected():
+    release = threading.Event()
+
+    async def scenario():
+        pool = ImageProcessingPool(workers=1, max_queue=1)
+        try:
+            running = asyncio.ensure_future(pool.run(release.wait))
+            queued = asyncio.ensure_future(pool.run(len, b"abc"))
+            await asyncio.sleep(0.05)
+            with pytest.raises(PoolSaturatedError) as rejected:
+                await pool.run(len, b"abc")
+            stats = pool.stats()
+            release.set()
+            return await running, await queued, rejected.value, stats
+        finally:
+            release.set()
+            pool.shutdown()
+
+    running, queued, rejected, stats = asyncio.run(scenario())
+    assert running is True and queued == 3
+    assert rejected.retry_after >= 1
+    assert (stats["running"], stats["queued"], stats["rejected"]) == (1, 1, 1)
+
+
+def test_event_loop_stays_responsive_while_images_are_processed():
+    release = threading.Event()
+
+    async def scenario():
+        pool = ImageProcessingPool(workers=1, max_queue=4)
+        try:
+            blocked = asyncio.ensure_future(pool.run(release.wait))
+            # 工作线程被占用时事件循环仍能处理其他协程
+            ticks = 0
+            for _ in range(5):
+                await asyncio.sleep(0.01)
+                ticks += 1
+            release.set()
+            await blocked
+            return ticks
+        finally:
+            release.set()
+            pool.shutdown()
+
+    assert asyncio.run(scenario()) == 5
+
+
+def test_process_pool_runs_picklable_work():
+    async def scenario():
+        pool = ImageProcessingPool(kind="process", workers=1)
+        try:
+            return await pool.run(len, b"abcd"), pool.accepts_file_objects
+        finally:
+            pool.shutdown()
+
+    assert asyncio.run(scenario()) == (4, False)
+
+
+def test_saturated_pool_returns_503_with_retry_after(api, monkeypatch):
+    monkeypatch.setattr(image_pool, "max_queue", 0)
+
+    async def scenario():
+        async with api() as client:
+            response = await client.post("/api/photo/analyze", files=upload_files(1), data={"model": "deepseek"})
+            return response, client.provider_stats.requests
+
+    response, requests = asyncio.run(scenario())
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert requests == 0
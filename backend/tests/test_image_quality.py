@@ -0,0 +1,124 @@
+import asyncio
+import io
+import json
+import random
+
+import pytest
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter
+
+from app.core.config import settings
+from app.services.ai_service import AIService
+from app.services.deepseek_client import DeepSeekClient
+from app.services.prompt import ANALYSIS_PROMPT, build_prompt
+from app.utils.image_quality import assess_image_quality
+from benchmarks.mock_provider import CANNED_RESULT, start_mock_provider
+
+
+def scene(width: int = 1600, height: int = 1200, tilt: float = 0) -> Image.Image:
+    """天空、地面和靠近右侧三分线的主体"""
+    rng = random.Random(0)
+    img = Image.new("RGB", (width, height), (120, 160, 210))
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((0, int(height * 0.6), width, height), fill=(70, 110, 60))
+    for _ in range(40):
+        x, y, r = rng.randrange(width), rng.randrange(int(height * 0.6), height), rng.randint(5, 40)
+        draw.ellipse((x - r, y - r, x + r, y + r), fill=tuple(rng.randrange(256) for _ in range(3)))
+    draw.rectangle((int(width * 0.62), int(height * 0.25), int(width * 0.72), int(height * 0.6)), fill=(200, 60, 40))
+    img = img.filter(ImageFilter.GaussianBlur(0.7))
+    if tilt:
+        img = img.rotate(tilt, resample=Image.Resampling.BICUBIC, fillcolor=(120, 160, 210))
+        img = img.crop((100, 100, width - 100, height - 100))
+    return img
+
+
+def encode(img: Image.Image) -> bytes:
+    output = io.BytesIO()
+    img.save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def test_sharp_photo_scores_above_blurred_one():
+    sharp = assess_image_quality(encode(scene()))
+    blurred = assess_image_quality(encode(scene().filter(ImageFilter.GaussianBlur(5))))
+    assert sharp.technical_score > blurred.technical_score + 20
+    assert sharp.sharpness > blurred.sharpness
+    assert any("模糊" in issue for issue in blurred.issues)
+    assert not any("模糊" in issue for issue in sharp.issues)
+    assert (sharp.width, sharp.height) == (1600, 1200)
+
+
+@pytest.mark.parametrize("factor, issue", [(0.25, "曝光不足"), (2.2, "曝光过度")])
+def test_exposure_problems_are_reported(factor, issue):
+    report = assess_image_quality(encode(ImageEnhance.Brightness(scene()).enhance(factor)))
+    assert any(issue in text for text in report.issues)
+    assert report.technical_score < assess_image_quality(encode(scene())).technical_score
+
+
+@pytest.mark.parametrize("degrees", [-6, 6])
+def test_horizon_tilt_is_detected(degrees):
+    report = assess_image_quality(encode(scene(tilt=degrees)))
+    assert report.tilt is not None and 4 <= abs(report.tilt) <= 8
+    assert any("倾斜" in issue for issue in report.issues)
+    level = assess_image_quality(encode(scene()))
+    assert level.tilt is None or abs(level.tilt) < 1
+
+
+def test_small_images_are_reported():
+    report = assess_image_quality(encode(scene().resize((400, 300))))
+    assert any("尺寸过小" in issue for issue in report.issues)
+    assert (report.width, report.height) == (400, 300)
+
+
+def test_subject_on_thirds_point():
+    # 平坦背景上，细节集中在右上三分点附近
+    img = Image.new("RGB", (1200, 900), (128, 128, 128))
+    patch = Image.frombytes("L", (160, 160), random.Random(1).randbytes(160 * 160)).convert("RGB")
+    img.paste(patch, (720, 220))
+    report = assess_image_quality(encode(img))
+    x, y = report.subject_position
+    assert abs(x - 2 / 3) < 0.08 and abs(y - 1 / 3) < 0.08
+    assert report.thirds > 0.7
+
+
+def test_prompt_is_grounded_by_measurements(monkeypatch):
+    report = assess_image_quality(encode(scene()))
+    monkeypatch.setattr(settings, "QUALITY_SHORT_CIRCUIT_TECHNICAL", False)
+    prompt = build_prompt(report)
+    assert prompt.startswith(ANALYSIS_PROMPT)
+    assert f"本地技术评分：{report.technical_score}" in prompt
+
+    monkeypatch.setattr(settings, "QUALITY_SHORT_CIRCUIT_TECHNICAL", True)
+    prompt = build_prompt(report)
+    assert '"technical"' not in prompt
+    assert f"评为 {report.technical_score} 分" in prompt
+    assert len(prompt) < len(build_prompt(None)) + len(report.describe()) + 200
+
+
+def test_short_circuit_fills_technical_score(monkeypatch):
+    monkeypatch.setattr(settings, "QUALITY_SHORT_CIRCUIT_TECHNICAL", True)
+    report = assess_image_quality(encode(scene()))
+    content = json.dumps({**CANNED_RESULT, "scores": {k: v for k, v in CANNED_RESULT["scores"].items() if k != "technical"}})
+    result = DeepSeekClient()._parse_response(content, report.technical_score)
+    assert result["scores"]["technical"] == report.technical_score
+
+
+def test_stream_yields_local_technical_score_first(monkeypatch):
+    monkeypatch.setattr(settings, "QUALITY_PRESCORE_ENABLED", True)
+    monkeypatch.setattr(settings, "QUALITY_SHORT_CIRCUIT_TECHNICAL", True)
+    image_data = encode(scene())
+    expected = assess_image_quality(image_data).technical_score
+
+    async def scenario():
+        runner, base_url = await start_mock_provider()
+        try:
+            service = AIService("deepseek")
+            monkeypatch.setattr(service.client, "base_url", base_url)
+            return [event async for event in service.stream_analysis(image_data, "a.jpg")]
+        finally:
+            await runner.cleanup()
+
+    events = asyncio.run(scenario())
+    technical = [e for e in events if e["type"] == "score" and e["dimension"] == "technical"]
+    assert technical == [{"type": "score", "dimension": "technical", "value": expected}]
+    assert events[0] == technical[0]
+    assert events[-1]["result"]["scores"]["technical"] == expected
@@ -0,0 +1,320 @@
+import asyncio
+import json
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.core.database import async_session
+from app.core.deadline import ProviderTimeoutError
+from app.models.job import AnalysisJob
+from app.services import job_queue
+from app.services.blob_store import BlobNotFoundError
+from app.services.http_pool import get_client_registry
+from app.services.job_queue import AnalysisJobWorker, is_retryable, parse_provider_limits, retry_delay
+from app.services.provider_router import ProviderHTTPError, ProviderUnavailableError
+from app.utils.stream_json import AnalysisParseError
+from tests.test_photo_api import upload_files
+
+
+async def submit_job(client, seed: int, model: str = "deepseek") -> dict:
+    response = await client.post("/api/photo/jobs", files=upload_files(seed), data={"model": model})
+    assert response.status_code == 202
+    return response.json()
+
+
+async def wait_for_job(client, job_id: int, timeout: float = 10) -> dict:
+    """长轮询直到任务结束"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        job = (await client.get(f"/api/photo/jobs/{job_id}", params={"wait": 1})).json()
+        if job["status"] in job_queue.TERMINAL_STATUSES or loop.time() > deadline:
+            return job
+
+
+@asynccontextmanager
+async def running_worker(monkeypatch, **options):
+    """启动后台 worker 并注册为当前进程的 worker，接口的长轮询和事件流由它唤醒"""
+    worker = AnalysisJobWorker(poll_interval=0.05, **options)
+    await worker.start()
+    monkeypatch.setattr(job_queue, "job_worker", worker)
+    try:
+        yield worker
+    finally:
+        await worker.stop()
+
+
+async def update_job(job_id: int, **values) -> None:
+    async with async_session() as db:
+        job = await db.get(AnalysisJob, job_id)
+        for name, value in values.items():
+            setattr(job, name, value)
+        await db.commit()
+
+
+async def load_job(job_id: int) -> AnalysisJob:
+    async with async_session() as db:
+        return await db.get(AnalysisJob, job_id)
+
+
+async def run_once(worker: AnalysisJobWorker) -> AnalysisJob:
+    """领取并执行一个任务，返回执行后的状态"""
+    job = await worker._claim()
+    assert job is not None
+    await worker._process(job)
+    return await load_job(job.id)
+
+
+def test_parse_provider_limits():
+    assert parse_provider_limits("deepseek=4, openai=2,claude=1") == {"deepseek": 4, "openai": 2, "claude": 1}
+    assert parse_provider_limits("") == {}
+    assert parse_provider_limits("deepseek=4,broken,openai=") == {"deepseek": 4}
+
+
+@pytest.mark.parametrize("attempts, base", [(1, 2.0), (2, 4.0), (3, 8.0)])
+def test_retry_delay_is_jittered_exponential(monkeypatch, attempts, base):
+    monkeypatch.setattr(job_queue.settings, "JOB_RETRY_BASE_SECONDS", 2.0)
+    monkeypatch.setattr(job_queue.settings, "JOB_RETRY_MAX_SECONDS", 300.0)
+    delays = [retry_delay(attempts) for _ in range(200)]
+    assert all(base / 2 <= delay <= base for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_retry_delay_is_capped(monkeypatch):
+    monkeypatch.setattr(job_queue.settings, "JOB_RETRY_BASE_SECONDS", 2.0)
+    monkeypatch.setattr(job_queue.settings, "JOB_RETRY_MAX_SECONDS", 10.0)
+    assert all(retry_delay(20) <= 10.0 for _ in range(50))
+
+
+def test_job_provider_limit_applies_to_coalesced_analyses(api, monkeypatch):
+    monkeypatch.setattr(job_queue.settings, "ANALYSIS_COALESCE_ENABLED", True)
+    monkeypatch.setattr(job_queue.settings, "USER_RATE_LIMIT_BURST", 100)
+
+    async def scenario():
+        async with api(latency=0.1) as client:
+            async with running_worker(monkeypatch, concurrency=4, provider_limits={"deepseek": 1}):
+                jobs = [await submit_job(client, seed) for seed in range(4)]
+                finished = [await wait_for_job(client, job["id"]) for job in jobs]
+            return finished, client.provider_stats
+
+    finished, stats = asyncio.run(scenario())
+    assert [job["status"] for job in finished] == ["succeeded"] * 4
+    assert stats.requests == 4
+    assert stats.peak_active == 1
+
+
+@pytest.mark.parametrize("error, retryable", [
+    (ProviderHTTPError("rate limited", 429), True),
+    (ProviderHTTPError("server error", 503), True),
+    (ProviderTimeoutError("timeout"), True),
+    (ProviderUnavailableError("unavailable"), True),
+    (ProviderHTTPError("bad request", 400), False),
+    (ProviderHTTPError("forbidden", 403), False),
+    (AnalysisParseError("broken"), False),
+    (ValueError("不支持的模型"), False),
+    (BlobNotFoundError("digest"), False),
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+def test_unknown_model_fails_on_the_first_attempt(api):
+    async def scenario():
+        async with api() as client:
+            job = await submit_job(client, 1)
+            await update_job(job["id"], model="unknown")
+            return await run_once(AnalysisJobWorker(concurrency=1))
+
+    job = asyncio.run(scenario())
+    assert (job.status, job.attempts, job.locked_by) == ("failed", 1, None)
+
+
+def test_rejected_request_is_not_retried(api, monkeypatch):
+    calls = []
+
+    async def scenario():
+        async with api() as client:
+            async def reject(*args, **kwargs):
+                calls.append(args)
+                raise ProviderHTTPError("bad request", 400)
+
+            monkeypatch.setattr(get_client_registry().get_client("deepseek"), "analyze_photo", reject)
+            await submit_job(client, 1)
+            return await run_once(AnalysisJobWorker(concurrency=1))
+
+    job = asyncio.run(scenario())
+    assert (job.status, job.attempts) == ("failed", 1)
+    assert "bad request" in job.error
+    assert len(calls) == 1
+
+
+def test_job_is_accepted_and_long_poll_returns_the_result(api, monkeypatch):
+    async def scenario():
+        async with api(latency=0.2) as client:
+            job = await submit_job(client, 1)
+            async with running_worker(monkeypatch, concurrency=1):
+                started = time.perf_counter()
+                finished = await wait_for_job(client, job["id"])
+                elapsed = time.perf_counter() - started
+            return job, finished, elapsed
+
+    job, finished, elapsed = asyncio.run(scenario())
+    assert (job["status"], job["attempts"]) == ("pending", 0)
+    assert (finished["status"], finished["attempts"]) == ("succeeded", 1)
+    assert finished["result"]["id"] == finished["photo_id"]
+    assert finished["result"]["model_used"] == "deepseek"
+    # 长轮询在任务结束时被唤醒，不等到超时
+    assert elapsed < 2
+
+
+def test_events_stream_until_the_job_finishes(api, monkeypatch):
+    async def scenario():
+        async with api(latency=0.2) as client:
+            job = await submit_job(client, 1)
+            async with running_worker(monkeypatch, concurrency=1):
+                response = await client.get(f"/api/photo/jobs/{job['id']}/events")
+            return response
+
+    response = asyncio.run(scenario())
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [
+        (block.split("\n")[0].removeprefix("event: "), json.loads(block.split("\n")[1].removeprefix("data: ")))
+        for block in response.text.split("\n\n")
+        if block.startswith("event:")
+    ]
+    assert [name for name, _ in events][-1] == "succeeded"
+    assert events[-1][1]["result"]["scores"]["technical"] is not None
+    assert all(name in ("pending", "running", "succeeded") for name, _ in events)
+
+
+def test_other_users_job_is_not_found(api):
+    async def scenario():
+        async with api() as client:
+            job = await submit_job(client, 1)
+            owner = (await client.get(f"/api/photo/jobs/{job['id']}")).status_code
+            credentials = {"username": "job_other_user", "password": "test-password"}
+            await client.post("/api/auth/register", json=credentials)
+            token = (await client.post("/api/auth/login", data=credentials)).json()["access_token"]
+            client.headers["Authorization"] = f"Bearer {token}"
+            other = (await client.get(f"/api/photo/jobs/{job['id']}")).status_code
+            return owner, other
+
+    assert asyncio.run(scenario()) == (200, 404)
+
+
+def test_transient_failure_is_retried(api, monkeypatch):
+    monkeypatch.setattr(settings, "PROVIDER_RETRY_MAX_ATTEMPTS", 1)
+    monkeypatch.setattr(settings, "JOB_RETRY_BASE_SECONDS", 0.01)
+
+    async def scenario():
+        async with api(fail_first=1) as client:
+            job = await submit_job(client, 1)
+            async with running_worker(monkeypatch, concurrency=1):
+                return await wait_for_job(client, job["id"]), client.provider_stats.requests
+
+    job, requests = asyncio.run(scenario())
+    assert (job["status"], job["attempts"]) == ("succeeded", 2)
+    assert requests == 2
+
+
+def test_job_fails_after_max_attempts(api, monkeypatch):
+    monkeypatch.setattr(settings, "PROVIDER_RETRY_MAX_ATTEMPTS", 1)
+    monkeypatch.setattr(settings, "JOB_RETRY_BASE_SECONDS", 0.01)
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 3)
+
+    async def scenario():
+        async with api(error_rate=1.0) as client:
+            job = await submit_job(client, 1)
+            async with running_worker(monkeypatch, concurrency=1):
+                return await wait_for_job(client, job["id"])
+
+    job = asyncio.run(scenario())
+    assert (job["status"], job["attempts"]) == ("failed", 3)
+    assert job["error"]
+    assert job["result"] is None
+
+
+def test_only_one_worker_claims_a_job(api):
+    async def scenario():
+        async with api() as client:
+            await submit_job(client, 1)
+            workers = [AnalysisJobWorker(concurrency=1) for _ in range(4)]
+            claims = await asyncio.gather(*(worker._claim() for worker in workers))
+            return [job for job in claims if job is not None], workers
+
+    claimed, workers = asyncio.run(scenario())
+    assert len(claimed) == 1
+    assert claimed[0].attempts == 1
+    assert claimed[0].locked_by in {worker.worker_id for worker in workers}
+
+
+def test_expired_lease_is_taken_over_and_the_old_owner_cannot_finish(api):
+    async def scenario():
+        async with api() as client:
+            job = await submit_job(client, 1)
+            owner, other = AnalysisJobWorker(concurrency=1), AnalysisJobWorker(concurrency=1)
+            await owner._claim()
+            # 租约有效期内其他 worker 领取不到
+            assert await other._claim() is None
+            await update_job(job["id"], locked_until=datetime.utcnow() - timedelta(seconds=1))
+            taken = await other._claim()
+            # 原持有者的结果不覆盖接管者的状态
+            await owner._finish(job["id"], status="failed", error="stale")
+            return taken, await load_job(job["id"]), other
+
+    taken, job, other = asyncio.run(scenario())
+    assert taken is not None and taken.attempts == 2
+    assert (job.status, job.locked_by, job.error) == ("running", other.worker_id, None)
+
+
+def test_heartbeat_keeps_the_lease_while_running(api):
+    async def scenario():
+        async with api(latency=0.6) as client:
+            job = await submit_job(client, 1)
+            owner, other = AnalysisJobWorker(concurrency=1, lease_seconds=0.3), AnalysisJobWorker(concurrency=1)
+            running = asyncio.create_task(run_once(owner))
+            await asyncio.sleep(0.45)
+            # 已超过首次租约的有效期，续租后仍不能被接管
+            stolen = await other._claim()
+            return stolen, await running
+
+    stolen, job = asyncio.run(scenario())
+    assert stolen is None
+    assert (job.status, job.attempts) == ("succeeded", 1)
+
+
+def test_worker_that_lost_its_lease_stops_executing(api):
+    async def scenario():
+        async with api(latency=1.0) as client:
+            job = await submit_job(client, 1)
+            owner = AnalysisJobWorker(concurrency=1, lease_seconds=0.3)
+            running = asyncio.create_task(run_once(owner))
+            await asyncio.sleep(0.05)
+            await update_job(job["id"], locked_by="other-worker")
+            started = time.perf_counter()
+            result = await running
+            return result, time.perf_counter() - started
+
+    job, elapsed = asyncio.run(scenario())
+    # 心跳发现租约已被接管后取消执行，不等待服务商返回，也不写入结果
+    assert elapsed < 0.8
+    assert (job.status, job.locked_by, job.photo_id) == ("running", "other-worker", None)
+
+
+def test_interrupted_jobs_are_requeued_on_start(api):
+    async def scenario():
+        async with api() as client:
+            expired, active = await submit_job(client, 1), await submit_job(client, 2)
+            now = datetime.utcnow()
+            await update_job(expired["id"], status="running", locked_by="gone", locked_until=now - timedelta(seconds=1))
+            await update_job(active["id"], status="running", locked_by="alive", locked_until=now + timedelta(minutes=1))
+            await AnalysisJobWorker(concurrency=1)._recover_interrupted()
+            return await load_job(expired["id"]), await load_job(active["id"])
+
+    expired, active = asyncio.run(scenario())
+    assert (expired.status, expired.locked_by) == ("pending", None)
+    # 其他进程仍持有租约的任务不受影响
+    assert (active.status, active.locked_by) == ("running", "alive")
@@ -0,0 +1,181 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from app.core.config import settings
+from app.core.metrics import (
+    HTTP_REQUESTS,
+    PROVIDER_IN_FLIGHT,
+    PROVIDER_REQUESTS,
+    PROVIDER_TOKENS,
+    Histogram,
+    MetricsMiddleware,
+    MetricsRegistry,
+    _Metric,
+    record_usage,
+    service_collector,
+    track_provider_call,
+)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("stage_seconds", "阶段耗时", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.labels("parse").observe(value)
+
+    text = registry.render()
+    assert '# TYPE stage_seconds histogram' in text
+    assert 'stage_seconds_bucket{stage="parse",le="0.1"} 2' in text
+    assert 'stage_seconds_bucket{stage="parse",le="1"} 3' in text
+    assert 'stage_seconds_bucket{stage="parse",le="+Inf"} 4' in text
+    assert 'stage_seconds_count{stage="parse"} 4' in text
+    assert 'stage_seconds_sum{stage="parse"} 3.65' in text
+
+
+def test_counter_family_and_label_escaping():
+    registry = MetricsRegistry()
+    counter = registry.counter("uploads_total", "上传次数", ["filename"])
+    counter.labels('a"b.jpg').inc(2)
+
+    text = registry.render()
+    assert '# TYPE uploads counter' in text
+    assert 'uploads_total{filename="a\\"b.jpg"} 2' in text
+
+
+def test_labels_are_cached_and_validated():
+    histogram = Histogram("h", "h", ["stage"])
+    assert histogram.labels("decode") is histogram.labels("decode")
+    with pytest.raises(ValueError):
+        histogram.labels("decode", "extra")
+
+
+def test_metric_type_must_implement_samples():
+    class Summary(_Metric):
+        def _new_child(self):
+            return Summary(self.name, self.documentation)
+
+    with pytest.raises(TypeError, match="_child_samples"):
+        Summary("s", "s")
+
+
+def test_collectors_run_at_scrape_time():
+    registry = MetricsRegistry()
+    state = {"hits": 1}
+    registry.register_collector(lambda: [("cache_hits", "gauge", "命中数", [("", {}, state["hits"])])])
+    state["hits"] = 5
+    assert "cache_hits 5" in registry.render()
+
+
+def test_record_usage_accepts_both_formats():
+    before_input = PROVIDER_TOKENS.labels("test-usage", "input").value
+    before_output = PROVIDER_TOKENS.labels("test-usage", "output").value
+    record_usage("test-usage", {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13})
+    record_usage("test-usage", {"input_tokens": 7, "output_tokens": 2})
+    record_usage("test-usage", None)
+    assert PROVIDER_TOKENS.labels("test-usage", "input").value - before_input == 17
+    assert PROVIDER_TOKENS.labels("test-usage", "output").value - before_output == 5
+
+
+class RateLimited(Exception):
+    rate_limited = True
+
+
+def test_track_provider_call_outcomes():
+    provider = "test-track"
+
+    async def call(error=None):
+        with track_provider_call(provider):
+            assert PROVIDER_IN_FLIGHT.labels(provider).value == 1
+            await asyncio.sleep(0)
+            if error:
+                raise error
+
+    run(call())
+    with pytest.raises(RuntimeError):
+        run(call(RuntimeError("boom")))
+    with pytest.raises(RateLimited):
+        run(call(RateLimited()))
+    with pytest.raises(asyncio.CancelledError):
+        run(call(asyncio.CancelledError()))
+
+    assert PROVIDER_IN_FLIGHT.labels(provider).value == 0
+    for outcome in ("ok", "error", "rate_limited", "cancelled"):
+        assert PROVIDER_REQUESTS.labels(provider, outcome).value == 1
+
+
+def test_middleware_labels_route_templates():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: int):
+        return {"id": item_id}
+
+    @app.get("/stream")
+    async def stream():
+        async def body():
+            yield b"a"
+            yield b"b"
+        return StreamingResponse(body(), status_code=201)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            for item_id in (1, 2):
+                assert (await client.get(f"/items/{item_id}")).status_code == 200
+            assert (await client.get("/stream")).content == b"ab"
+            assert (await client.get("/missing")).status_code == 404
+
+    run(scenario())
+    assert HTTP_REQUESTS.labels("GET", "/items/{item_id}", "200").value == 2
+    assert HTTP_REQUESTS.labels("GET", "/stream", "201").value == 1
+    assert HTTP_REQUESTS.labels("GET", "unmatched", "404").value >= 1
+
+
+def test_service_collector_exports_internal_stats():
+    registry = MetricsRegistry()
+    cache = {"memory_hits": 3, "db_hits": 1, "misses": 4, "hit_rate": 0.5}
+    pool = {"queued": 2, "running": 1, "completed": 9, "failed": 0, "rejected": 1}
+    router = {
+        "providers": {"deepseek": {"state": "open", "error_rate": 0.4, "p50_seconds": 1.5, "p95_seconds": None}},
+        "hedges": 2,
+        "hedge_wins": 1,
+    }
+    registry.register_collector(service_collector(lambda: cache, lambda: pool, lambda: router))
+    text = registry.render()
+    assert 'analysis_cache_lookups_total{result="miss"} 4' in text
+    assert 'image_pool_tasks{state="queued"} 2' in text
+    assert 'provider_circuit_state{provider="deepseek",state="open"} 1' in text
+    assert 'provider_recent_latency_seconds{provider="deepseek",quantile="0.5"} 1.5' in text
+    assert 'quantile="0.95"' not in text
+    assert 'provider_hedges_total{outcome="won"} 1' in text
+
+
+def test_health_is_liveness_only_and_metrics_need_token(monkeypatch):
+    from main import app
+
+    async def scenario(token):
+        monkeypatch.setattr(settings, "METRICS_TOKEN", token)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            health = await client.get("/health")
+            anonymous = await client.get("/metrics")
+            wrong = await client.get("/metrics", headers={"Authorization": "Bearer wrong"})
+            scraped = await client.get("/metrics", headers={"Authorization": "Bearer secret"})
+            return health.json(), anonymous.status_code, wrong.status_code, scraped
+
+    health, anonymous, wrong, scraped = run(scenario("secret"))
+    assert health == {"status": "ok"}
+    assert (anonymous, wrong, scraped.status_code) == (401, 401, 200)
+    assert "provider_circuit_state" in scraped.text
+
+    _, anonymous, _, scraped = run(scenario(None))
+    assert anonymous == 404 and scraped.status_code == 404
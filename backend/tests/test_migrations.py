@@ -0,0 +1,78 @@
+import sqlalchemy as sa
+from sqlalchemy.engine import make_url
+
+from app.core.database import Base, database_url, engine_options
+from app.migrations import applied_revisions, load_migrations, upgrade
+from app.models import analysis_cache, job, photo, user  # noqa: F401  注册全部模型
+
+
+def migrate(path) -> sa.Engine:
+    engine = sa.create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        upgrade(conn)
+    return engine
+
+
+def test_migrations_form_a_single_chain():
+    migrations = load_migrations()
+    assert migrations[0].down_revision is None
+    for previous, current in zip(migrations, migrations[1:]):
+        assert current.down_revision == previous.revision
+
+
+def test_migrated_schema_matches_models(tmp_path):
+    engine = migrate(tmp_path / "app.db")
+    inspector = sa.inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        columns = {column["name"]: column for column in inspector.get_columns(table.name)}
+        assert set(columns) == {column.name for column in table.columns}, table.name
+        for column in table.columns:
+            assert columns[column.name]["nullable"] == column.nullable or column.primary_key, (table.name, column.name)
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        assert {index.name for index in table.indexes} <= indexes, table.name
+
+
+def test_upgrade_is_idempotent(tmp_path):
+    engine = migrate(tmp_path / "app.db")
+    with engine.begin() as conn:
+        assert upgrade(conn) == []
+        assert applied_revisions(conn) == [m.revision for m in load_migrations()]
+
+
+def test_legacy_database_gets_missing_columns(tmp_path):
+    path = tmp_path / "legacy.db"
+    engine = sa.create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        # 早期版本创建的表：图片以 base64 内联存储，没有 blob 摘要和感知哈希
+        conn.execute(sa.text(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(50) NOT NULL, "
+            "password_hash VARCHAR(255) NOT NULL, created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL)"
+        ))
+        conn.execute(sa.text(
+            "CREATE TABLE photos (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, filename VARCHAR(255) NOT NULL, "
+            "thumbnail TEXT, image_data TEXT, overall_score INTEGER, analysis TEXT, created_at DATETIME NOT NULL)"
+        ))
+        conn.execute(sa.text(
+            "INSERT INTO photos (user_id, filename, image_data, created_at) VALUES (1, 'a.jpg', 'data:', '2024-01-01')"
+        ))
+    migrate(path)
+
+    inspector = sa.inspect(engine)
+    columns = {column["name"] for column in inspector.get_columns("photos")}
+    assert {"image_hash", "thumbnail_hash", "phash", "duplicate_of_id"} <= columns
+    assert "ix_photos_user_id_created_at" in {index["name"] for index in inspector.get_indexes("photos")}
+    with engine.connect() as conn:
+        assert conn.execute(sa.text("SELECT image_data FROM photos")).scalar() == "data:"
+
+
+def test_database_url_uses_async_drivers():
+    assert database_url("postgresql://u:p@db/app").drivername == "postgresql+asyncpg"
+    assert database_url("sqlite:///./app.db").drivername == "sqlite+aiosqlite"
+    assert database_url("sqlite+aiosqlite:///./app.db").drivername == "sqlite+aiosqlite"
+
+
+def test_engine_options_by_backend():
+    assert "pool_size" not in engine_options(make_url("sqlite+aiosqlite:///:memory:"))
+    assert engine_options(make_url("sqlite+aiosqlite:///./app.db"))["pool_size"] > 0
+    postgres = engine_options(make_url("postgresql+asyncpg://u:p@db/app"))
+    assert postgres["connect_args"]["server_settings"]["application_name"]
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from app.core.metrics import PROVIDER_TOKENS
+from app.services.claude_client import ClaudeClient
+from app.services.deepseek_client import DeepSeekClient
+from app.services.provider_router import ProviderHTTPError
+from benchmarks.corpus import generate_corpus
+from benchmarks.mock_provider import start_mock_provider
+
+
+def analyze(client_class, stream: bool = False, **options):
+    async def scenario():
+        runner, base_url = await start_mock_provider(**options)
+        try:
+            client = client_class()
+            client.base_url = base_url
+            if stream:
+                return [event async for event in client.stream_analysis(b"image", "a.jpg")][-1]["result"]
+            return await client.analyze_photo(b"image", "a.jpg")
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(scenario())
+
+
+def test_rate_limited_responses_carry_retry_after():
+    with pytest.raises(ProviderHTTPError) as info:
+        analyze(DeepSeekClient, rate_limit_rate=1.0, retry_after=7)
+    assert info.value.status == 429
+    assert info.value.retry_after == 7
+    assert info.value.rate_limited
+
+
+def test_server_errors_are_injected():
+    with pytest.raises(ProviderHTTPError) as info:
+        analyze(ClaudeClient, stream=True, error_rate=1.0)
+    assert info.value.status == 500
+
+
+@pytest.mark.parametrize("client_class, provider", [(DeepSeekClient, "deepseek"), (ClaudeClient, "claude")])
+@pytest.mark.parametrize("stream", [False, True])
+def test_token_usage_is_recorded(client_class, provider, stream):
+    before = {kind: PROVIDER_TOKENS.labels(provider, kind).value for kind in ("input", "output")}
+    analyze(client_class, stream=stream)
+    assert PROVIDER_TOKENS.labels(provider, "input").value - before["input"] == 900
+    assert PROVIDER_TOKENS.labels(provider, "output").value - before["output"] == 180
+
+
+def test_corpus_is_deterministic_and_distinct():
+    corpus = generate_corpus(6, seed=3, scale=0.05)
+    assert [image.content for image in corpus] == [image.content for image in generate_corpus(6, seed=3, scale=0.05)]
+    assert len({image.content for image in corpus}) == 6
+    assert {image.content_type for image in corpus} <= {"image/jpeg", "image/png"}
+
+    with_duplicates = generate_corpus(20, seed=3, duplicate_ratio=0.5, scale=0.05)
+    assert len({image.content for image in with_duplicates}) < 20
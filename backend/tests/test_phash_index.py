@@ -0,0 +1,103 @@
+import asyncio
+import random
+
+from app.core.database import async_session
+from app.models.user import User
+from app.services.phash_index import PerceptualHashIndex, is_informative, to_signed, to_unsigned
+from app.services.photo_service import NEAR_DUPLICATE_CANDIDATES, build_photo, create_photos, find_near_duplicate
+from tests.test_history import ANALYSIS_RESULT
+
+# 1 和 0 各占一半的哈希，可以参与匹配
+BASE = 0x5A5A_5A5A_5A5A_5A5A
+
+
+def flip(value: int, *bits: int) -> int:
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+def test_signed_round_trip():
+    for value in (0, 1, BASE, (1 << 64) - 1, 1 << 63):
+        signed = to_signed(value)
+        assert -(1 << 63) <= signed < (1 << 63)
+        assert to_unsigned(signed) == value
+
+
+def test_query_finds_hashes_within_distance():
+    index = PerceptualHashIndex(max_distance=4)
+    index.add(1, BASE)
+    index.add(2, flip(BASE, 0, 17, 40, 63))
+    index.add(3, flip(BASE, 0, 9, 17, 40, 63))
+    assert index.query(BASE) == [(1, 0), (2, 4)]
+    assert index.query(BASE, max_distance=1) == [(1, 0)]
+
+
+def test_query_matches_brute_force():
+    rng = random.Random(7)
+    index = PerceptualHashIndex(max_distance=6)
+    hashes = {}
+    for item_id in range(2000):
+        value = flip(BASE, *rng.sample(range(64), rng.randint(0, 10)))
+        hashes[item_id] = value
+        index.add(item_id, value)
+
+    probe = flip(BASE, 3, 30)
+    expected = sorted(
+        ((item_id, (value ^ probe).bit_count()) for item_id, value in hashes.items()
+         if (value ^ probe).bit_count() <= 6),
+        key=lambda m: m[1]
+    )
+    assert sorted(index.query(probe)) == sorted(expected)
+    assert [d for _, d in index.query(probe)] == sorted(d for _, d in expected)
+
+
+def test_add_replaces_and_remove_deletes():
+    index = PerceptualHashIndex(max_distance=4)
+    index.add(1, BASE)
+    index.add(1, ~BASE)
+    assert index.query(BASE) == []
+    assert index.query(to_unsigned(~BASE)) == [(1, 0)]
+    index.remove(1)
+    index.remove(1)
+    assert len(index) == 0
+    assert index.query(to_unsigned(~BASE)) == []
+
+
+def test_flat_frames_are_not_indexed():
+    # 纯色、天空等画面的 dHash 几乎全为 0，彼此距离很近却不是同一张照片
+    assert not is_informative(0, min_bits=8)
+    assert not is_informative(0x181800000000, min_bits=8)
+    assert not is_informative((1 << 64) - 1, min_bits=8)
+    assert is_informative(BASE, min_bits=8)
+
+    index = PerceptualHashIndex(max_distance=4)
+    index.add(1, 0)
+    index.add(2, 0x181800000000)
+    assert len(index) == 0
+    assert index.query(0) == []
+
+
+def test_own_near_duplicate_is_found_behind_other_users_photos(api):
+    async def scenario():
+        async with api() as client:
+            own_id = (await client.get("/api/auth/me")).json()["id"]
+            async with async_session() as db:
+                other = User(username="phash_other_user", password_hash="-")
+                db.add(other)
+                await db.commit()
+                # 其他用户的完全相同的图片排在前面，超过一批候选数
+                photos = [
+                    build_photo(other.id, f"wallpaper_{i}.jpg", f"{i:064x}", f"{i:064x}", BASE, "deepseek",
+                                ANALYSIS_RESULT)
+                    for i in range(NEAR_DUPLICATE_CANDIDATES + 50)
+                ]
+                own = build_photo(own_id, "mine.jpg", "f" * 64, "f" * 64, flip(BASE, 5), "deepseek", ANALYSIS_RESULT)
+                await create_photos(db, [*photos, own])
+                found = await find_near_duplicate(db, own_id, BASE, "deepseek")
+                missing = await find_near_duplicate(db, own_id, BASE, "openai")
+            return found, missing, own.id
+
+    found, missing, own_id = asyncio.run(scenario())
+    assert found is not None and found.id == own_id
+    assert missing is None
@@ -0,0 +1,88 @@
+import asyncio
+
+from app.api import photo as photo_api
+from app.core.config import settings
+from benchmarks.corpus import make_photo
+
+
+def upload_files(*seeds: int, size=(320, 240)):
+    return [("file", (f"photo_{seed}.jpg", make_photo(*size, seed), "image/jpeg")) for seed in seeds]
+
+
+def test_unknown_model_is_rejected(api):
+    async def scenario():
+        async with api() as client:
+            response = await client.post("/api/photo/analyze", files=upload_files(1), data={"model": "unknown"})
+            return response.status_code, client.provider_stats.requests
+
+    status_code, requests = asyncio.run(scenario())
+    assert status_code == 400
+    assert requests == 0
+
+
+def test_reused_results_are_not_charged(api, monkeypatch):
+    monkeypatch.setattr(settings, "USER_RATE_LIMIT_BURST", 1)
+    monkeypatch.setattr(settings, "USER_RATE_LIMIT_PER_MINUTE", 1)
+
+    async def scenario():
+        async with api() as client:
+            first = await client.post("/api/photo/analyze", files=upload_files(1), data={"model": "deepseek"})
+            again = await client.post("/api/photo/analyze", files=upload_files(1), data={"model": "deepseek"})
+            other = await client.post("/api/photo/analyze", files=upload_files(2), data={"model": "deepseek"})
+            return first, again, other, client.provider_stats.requests
+
+    first, again, other, requests = asyncio.run(scenario())
+    assert first.status_code == 200 and not first.json()["cached"]
+    # 重复上传直接返回已有记录，不占用分析次数
+    assert again.status_code == 200 and again.json()["cached"]
+    assert again.json()["id"] == first.json()["id"]
+    assert other.status_code == 429
+    assert requests == 1
+
+
+def stream_events(response):
+    return [block.split("\n")[0].removeprefix("event: ") for block in response.text.split("\n\n") if block]
+
+
+def test_stream_rejects_unknown_model_before_processing_the_upload(api, monkeypatch):
+    prepared = []
+
+    async def recording_prepare(*args):
+        prepared.append(args)
+
+    monkeypatch.setattr(photo_api, "prepare_upload", recording_prepare)
+
+    async def scenario():
+        async with api() as client:
+            response = await client.post("/api/photo/analyze/stream", files=upload_files(1), data={"model": "unknown"})
+            return response.status_code, client.provider_stats.requests
+
+    assert asyncio.run(scenario()) == (400, 0)
+    assert prepared == []
+
+
+def test_stream_charges_only_provider_calls(api, monkeypatch):
+    monkeypatch.setattr(settings, "USER_RATE_LIMIT_BURST", 1)
+    monkeypatch.setattr(settings, "USER_RATE_LIMIT_PER_MINUTE", 1)
+
+    async def scenario():
+        async with api() as client:
+            async def stream(seed):
+                files = upload_files(seed)
+                return await client.post("/api/photo/analyze/stream", files=files, data={"model": "deepseek"})
+
+            first = await stream(1)
+            again = await stream(1)
+            # 删除记录后结果缓存仍在，再次上传同一张图片复用缓存
+            photo_id = (await client.get("/api/photo/history")).json()["items"][0]["id"]
+            await client.delete(f"/api/photo/{photo_id}")
+            from_cache = await stream(1)
+            other = await stream(2)
+            return first, again, from_cache, other, client.provider_stats.requests
+
+    first, again, from_cache, other, requests = asyncio.run(scenario())
+    assert stream_events(first)[-1] == "result"
+    assert stream_events(again) == ["result"]
+    assert stream_events(from_cache) == ["result"]
+    assert other.status_code == 429
+    assert requests == 1
@@ -0,0 +1,158 @@
+import asyncio
+
+import pytest
+
+from app.services import provider_router as router_module
+from app.services.provider_router import CircuitBreaker, ProviderRouter, ProviderUnavailableError
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(router_module.time, "monotonic", clock)
+    return clock
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_seconds=10)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == "closed" and breaker.acquire()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.available()
+
+
+def test_success_resets_failure_count(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=10)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+
+
+def test_half_open_allows_single_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.now += 10
+    assert breaker.available()
+    assert breaker.acquire()
+    assert breaker.state == "half_open"
+    assert not breaker.acquire()
+    breaker.release()
+    assert breaker.acquire()
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens(clock):
+    breaker = CircuitBreaker(failure_threshold=5, reset_seconds=10)
+    for _ in range(5):
+        breaker.record_failure()
+    clock.now += 10
+    assert breaker.acquire()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    clock.now += 9
+    assert not breaker.available()
+
+
+def fake_provider(delays, failures=(), calls=None, cancelled=None):
+    async def call(provider):
+        if calls is not None:
+            calls.append(provider)
+        try:
+            await asyncio.sleep(delays.get(provider, 0))
+        except asyncio.CancelledError:
+            if cancelled is not None:
+                cancelled.append(provider)
+            raise
+        if provider in failures:
+            raise RuntimeError(provider)
+        return f"result-{provider}"
+    return call
+
+
+def test_call_uses_first_provider():
+    router = ProviderRouter(["a", "b"], hedge_enabled=False, min_samples=1)
+    calls = []
+    assert run(router.call(fake_provider({}, calls=calls))) == ("result-a", "a")
+    assert calls == ["a"]
+
+
+def test_call_fails_over_and_records_failure():
+    router = ProviderRouter(["a", "b"], hedge_enabled=False, min_samples=1)
+    calls = []
+    result = run(router.call(fake_provider({}, failures={"a"}, calls=calls)))
+    assert result == ("result-b", "b")
+    assert calls == ["a", "b"]
+    assert router.stats["a"].error_rate == 1.0
+    assert router.breakers["a"].failures == 1
+
+
+def test_call_raises_last_error_when_all_fail():
+    router = ProviderRouter(["a", "b"], hedge_enabled=False, min_samples=1)
+    with pytest.raises(RuntimeError, match="b"):
+        run(router.call(fake_provider({}, failures={"a", "b"})))
+
+
+def test_call_skips_open_breakers():
+    router = ProviderRouter(["a", "b"], hedge_enabled=False, min_samples=1)
+    router.breakers["a"].state = "open"
+    router.breakers["a"].opened_at = float("inf")
+    assert run(router.call(fake_provider({}))) == ("result-b", "b")
+    router.breakers["b"].state = "open"
+    router.breakers["b"].opened_at = float("inf")
+    with pytest.raises(ProviderUnavailableError):
+        run(router.call(fake_provider({})))
+
+
+def test_rank_prefers_faster_healthy_provider():
+    router = ProviderRouter(["a", "b", "c"], hedge_enabled=False, min_samples=2)
+    for _ in range(2):
+        router.stats["a"].record(2.0, True)
+        router.stats["b"].record(0.5, True)
+        router.stats["c"].record(0.1, False)
+    # c 错误率过高排最后，a、b 按 p50 排序
+    assert router.rank() == ["b", "a", "c"]
+    assert router.rank(["a", "c"]) == ["a", "c"]
+
+
+def test_hedge_fires_after_delay_and_records_loser(monkeypatch):
+    monkeypatch.setattr(router_module.settings, "ROUTER_HEDGE_DEFAULT_DELAY_SECONDS", 0.05)
+    router = ProviderRouter(["a", "b"], hedge_enabled=True, min_samples=5)
+    calls, cancelled = [], []
+    result = run(router.call(fake_provider({"a": 1.0, "b": 0.0}, calls=calls, cancelled=cancelled)))
+    assert result == ("result-b", "b")
+    assert calls == ["a", "b"]
+    assert cancelled == ["a"]
+    assert router.hedges == 1 and router.hedge_wins == 1
+    # 落后的请求按失败计入统计，熔断器不受影响
+    assert list(router.stats["a"].samples)[0][1] is False
+    assert router.breakers["a"].failures == 0 and not router.breakers["a"]._probing
+
+
+def test_cancelled_call_records_nothing():
+    router = ProviderRouter(["a"], hedge_enabled=False, min_samples=1)
+
+    async def scenario():
+        task = asyncio.create_task(router.call(fake_provider({"a": 1.0})))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    run(scenario())
+    assert len(router.stats["a"]) == 0
@@ -0,0 +1,118 @@
+import asyncio
+from email.utils import formatdate
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.core.rate_limit import (
+    MemoryRateLimitBackend,
+    ProviderRateLimitedError,
+    RateLimitBackend,
+    RateLimiter,
+    RateLimitExceededError,
+    SQLiteRateLimitBackend,
+    defer_tokens,
+    parse_retry_after,
+    take_tokens,
+)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_bucket_starts_full_and_refills():
+    state = None
+    for _ in range(3):
+        state, wait = take_tokens(state, 0.0, capacity=3, rate=1.0, cost=1)
+        assert wait == 0
+    state, wait = take_tokens(state, 0.0, capacity=3, rate=1.0, cost=1)
+    assert wait == pytest.approx(1.0)
+    state, wait = take_tokens(state, 1.0, capacity=3, rate=1.0, cost=1)
+    assert wait == 0
+
+
+def test_cost_above_capacity_goes_into_debt():
+    state, wait = take_tokens(None, 0.0, capacity=5, rate=1.0, cost=8)
+    assert wait == 0 and state[0] == -3
+    _, wait = take_tokens(state, 0.0, capacity=5, rate=1.0, cost=1)
+    assert wait == pytest.approx(4.0)
+
+
+def test_defer_blocks_for_given_seconds():
+    state = defer_tokens(None, 0.0, capacity=5, rate=2.0, seconds=10)
+    _, wait = take_tokens(state, 0.0, capacity=5, rate=2.0, cost=1)
+    assert wait == pytest.approx(10.0)
+    _, wait = take_tokens(state, 10.0, capacity=5, rate=2.0, cost=1)
+    assert wait == 0
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("12") == 12
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert 25 <= parse_retry_after(formatdate(time.time() + 30, usegmt=True)) <= 30
+
+
+def test_check_user_raises_with_retry_after(monkeypatch):
+    monkeypatch.setattr(settings, "USER_RATE_LIMIT_PER_MINUTE", 6)
+    monkeypatch.setattr(settings, "USER_RATE_LIMIT_BURST", 2)
+    limiter = RateLimiter(MemoryRateLimitBackend(), enabled=True)
+
+    async def scenario():
+        await limiter.check_user(1)
+        await limiter.check_user(1)
+        # 其他用户有自己的桶
+        await limiter.check_user(2)
+        with pytest.raises(RateLimitExceededError) as exc:
+            await limiter.check_user(1)
+        return exc.value.retry_after
+
+    assert run(scenario()) == 10
+
+
+def test_provider_waits_then_gives_up(monkeypatch):
+    monkeypatch.setattr(settings, "PROVIDER_RATE_LIMIT_BURST", 1)
+    monkeypatch.setattr(settings, "PROVIDER_RATE_LIMIT_MAX_WAIT_SECONDS", 1.0)
+    limiter = RateLimiter(MemoryRateLimitBackend(), enabled=True)
+    limiter.provider_limits = {"deepseek": 600}
+
+    async def scenario():
+        await limiter.acquire_provider("deepseek")
+        started = time.monotonic()
+        await limiter.acquire_provider("deepseek")
+        waited = time.monotonic() - started
+        await limiter.defer_provider("deepseek", 60)
+        with pytest.raises(ProviderRateLimitedError):
+            await limiter.acquire_provider("deepseek")
+        # 未配置限额的服务商不受限制
+        await limiter.acquire_provider("claude")
+        return waited
+
+    assert 0.05 <= run(scenario()) < 0.5
+
+
+def test_sqlite_backend_is_shared(tmp_path):
+    path = str(tmp_path / "rate_limit.db")
+    first, second = SQLiteRateLimitBackend(path), SQLiteRateLimitBackend(path)
+
+    async def scenario():
+        assert await first.take("user:1", 2, 0.01) == 0
+        assert await second.take("user:1", 2, 0.01) == 0
+        return await first.take("user:1", 2, 0.01)
+
+    try:
+        assert run(scenario()) > 0
+    finally:
+        first.close()
+        second.close()
+
+
+def test_backend_missing_defer_cannot_be_created():
+    class TakeOnlyBackend(RateLimitBackend):
+        async def take(self, key, capacity, rate, cost=1.0):
+            return 0.0
+
+    with pytest.raises(TypeError, match="defer"):
+        TakeOnlyBackend()
@@ -0,0 +1,189 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+
+from app.core.config import settings
+from app.core.deadline import (
+    ClientDisconnectedError,
+    Deadline,
+    DeadlineExceededError,
+    ProviderTimeoutError,
+    cancel_on_disconnect,
+)
+from app.core.metrics import PROVIDER_RETRIES
+from app.core.rate_limit import get_rate_limiter
+from app.services import http_pool, provider_router
+from app.services.ai_service import AIService
+from app.services.http_pool import ClientRegistry
+from app.services.provider_retry import retry_delay
+from app.services.provider_router import ProviderHTTPError, ProviderRouter
+from app.utils.stream_json import AnalysisParseError
+from benchmarks.mock_provider import CANNED_RESULT, start_mock_provider
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(settings, "PROVIDER_RETRY_BASE_SECONDS", 0.01)
+    monkeypatch.setattr(settings, "PROVIDER_RETRY_MAX_SECONDS", 0.05)
+    monkeypatch.setattr(settings, "PROVIDER_RETRY_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "QUALITY_PRESCORE_ENABLED", False)
+    monkeypatch.setattr(settings, "IMAGE_PROFILES_ENABLED", False)
+    monkeypatch.setattr(get_rate_limiter(), "enabled", False)
+    # 每个用例使用独立的路由统计，失败不影响其他用例的熔断器
+    monkeypatch.setattr(provider_router, "_router", ProviderRouter(["deepseek"]))
+
+
+def run(monkeypatch, scenario, deadline=None, **options):
+    """在模拟服务上运行 scenario(service)，返回 (结果或异常, 模拟服务的统计)"""
+    async def main():
+        runner, base_url = await start_mock_provider(seed=0, **options)
+        # 客户端会话绑定事件循环，每个用例创建自己的注册表
+        registry = ClientRegistry()
+        monkeypatch.setattr(http_pool, "_registry", registry)
+        registry.get_client("deepseek").base_url = base_url
+        try:
+            try:
+                outcome = await scenario(AIService("deepseek", deadline=deadline))
+            except Exception as e:
+                outcome = e
+            # 等待模拟服务察觉被取消的连接
+            await asyncio.sleep(0.05)
+            return outcome, runner.app["stats"]
+        finally:
+            await registry.close()
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def analyze(service):
+    return service.analyze_photo(b"image", "a.jpg")
+
+
+async def stream(service):
+    return [event async for event in service.stream_analysis(b"image", "a.jpg")]
+
+
+def test_retry_delay_only_for_safe_errors():
+    deadline = Deadline()
+    assert retry_delay(ProviderHTTPError("", 503), 1, deadline) is not None
+    assert retry_delay(ProviderTimeoutError(), 1, deadline) is not None
+    assert retry_delay(aiohttp.ServerDisconnectedError(), 1, deadline) is not None
+    for error in (ProviderHTTPError("", 400), ProviderHTTPError("", 401), AnalysisParseError("")):
+        assert retry_delay(error, 1, deadline) is None
+    assert retry_delay(ProviderHTTPError("", 503), 3, deadline) is None
+
+
+def test_retry_delay_backs_off_with_jitter():
+    delays = [retry_delay(ProviderHTTPError("", 500), attempt, Deadline()) for attempt in (1, 2)]
+    assert 0.005 <= delays[0] <= 0.01
+    assert 0.01 <= delays[1] <= 0.02
+
+
+def test_retry_after_is_honored_within_limits():
+    assert retry_delay(ProviderHTTPError("", 429, retry_after=0.04), 1, Deadline()) == 0.04
+    # 要求暂停太久时交由路由切换服务商
+    assert retry_delay(ProviderHTTPError("", 429, retry_after=30), 1, Deadline()) is None
+    # 等待后已来不及完成调用
+    assert retry_delay(ProviderHTTPError("", 429, retry_after=0.04), 1, Deadline(0.02)) is None
+
+
+def test_request_deadline_can_only_be_shortened():
+    assert Deadline.for_request(60).remaining() == pytest.approx(60, abs=0.1)
+    assert Deadline.for_request(60, 5).remaining() == pytest.approx(5, abs=0.1)
+    assert Deadline.for_request(60, 600).remaining() == pytest.approx(60, abs=0.1)
+    assert Deadline().remaining() is None
+
+
+def test_server_errors_are_retried(monkeypatch):
+    retried = PROVIDER_RETRIES.labels("deepseek", "http_503").value
+    result, stats = run(monkeypatch, analyze, fail_first=2)
+    assert result["scores"] == CANNED_RESULT["scores"]
+    assert stats.requests == 3
+    assert PROVIDER_RETRIES.labels("deepseek", "http_503").value == retried + 2
+
+
+def test_retries_stop_after_max_attempts(monkeypatch):
+    error, stats = run(monkeypatch, analyze, fail_first=5)
+    assert isinstance(error, ProviderHTTPError) and error.status == 503
+    assert stats.requests == 3
+
+
+def test_dropped_connections_are_retried(monkeypatch):
+    monkeypatch.setattr(settings, "PROVIDER_RETRY_MAX_ATTEMPTS", 2)
+    retried = PROVIDER_RETRIES.labels("deepseek", "connection").value
+    error, stats = run(monkeypatch, analyze, disconnect_rate=1.0)
+    assert isinstance(error, aiohttp.ClientConnectionError)
+    assert stats.requests == 2
+    assert PROVIDER_RETRIES.labels("deepseek", "connection").value == retried + 1
+
+
+def test_hung_attempt_is_cancelled_and_retried(monkeypatch):
+    monkeypatch.setattr(settings, "PROVIDER_ATTEMPT_TIMEOUT_SECONDS", 0.1)
+    monkeypatch.setattr(settings, "PROVIDER_RETRY_MAX_ATTEMPTS", 2)
+    error, stats = run(monkeypatch, analyze, hang_rate=1.0)
+    assert isinstance(error, ProviderTimeoutError)
+    # 超时的请求被取消，连接随之关闭
+    assert stats.requests == stats.abandoned == 2
+
+
+def test_deadline_stops_retries_without_blaming_provider(monkeypatch):
+    monkeypatch.setattr(settings, "PROVIDER_ATTEMPT_TIMEOUT_SECONDS", 5)
+    started = time.perf_counter()
+    error, stats = run(monkeypatch, analyze, deadline=Deadline(0.2), hang_rate=1.0)
+    assert isinstance(error, DeadlineExceededError)
+    assert time.perf_counter() - started < 2
+    assert stats.requests == stats.abandoned == 1
+    router = provider_router.get_provider_router()
+    assert len(router.stats["deepseek"]) == 0
+    assert router.breakers["deepseek"].state == "closed"
+
+
+def test_stream_retries_before_first_event(monkeypatch):
+    events, stats = run(monkeypatch, stream, fail_first=1)
+    assert events[-1]["result"]["scores"] == CANNED_RESULT["scores"]
+    assert [e["type"] for e in events].count("score") == 4
+    assert stats.requests == 2
+
+
+def test_stream_first_event_timeout(monkeypatch):
+    monkeypatch.setattr(settings, "PROVIDER_ATTEMPT_TIMEOUT_SECONDS", 0.1)
+    monkeypatch.setattr(settings, "PROVIDER_RETRY_MAX_ATTEMPTS", 1)
+    error, stats = run(monkeypatch, stream, hang_rate=1.0)
+    assert isinstance(error, ProviderTimeoutError)
+    assert stats.abandoned == 1
+
+
+class DisconnectingRequest:
+    """请求体读完后 delay 秒客户端断开"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def receive(self):
+        await asyncio.sleep(self.delay)
+        return {"type": "http.disconnect"}
+
+
+def test_client_disconnect_cancels_provider_call(monkeypatch):
+    monkeypatch.setattr(settings, "PROVIDER_ATTEMPT_TIMEOUT_SECONDS", 5)
+
+    async def scenario(service):
+        return await cancel_on_disconnect(DisconnectingRequest(0.1), analyze(service))
+
+    started = time.perf_counter()
+    error, stats = run(monkeypatch, scenario, hang_rate=1.0)
+    assert isinstance(error, ClientDisconnectedError)
+    assert time.perf_counter() - started < 2
+    assert stats.requests == stats.abandoned == 1
+    assert len(provider_router.get_provider_router().stats["deepseek"]) == 0
+
+
+def test_finished_analysis_is_returned_before_disconnect(monkeypatch):
+    async def scenario(service):
+        return await cancel_on_disconnect(DisconnectingRequest(5), analyze(service))
+
+    result, _ = run(monkeypatch, scenario)
+    assert result["scores"] == CANNED_RESULT["scores"]
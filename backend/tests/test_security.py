@@ -0,0 +1,135 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+
+from app.core import security
+from app.core.config import settings
+from app.core.database import async_session, engine, init_db
+from app.core.security import create_access_token, get_current_user
+from app.models.photo import Photo  # noqa: F401  注册 User.photos 关联的映射
+from app.models.user import User
+
+
+@pytest.fixture(autouse=True)
+def clear_caches(monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_CACHE_ENABLED", True)
+    security._token_cache.clear()
+    security._user_cache.clear()
+
+
+def test_invalid_tokens_are_rejected():
+    assert security._decode_token("not-a-token") is None
+    expired = create_access_token({"sub": "1"}, expires_delta=timedelta(seconds=-1))
+    assert security._decode_token(expired) is None
+    assert len(security._token_cache) == 0
+
+
+def test_decoded_token_is_cached(monkeypatch):
+    token = create_access_token({"sub": "42"})
+    assert security._decode_token(token) == 42
+
+    def fail(*args, **kwargs):
+        raise AssertionError("token 应命中缓存")
+
+    monkeypatch.setattr(security.jwt, "decode", fail)
+    assert security._decode_token(token) == 42
+
+
+def test_user_cache_skips_database_and_invalidates_on_update():
+    queries = []
+
+    def count(*args):
+        queries.append(args[2])
+
+    async def scenario():
+        await init_db()
+        async with async_session() as db:
+            user = User(username="cache-user", password_hash="x")
+            db.add(user)
+            await db.commit()
+            token = create_access_token({"sub": str(user.id)})
+
+        event.listen(engine.sync_engine, "before_cursor_execute", count)
+        try:
+            async with async_session() as db:
+                first = await get_current_user(token, db)
+            async with async_session() as db:
+                second = await get_current_user(token, db)
+            hits = len(queries)
+
+            # 修改用户后缓存失效，下次请求重新查询
+            async with async_session() as db:
+                stored = await db.get(User, first.id)
+                stored.username = "renamed"
+                await db.commit()
+            queries.clear()
+            async with async_session() as db:
+                third = await get_current_user(token, db)
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", count)
+        return first, second, third, hits, len(queries)
+
+    first, second, third, hits, after_update = asyncio.run(scenario())
+    assert hits == 1
+    assert second is not first and second.username == "cache-user"
+    assert after_update == 1 and third.username == "renamed"
+
+
+def test_unknown_user_is_rejected():
+    token = create_access_token({"sub": "999999"})
+
+    async def scenario():
+        await init_db()
+        async with async_session() as db:
+            await get_current_user(token, db)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(scenario())
+    assert exc.value.status_code == 401
+
+
+def test_password_hash_uses_configured_rounds(monkeypatch):
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+    hashed = asyncio.run(security.get_password_hash_async("secret1"))
+    assert hashed.startswith("$2b$04$")
+    assert not security.password_needs_rehash(hashed)
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 5)
+    assert security.password_needs_rehash(hashed)
+    assert asyncio.run(security.verify_password_async("secret1", hashed))
+    assert not asyncio.run(security.verify_password_async("wrong", hashed))
+
+
+def test_long_multibyte_password_is_truncated_to_72_bytes(monkeypatch):
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+    password = "密码" * 30
+    hashed = security.get_password_hash(password)
+    assert security.verify_password(password, hashed)
+
+
+def test_login_rehashes_when_rounds_change(monkeypatch):
+    from fastapi.security import OAuth2PasswordRequestForm
+
+    from app.api.auth import login
+
+    monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+
+    async def scenario():
+        await init_db()
+        async with async_session() as db:
+            user = User(username="rehash-user", password_hash=security.get_password_hash("secret1"))
+            db.add(user)
+            await db.commit()
+            user_id = user.id
+        monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 5)
+        form = OAuth2PasswordRequestForm(username="rehash-user", password="secret1")
+        async with async_session() as db:
+            token = await login(form, db)
+        async with async_session() as db:
+            return token, (await db.get(User, user_id)).password_hash
+
+    token, password_hash = asyncio.run(scenario())
+    assert token["access_token"]
+    assert password_hash.startswith("$2b$05$")
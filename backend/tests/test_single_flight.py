@@ -0,0 +1,178 @@
+import asyncio
+
+from app.core.config import settings
+from app.core.deadline import Deadline, DeadlineExceededError
+from app.core.metrics import ANALYSIS_COALESCED
+from app.core.rate_limit import get_rate_limiter
+from app.services import http_pool, provider_router
+from app.services.ai_service import AIService
+from app.services.http_pool import ClientRegistry
+from app.services.provider_router import ProviderRouter
+from app.utils.single_flight import SingleFlight
+from benchmarks.mock_provider import CANNED_RESULT, start_mock_provider
+
+
+class Work:
+    """记录被执行的次数，release 之后才返回"""
+
+    def __init__(self, result="done", error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flights, work = SingleFlight(), Work()
+        callers = [asyncio.create_task(flights.run("k", work)) for _ in range(3)]
+        await asyncio.sleep(0)
+        work.release.set()
+        results = await asyncio.gather(*callers)
+        return results, work.calls, len(flights)
+
+    results, calls, remaining = asyncio.run(scenario())
+    assert results == [("done", False), ("done", True), ("done", True)]
+    assert calls == 1
+    assert remaining == 0
+
+
+def test_different_keys_run_separately():
+    async def scenario():
+        flights, work = SingleFlight(), Work()
+        work.release.set()
+        return await asyncio.gather(flights.run("a", work), flights.run("b", work)), work.calls
+
+    results, calls = asyncio.run(scenario())
+    assert [shared for _, shared in results] == [False, False]
+    assert calls == 2
+
+
+def test_error_reaches_every_waiter():
+    async def scenario():
+        flights, work = SingleFlight(), Work(error=ValueError("boom"))
+        callers = [asyncio.create_task(flights.run("k", work)) for _ in range(3)]
+        await asyncio.sleep(0)
+        work.release.set()
+        return await asyncio.gather(*callers, return_exceptions=True), work.calls
+
+    results, calls = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) and str(result) == "boom" for result in results)
+    assert calls == 1
+
+
+def test_cancelled_leader_does_not_cancel_waiters():
+    async def scenario():
+        flights, work = SingleFlight(), Work()
+        leader = asyncio.create_task(flights.run("k", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.run("k", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        work.release.set()
+        return await follower, leader.cancelled(), work.calls, work.cancelled
+
+    result, leader_cancelled, calls, work_cancelled = asyncio.run(scenario())
+    assert result == ("done", True)
+    assert leader_cancelled
+    assert calls == 1 and not work_cancelled
+
+
+def test_execution_is_cancelled_when_nobody_waits():
+    async def scenario():
+        flights, work = SingleFlight(), Work()
+        callers = [asyncio.create_task(flights.run("k", work)) for _ in range(2)]
+        await asyncio.sleep(0)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        cancelled = work.cancelled
+        # 之后的调用重新执行，不会加入已取消的执行
+        work.release.set()
+        return cancelled, await flights.run("k", work), work.calls
+
+    cancelled, result, calls = asyncio.run(scenario())
+    assert cancelled
+    assert result == ("done", False)
+    assert calls == 2
+
+
+def analyze_concurrently(monkeypatch, models, deadlines=None, **options):
+    """同时分析同一张图片，返回 (各请求的结果和模型, 模拟服务收到的请求数)"""
+    monkeypatch.setattr(settings, "QUALITY_PRESCORE_ENABLED", False)
+    monkeypatch.setattr(settings, "IMAGE_PROFILES_ENABLED", False)
+    monkeypatch.setattr(get_rate_limiter(), "enabled", False)
+    monkeypatch.setattr(provider_router, "_router", ProviderRouter(["deepseek", "openai"]))
+    deadlines = deadlines or [None] * len(models)
+
+    async def scenario():
+        runner, base_url = await start_mock_provider(latency=0.1, **options)
+        registry = ClientRegistry()
+        monkeypatch.setattr(http_pool, "_registry", registry)
+        for provider in ("deepseek", "openai"):
+            registry.get_client(provider).base_url = base_url
+        try:
+            services = [AIService(model, deadline=deadline) for model, deadline in zip(models, deadlines)]
+            results = await asyncio.gather(
+                *[service.analyze_photo(b"image", "a.jpg") for service in services], return_exceptions=True
+            )
+            return [(result, service.model) for result, service in zip(results, services)], runner.app["stats"].requests
+        finally:
+            await registry.close()
+            await runner.cleanup()
+
+    return asyncio.run(scenario())
+
+
+def test_identical_analyses_call_provider_once(monkeypatch):
+    coalesced = ANALYSIS_COALESCED.value
+    outcomes, requests = analyze_concurrently(monkeypatch, ["deepseek"] * 3)
+    assert requests == 1
+    assert ANALYSIS_COALESCED.value == coalesced + 2
+    for result, model in outcomes:
+        assert result["scores"] == CANNED_RESULT["scores"]
+        assert model == "deepseek"
+    # 发起者和等待者各自得到独立的副本
+    results = [result for result, _ in outcomes]
+    assert len({id(result) for result in results}) == 3
+
+
+def test_short_leader_deadline_does_not_fail_followers(monkeypatch):
+    outcomes, requests = analyze_concurrently(
+        monkeypatch, ["deepseek"] * 2, deadlines=[Deadline(0.02), Deadline(10)]
+    )
+    assert requests == 1
+    assert isinstance(outcomes[0][0], DeadlineExceededError)
+    assert outcomes[1][0]["scores"] == CANNED_RESULT["scores"]
+
+
+def test_different_models_are_not_coalesced(monkeypatch):
+    _, requests = analyze_concurrently(monkeypatch, ["deepseek", "openai"])
+    assert requests == 2
+
+
+def test_failure_reaches_every_request(monkeypatch):
+    monkeypatch.setattr(settings, "PROVIDER_RETRY_MAX_ATTEMPTS", 1)
+    outcomes, requests = analyze_concurrently(monkeypatch, ["deepseek"] * 2, error_rate=1.0)
+    assert requests == 1
+    assert all(isinstance(result, Exception) for result, _ in outcomes)
+
+
+def test_coalescing_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "ANALYSIS_COALESCE_ENABLED", False)
+    _, requests = analyze_concurrently(monkeypatch, ["deepseek"] * 2)
+    assert requests == 2
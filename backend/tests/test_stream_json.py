@@ -0,0 +1,137 @@
+import asyncio
+import json
+
+import pytest
+
+from app.services.claude_client import ClaudeClient
+from app.services.deepseek_client import DeepSeekClient
+from app.services.openai_client import OpenAIClient
+from app.services.provider_client import ProviderClient
+from app.utils.stream_json import (
+    ANALYSIS_KEYS,
+    AnalysisParseError,
+    AnalysisStreamParser,
+    IncrementalJSONParser,
+    iter_json_objects,
+    parse_analysis,
+    parse_analysis_fields,
+)
+from benchmarks.bench_parser import MESSY_OUTPUTS
+from benchmarks.mock_provider import CANNED_RESULT, start_mock_provider
+
+
+def feed_in_chunks(parser, text: str, size: int):
+    events = []
+    for i in range(0, len(text), size):
+        events.extend(parser.feed(text[i:i + size]))
+    return events
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_scalars_are_emitted_with_paths(size):
+    text = '{"a": 1, "b": {"c": "x\\"y", "d": [true, null, -2.5e1]}, "e": []}'
+    events = feed_in_chunks(IncrementalJSONParser(), text, size)
+    assert events == [
+        (("a",), 1),
+        (("b", "c"), 'x"y'),
+        (("b", "d", 0), True),
+        (("b", "d", 1), None),
+        (("b", "d", 2), -25.0),
+    ]
+
+
+def test_text_before_and_after_root_is_ignored():
+    parser = IncrementalJSONParser()
+    events = parser.feed('```json\n{"a": "多行\n文本"}\n```')
+    assert events == [(("a",), "多行\n文本")]
+    assert parser.done
+    assert parser.text == '{"a": "多行\n文本"}'
+
+
+def test_value_is_emitted_only_when_complete():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"a": 12') == []
+    assert parser.feed('3, "b": "hel') == [(("a",), 123)]
+    assert parser.feed('lo"}') == [(("b",), "hello")]
+
+
+@pytest.mark.parametrize("size", [1, 5, 50])
+def test_analysis_events(size):
+    text = json.dumps(CANNED_RESULT, ensure_ascii=False)
+    events = feed_in_chunks(AnalysisStreamParser(), text, size)
+    scores = [(e["dimension"], e["value"]) for e in events if e["type"] == "score"]
+    items = [(e["category"], e["index"], e["text"]) for e in events if e["type"] == "item"]
+    assert scores == list(CANNED_RESULT["scores"].items())
+    assert items == [
+        (category, index, item)
+        for category, values in CANNED_RESULT["analysis"].items()
+        for index, item in enumerate(values)
+    ]
+
+
+@pytest.mark.parametrize("client_class", [DeepSeekClient, OpenAIClient, ClaudeClient])
+def test_client_stream_against_mock(client_class):
+    async def scenario():
+        runner, base_url = await start_mock_provider(token_delay=0.0)
+        try:
+            client = client_class()
+            client.base_url = base_url
+            return [event async for event in client.stream_analysis(b"image", "a.jpg")]
+        finally:
+            await runner.cleanup()
+
+    events = asyncio.run(scenario())
+    assert [e["type"] for e in events].count("score") == 4
+    assert [e["type"] for e in events].count("item") == 6
+    assert events[-1]["type"] == "result"
+    assert events[-1]["result"]["scores"] == CANNED_RESULT["scores"]
+
+
+def test_json_objects_are_found_by_bracket_balance():
+    text = 'a {x} b {"k": "}{\\"", "n": {"a": 1}} c {"t": [1,]} d {'
+    assert list(iter_json_objects(text)) == [{"k": '}{"', "n": {"a": 1}}, {"t": [1]}]
+
+
+@pytest.mark.parametrize("name, content, parsable", MESSY_OUTPUTS, ids=[case[0] for case in MESSY_OUTPUTS])
+def test_messy_outputs(name, content, parsable):
+    if not parsable:
+        with pytest.raises(AnalysisParseError):
+            parse_analysis(content)
+        return
+    result = parse_analysis(content)
+    assert result["scores"]["composition"] == CANNED_RESULT["scores"]["composition"]
+    assert result["scores"]["technical"] in (78, 79)
+    assert set(result["analysis"]) == {"highlights", "improvements", "suggestions"}
+    assert all(isinstance(item, str) for items in result["analysis"].values() for item in items)
+    assert result["overall_score"] == int(sum(result["scores"].values()) / 4)
+
+
+def test_scores_are_normalized():
+    result = parse_analysis('{"scores": {"technical": "85分", "composition": 101, "aesthetic": 72.6, "narrative": -3},'
+                            ' "analysis": {"highlights": "主体清晰", "improvements": [{"a": 1}], "suggestions": null}}')
+    assert result["scores"] == {"technical": 85, "composition": 100, "aesthetic": 73, "narrative": 0}
+    assert result["analysis"] == {"highlights": ["主体清晰"], "improvements": ['{"a": 1}'], "suggestions": []}
+
+
+def test_absent_categories_are_reported():
+    content = json.dumps({"scores": CANNED_RESULT["scores"], "analysis": {"highlights": ["主体清晰"], "improvements": []}})
+    result, missing = parse_analysis_fields(content)
+    assert result["analysis"]["improvements"] == [] and result["analysis"]["suggestions"] == []
+    assert missing == ["suggestions"]
+    assert parse_analysis_fields(json.dumps({"scores": CANNED_RESULT["scores"]}))[1] == list(ANALYSIS_KEYS)
+
+
+def test_missing_technical_needs_local_score():
+    content = json.dumps({"scores": {"composition": 70, "aesthetic": 80, "narrative": 60}})
+    with pytest.raises(AnalysisParseError):
+        parse_analysis(content)
+    assert parse_analysis(content, technical=90)["scores"]["technical"] == 90
+
+
+def test_client_missing_a_hook_cannot_be_created():
+    class IncompleteClient(ProviderClient):
+        def _headers(self):
+            return {}
+
+    with pytest.raises(TypeError, match="_stream_text"):
+        IncompleteClient("key", "http://localhost")
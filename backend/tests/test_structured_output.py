@@ -0,0 +1,167 @@
+import asyncio
+import json
+
+import pytest
+
+from app.core.config import settings
+from app.core.metrics import PROVIDER_PARSE, provider_usage_report
+from app.schemas.photo import AnalysisDetail, ScoreDetail
+from app.services.claude_client import ClaudeClient
+from app.services.deepseek_client import DeepSeekClient
+from app.services.openai_client import OpenAIClient
+from app.services.prompt import ANALYSIS_PROMPT, COMPACT_PROMPT, analysis_schema, output_token_budget
+from app.utils.stream_json import AnalysisParseError
+from benchmarks.mock_provider import CANNED_RESULT, start_mock_provider
+
+
+def run(client_class, stream: bool = False, **options):
+    async def scenario():
+        runner, base_url = await start_mock_provider(seed=0, **options)
+        try:
+            client = client_class()
+            client.base_url = base_url
+            if stream:
+                events = [event async for event in client.stream_analysis(b"image", "a.jpg")]
+                return events, runner.app["stats"].requests
+            return await client.analyze_photo(b"image", "a.jpg"), runner.app["stats"].requests
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(scenario())
+
+
+def test_schema_is_derived_from_response_models():
+    schema = analysis_schema()
+    assert set(schema["properties"]["scores"]["properties"]) == set(ScoreDetail.model_fields)
+    assert set(schema["properties"]["analysis"]["properties"]) == set(AnalysisDetail.model_fields)
+    assert schema["properties"]["scores"]["additionalProperties"] is False
+
+    subset = analysis_schema([], ["suggestions"])
+    assert list(subset["properties"]) == ["analysis"]
+    assert subset["properties"]["analysis"]["required"] == ["suggestions"]
+
+
+def test_payloads_use_native_structured_output():
+    openai = OpenAIClient()._analysis_payload(b"image", "image/jpeg", None)
+    assert openai["response_format"]["type"] == "json_schema"
+    assert openai["response_format"]["json_schema"]["schema"] == analysis_schema()
+    assert openai["max_tokens"] == output_token_budget() < 1000
+    assert openai["messages"][0]["content"][0]["text"] == COMPACT_PROMPT
+
+    assert DeepSeekClient()._analysis_payload(b"image", "image/jpeg", None)["response_format"] == {"type": "json_object"}
+
+    claude = ClaudeClient()._analysis_payload(b"image", "image/jpeg", None)
+    assert claude["tools"][0]["input_schema"] == analysis_schema()
+    assert claude["tool_choice"] == {"type": "tool", "name": claude["tools"][0]["name"]}
+
+
+def test_structured_output_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "STRUCTURED_OUTPUT_ENABLED", False)
+    payload = OpenAIClient()._analysis_payload(b"image", "image/jpeg", None)
+    assert "response_format" not in payload
+    assert payload["max_tokens"] == 1000
+    assert payload["messages"][0]["content"][0]["text"] == ANALYSIS_PROMPT
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_claude_tool_call_result(stream):
+    result, requests = run(ClaudeClient, stream=stream)
+    if stream:
+        events, result = result, result[-1]["result"]
+        assert [e["type"] for e in events].count("item") == 6
+    assert result["scores"] == CANNED_RESULT["scores"]
+    assert result["analysis"] == CANNED_RESULT["analysis"]
+    assert requests == 1
+
+
+@pytest.mark.parametrize("client_class", [DeepSeekClient, ClaudeClient])
+@pytest.mark.parametrize("stream", [False, True])
+def test_truncated_output_is_repaired_with_one_small_request(client_class, stream):
+    repaired = PROVIDER_PARSE.labels(client_class.provider, "repaired").value
+    result, requests = run(client_class, stream=stream, truncate_rate=1.0)
+    if stream:
+        events, result = result, result[-1]["result"]
+        suggestions = [e["text"] for e in events if e["type"] == "item" and e["category"] == "suggestions"]
+        assert suggestions == CANNED_RESULT["analysis"]["suggestions"]
+    assert result["analysis"] == CANNED_RESULT["analysis"]
+    assert result["scores"] == CANNED_RESULT["scores"]
+    assert requests == 2
+    assert PROVIDER_PARSE.labels(client_class.provider, "repaired").value == repaired + 1
+
+
+def test_missing_scores_are_asked_with_the_image(monkeypatch):
+    client = DeepSeekClient()
+    payloads = []
+
+    async def fake_request(payload):
+        payloads.append(payload)
+        return json.dumps({"scores": {"narrative": 61}})
+
+    monkeypatch.setattr(client, "_request", fake_request)
+    content = json.dumps({"scores": {k: v for k, v in CANNED_RESULT["scores"].items() if k != "narrative"},
+                          "analysis": CANNED_RESULT["analysis"]})[:-1]
+    result = asyncio.run(client._complete(content, b"image", "image/jpeg", None))
+    assert result["scores"]["narrative"] == 61
+    assert result["analysis"] == CANNED_RESULT["analysis"]
+
+    (payload,) = payloads
+    assert payload["messages"][0]["content"][1]["type"] == "image_url"
+    assert "scores.narrative" in payload["messages"][0]["content"][0]["text"]
+    assert payload["max_tokens"] == output_token_budget(["narrative"], [])
+
+
+def test_missing_analysis_is_asked_without_the_image(monkeypatch):
+    client = OpenAIClient()
+    payloads = []
+
+    async def fake_request(payload):
+        payloads.append(payload)
+        return json.dumps({"analysis": {"suggestions": ["补光"]}}, ensure_ascii=False)
+
+    monkeypatch.setattr(client, "_request", fake_request)
+    analysis = {key: items for key, items in CANNED_RESULT["analysis"].items() if key != "suggestions"}
+    content = json.dumps({**CANNED_RESULT, "analysis": analysis})
+    result = asyncio.run(client._complete(content, b"image", "image/jpeg", None))
+    assert result["analysis"]["suggestions"] == ["补光"]
+    (payload,) = payloads
+    assert len(payload["messages"][0]["content"]) == 1
+    assert payload["response_format"]["json_schema"]["schema"] == analysis_schema([], ["suggestions"])
+
+
+def test_empty_category_is_not_repaired(monkeypatch):
+    monkeypatch.setattr(settings, "ANALYSIS_REPAIR_ENABLED", True)
+    client = OpenAIClient()
+    payloads = []
+
+    async def fake_request(payload):
+        payloads.append(payload)
+        return json.dumps({**CANNED_RESULT, "analysis": {**CANNED_RESULT["analysis"], "improvements": []}})
+
+    monkeypatch.setattr(client, "_request", fake_request)
+    result = asyncio.run(client.analyze_photo(b"image", "a.jpg"))
+    assert result["analysis"]["improvements"] == []
+    assert len(payloads) == 1
+
+
+def test_unusable_output_fails_without_repair(monkeypatch):
+    client = OpenAIClient()
+    failed = PROVIDER_PARSE.labels("openai", "failed").value
+
+    async def fake_request(payload):
+        raise AssertionError("不应追问")
+
+    monkeypatch.setattr(client, "_request", fake_request)
+    with pytest.raises(AnalysisParseError):
+        asyncio.run(client._complete("抱歉，我无法分析这张图片。", b"image", "image/jpeg", None))
+    assert PROVIDER_PARSE.labels("openai", "failed").value == failed + 1
+
+
+def test_usage_report():
+    PROVIDER_PARSE.clear()
+    run(DeepSeekClient)
+    run(DeepSeekClient, truncate_rate=1.0)
+    report = provider_usage_report()["deepseek"]
+    assert report["analyses"] == 2
+    assert report["repair_rate"] == 0.5
+    assert report["parse_failure_rate"] == 0
+    assert report["avg_input_tokens"] > 0 and report["avg_output_tokens"] > 0
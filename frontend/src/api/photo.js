@@ -13,6 +13,88 @@ export function analyzePhoto(formData) {
   })
 }
 
+/**
+ * 批量上传图片进行AI分析，按完成顺序逐条回调结果
+ * axios 在浏览器中无法逐行读取响应，这里使用 fetch 读取 NDJSON 流
+ * @param {FormData} formData - 包含多个 files 字段和模型参数的FormData对象
+ * @param {Function} onLine - 每收到一行结果时调用，参数为解析后的对象
+ * @returns {Promise} - 最后一行汇总结果
+ */
+export async function analyzePhotoBatch(formData, onLine) {
+  const response = await fetch('/api/photo/analyze/batch', {
+    method: 'POST',
+    headers: { Authorization: `Bearer ${localStorage.getItem('token') || ''}` },
+    body: formData
+  })
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({}))
+    throw new Error(error.detail || '请求失败')
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  let summary = null
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    const lines = buffer.split('\n')
+    buffer = lines.pop()
+    for (const line of lines) {
+      if (!line.trim()) continue
+      const item = JSON.parse(line)
+      if (item.event === 'done') summary = item
+      onLine?.(item)
+    }
+  }
+  return summary
+}
+
+/**
+ * 上传图片进行AI分析，评分和每条点评生成后立即回调
+ * 接口返回 Server-Sent Events，EventSource 只支持 GET，这里使用 fetch 读取事件流
+ * @param {FormData} formData - 包含图片文件和模型参数的FormData对象
+ * @param {Function} onEvent - 每收到一个 score / item 事件时调用，参数为 (事件名, 数据)
+ * @returns {Promise} - 完整的分析结果，与 analyzePhoto 相同
+ */
+export async function analyzePhotoStream(formData, onEvent) {
+  const response = await fetch('/api/photo/analyze/stream', {
+    method: 'POST',
+    headers: { Authorization: `Bearer ${localStorage.getItem('token') || ''}` },
+    body: formData
+  })
+  if (!response.ok) {
+    const error = await response.json().catch(() => ({}))
+    throw new Error(error.detail || '请求失败')
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    const blocks = buffer.split('\n\n')
+    buffer = blocks.pop()
+    for (const block of blocks) {
+      let event = 'message'
+      const data = []
+      for (const line of block.split('\n')) {
+        if (line.startsWith('event:')) event = line.slice(6).trim()
+        else if (line.startsWith('data:')) data.push(line.slice(5).trim())
+      }
+      if (!data.length) continue
+      const payload = JSON.parse(data.join('\n'))
+      if (event === 'result') return payload
+      if (event === 'error') throw new Error(payload.detail || '分析失败')
+      onEvent?.(event, payload)
+    }
+  }
+  throw new Error('分析中断，请重试')
+}
+
 /**
  * 获取历史记录列表
  * @param {number} page - 页码